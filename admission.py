@@ -0,0 +1,215 @@
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from db import Database
+from job_store import SCHEMA as JOB_SCHEMA
+
+SCHEMA = """
+-- Last star balance a worker saw per business account, lowered as stars are moved to the bot
+CREATE TABLE IF NOT EXISTS star_balances (
+    scope TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    observed_at REAL NOT NULL
+);
+
+-- Stars a job will move to its bot per business account; funded counts those already moved
+CREATE TABLE IF NOT EXISTS star_reservations (
+    job_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    stars INTEGER NOT NULL,
+    funded INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, scope)
+);
+CREATE INDEX IF NOT EXISTS idx_star_reservations_scope ON star_reservations(scope);
+"""
+
+# Job statuses whose reservations still count
+QUEUED_AND_RUNNING = ("queued", "running")
+RUNNING = ("running",)
+
+
+class AdmissionError(Exception):
+    """Raised when a job cannot be funded from the known star balance."""
+
+
+class AdmissionController:
+    """
+    Keeps track of what each business account can still fund, so jobs that
+    would stop at "Not enough stars" are turned away before they take a
+    worker slot.
+
+    Workers report the balance whenever they read it, and every star moved
+    to a bot lowers it. Queued and running jobs reserve the stars they will
+    move. The JobQueue consults the controller while holding its write
+    lock: on enqueue, a job whose stars exceed the balance left after all
+    reservations is rejected; on claim, a job that only fits once running
+    jobs give their stars back is deferred, and one that cannot fit at all
+    is failed without starting. A balance older than balance_ttl is not
+    trusted, and jobs are admitted to let the worker check it.
+
+    Args:
+        database (Database): Shared state database
+        balance_ttl (float): Seconds an observed balance is trusted
+    """
+
+    def __init__(self, database: Database, balance_ttl: float = 300):
+        self.db = database
+        self.balance_ttl = balance_ttl
+        self.db.executescript(JOB_SCHEMA)
+        self.db.executescript(SCHEMA)
+
+    def observe(self, scope: str, amount: int) -> None:
+        """
+        Store a balance read by a worker.
+
+        Args:
+            scope (str): Cache key of the business connection
+            amount (int): Star balance of the business account
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO star_balances (scope, balance, observed_at) VALUES (?, ?, ?)",
+                (scope, amount, time.time())
+            )
+
+    def record_funding(self, job_id: str, scope: str, stars: int) -> None:
+        """
+        Account for stars a job moved from the business account to its bot.
+
+        Args:
+            job_id (str): The job
+            scope (str): Cache key of the business connection
+            stars (int): Stars moved
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE star_balances SET balance = MAX(balance - ?, 0) WHERE scope = ?", (stars, scope))
+            conn.execute("UPDATE star_reservations SET funded = funded + ? WHERE job_id = ? AND scope = ?",
+                         (stars, job_id, scope))
+
+    def balance(self, scope: str, conn: Optional[sqlite3.Connection] = None) -> Optional[int]:
+        """
+        Get the balance of a business account if it is recent enough to trust.
+
+        Args:
+            scope (str): Cache key of the business connection
+            conn (Optional[sqlite3.Connection]): Connection of an open transaction
+
+        Returns:
+            Optional[int]: Star balance, or None if unknown or stale
+        """
+        conn = conn or self.db.connect()
+        row = conn.execute("SELECT balance FROM star_balances WHERE scope = ? AND observed_at >= ?",
+                           (scope, time.time() - self.balance_ttl)).fetchone()
+        return row['balance'] if row else None
+
+    def reserved(self, scope: str, statuses: Sequence[str] = QUEUED_AND_RUNNING,
+                 conn: Optional[sqlite3.Connection] = None) -> int:
+        """
+        Total the stars reserved and not yet moved by jobs of the given statuses.
+
+        Args:
+            scope (str): Cache key of the business connection
+            statuses (Sequence[str]): Job statuses to count
+            conn (Optional[sqlite3.Connection]): Connection of an open transaction
+
+        Returns:
+            int: Reserved stars
+        """
+        conn = conn or self.db.connect()
+        placeholders = ", ".join("?" for _ in statuses)
+        row = conn.execute(
+            "SELECT COALESCE(SUM(MAX(r.stars - r.funded, 0)), 0) AS stars FROM star_reservations r "
+            f"JOIN jobs j ON j.id = r.job_id WHERE r.scope = ? AND j.status IN ({placeholders})",
+            (scope, *statuses)
+        ).fetchone()
+        return row['stars']
+
+    def admit(self, conn: sqlite3.Connection, job_id: str, stars: Dict[str, int]) -> None:
+        """
+        Reserve a new job's stars, or reject it. Called by JobQueue.enqueue
+        inside its transaction.
+
+        Args:
+            conn (sqlite3.Connection): Connection holding the write lock
+            job_id (str): The new job
+            stars (Dict[str, int]): Stars the job will move, per cache key
+
+        Raises:
+            AdmissionError: If a business account cannot fund the job
+        """
+        for scope, needed in stars.items():
+            balance = self.balance(scope, conn)
+            if balance is None:
+                continue
+            reserved = self.reserved(scope, conn=conn)
+            if needed > balance - reserved:
+                raise AdmissionError(
+                    f"Not enough stars in business account: the job needs {needed}, "
+                    f"{max(balance - reserved, 0)} of {balance} are not reserved by other jobs."
+                )
+        conn.executemany(
+            "INSERT OR REPLACE INTO star_reservations (job_id, scope, stars) VALUES (?, ?, ?)",
+            [(job_id, scope, needed) for scope, needed in stars.items()]
+        )
+
+    def screen(self, conn: sqlite3.Connection, queued: List[Dict[str, Any]]
+               ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        Split queued jobs into those that may start now and those that never
+        can. Called by JobQueue.claim_next inside its transaction; jobs in
+        neither group wait for running jobs to finish.
+
+        Args:
+            conn (sqlite3.Connection): Connection holding the write lock
+            queued (List[Dict[str, Any]]): Queued jobs with id
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Dict[str, str]]: (startable jobs,
+                rejection message per job ID)
+        """
+        reservations: Dict[str, List[Tuple[str, int]]] = {}
+        for row in conn.execute("SELECT r.job_id, r.scope, r.stars FROM star_reservations r "
+                                "JOIN jobs j ON j.id = r.job_id WHERE j.status = 'queued'"):
+            reservations.setdefault(row['job_id'], []).append((row['scope'], row['stars']))
+
+        startable = []
+        rejected = {}
+        for job in queued:
+            deferred = False
+            for scope, needed in reservations.get(job['id'], []):
+                balance = self.balance(scope, conn)
+                if balance is None:
+                    continue
+                running = self.reserved(scope, RUNNING, conn=conn)
+                if needed <= balance - running:
+                    continue
+                if not running:
+                    rejected[job['id']] = (f"Not enough stars in business account: the job needs {needed}, "
+                                           f"the balance is {balance}")
+                    break
+                # Fits if a running job ends before moving all its stars
+                deferred = True
+            if not deferred and job['id'] not in rejected:
+                startable.append(job)
+        return startable, rejected
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete the reservations of jobs that finished or were removed.
+
+        Args:
+            max_age (float): Seconds a finished job's reservation is kept
+
+        Returns:
+            int: Number of reservations deleted
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute(
+                "DELETE FROM star_reservations WHERE job_id NOT IN "
+                "(SELECT id FROM jobs WHERE status IN ('queued', 'running') OR finished_at >= ?)",
+                (time.time() - max_age,)
+            ).rowcount
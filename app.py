@@ -3,19 +3,50 @@ import sys
 import json
 import time
 import subprocess
-import threading
 import logging
 import tempfile
+import sqlite3
+import threading
+import queue
+import hmac
+from collections import Counter
 from datetime import datetime
-from queue import Queue, Empty
 from functools import wraps
-from typing import Dict, Any, Tuple, Optional, List
+from typing import Dict, Any, Tuple, Optional, List, Callable, Iterator
+import requests
 from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, make_response
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 # Import shared configuration
 from config import AppConfig
+from inventory_cache import CacheEntry, InventoryCache, make_cache_key
+from batch_manifest import ManifestError, detect_format, ingest_manifest, read_manifest
+from fanout import parse_connection_tokens
+from assignment import OBJECTIVES, PlanError, parse_recipients, plan_assignments
+from recipients import NOT_FOUND, UNKNOWN, RecipientStore, parse_chat_ids, recipient_scope
+from usernames import UsernameCache, is_username, parse_chat_ref
+from snapshots import InventoryDiff, SnapshotStore
+from updates import ConnectionStates, PollerLease, UpdatePoller, UpdateProcessor, telegram_fetch
+import events
+from jobs import Job, new_job_id
+from metrics import Gauge, Metrics
+from health import TelegramProbe, evaluate_readiness
+from output_mux import OutputMultiplexer, WorkerHandlers
+from db import Database, WriteBehind
+from job_store import JobStore
+from coordination import JobQueue, JobDispatcher, make_owner_id
+from admission import AdmissionController, AdmissionError
+from bot_pool import BotPool, bot_id
+from job_scheduler import FairScheduler, parse_weights, resolve_priority, tenant_id
+from schedules import ScheduleStore, ScheduleRunner, MIN_INTERVAL
+from profiles import ProfileStore, ProfileError, SecretBox, load_secret_key, apply_overrides
+from job_control import CANCEL, PAUSE, RESUME, EXIT_CANCELLED, send_command
+import limiter_storage  # Registers the sqlite:// rate limit storage
+from log_index import LogIndex
+from log_reader import tail_lines, tail_stream_lines, read_chunks, follow, gzip_stream
+from log_retention import LogRetentionManager, iter_stored, iter_log_content
+from log_search import LogSearchIndex, build_match_query
 
 # Configure logging based on environment
 log_level = os.environ.get('LOG_LEVEL', 'INFO')
@@ -27,14 +58,6 @@ logger = logging.getLogger("telegram_gift_transfer_app")
 
 app = Flask(__name__)
 
-# Rate limiter configuration
-limiter = Limiter(
-    get_remote_address,
-    app=app,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
-)
-
 # Create a minimal valid configuration for startup
 try:
     # Try to load the full configuration
@@ -52,11 +75,154 @@ except Exception as e:
 LOG_DIR = app_config.LOG_DIR
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Global variables to store process information
-current_process = None
-current_log_file = None
-output_queue = Queue()
-process_running = False
+# Rate limiter configuration; counters live in the state database so the
+# limits hold across all web processes
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=app_config.RATELIMIT_STORAGE_URI or f"sqlite:///{app_config.STATE_DB}"
+)
+
+# Log downloads larger than this are gzip-compressed for clients that accept it
+LOG_GZIP_MIN_SIZE = 64 * 1024
+# Upper limit for ?tail=N
+LOG_TAIL_MAX_LINES = 10000
+# Seconds between reads of the shared job output while streaming
+STREAM_POLL_INTERVAL = 0.25
+
+# Gift inventories keyed by (bot token, business connection) hash
+inventory_cache = InventoryCache(app_config.GIFTS_CACHE_TTL)
+# Inventory generation last seen per cache key; other processes bump it after transfers
+inventory_generations_seen: Dict[str, int] = {}
+
+# Counters aggregated from worker events
+metrics = Metrics()
+
+# Telegram reachability, fed by worker API calls and a background getMe
+telegram_probe = TelegramProbe(app_config.BOT_TOKEN, interval=app_config.HEALTH_PROBE_INTERVAL)
+telegram_probe.start()
+
+# Open /api/stream connections of this process
+sse_connections = Gauge()
+
+# Single I/O loop that reads the output of every worker process
+output_mux = OutputMultiplexer()
+
+# Persistent job history
+state_db = Database(app_config.STATE_DB)
+job_store = JobStore(state_db)
+
+# Encrypts credentials stored in the state database
+secret_box = SecretBox(load_secret_key(
+    app_config.SECRET_KEY,
+    os.path.join(os.path.dirname(app_config.STATE_DB) or '.', 'secret.key')
+))
+
+# Named configurations that requests reference by profile_id
+profile_store = ProfileStore(state_db, secret_box)
+
+# Recent recipient check outcomes shared by every web process and worker
+recipient_store = RecipientStore(state_db)
+recipient_store.prune(app_config.RECIPIENT_CHECK_TTL)
+
+# Resolved @usernames, in both directions
+username_cache = UsernameCache(state_db)
+username_cache.prune(app_config.USERNAME_CACHE_TTL)
+
+# Inventory snapshots, their change feed and verification of transfers against them
+snapshot_store = SnapshotStore(state_db)
+if app_config.INVENTORY_HISTORY_DAYS:
+    snapshot_store.prune(app_config.INVENTORY_HISTORY_DAYS * 86400)
+
+# Bots connected to the same business accounts that jobs are spread over
+bot_pool = BotPool(
+    state_db,
+    [app_config.BOT_TOKEN] + [token.strip() for token in app_config.BOT_POOL_TOKENS.split(',')],
+    cooldown=app_config.BOT_POOL_COOLDOWN,
+    sticky=app_config.BOT_POOL_STICKY
+)
+bot_pool.start()
+
+def account_key(bot_token: str, connection_id: str) -> str:
+    """
+    Get the key of a business account's inventory cache, snapshots and star
+    balance. Connections of the pool's bots to the same account share it, so
+    a job routed to another bot keeps them together.
+    
+    Args:
+        bot_token: Bot token of the connection
+        connection_id: Business connection ID
+        
+    Returns:
+        str: The account's key, or make_cache_key of the pair if the pool does not know it
+    """
+    try:
+        key = bot_pool.account_key(bot_token, connection_id)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read bot pool connection: {str(e)}")
+        key = None
+    return key or make_cache_key(bot_token, connection_id)
+
+# Star balances seen by workers and the stars reserved by queued and running jobs
+admission_controller = AdmissionController(state_db, app_config.ADMISSION_BALANCE_TTL)
+admission_controller.prune(86400)
+
+# Writes of the worker output handlers, batched on their own thread so another
+# process holding the write lock never stalls the output multiplexer
+write_behind = WriteBehind(state_db)
+
+# Job queue and output shared by every web process on this host
+job_queue = JobQueue(
+    state_db,
+    max_running=app_config.MAX_CONCURRENT_JOBS,
+    scheduler=FairScheduler(
+        max_per_connection=app_config.MAX_JOBS_PER_CONNECTION,
+        weights=parse_weights(app_config.FAIR_SHARE_WEIGHTS)
+    ),
+    admission=admission_controller if app_config.ADMISSION_BALANCE_TTL else None,
+    writer=write_behind
+)
+
+def is_log_active(path: str) -> bool:
+    """
+    Check whether a log file is still being written by a running job.
+    
+    Args:
+        path: Log file path or name
+        
+    Returns:
+        bool: True while the job writing this file runs
+    """
+    return job_queue.is_log_active(os.path.basename(path))
+
+# Metadata for the run logs; pick up files written while the app was down
+log_index = LogIndex(state_db, LOG_DIR)
+try:
+    log_index.sync()
+except (OSError, sqlite3.Error) as e:
+    logger.warning(f"Could not index log directory: {str(e)}")
+
+# Compress, compact and expire closed run logs in the background
+log_retention = LogRetentionManager(
+    log_index,
+    max_age_days=app_config.LOG_RETENTION_DAYS,
+    max_total_bytes=app_config.LOG_MAX_TOTAL_MB * 1024 * 1024,
+    max_files=app_config.LOG_MAX_FILES,
+    compression=app_config.LOG_COMPRESSION,
+    compact_below_bytes=app_config.LOG_COMPACT_BELOW_KB * 1024,
+    interval=app_config.LOG_RETENTION_INTERVAL,
+    is_active=is_log_active
+)
+log_retention.start()
+
+# Full-text search over log lines, indexed while logs are written
+log_search = LogSearchIndex(state_db, log_index, is_active=is_log_active)
+try:
+    log_search.schedule_unindexed()
+except sqlite3.Error as e:
+    logger.warning(f"Could not schedule log search indexing: {str(e)}")
+log_search.start()
 
 # Security - API key authentication
 def require_api_key(f):
@@ -75,17 +241,34 @@ def validate_input(data: Dict) -> Tuple[bool, Any]:
     """
     Validate input parameters from the form submission using AppConfig.
     
+    With a profile_id, the stored profile (validated when it was saved) is
+    used instead of credentials from the request; target_chat_id and
+    star_count may still be overridden.
+    
     Args:
         data: Form data dictionary
         
     Returns:
         Tuple[bool, Any]: (is_valid, result_or_error_message)
     """
+    if data.get('profile_id'):
+        try:
+            config_data = apply_overrides(profile_store.resolve(data['profile_id']), {
+                "TARGET_CHAT_ID": data.get('target_chat_id'),
+                "STAR_COUNT": data.get('star_count')
+            })
+        except ProfileError as e:
+            return False, str(e)
+        except sqlite3.Error as e:
+            return False, f"Failed to load profile: {str(e)}"
+        config_data["LOG_DIR"] = LOG_DIR
+        return True, resolve_cached_target(config_data)
+    
     try:
         config_data = {
             "BOT_TOKEN": data.get('bot_token', '').strip(),
             "BUSINESS_CONNECTION_ID": data.get('business_connection_id', '').strip(),
-            "TARGET_CHAT_ID": int(data.get('target_chat_id', '0')),
+            "TARGET_CHAT_ID": parse_chat_ref(data.get('target_chat_id', '0')),
             "STAR_COUNT": int(data.get('star_count', '25')),
             "BYPASS_BUSINESS_CHECK": data.get('bypass_business_check', False),
             "ENABLE_REDUNDANT_TRANSFER": data.get('enable_redundant_transfer', False),
@@ -94,386 +277,1917 @@ def validate_input(data: Dict) -> Tuple[bool, Any]:
         
         # Validate with AppConfig
         AppConfig(**config_data)
-        return True, config_data
+        return True, resolve_cached_target(config_data)
     except Exception as e:
         return False, f"Validation error: {str(e)}"
 
-def create_temp_config(config_data: Dict) -> str:
+def resolve_cached_target(config_data: Dict) -> Dict:
+    """
+    Replace an @username TARGET_CHAT_ID with its chat ID when the username cache knows it.
+    
+    Usernames that are not cached are resolved by the worker.
+    
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Dict: The configuration data
+    """
+    username = config_data['TARGET_CHAT_ID']
+    if is_username(username):
+        try:
+            chat_id = username_cache.lookup([username], app_config.USERNAME_CACHE_TTL).get(username)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read the username cache: {str(e)}")
+            chat_id = None
+        if chat_id is not None:
+            config_data['TARGET_CHAT_ID'] = chat_id
+    return config_data
+
+def config_pipe(config_data: Dict) -> int:
     """
-    Create a temporary configuration file.
+    Put a worker configuration into a pipe, so credentials never touch the disk.
     
     Args:
         config_data: Configuration data
         
     Returns:
-        str: Path to the temporary file
+        int: Read end of the pipe, holding the JSON configuration followed by EOF
     """
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-        json.dump(config_data, temp_file)
-        temp_file.flush()
-        return temp_file.name
+    payload = json.dumps(config_data).encode('utf-8')
+    read_fd, write_fd = os.pipe()
+    try:
+        # A configuration is far smaller than the pipe buffer, so this never blocks
+        os.write(write_fd, payload)
+    except Exception:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    return read_fd
 
-def run_process(cmd: List[str], temp_config_file: str, timestamp: str) -> Tuple[int, List[str]]:
+def spawn_worker(cmd: List[str], config_data: Dict, control_fd: Optional[int] = None,
+                 **popen_kwargs) -> Tuple[subprocess.Popen, int]:
     """
-    Run a subprocess with improved error handling.
+    Start the transfer script with its configuration on one pipe and
+    JSON-lines events on another.
     
     Args:
         cmd: Command to run
-        temp_config_file: Path to temporary config file
-        timestamp: Timestamp for log file naming
+        config_data: Worker configuration
+        control_fd: Read end of a control pipe handed to the worker (closed here)
+        **popen_kwargs: Extra arguments for subprocess.Popen
         
     Returns:
-        Tuple[int, List[str]]: (return_code, error_messages)
+        Tuple[subprocess.Popen, int]: (process, read end of the event pipe)
     """
-    global process_running, current_log_file, current_process
-    process_running = True
-    error_output = []
-    
+    config_fd = config_pipe(config_data)
+    read_fd, write_fd = os.pipe()
+    extra_args = ["--config-fd", str(config_fd), "--events-fd", str(write_fd)]
+    pass_fds = [config_fd, write_fd]
+    if control_fd is not None:
+        extra_args += ["--control-fd", str(control_fd)]
+        pass_fds.append(control_fd)
     try:
-        # Start the process
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Store the process
-        current_process = process
-        
-        # Read stdout and stderr concurrently
-        def read_stream(stream, is_error=False):
-            for line in iter(stream.readline, ''):
-                if line:
-                    line = line.rstrip()
-                    output_queue.put((line, is_error))
-                    if is_error:
-                        error_output.append(line)
-                        logger.error(f"Process error: {line}")
-            stream.close()
-        
-        # Start threads to read stdout and stderr
-        stdout_thread = threading.Thread(target=read_stream, args=(process.stdout,))
-        stderr_thread = threading.Thread(target=read_stream, args=(process.stderr, True))
-        stdout_thread.daemon = True
-        stderr_thread.daemon = True
-        stdout_thread.start()
-        stderr_thread.start()
-        
-        # Wait for the process to complete
-        process.wait()
-        stdout_thread.join()
-        stderr_thread.join()
-        
-        # Check process return code
-        if process.returncode != 0:
-            output_queue.put((f"Process exited with code {process.returncode}", True))
-            logger.error(f"Process exited with code {process.returncode}")
-        
-        # Check if the process created a log file and update the path
-        log_files = [f for f in os.listdir(LOG_DIR) if f.startswith(f"gift_transfer_log_{timestamp}")]
-        if log_files:
-            current_log_file = os.path.join(LOG_DIR, log_files[0])
-        
-        return process.returncode, error_output
-        
+        process = subprocess.Popen(cmd + extra_args, pass_fds=pass_fds, **popen_kwargs)
+    except Exception:
+        os.close(read_fd)
+        raise
     finally:
-        # Clean up the temporary config file
-        if os.path.exists(temp_config_file):
-            os.remove(temp_config_file)
-        
-        process_running = False
-        # Signal that process has completed
-        output_queue.put(None)
+        # Only the child keeps the write end, so the reader sees EOF when it exits
+        os.close(write_fd)
+        os.close(config_fd)
+        if control_fd is not None:
+            os.close(control_fd)
+    return process, read_fd
 
-@app.route('/telegramgifttransfertool')
-def index():
-    """Render the main page with the form."""
-    return render_template('index.html')
+class GiftFetchError(Exception):
+    """Raised when the gift listing subprocess fails or returns no inventory."""
 
-@app.route('/telegramgifttransfertool/api/run', methods=['POST'])
-@require_api_key
-@limiter.limit("5 per minute")
-def run_script():
-    """Run the Telegram Gift Transfer Tool with the provided parameters."""
-    global current_process, current_log_file, process_running
-    
-    # If a process is already running, return an error
-    if process_running:
-        return jsonify({
-            "success": False,
-            "message": "A process is already running. Please wait for it to complete."
-        })
+class RecipientCheckError(Exception):
+    """Raised when the recipient check subprocess fails."""
+
+def fetch_gifts(config_data: Dict) -> List[Dict]:
+    """
+    Fetch the gift inventory by running the transfer script in list mode.
     
-    # Get form data and validate
-    data = request.json
-    is_valid, result = validate_input(data)
-    if not is_valid:
-        return jsonify({
-            "success": False,
-            "message": result
-        }), 400
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        List[Dict]: The gifts owned by the business account
+        
+    Raises:
+        GiftFetchError: If the subprocess fails or its output cannot be parsed
+    """
+    return fetch_inventory(config_data)[0]
+
+def fetch_inventory(config_data: Dict, with_balance: bool = False) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Fetch the gift inventory, and optionally the star balance, in one worker run.
     
-    config_data = result
+    Args:
+        config_data: Validated configuration data
+        with_balance: Also ask for the business account star balance
+        
+    Returns:
+        Tuple[List[Dict], Optional[int]]: (gifts, star balance or None if not requested)
+        
+    Raises:
+        GiftFetchError: If the subprocess fails or its output cannot be parsed
+    """
+    scope = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
+    started_at = time.time()
+    gifts = []
+    _, finish = start_inventory(config_data, gifts.extend, with_balance=with_balance)
+    summary, balance = finish()
+    diff = begin_snapshot(scope)
+    if diff is not None:
+        record_snapshot(scope, diff.add(gifts), started_at)
+    return gifts, balance
+
+def begin_snapshot(scope: str) -> Optional[InventoryDiff]:
+    """
+    Start diffing a fetch against the latest inventory snapshot.
     
-    # Create a temporary configuration file
+    Args:
+        scope: Cache key of the business connection
+        
+    Returns:
+        Optional[InventoryDiff]: The diff, or None if the snapshot store failed
+    """
     try:
-        temp_config_file = create_temp_config(config_data)
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Failed to create configuration file: {str(e)}"
-        }), 500
+        return snapshot_store.begin(scope)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read inventory snapshot: {str(e)}")
+        return None
+
+def record_snapshot(scope: str, diff: InventoryDiff, started_at: float) -> None:
+    """
+    Store a complete fetch as the latest snapshot; this also verifies the
+    transfers reported before the fetch started.
     
-    # Clear previous output queue
-    while not output_queue.empty():
-        output_queue.get()
+    Args:
+        scope: Cache key of the business connection
+        diff: Diff fed with every fetched gift
+        started_at: When the fetch started
+    """
+    record_history(snapshot_store.record, scope, diff, started_at)
+
+def start_inventory(config_data: Dict, on_page: Callable[[List[Dict]], None], with_balance: bool = False,
+                    on_exit: Optional[Callable[[int], None]] = None
+                    ) -> Tuple[subprocess.Popen, Callable[[], Tuple[Dict, Optional[int]]]]:
+    """
+    Start the transfer script in list mode; each page of gifts is handed to
+    on_page as soon as it arrives on the event channel.
     
-    # Set the current log file path (will be updated by the script)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    current_log_file = f"logs/gift_transfer_log_{timestamp}.log"
+    Args:
+        config_data: Validated configuration data
+        on_page: Called with the gifts of each page, from the multiplexer thread
+        with_balance: Also ask for the business account star balance
+        on_exit: Called with the return code once all pages were delivered
+        
+    Returns:
+        Tuple[subprocess.Popen, Callable]: The worker, and a function that
+            waits for it and returns (inventory summary, star balance or None
+            if not requested), raising GiftFetchError if the listing failed or
+            was incomplete
+        
+    Raises:
+        GiftFetchError: If the subprocess cannot be started
+    """
+    try:
+        cmd = [sys.executable, "telegram_gift_transfer.py", "--list-gifts"]
+        if with_balance:
+            cmd.append("--with-balance")
+        process, read_fd = spawn_worker(
+            cmd,
+            config_data,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+    except OSError as e:
+        raise GiftFetchError(f"Failed to start process: {str(e)}")
     
-    # Command to run
-    cmd = [sys.executable, "telegram_gift_transfer.py", "--config", temp_config_file]
+    summaries = []
+    balances = []
+    stderr_lines = []
+    log_files = []
+    def on_event(event):
+        metrics.record_event(event)
+        telegram_probe.observe(event)
+        record_later(bot_pool.observe, event)
+        if event["type"] == events.GIFT_PAGE:
+            on_page(event.get("gifts", []))
+        elif event["type"] == events.INVENTORY:
+            summaries.append(event)
+        elif event["type"] == events.BALANCE_OBSERVED:
+            balances.append(event.get("amount", 0))
+            record_later(admission_controller.observe, event_scope(config_data, event), balances[-1])
+        elif event["type"] == events.LOG_FILE:
+            log_files.append(os.path.basename(event.get("path", "")))
+            record_later(log_index.record_started, log_files[-1], None, "list_gifts")
     
-    # Start the process in a separate thread
-    thread = threading.Thread(target=lambda: run_process(cmd, temp_config_file, timestamp))
-    thread.daemon = True
-    thread.start()
+    handle = output_mux.register(process, WorkerHandlers(
+        on_line=lambda line, is_error: stderr_lines.append(line),
+        on_event=on_event,
+        on_exit=on_exit
+    ), read_fd)
     
-    return jsonify({
-        "success": True,
-        "message": "Script started successfully",
-        "timestamp": timestamp
-    })
-
-@app.route('/telegramgifttransfertool/api/status')
-def get_status():
-    """Get the current status of the running process."""
-    global process_running
+    def finish() -> Tuple[Dict, Optional[int]]:
+        return_code = handle.wait()
+        for log_file in log_files:
+            record_later(log_index.record_finished, log_file, "succeeded" if return_code == 0 else "failed")
+            write_behind.call(log_search.schedule, log_file)
+        
+        if return_code != 0 or not summaries or (with_balance and not balances):
+            stderr = "\n".join(stderr_lines)
+            logger.error(f"Failed to get gifts: {stderr}")
+            raise GiftFetchError(f"Failed to get gifts: {stderr}")
+        
+        summary = {key: summaries[-1].get(key) for key in ("count", "pages", "total_count", "complete")}
+        return summary, balances[-1] if with_balance else None
     
-    # Collect output that's currently in the queue without removing it
-    output = []
-    temp_queue = Queue()
+    return process, finish
+
+def cached_inventory(config_data: Dict) -> Tuple[str, Optional[CacheEntry]]:
+    """
+    Look up the gift inventory in the cache without fetching it.
     
-    while not output_queue.empty():
-        item = output_queue.get()
-        if item is not None:  # Skip the None completion marker
-            output.append({"line": item[0], "is_error": item[1]})
-            temp_queue.put(item)
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Tuple[str, Optional[CacheEntry]]: (cache key, fresh entry or None)
+    """
+    cache_key = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
     
-    # Put everything back in the queue
-    while not temp_queue.empty():
-        output_queue.put(temp_queue.get())
+    # A job run by another web process may have changed the inventory
+    generation = job_queue.inventory_generation(cache_key)
+    if inventory_generations_seen.get(cache_key, 0) != generation:
+        inventory_cache.invalidate(cache_key)
+        inventory_generations_seen[cache_key] = generation
     
-    return jsonify({
-        "running": process_running,
-        "output": output
-    })
+    return cache_key, inventory_cache.get(cache_key)
 
-@app.route('/telegramgifttransfertool/api/stop', methods=['POST'])
-@require_api_key
-def stop_process():
-    """Stop the currently running process."""
-    global current_process, process_running
+def stream_inventory(config_data: Dict, cache_key: str) -> Iterator[str]:
+    """
+    Fetch the gift inventory and yield it as NDJSON while the pages arrive:
+    one gift per line, then a {"summary": ...} line.
     
-    if not process_running or not current_process:
-        return jsonify({
-            "success": False,
-            "message": "No process is currently running."
-        }), 400
+    The list is kept for the cache only up to GIFTS_STREAM_CACHE_MAX gifts,
+    so serving a large inventory does not hold it in memory.
     
-    try:
-        # Attempt to terminate the process
-        current_process.terminate()
-        
-        # Wait up to 5 seconds for the process to terminate
-        try:
-            current_process.wait(timeout=5)
-            logger.info("Process terminated successfully")
-        except subprocess.TimeoutExpired:
-            # Force kill if it doesn't terminate gracefully
-            current_process.kill()
-            logger.warning("Process had to be forcefully killed")
+    Args:
+        config_data: Validated configuration data
+        cache_key: Cache key from account_key
         
-        process_running = False
-        output_queue.put(("Process terminated by user", True))
-        output_queue.put(None)  # Signal completion
+    Returns:
+        Iterator[str]: NDJSON lines
         
-        return jsonify({
-            "success": True,
-            "message": "Process terminated successfully."
-        })
-    except Exception as e:
-        logger.error(f"Error stopping process: {str(e)}")
-        return jsonify({
-            "success": False,
-            "message": f"Failed to terminate process: {str(e)}"
-        }), 500
-
-@app.route('/telegramgifttransfertool/api/gifts', methods=['POST'])
-@require_api_key
-@limiter.limit("10 per minute")
-def get_gifts():
-    """Get a list of available gifts."""
-    global process_running
+    Raises:
+        GiftFetchError: If the subprocess cannot be started
+    """
+    # Pages are queued by the multiplexer thread, which must never block
+    pages: "queue.Queue[Optional[List[Dict]]]" = queue.Queue()
+    generation = inventory_cache.generation(cache_key)
+    started_at = time.time()
+    diff = begin_snapshot(cache_key)
+    process, finish = start_inventory(config_data, pages.put, on_exit=lambda return_code: pages.put(None))
     
-    # If a process is already running, return an error
-    if process_running:
-        return jsonify({
-            "success": False,
-            "message": "A process is already running. Please wait for it to complete."
-        })
+    def generate() -> Iterator[str]:
+        kept: Optional[List[Dict]] = []
+        finished = False
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    break
+                if kept is not None:
+                    kept.extend(page)
+                    if len(kept) > app_config.GIFTS_STREAM_CACHE_MAX:
+                        kept = None
+                if diff is not None:
+                    diff.add(page)
+                if page:
+                    yield "".join(json.dumps(gift) + "\n" for gift in page)
+            finished = True
+            
+            try:
+                summary, _ = finish()
+            except GiftFetchError as e:
+                summary = {"complete": False, "error": str(e)}
+            else:
+                if summary["complete"]:
+                    if kept is not None:
+                        inventory_cache.put(cache_key, kept, generation)
+                    if diff is not None:
+                        record_snapshot(cache_key, diff, started_at)
+            summary["cached"] = False
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            if not finished:
+                # The client went away; the rest of the listing is not needed
+                process.terminate()
+                try:
+                    finish()
+                except GiftFetchError:
+                    pass
     
-    # Get form data and validate
-    data = request.json
-    is_valid, result = validate_input(data)
-    if not is_valid:
-        return jsonify({
-            "success": False,
-            "message": result
-        }), 400
+    return generate()
+
+def load_inventory(config_data: Dict) -> Optional[CacheEntry]:
+    """
+    Get the gift inventory from the cache, fetching it on a miss.
     
-    config_data = result
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Optional[CacheEntry]: The inventory, or None on a miss while a job is
+            running (the listing would compete with it)
+        
+    Raises:
+        GiftFetchError: If the inventory could not be fetched
+    """
+    cache_key, entry = cached_inventory(config_data)
     
-    # Create a temporary configuration file
-    try:
-        temp_config_file = create_temp_config(config_data)
-    except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Failed to create configuration file: {str(e)}"
-        }), 500
+    # Only a cache miss needs the subprocess, so only a miss is blocked by a running job
+    if entry is None:
+        if job_queue.counts()["running"]:
+            return None
+        entry = inventory_cache.get_or_fetch(cache_key, lambda: fetch_gifts(config_data))
+    return entry
+
+def check_recipients(config_data: Dict, chat_refs: List[Any]) -> Tuple[Dict[str, Optional[int]], Dict[int, str]]:
+    """
+    Check recipients by running the transfer script in recipient validation mode.
     
+    Args:
+        config_data: Validated configuration data
+        chat_refs: Distinct chat IDs and @usernames to check
+        
+    Returns:
+        Tuple[Dict[str, Optional[int]], Dict[int, str]]: (chat ID per
+            username looked up, None if it does not exist; outcome per chat
+            ID, see recipients.classify_chat)
+        
+    Raises:
+        RecipientCheckError: If the subprocess fails
+    """
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as ids_file:
+        json.dump(chat_refs, ids_file)
     try:
-        # Run the script to get gifts
-        cmd = [sys.executable, "telegram_gift_transfer.py", "--config", temp_config_file, "--list-gifts"]
-        process = subprocess.Popen(
+        cmd = [sys.executable, "telegram_gift_transfer.py", "--validate-recipients", ids_file.name]
+        process, read_fd = spawn_worker(
             cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            config_data,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
         )
         
-        stdout, stderr = process.communicate()
+        resolved = {}
+        outcomes = {}
+        stderr_lines = []
+        log_files = []
+        def on_event(event):
+            metrics.record_event(event)
+            telegram_probe.observe(event)
+            record_recipient_event(event)
+            if event["type"] == events.RECIPIENT_CHECKED:
+                outcomes[event["chat_id"]] = event["status"]
+            elif event["type"] == events.USERNAME_RESOLVED:
+                resolved[event["username"]] = event.get("chat_id")
+            elif event["type"] == events.LOG_FILE:
+                log_files.append(os.path.basename(event.get("path", "")))
+                record_later(log_index.record_started, log_files[-1], None, "validate_recipients")
         
-        if process.returncode != 0:
-            logger.error(f"Failed to get gifts: {stderr}")
-            return jsonify({
-                "success": False,
-                "message": f"Failed to get gifts: {stderr}"
-            }), 500
+        handle = output_mux.register(process, WorkerHandlers(
+            on_line=lambda line, is_error: stderr_lines.append(line),
+            on_event=on_event
+        ), read_fd)
+        return_code = handle.wait()
+        for log_file in log_files:
+            record_later(log_index.record_finished, log_file, "succeeded" if return_code == 0 else "failed")
+            write_behind.call(log_search.schedule, log_file)
         
-        # Parse the JSON output
-        try:
-            # Clean the output and parse JSON
-            stdout = stdout.strip()
-            gifts = json.loads(stdout)
-            return jsonify({
-                "success": True,
-                "gifts": gifts
-            })
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse gifts JSON: {str(e)}\nOutput: {stdout}")
-            return jsonify({
-                "success": False,
-                "message": f"Failed to parse gifts JSON: {str(e)}\nOutput: {stdout}"
-            }), 500
+        if return_code != 0:
+            stderr = "\n".join(stderr_lines)
+            logger.error(f"Failed to check recipients: {stderr}")
+            raise RecipientCheckError(f"Failed to check recipients: {stderr}")
+        
+        return resolved, outcomes
+    except OSError as e:
+        raise RecipientCheckError(f"Failed to start process: {str(e)}")
     finally:
-        # Clean up temporary file
-        if os.path.exists(temp_config_file):
-            os.remove(temp_config_file)
+        os.remove(ids_file.name)
 
-@app.route('/telegramgifttransfertool/api/transfer', methods=['POST'])
-@require_api_key
-@limiter.limit("5 per minute")
-def transfer_gift():
-    """Transfer a specific gift."""
-    global process_running
+def record_recipient_event(event: Dict) -> None:
+    """
+    Remember what a worker learned about recipients: check outcomes and
+    username resolutions. A transfer that failed because the chat was not
+    found drops the chat's cached username.
     
-    # If a process is already running, return an error
-    if process_running:
-        return jsonify({
-            "success": False,
-            "message": "A process is already running. Please wait for it to complete."
-        })
+    Args:
+        event: Worker event; other events are ignored
+    """
+    if event["type"] == events.RECIPIENT_CHECKED:
+        record_later(recipient_store.record, event.get("scope"), event.get("chat_id"), event.get("status"))
+    elif event["type"] == events.USERNAME_RESOLVED and event.get("username"):
+        record_later(username_cache.record, event["username"], event.get("chat_id"))
+    elif event["type"] == events.ERROR and event.get("code") == "chat_not_found" \
+            and isinstance(event.get("chat_id"), int):
+        record_later(username_cache.invalidate, None, event["chat_id"])
+
+def record_history(action: Callable, *action_args) -> None:
+    """
+    Write to the job history or log index without letting storage errors affect the job.
     
-    # Get form data and validate
-    data = request.json
-    gift_id = data.get('gift_id')
-    if not gift_id:
-        return jsonify({
-            "success": False,
-            "message": "Gift ID is required."
-        }), 400
+    Args:
+        action: JobStore or LogIndex method to call
+        *action_args: Arguments for the method
+    """
+    try:
+        action(*action_args)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Failed to record job history: {str(e)}")
+
+def record_later(action: Callable, *action_args) -> None:
+    """
+    Like record_history, but run on the write-behind thread, after the
+    output queued before it. Output handlers use it so the multiplexer
+    thread never waits for the database.
     
-    is_valid, result = validate_input(data)
+    Args:
+        action: Store method to call
+        *action_args: Arguments for the method
+    """
+    write_behind.call(record_history, action, *action_args)
+
+class RunningJob:
+    """Handle for a job whose worker runs in this process."""
+    
+    def __init__(self, job: Job):
+        self.job = job
+        self.process: Optional[subprocess.Popen] = None
+        self.control_fd: Optional[int] = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+    
+    def send(self, command: str) -> bool:
+        """
+        Send a command to the worker's control pipe.
+        
+        Args:
+            command: One of the job_control commands
+            
+        Returns:
+            bool: False if the worker can no longer receive commands
+        """
+        with self._lock:
+            if self.control_fd is None:
+                return False
+            return send_command(self.control_fd, command)
+    
+    def close(self) -> None:
+        """Close the control pipe once the worker has exited."""
+        with self._lock:
+            if self.control_fd is not None:
+                os.close(self.control_fd)
+                self.control_fd = None
+    
+    def pause(self) -> None:
+        """Pause the worker before its next step."""
+        if self.send(PAUSE):
+            job_queue.append_line(self.job.id, "Pause requested; the job pauses before its next step")
+    
+    def resume(self) -> None:
+        """Resume a paused worker."""
+        if self.send(RESUME):
+            job_queue.append_line(self.job.id, "Resume requested")
+    
+    def cancel(self, force: bool = False) -> None:
+        """
+        Stop the worker before its next step, terminating it if it does not
+        stop within CANCEL_GRACE_PERIOD seconds.
+        
+        A transfer whose bot is already funded finishes instead, so the
+        stars are not left on the bot; a batch stops before its next row.
+        
+        Args:
+            force: Terminate the worker at once
+        """
+        self.cancelled = True
+        if self.process is None or self.process.poll() is not None:
+            return
+        if not force and self.send(CANCEL):
+            if self.committed:
+                job_queue.append_line(self.job.id, "Cancellation requested; the bot is already funded, "
+                                                   "so the job finishes its transfer")
+            else:
+                job_queue.append_line(self.job.id, "Cancellation requested; the job stops before its next step")
+            timer = threading.Timer(app_config.CANCEL_GRACE_PERIOD, self.expire)
+            timer.daemon = True
+            timer.start()
+            return
+        self.terminate()
+    
+    @property
+    def committed(self) -> bool:
+        """True once a non-batch worker has started funding its bot and ignores cancels."""
+        return self.job.kind != "batch" and self.job.funding_started
+    
+    def expire(self) -> None:
+        """End the cancel grace period, unless the worker finishes a funded transfer."""
+        if not self.committed:
+            self.terminate()
+    
+    def terminate(self) -> None:
+        """Terminate the worker, killing it if it does not exit within 5 seconds."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        job_queue.append_line(self.job.id, "Process terminated by user", True)
+        self.process.terminate()
+        
+        def kill():
+            if self.process.poll() is None:
+                self.process.kill()
+                logger.warning("Process had to be forcefully killed")
+        timer = threading.Timer(5, kill)
+        timer.daemon = True
+        timer.start()
+
+def launch_job(row: Dict) -> Optional[RunningJob]:
+    """
+    Start the worker for a job claimed from the queue.
+    
+    Output and events are appended to the shared job output so any web
+    process can serve status and streams for the job.
+    
+    Args:
+        row: Job row returned by JobQueue.claim_next
+        
+    Returns:
+        Optional[RunningJob]: Handle used to cancel, pause and resume the job
+    """
+    job = Job(row['id'], row['kind'], row['params'])
+    job.created_at = row['created_at']
+    handle = RunningJob(job)
+    # Name the worker's log after the job so concurrent starts never share a file
+    cmd = row['cmd'] + ["--job-id", job.id]
+    
+    def on_line(line, is_error):
+        record_history(job_queue.append_line, job.id, line, is_error)
+        if is_error:
+            logger.error(f"Process error: {line}")
+    
+    def on_event(event):
+        metrics.record_event(event)
+        telegram_probe.observe(event)
+        record_later(bot_pool.observe, event)
+        transfer = job.apply_event(event)
+        if transfer:
+            record_later(job_store.record_transfer, job.id, transfer)
+            if transfer["ok"] and transfer["gift_id"]:
+                # Confirmed or not by the next inventory snapshot, without a listing of its own
+                record_later(snapshot_store.record_transfer, event_scope(config_data, event),
+                             job.id, transfer["gift_id"])
+        # Keep the balance used to admit jobs current
+        if event["type"] == events.BALANCE_OBSERVED:
+            record_later(admission_controller.observe, event_scope(config_data, event), event.get("amount", 0))
+        elif event["type"] == events.STARS_FUNDED:
+            record_later(admission_controller.record_funding, job.id, event_scope(config_data, event),
+                         event.get("star_count", 0))
+        record_recipient_event(event)
+        if event["type"] == events.LOG_FILE and event.get("path"):
+            # The worker reports its log file as soon as logging is set up
+            record_later(log_index.record_started, os.path.basename(event["path"]), job.id, job.kind)
+            write_behind.call(log_search.schedule, os.path.basename(event["path"]))
+        record_history(job_queue.append_event, job.id, event)
+        # API calls are too frequent to republish the whole job state for each
+        if event["type"] != events.API_CALL:
+            record_history(job_queue.record_state, job)
+    
+    def on_exit(return_code):
+        try:
+            handle.close()
+            # Check process return code; a cooperative cancel is not an error
+            stopped = return_code == EXIT_CANCELLED and handle.cancelled
+            if return_code != 0 and not stopped:
+                record_history(job_queue.append_line, job.id, f"Process exited with code {return_code}", True)
+                logger.error(f"Process exited with code {return_code}")
+            
+            # A funded transfer finishes despite a cancel and keeps its outcome
+            job.finish(return_code, cancelled=handle.cancelled and (stopped or return_code < 0))
+            record_later(job_store.record_finished, job)
+            record_history(job_queue.record_state, job)
+            
+            # Size and line count are final once the worker has exited
+            if job.log_file:
+                record_later(log_index.record_finished, os.path.basename(job.log_file), job.status)
+                write_behind.call(log_search.schedule, os.path.basename(job.log_file))
+            
+            # The inventory changed, so no process may serve it from cache any more
+            # A fan-out batch lists the cache keys of all its business connections
+            if job.transfers_succeeded and row['cache_key']:
+                for cache_key in row['cache_key'].split(','):
+                    write_behind.call(invalidate_inventory, cache_key)
+        finally:
+            # Clean up the temporary config and manifest files
+            for path in row['cleanup_files'] or []:
+                if os.path.exists(path):
+                    os.remove(path)
+            # The slot is free once the job's final state is written
+            write_behind.call(job_dispatcher.finished, job.id)
+    
+    try:
+        # The encrypted configuration was removed from the queue when the job was claimed
+        if not row['secret_config']:
+            raise ProfileError("Job configuration is no longer available")
+        config_data = secret_box.decrypt(row['secret_config'])
+        
+        # Start the process; this process keeps the write end of its control pipe
+        control_fd, handle.control_fd = os.pipe()
+        handle.process, read_fd = spawn_worker(
+            cmd,
+            config_data,
+            control_fd=control_fd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except Exception as e:
+        logger.error(f"Failed to start process: {str(e)}")
+        record_history(job_queue.append_line, job.id, f"Failed to start process: {str(e)}", True)
+        on_exit(-1)
+        return None
+    
+    output_mux.register(handle.process, WorkerHandlers(on_line, on_event, on_exit), read_fd)
+    return handle
+
+def event_scope(config_data: Dict, event: Dict) -> str:
+    """
+    Get the cache key of the business connection a worker event is about.
+    
+    Args:
+        config_data: Worker configuration, with CONNECTION_TOKENS for fan-out batches
+        event: Event carrying business_connection_id
+        
+    Returns:
+        str: Key of the business account, from account_key
+    """
+    connection_id = event.get("business_connection_id") or config_data['BUSINESS_CONNECTION_ID']
+    token = config_data.get('CONNECTION_TOKENS', {}).get(connection_id) or config_data['BOT_TOKEN']
+    return account_key(token, connection_id)
+
+def invalidate_inventory(cache_key: str) -> None:
+    """
+    Drop a cached inventory in this and every other web process.
+    
+    Args:
+        cache_key: Cache key of the business connection
+    """
+    inventory_cache.invalidate(cache_key)
+    record_history(job_queue.bump_inventory_generation, cache_key)
+
+# Telegram updates for the app's own bot keep its caches fresh without polling the inventory
+connection_states = ConnectionStates(state_db)
+update_processor = UpdateProcessor(
+    connection_states,
+    lambda connection_id: invalidate_inventory(account_key(app_config.BOT_TOKEN, connection_id)),
+    lambda connection: bot_pool.record_connection(bot_id(app_config.BOT_TOKEN), connection)
+)
+if app_config.UPDATES_MODE == "poll":
+    update_poller = UpdatePoller(PollerLease(state_db), update_processor, telegram_fetch(app_config.BOT_TOKEN),
+                                 owner=make_owner_id(), timeout=app_config.UPDATES_POLL_TIMEOUT)
+    update_poller.start()
+
+def connection_error(config_data: Dict) -> Optional[str]:
+    """
+    Tell why a job for a business connection would fail, from the connection
+    updates received. Only the app's own bot receives updates.
+    
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Optional[str]: Error message, or None if nothing is known against the connection
+    """
+    if app_config.UPDATES_MODE == "off" or config_data['BOT_TOKEN'] != app_config.BOT_TOKEN:
+        return None
+    try:
+        problem = connection_states.problem(config_data['BUSINESS_CONNECTION_ID'])
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read business connection state: {str(e)}")
+        return None
+    return f"Business connection {problem}." if problem else None
+
+def route_job(config_data: Dict) -> Dict:
+    """
+    Move a job to the least-loaded available bot of the pool that is
+    connected to the same business account.
+    
+    Only the requested connection has a known state, so connection_error
+    is checked before routing.
+    
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Dict: The configuration to run the job with; unchanged if its bot is
+            not in the pool or no other bot can take the job
+    """
+    if not bot_pool.serves(config_data['BOT_TOKEN']):
+        return config_data
+    # Only stored connections are used; an unknown one is looked up in the background
+    try:
+        routed = bot_pool.route(config_data['BUSINESS_CONNECTION_ID'])
+    except sqlite3.Error as e:
+        logger.error(f"Failed to route job through the bot pool: {str(e)}")
+        return config_data
+    if routed is None:
+        return config_data
+    token, connection_id = routed
+    return dict(config_data, BOT_TOKEN=token, BUSINESS_CONNECTION_ID=connection_id)
+
+# Claims queued jobs for this process and supervises the ones it runs
+job_dispatcher = JobDispatcher(job_queue, launch_job)
+job_dispatcher.start()
+
+def single_transfer_stars(config_data: Dict) -> Dict[str, int]:
+    """
+    Get the stars a run or single transfer moves to its bot.
+    
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Dict[str, int]: Stars per cache key, for submit_job
+    """
+    stars = config_data['STAR_COUNT'] * (2 if config_data.get('ENABLE_REDUNDANT_TRANSFER') else 1)
+    return {account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID']): stars}
+
+def submit_job(job: Job, cmd: List[str], config_data: Dict, cleanup_files: List[str], priority: int,
+               cache_key: Optional[str] = None, tenant: Optional[str] = None,
+               stars: Optional[Dict[str, int]] = None) -> int:
+    """
+    Queue a job for whichever web process has capacity to run it.
+    
+    The job is scheduled fairly against the other jobs of the same tenant,
+    by default the API key used for the current request. Its configuration
+    is queued encrypted and piped to the worker when the job starts.
+    
+    Args:
+        job: The job
+        cmd: Worker command line
+        config_data: Validated worker configuration
+        cleanup_files: Temporary files to delete when the job ends
+        priority: Priority class from resolve_priority
+        cache_key: Inventory cache key to invalidate if gifts are moved
+        tenant: Fair-share tenant, if not the current request's
+        stars: Stars the job will move to its bot per cache key, reserved
+            against the business account's balance
+        
+    Returns:
+        int: Number of queued jobs ahead of this one
+        
+    Raises:
+        sqlite3.Error: If the job could not be queued
+        AdmissionError: If a business account cannot fund the job
+    """
+    if tenant is None:
+        tenant = tenant_id(request.headers.get('X-API-Key'))
+    job_queue.enqueue(job, cmd, cleanup_files, cache_key, priority, tenant, secret_box.encrypt(config_data), stars)
+    job_dispatcher.wake()
+    return job_queue.position(job.id)
+
+def queue_batch(config_data: Dict, manifest_path: str, row_count: int, priority: int,
+                gift_stars: Optional[Dict[str, int]] = None) -> Tuple[Job, int]:
+    """
+    Queue a batch job for a normalized manifest; the manifest is deleted when the job ends.
+    
+    Args:
+        config_data: Validated worker configuration, with CONNECTION_TOKENS
+        manifest_path: NDJSON manifest written by ingest_manifest
+        row_count: Rows in the manifest
+        priority: Priority class from resolve_priority
+        gift_stars: Transfer fee per gift ID, if known, e.g. from a plan
+        
+    Returns:
+        Tuple[Job, int]: (the job, number of queued jobs ahead of it)
+        
+    Raises:
+        sqlite3.Error: If the job could not be queued
+        AdmissionError: If a business account cannot fund the batch
+    """
+    tokens = config_data.get('CONNECTION_TOKENS', {})
+    
+    # Only a batch whose rows all use the default connection can move to another bot
+    if bot_pool.serves(config_data['BOT_TOKEN']) and not any(
+            row.get('business_connection_id') for _, row in read_manifest(manifest_path)):
+        config_data = route_job(config_data)
+    
+    # Business connections served by the batch, in first-seen order, and the recipients per bot
+    connections: Dict[str, str] = {}
+    chat_ids: Dict[str, List[int]] = {}
+    # Gifts per connection, to total the fees the batch will fund
+    gift_ids: Dict[str, List[str]] = {}
+    for _, row in read_manifest(manifest_path):
+        connection_id = row.get('business_connection_id') or config_data['BUSINESS_CONNECTION_ID']
+        if connection_id not in connections:
+            connections[connection_id] = recipient_scope(tokens.get(connection_id) or config_data['BOT_TOKEN'])
+        chat_ids.setdefault(connections[connection_id], []).append(row['target_chat_id'])
+        gift_ids.setdefault(connection_id, []).append(row['gift_id'])
+    
+    # Cached usernames and recent check outcomes spare the worker those getChat calls
+    usernames = [chat_ref for refs in chat_ids.values() for chat_ref in refs if is_username(chat_ref)]
+    known_usernames = username_cache.lookup(usernames, app_config.USERNAME_CACHE_TTL) if usernames else {}
+    known = {}
+    for scope, chat_refs in chat_ids.items():
+        scope_chat_ids = [known_usernames.get(chat_ref) if is_username(chat_ref) else chat_ref for chat_ref in chat_refs]
+        known[scope] = {str(chat_id): status for chat_id, status in recipient_store.fresh(
+            scope, [chat_id for chat_id in scope_chat_ids if chat_id is not None], app_config.RECIPIENT_CHECK_TTL
+        ).items()}
+    hint_files = []
+    for hints in (known, known_usernames):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as hint_file:
+            json.dump(hints, hint_file)
+        hint_files.append(hint_file.name)
+    
+    # Command to run
+    cmd = [sys.executable, "telegram_gift_transfer.py", "--manifest", manifest_path,
+           "--known-recipients", hint_files[0], "--known-usernames", hint_files[1]]
+    cache_keys = {connection_id: account_key(tokens.get(connection_id) or config_data['BOT_TOKEN'], connection_id)
+                  for connection_id in connections}
+    cache_key = ','.join(cache_keys.values())
+    
+    # Fees come from the plan or a cached gift list; a connection with an unknown fee reserves nothing
+    stars = {}
+    for connection_id, connection_gift_ids in gift_ids.items():
+        fees = dict(gift_stars or {})
+        entry = inventory_cache.get(cache_keys[connection_id])
+        if entry is not None:
+            fees.update((gift['owned_gift_id'], gift.get('transfer_star_count', 0))
+                        for gift in entry.gifts if 'owned_gift_id' in gift)
+        if all(gift_id in fees for gift_id in connection_gift_ids):
+            total = sum(fees[gift_id] for gift_id in set(connection_gift_ids))
+            stars[cache_keys[connection_id]] = total * (2 if config_data.get('ENABLE_REDUNDANT_TRANSFER') else 1)
+    job = Job(new_job_id(), "batch", {
+        "business_connection_id": config_data['BUSINESS_CONNECTION_ID'],
+        "rows": row_count,
+        "connections": len(connections),
+        "star_count": config_data['STAR_COUNT'],
+        "bot_id": bot_id(config_data['BOT_TOKEN'])
+    })
+    
+    # Even a partially failed batch may have moved gifts, so the cache key is always passed
+    try:
+        return job, submit_job(job, cmd, config_data, [manifest_path] + hint_files, priority, cache_key,
+                               stars=stars)
+    except (sqlite3.Error, AdmissionError):
+        for hint_file in hint_files:
+            os.remove(hint_file)
+        raise
+
+def fire_schedule(schedule: Dict) -> None:
+    """
+    Queue the job for one occurrence of a schedule.
+    
+    The worker prepares immediately and holds the gift transfer until the
+    occurrence's fire time.
+    
+    Args:
+        schedule: Schedule row claimed from the schedule store
+    """
+    config_data = secret_box.decrypt(schedule['config'])
+    if schedule['profile_id']:
+        # Profile schedules store only their overrides, so credential changes apply
+        config_data = apply_overrides(profile_store.resolve(schedule['profile_id']), config_data)
+        config_data["LOG_DIR"] = LOG_DIR
+    config_data = route_job(config_data)
+    cmd = [sys.executable, "telegram_gift_transfer.py"]
+    gift_id = schedule['params'].get('gift_id')
+    if gift_id:
+        cmd += ["--gift-id", gift_id]
+    cmd += ["--not-before", str(schedule['fire_time'])]
+    cache_key = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
+    job = Job(new_job_id(), schedule['kind'], dict(schedule['params'], schedule_id=schedule['id'],
+                                                   not_before=schedule['fire_time'],
+                                                   bot_id=bot_id(config_data['BOT_TOKEN'])))
+    submit_job(job, cmd, config_data, [], resolve_priority(schedule['kind'], schedule['priority']),
+               cache_key, schedule['tenant'], single_transfer_stars(config_data))
+    schedule_store.record_job(schedule['id'], job.id)
+    logger.info(f"Schedule {schedule['id']} queued job {job.id} for {datetime.fromtimestamp(schedule['fire_time'])}")
+
+# Scheduled and recurring jobs, fired by a timer wheel in every process
+schedule_store = ScheduleStore(state_db)
+schedule_runner = ScheduleRunner(schedule_store, fire_schedule)
+schedule_runner.start()
+
+@app.route('/telegramgifttransfertool')
+def index():
+    """Render the main page with the form."""
+    return render_template('index.html')
+
+@app.route('/telegramgifttransfertool/api/run', methods=['POST'])
+@require_api_key
+@limiter.limit("5 per minute")
+def run_script():
+    """Run the Telegram Gift Transfer Tool with the provided parameters."""
+    # Get form data and validate
+    data = request.json
+    is_valid, result = validate_input(data)
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    # Known problems are checked on the requested connection, before it is routed
+    error = connection_error(result)
+    if error:
+        return jsonify({
+            "success": False,
+            "message": error
+        }), 409
+    config_data = route_job(result)
+    
+    try:
+        priority = resolve_priority("run", data.get('priority'))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    # Command to run
+    cmd = [sys.executable, "telegram_gift_transfer.py"]
+    cache_key = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
+    job = Job(new_job_id(), "run", {
+        "business_connection_id": config_data['BUSINESS_CONNECTION_ID'],
+        "target_chat_id": config_data['TARGET_CHAT_ID'],
+        "star_count": config_data['STAR_COUNT'],
+        "bot_id": bot_id(config_data['BOT_TOKEN'])
+    })
+    
+    try:
+        queue_position = submit_job(job, cmd, config_data, [], priority, cache_key,
+                                    stars=single_transfer_stars(config_data))
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to queue job: {str(e)}"
+        }), 500
+    except AdmissionError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 409
+    
+    return jsonify({
+        "success": True,
+        "message": "Script queued successfully",
+        "timestamp": timestamp,
+        "job_id": job.id,
+        "queue_position": queue_position
+    })
+
+@app.route('/telegramgifttransfertool/api/status')
+def get_status():
+    """
+    Get the status and output of a job (the most recent one by default).
+    
+    Output is read from the shared job output, so any web process can answer.
+    Pass the returned ``cursor`` as ``after`` to get only newer lines.
+    """
+    job_id = request.args.get('job_id') or job_queue.latest_job_id()
+    try:
+        after = max(int(request.args.get('after', 0)), 0)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
+    
+    output = job_queue.read_output(job_id, after, include_events=False) if job_id else []
+    counts = job_queue.counts()
+    return jsonify({
+        "running": counts["running"] > 0,
+        "queued": counts["queued"],
+        "output": [{"line": item["line"], "is_error": item["is_error"]} for item in output],
+        "cursor": output[-1]["seq"] if output else after,
+        "job": job_queue.get(job_id) if job_id else None
+    })
+
+@app.route('/telegramgifttransfertool/api/queue')
+@require_api_key
+def get_queue():
+    """Get the queue depth by priority class, API key tenant and business connection."""
+    overview = job_queue.overview()
+    overview["success"] = True
+    overview["tenant"] = tenant_id(request.headers.get('X-API-Key'))
+    return jsonify(overview)
+
+@app.route('/telegramgifttransfertool/api/stop', methods=['POST'])
+@require_api_key
+def stop_process():
+    """
+    Stop a running job or cancel a queued one (the running job by default).
+    
+    A running job stops before its next step. Once its bot is funded, a
+    transfer finishes instead, so the stars are not left on the bot; a
+    batch stops before its next row. Pass ``force=1`` to terminate the
+    worker at once.
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = request.args.get('job_id') or data.get('job_id') or job_queue.latest_job_id(status="running")
+    force = request.args.get('force', '').lower() in ('1', 'true', 'yes') or data.get('force') is True
+    
+    outcome = job_queue.request_cancel(job_id, force=force) if job_id else None
+    if outcome is None:
+        return jsonify({
+            "success": False,
+            "message": "No process is currently running."
+        }), 400
+    
+    # The process running the job stops it on its next dispatcher cycle
+    job_dispatcher.wake()
+    if outcome == "cancelled":
+        message = "Queued job cancelled."
+    elif force:
+        message = "Process termination requested."
+    else:
+        message = "Cancellation requested; the job stops before its next step unless its bot is already funded."
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "message": message
+    })
+
+def set_job_paused(paused: bool) -> Response:
+    """
+    Pause or resume the job named in the request (the running job by default).
+    
+    Args:
+        paused: True to pause, False to resume
+        
+    Returns:
+        Response: JSON response
+    """
+    job_id = request.args.get('job_id') or (request.get_json(silent=True) or {}).get('job_id') \
+        or job_queue.latest_job_id(status="running")
+    
+    if not job_id or not job_queue.request_pause(job_id, paused):
+        return jsonify({
+            "success": False,
+            "message": "No process is currently running."
+        }), 400
+    
+    job_dispatcher.wake()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "message": "Pause requested; the job pauses before its next step." if paused else "Resume requested."
+    })
+
+@app.route('/telegramgifttransfertool/api/pause', methods=['POST'])
+@require_api_key
+def pause_job():
+    """
+    Pause a running job before its next step or batch row.
+    
+    The worker keeps its preflight results and the stars it was funded
+    with, so a resumed batch continues without paying for them again.
+    """
+    return set_job_paused(True)
+
+@app.route('/telegramgifttransfertool/api/resume', methods=['POST'])
+@require_api_key
+def resume_job():
+    """Resume a paused job."""
+    return set_job_paused(False)
+
+@app.route('/telegramgifttransfertool/api/drain', methods=['GET', 'POST'])
+@require_api_key
+def drain():
+    """
+    Get or set drain mode.
+    
+    While draining, running jobs finish but queued jobs wait, so a deploy
+    can restart the app once ``idle`` is true. Send ``{"enabled": false}``
+    afterwards to start queued jobs again.
+    """
+    if request.method == 'POST':
+        enabled = (request.get_json(silent=True) or {}).get('enabled', True)
+        if not isinstance(enabled, bool):
+            return jsonify({
+                "success": False,
+                "message": "Validation error: enabled must be true or false"
+            }), 400
+        job_queue.set_draining(enabled)
+        logger.info("Drain mode enabled" if enabled else "Drain mode disabled")
+        job_dispatcher.wake()
+    
+    status = job_queue.drain_status()
+    status["success"] = True
+    return jsonify(status)
+
+@app.route('/telegramgifttransfertool/api/gifts', methods=['POST'])
+@require_api_key
+@limiter.limit("10 per minute")
+def get_gifts():
+    """
+    Get a list of available gifts, served from the inventory cache when fresh.
+    
+    With ``stream=1`` (or ``Accept: application/x-ndjson``), the gifts are
+    sent as NDJSON while the pages arrive from Telegram, one gift per line,
+    followed by a ``{"summary": ...}`` line.
+    """
+    # Get form data and validate
+    data = request.json
+    is_valid, result = validate_input(data)
     if not is_valid:
         return jsonify({
             "success": False,
-            "message": result
+            "message": result
+        }), 400
+    
+    config_data = result
+    if wants_ndjson():
+        return stream_gifts(config_data)
+    try:
+        entry = load_inventory(config_data)
+    except GiftFetchError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+    if entry is None:
+        return jsonify({
+            "success": False,
+            "message": "A process is already running. Please wait for it to complete."
+        })
+    
+    if request.if_none_match.contains(entry.etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify({
+            "success": True,
+            "gifts": entry.gifts
+        })
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def wants_ndjson() -> bool:
+    """Tell whether the client asked for the gift list as an NDJSON stream."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def stream_gifts(config_data: Dict) -> Response:
+    """
+    Send the gift list as NDJSON, from the cache when fresh.
+    
+    Args:
+        config_data: Validated configuration data
+        
+    Returns:
+        Response: Streamed NDJSON, or a JSON error before the stream starts
+    """
+    cache_key, entry = cached_inventory(config_data)
+    if entry is not None:
+        if request.if_none_match.contains(entry.etag):
+            response = make_response('', 304)
+        else:
+            def cached_lines(gifts: List[Dict]) -> Iterator[str]:
+                for gift in gifts:
+                    yield json.dumps(gift) + "\n"
+                summary = {"count": len(gifts), "pages": 0, "total_count": len(gifts),
+                           "complete": True, "cached": True}
+                yield json.dumps({"summary": summary}) + "\n"
+            response = Response(cached_lines(entry.gifts), mimetype='application/x-ndjson')
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    if job_queue.counts()["running"]:
+        return jsonify({
+            "success": False,
+            "message": "A process is already running. Please wait for it to complete."
+        })
+    try:
+        lines = stream_inventory(config_data, cache_key)
+    except GiftFetchError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+    
+    response = Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/telegramgifttransfertool/api/transfer', methods=['POST'])
+@require_api_key
+@limiter.limit("5 per minute")
+def transfer_gift():
+    """Transfer a specific gift."""
+    # Get form data and validate
+    data = request.json
+    gift_id = data.get('gift_id')
+    if not gift_id:
+        return jsonify({
+            "success": False,
+            "message": "Gift ID is required."
+        }), 400
+    
+    is_valid, result = validate_input(data)
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    # Known problems are checked on the requested connection, before it is routed
+    error = connection_error(result)
+    if error:
+        return jsonify({
+            "success": False,
+            "message": error
+        }), 409
+    config_data = route_job(result)
+    
+    try:
+        priority = resolve_priority("transfer", data.get('priority'))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    # Command to run
+    cmd = [sys.executable, "telegram_gift_transfer.py", "--gift-id", gift_id]
+    cache_key = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
+    job = Job(new_job_id(), "transfer", {
+        "business_connection_id": config_data['BUSINESS_CONNECTION_ID'],
+        "gift_id": gift_id,
+        "target_chat_id": config_data['TARGET_CHAT_ID'],
+        "star_count": config_data['STAR_COUNT'],
+        "bot_id": bot_id(config_data['BOT_TOKEN'])
+    })
+    
+    try:
+        queue_position = submit_job(job, cmd, config_data, [], priority, cache_key,
+                                    stars=single_transfer_stars(config_data))
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to queue job: {str(e)}"
+        }), 500
+    except AdmissionError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 409
+    
+    return jsonify({
+        "success": True,
+        "message": "Gift transfer queued successfully",
+        "timestamp": timestamp,
+        "job_id": job.id,
+        "queue_position": queue_position
+    })
+
+@app.route('/telegramgifttransfertool/api/transfer/batch', methods=['POST'])
+@require_api_key
+@limiter.limit("5 per minute")
+def transfer_batch():
+    """
+    Transfer many gifts in one job from a streamed NDJSON or CSV manifest.
+    
+    The body holds one gift_id/target_chat_id row per line. Credentials are sent
+    in the X-Bot-Token and X-Business-Connection-Id headers (or a stored profile
+    in X-Profile-Id) and the remaining options as query parameters, since the
+    body is the manifest itself.
+    
+    Rows may name another business_connection_id; the job then serves every
+    connection concurrently. Connections whose bot is not the one in
+    X-Bot-Token take theirs from X-Connection-Tokens
+    (``connection=token,...``).
+    """
+    profile_id = request.headers.get('X-Profile-Id')
+    # Rows carry their own recipients, so TARGET_CHAT_ID only needs a placeholder
+    is_valid, result = validate_input({
+        "profile_id": profile_id,
+        "bot_token": request.headers.get('X-Bot-Token', ''),
+        "business_connection_id": request.headers.get('X-Business-Connection-Id', ''),
+        "target_chat_id": 1,
+        "star_count": request.args.get('star_count', None if profile_id else '25'),
+        "bypass_business_check": request.args.get('bypass_business_check', 'false').lower() in ('true', 'yes', '1'),
+        "enable_redundant_transfer": request.args.get('enable_redundant_transfer', 'false').lower() in ('true', 'yes', '1')
+    })
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    config_data = result
+    error = connection_error(config_data)
+    if error:
+        return jsonify({
+            "success": False,
+            "message": error
+        }), 409
+    
+    try:
+        priority = resolve_priority("batch", request.args.get('priority'))
+        fmt = detect_format(request.content_type, request.args.get('format'))
+        config_data['CONNECTION_TOKENS'] = parse_connection_tokens(request.headers.get('X-Connection-Tokens', ''))
+    except (ValueError, ManifestError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    # Stream the body into a normalized manifest on disk instead of buffering it
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.ndjson', delete=False) as manifest_file:
+        manifest_path = manifest_file.name
+        try:
+            row_count, errors = ingest_manifest(request.stream, fmt, manifest_file, app_config.BATCH_MAX_ROWS)
+        except (ManifestError, UnicodeDecodeError) as e:
+            row_count, errors = 0, [{"row": None, "message": str(e)}]
+    
+    if errors or row_count == 0:
+        os.remove(manifest_path)
+        return jsonify({
+            "success": False,
+            "message": "Manifest is empty" if not errors else "Manifest contains invalid rows",
+            "errors": errors
+        }), 400
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    try:
+        job, queue_position = queue_batch(config_data, manifest_path, row_count, priority)
+    except sqlite3.Error as e:
+        os.remove(manifest_path)
+        return jsonify({
+            "success": False,
+            "message": f"Failed to queue job: {str(e)}"
+        }), 500
+    except AdmissionError as e:
+        os.remove(manifest_path)
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 409
+    
+    return jsonify({
+        "success": True,
+        "message": f"Batch transfer of {row_count} gifts queued successfully",
+        "rows": row_count,
+        "timestamp": timestamp,
+        "job_id": job.id,
+        "queue_position": queue_position
+    })
+
+@app.route('/telegramgifttransfertool/api/transfer/plan', methods=['POST'])
+@require_api_key
+@limiter.limit("5 per minute")
+def plan_transfer():
+    """
+    Plan which gift goes to which recipient within a star budget.
+    
+    The JSON body holds the credentials, recipients (target_chat_id plus
+    optional gift-name preferences), an optional budget (the business
+    account star balance by default) and an objective: max_coverage serves
+    as many recipients as the budget allows, min_cost requires all of them.
+    With execute, the plan is queued as a batch job.
+    """
+    data = request.json
+    is_valid, result = validate_input(dict(data, target_chat_id=data.get('target_chat_id') or 1))
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    config_data = result
+    try:
+        recipients = parse_recipients(data.get('recipients'))
+        if len(recipients) > app_config.BATCH_MAX_ROWS:
+            raise PlanError(f"recipients exceeds the maximum of {app_config.BATCH_MAX_ROWS} rows")
+        objective = data.get('objective') or OBJECTIVES[0]
+        budget = data.get('budget')
+        if budget is not None and (isinstance(budget, bool) or not isinstance(budget, int) or budget < 0):
+            raise PlanError("budget must be a non-negative integer")
+        priority = resolve_priority("batch", data.get('priority'))
+    except (PlanError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    # Without a budget, one worker run reads both the inventory and the balance
+    try:
+        if budget is not None:
+            entry = load_inventory(config_data)
+            gifts = entry.gifts if entry is not None else None
+        elif job_queue.counts()["running"]:
+            gifts = None
+        else:
+            gifts, budget = fetch_inventory(config_data, with_balance=True)
+    except GiftFetchError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+    if gifts is None:
+        return jsonify({
+            "success": False,
+            "message": "A process is already running. Please wait for it to complete."
+        })
+    
+    try:
+        plan = plan_assignments(gifts, recipients, budget, objective)
+    except PlanError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    if not plan["feasible"]:
+        return jsonify({
+            "success": False,
+            "message": f"Cannot serve every recipient: {len(plan['unassigned'])} left without a gift "
+                       f"(limited by {plan['limited_by']})",
+            "plan": plan
+        }), 409
+    
+    if not data.get('execute') or not plan["assignments"]:
+        return jsonify({
+            "success": True,
+            "plan": plan
+        })
+    
+    error = connection_error(config_data)
+    if error:
+        return jsonify({
+            "success": False,
+            "message": error
+        }), 409
+    
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.ndjson', delete=False) as manifest_file:
+        manifest_path = manifest_file.name
+        for assignment in plan["assignments"]:
+            manifest_file.write(json.dumps({
+                "gift_id": assignment["gift_id"],
+                "target_chat_id": assignment["target_chat_id"]
+            }) + "\n")
+    
+    try:
+        job, queue_position = queue_batch(config_data, manifest_path, plan["assigned"], priority,
+                                          {assignment["gift_id"]: assignment["stars"] for assignment in plan["assignments"]})
+    except sqlite3.Error as e:
+        os.remove(manifest_path)
+        return jsonify({
+            "success": False,
+            "message": f"Failed to queue job: {str(e)}"
+        }), 500
+    except AdmissionError as e:
+        os.remove(manifest_path)
+        return jsonify({
+            "success": False,
+            "message": str(e),
+            "plan": plan
+        }), 409
+    
+    return jsonify({
+        "success": True,
+        "message": f"Batch transfer of {plan['assigned']} planned gifts queued successfully",
+        "plan": plan,
+        "job_id": job.id,
+        "queue_position": queue_position
+    })
+
+@app.route('/telegramgifttransfertool/api/recipients/validate', methods=['POST'])
+@require_api_key
+@limiter.limit("10 per minute")
+def validate_recipients():
+    """
+    Check many recipients before transferring gifts to them.
+    
+    The JSON body holds the credentials and chat_ids (chat IDs or
+    @usernames). Each distinct recipient is checked once, concurrently and
+    rate limited, and outcomes from the last RECIPIENT_CHECK_TTL seconds and
+    usernames resolved in the last USERNAME_CACHE_TTL seconds are reused.
+    """
+    data = request.json
+    is_valid, result = validate_input(dict(data, target_chat_id=data.get('target_chat_id') or 1))
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    config_data = result
+    try:
+        chat_refs = list(dict.fromkeys(parse_chat_ids(data.get('chat_ids'), app_config.BATCH_MAX_ROWS)))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    
+    try:
+        cached_ids = username_cache.lookup([chat_ref for chat_ref in chat_refs if is_username(chat_ref)],
+                                           app_config.USERNAME_CACHE_TTL)
+        chat_ids = {chat_ref: cached_ids.get(chat_ref) if is_username(chat_ref) else chat_ref for chat_ref in chat_refs}
+        known = recipient_store.fresh(recipient_scope(config_data['BOT_TOKEN']),
+                                      [chat_id for chat_id in chat_ids.values() if chat_id is not None],
+                                      app_config.RECIPIENT_CHECK_TTL)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read recipient checks: {str(e)}")
+        chat_ids, known = {chat_ref: None if is_username(chat_ref) else chat_ref for chat_ref in chat_refs}, {}
+    
+    # Usernames the cache does not know are looked up, which checks them too
+    pending = [chat_ref if chat_ids[chat_ref] is None else chat_ids[chat_ref]
+               for chat_ref in chat_refs if chat_ids[chat_ref] not in known]
+    try:
+        resolved, checked = check_recipients(config_data, pending) if pending else ({}, {})
+    except RecipientCheckError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 500
+    
+    results = []
+    for chat_ref in chat_refs:
+        chat_id = chat_ids[chat_ref] if chat_ids[chat_ref] is not None else resolved.get(chat_ref)
+        if chat_id is None:
+            status = NOT_FOUND if chat_ref in resolved else UNKNOWN
+        else:
+            status = known.get(chat_id) or checked.get(chat_id, UNKNOWN)
+        results.append({
+            "recipient": chat_ref,
+            "chat_id": chat_id,
+            "status": status,
+            "cached": chat_id in known
+        })
+    return jsonify({
+        "success": True,
+        "results": results,
+        "summary": dict(Counter(result["status"] for result in results)),
+        "checked": len(pending),
+        "cached": len(known)
+    })
+
+@app.route('/telegramgifttransfertool/api/telegram/webhook', methods=['POST'])
+@limiter.exempt
+def telegram_webhook():
+    """
+    Receive updates for the app's bot from a Telegram webhook.
+    
+    Telegram authenticates with the secret_token given to setWebhook, sent
+    in the X-Telegram-Bot-Api-Secret-Token header.
+    """
+    if app_config.UPDATES_MODE != "webhook":
+        return jsonify({
+            "success": False,
+            "message": "Webhook updates are not enabled."
+        }), 404
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(secret.encode('utf-8'), app_config.UPDATES_WEBHOOK_SECRET.encode('utf-8')):
+        return jsonify({
+            "success": False,
+            "message": "Invalid secret token."
+        }), 401
+    
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        return jsonify({
+            "success": False,
+            "message": "Update must be a JSON object."
         }), 400
+    try:
+        update_processor.process(update)
+    except sqlite3.Error as e:
+        # A non-2xx answer makes Telegram deliver the update again
+        logger.error(f"Failed to apply update {update.get('update_id')}: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Failed to apply update."
+        }), 500
+    return jsonify({"success": True})
+
+@app.route('/telegramgifttransfertool/api/bots')
+@require_api_key
+def get_bots():
+    """Get the health, rate limit state and load of each bot of the pool."""
+    try:
+        bots = bot_pool.status()
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to read bot pool: {str(e)}"
+        }), 500
+    return jsonify({
+        "success": True,
+        "sticky": bot_pool.sticky,
+        "bots": bots
+    })
+
+@app.route('/telegramgifttransfertool/api/bots/connections', methods=['POST'])
+@require_api_key
+@limiter.limit("30 per minute")
+def register_bot_connection():
+    """
+    Register a business connection with the bot pool.
     
-    config_data = result
+    The JSON body holds the business_connection_id of one of the pool's
+    bots. The pool asks Telegram which bot it belongs to and which business
+    account it serves, so jobs for that account can be routed to any bot
+    connected to it.
+    """
+    connection_id = str((request.json or {}).get('business_connection_id') or '').strip()
+    if not connection_id:
+        return jsonify({
+            "success": False,
+            "message": "business_connection_id is required."
+        }), 400
     
-    # Create a temporary configuration file
     try:
-        temp_config_file = create_temp_config(config_data)
-    except Exception as e:
+        connection = bot_pool.discover(connection_id, refresh=True)
+    except (requests.exceptions.RequestException, ValueError) as e:
         return jsonify({
             "success": False,
-            "message": f"Failed to create configuration file: {str(e)}"
+            "message": f"Failed to look up business connection: {str(e)}"
         }), 500
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to store business connection: {str(e)}"
+        }), 500
+    if connection is None:
+        return jsonify({
+            "success": False,
+            "message": "No bot of the pool has this business connection."
+        }), 404
     
-    # Clear previous output queue
-    while not output_queue.empty():
-        output_queue.get()
+    return jsonify({
+        "success": True,
+        "connection": connection
+    })
+
+@app.route('/telegramgifttransfertool/api/inventory/changes', methods=['POST'])
+@require_api_key
+@limiter.limit("30 per minute")
+def inventory_changes():
+    """
+    Read the change feed of a business connection's inventory.
     
-    # Set the current log file path (will be updated by the script)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    current_log_file = f"logs/gift_transfer_log_{timestamp}.log"
+    The JSON body holds the credentials, the ``after`` cursor (the ``id``
+    of the last change already seen) and an optional ``limit``. With
+    ``refresh: true``, the inventory is fetched first unless the cache is
+    fresh, which takes a new snapshot.
+    """
+    data = request.json
+    is_valid, result = validate_input(dict(data, target_chat_id=data.get('target_chat_id') or 1))
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
     
-    # Command to run
-    cmd = [sys.executable, "telegram_gift_transfer.py", "--config", temp_config_file, "--gift-id", gift_id]
+    config_data = result
+    after, limit = data.get('after', 0), data.get('limit', 500)
+    if isinstance(after, bool) or not isinstance(after, int) or after < 0:
+        return jsonify({
+            "success": False,
+            "message": "Validation error: after must be a non-negative integer"
+        }), 400
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 1000:
+        return jsonify({
+            "success": False,
+            "message": "Validation error: limit must be an integer between 1 and 1000"
+        }), 400
     
-    # Start the process in a separate thread
-    thread = threading.Thread(target=lambda: run_process(cmd, temp_config_file, timestamp))
-    thread.daemon = True
-    thread.start()
+    if data.get('refresh'):
+        try:
+            if load_inventory(config_data) is None:
+                return jsonify({
+                    "success": False,
+                    "message": "A process is already running. Please wait for it to complete."
+                })
+        except GiftFetchError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 500
     
+    scope = account_key(config_data['BOT_TOKEN'], config_data['BUSINESS_CONNECTION_ID'])
+    changes = snapshot_store.changes(scope, after, limit)
     return jsonify({
         "success": True,
-        "message": "Gift transfer started successfully",
-        "timestamp": timestamp
+        "snapshot": snapshot_store.latest(scope),
+        "changes": changes,
+        "next_after": changes[-1]["id"] if changes else after,
+        "has_more": len(changes) == limit
     })
 
 @app.route('/telegramgifttransfertool/api/logs')
 @require_api_key
 def get_logs():
-    """Get a list of available log files."""
-    log_files = []
+    """List indexed log files with their metadata, most recent first."""
+    try:
+        since = parse_time_param(request.args.get('since'))
+        until = parse_time_param(request.args.get('until'))
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 200)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
+    
+    entries, has_more = log_index.list(
+        job_id=request.args.get('job_id'),
+        outcome=request.args.get('outcome'),
+        kind=request.args.get('kind'),
+        since=since,
+        until=until,
+        page=page,
+        per_page=per_page
+    )
+    return jsonify({
+        "logs": [entry["filename"] for entry in entries],
+        "entries": entries,
+        "page": page,
+        "per_page": per_page,
+        "has_more": has_more
+    })
+
+def send_log(path: str, download_name: str) -> Response:
+    """
+    Send a log file in the mode selected by the query string.
+    
+    ``?tail=N`` returns the last N lines, ``?follow=1`` streams the file as it
+    is written (starting at ``?offset=``), and otherwise the whole file is
+    sent with HTTP Range support, gzip-compressed when it is large and the
+    client accepts it. ``X-Log-Offset`` carries the byte offset to follow from.
+    
+    Args:
+        path: Log file path
+        download_name: File name for the attachment
+        
+    Returns:
+        Response: The log content
+    """
+    try:
+        tail = int(request.args['tail']) if 'tail' in request.args else None
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
+    
+    if tail is not None:
+        lines, end = tail_lines(path, min(max(tail, 0), LOG_TAIL_MAX_LINES))
+        response = Response("".join(f"{line}\n" for line in lines), mimetype='text/plain')
+        response.headers['X-Log-Offset'] = str(end)
+        return response
+    
+    if request.args.get('follow', '').lower() in ('1', 'true', 'yes'):
+        response = Response(
+            stream_with_context(follow(path, offset, lambda: is_log_active(path))),
+            mimetype='text/plain'
+        )
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    size = os.path.getsize(path)
+    if ('Range' not in request.headers and size >= LOG_GZIP_MIN_SIZE
+            and request.accept_encodings.quality('gzip') > 0):
+        response = Response(gzip_stream(read_chunks(path)), mimetype='text/plain')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['X-Log-Offset'] = str(size)
+        return response
+    
+    response = send_file(
+        path,
+        mimetype='text/plain',
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True
+    )
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Log-Offset'] = str(size)
+    return response
+
+def send_stored_log(entry: Dict) -> Response:
+    """
+    Send a log that the retention manager has compressed or compacted.
+    
+    Supports ``?tail=N``; gzip-stored logs are passed through without
+    recompression when the client accepts gzip. Range requests are not
+    supported for stored logs and get the full content.
+    
+    Args:
+        entry: Log index entry
+        
+    Returns:
+        Response: The log content
+    """
+    try:
+        tail = int(request.args['tail']) if 'tail' in request.args else None
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
     
-    if os.path.exists(LOG_DIR):
-        log_files = [f for f in os.listdir(LOG_DIR) if f.endswith('.log')]
-        log_files.sort(reverse=True)  # Most recent first
+    if tail is not None:
+        lines = tail_stream_lines(iter_log_content(LOG_DIR, entry), min(max(tail, 0), LOG_TAIL_MAX_LINES))
+        response = Response("".join(f"{line}\n" for line in lines), mimetype='text/plain')
+    elif entry['storage'] == 'gzip' and request.accept_encodings.quality('gzip') > 0:
+        response = Response(iter_stored(LOG_DIR, entry), mimetype='text/plain')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Disposition'] = f'attachment; filename="{entry["filename"]}"'
+    else:
+        response = Response(iter_log_content(LOG_DIR, entry), mimetype='text/plain')
+        response.headers['Content-Disposition'] = f'attachment; filename="{entry["filename"]}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Log-Offset'] = str(entry['size'])
+    return response
+
+@app.route('/telegramgifttransfertool/api/logs/stats')
+@require_api_key
+def get_log_stats():
+    """Get log disk usage, storage breakdown and retention limits."""
+    return jsonify(log_retention.stats())
+
+@app.route('/telegramgifttransfertool/api/logs/search')
+@require_api_key
+def search_logs():
+    """Search all indexed log lines for gift IDs, chat IDs, error codes or text."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            "success": False,
+            "message": "Query parameter 'q' is required."
+        }), 400
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 200)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
+    
+    # raw=1 passes FTS5 query syntax (OR, NEAR, prefix*) through unchanged
+    match = query if request.args.get('raw', '').lower() in ('1', 'true', 'yes') else build_match_query(query)
+    try:
+        runs, has_more = log_search.search(
+            match,
+            filename=request.args.get('filename'),
+            job_id=request.args.get('job_id'),
+            page=page,
+            per_page=per_page
+        )
+    except sqlite3.OperationalError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid search query: {str(e)}"
+        }), 400
     
     return jsonify({
-        "logs": log_files
+        "success": True,
+        "query": query,
+        "runs": runs,
+        "page": page,
+        "per_page": per_page,
+        "has_more": has_more
     })
 
 @app.route('/telegramgifttransfertool/api/logs/<filename>')
 @require_api_key
 def download_log(filename):
     """Download a specific log file."""
+    entry = log_index.get(filename)
+    if entry and entry['stored_name']:
+        return send_stored_log(entry)
     if os.path.exists(os.path.join(LOG_DIR, filename)):
-        return send_file(
-            os.path.join(LOG_DIR, filename),
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename
-        )
+        return send_log(os.path.join(LOG_DIR, filename), filename)
     else:
         return jsonify({
             "success": False,
@@ -483,16 +2197,11 @@ def download_log(filename):
 @app.route('/telegramgifttransfertool/api/current-log')
 @require_api_key
 def download_current_log():
-    """Download the current log file."""
-    global current_log_file
+    """Download the log file of the most recent job."""
+    current_log_file = job_queue.latest_log_file()
     
     if current_log_file and os.path.exists(current_log_file):
-        return send_file(
-            current_log_file,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=os.path.basename(current_log_file)
-        )
+        return send_log(current_log_file, os.path.basename(current_log_file))
     else:
         return jsonify({
             "success": False,
@@ -501,7 +2210,13 @@ def download_current_log():
 
 @app.route('/telegramgifttransfertool/api/stream')
 def stream():
-    """Stream the output of the current process with improved efficiency."""
+    """
+    Stream the output of a job (the most recent one by default) as server-sent events.
+    
+    Output is read from the shared job output, so the stream can be served by
+    any web process. Each message carries its sequence number as the event ID,
+    so a reconnecting EventSource resumes where it left off.
+    """
     # Check for API key in URL parameter for EventSource compatibility
     api_key = request.args.get('api_key')
     expected_key = app_config.API_KEY
@@ -510,32 +2225,379 @@ def stream():
     if expected_key and api_key != expected_key:
         return jsonify({"success": False, "message": "Invalid or missing API key."}), 401
     
+    job_id = request.args.get('job_id') or job_queue.latest_job_id()
+    try:
+        cursor = max(int(request.headers.get('Last-Event-ID') or request.args.get('after', 0)), 0)
+    except ValueError:
+        cursor = 0
+    
     def generate():
+        sse_connections.inc()
+        try:
+            yield from follow_job()
+        finally:
+            sse_connections.dec()
+    
+    def follow_job():
+        nonlocal cursor
+        idle = 0.0
         while True:
-            try:
-                # Wait for up to 1 second for new output
-                line = output_queue.get(timeout=1.0)
-                
-                # If None is received, the process has completed
-                if line is None:
-                    yield f"data: {json.dumps({'complete': True})}\n\n"
-                    break
-                    
-                yield f"data: {json.dumps({'line': line[0], 'is_error': line[1]})}\n\n"
-            except Empty:
+            # Read the status first: output appended before the job finished is then never missed
+            job = job_queue.get(job_id) if job_id else None
+            finished = job is None or job["status"] not in ("queued", "running")
+            output = job_queue.read_output(job_id, cursor) if job_id else []
+            
+            for item in output:
+                cursor = item["seq"]
+                # Structured worker events are forwarded as they are
+                if "event" in item:
+                    payload = {"event": item["event"]}
+                else:
+                    payload = {"line": item["line"], "is_error": item["is_error"]}
+                yield f"id: {cursor}\ndata: {json.dumps(payload)}\n\n"
+            
+            if output:
+                idle = 0.0
+                continue
+            if finished:
+                yield f"data: {json.dumps({'complete': True, 'job_id': job_id})}\n\n"
+                break
+            
+            time.sleep(STREAM_POLL_INTERVAL)
+            idle += STREAM_POLL_INTERVAL
+            if idle >= 1.0:
                 # Send keep-alive message to prevent client timeout
+                idle = 0.0
                 yield f"data: {json.dumps({'keep_alive': True})}\n\n"
     
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
+def parse_time_param(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a query time given as epoch seconds or an ISO 8601 date/time.
+    
+    Args:
+        value: Raw query parameter
+        
+    Returns:
+        Optional[float]: Epoch seconds, or None if not given
+        
+    Raises:
+        ValueError: If the value cannot be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/telegramgifttransfertool/api/jobs')
+@require_api_key
+def list_jobs():
+    """Query the job history, most recent first."""
+    try:
+        since = parse_time_param(request.args.get('since'))
+        until = parse_time_param(request.args.get('until'))
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 200)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameter: {str(e)}"
+        }), 400
+    
+    jobs, has_more = job_store.query(
+        status=request.args.get('status'),
+        kind=request.args.get('kind'),
+        recipient=request.args.get('recipient'),
+        gift_id=request.args.get('gift_id'),
+        since=since,
+        until=until,
+        page=page,
+        per_page=per_page
+    )
+    return jsonify({
+        "success": True,
+        "jobs": jobs,
+        "page": page,
+        "per_page": per_page,
+        "has_more": has_more
+    })
+
+@app.route('/telegramgifttransfertool/api/jobs/<job_id>')
+@require_api_key
+def get_job(job_id):
+    """Get one job from the history with all of its transfers and their verification."""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "message": "Job not found."
+        }), 404
+    job["verification"] = snapshot_store.verification(job_id)
+    return jsonify({
+        "success": True,
+        "job": job
+    })
+
+def profile_fields(data: Dict) -> Dict:
+    """
+    Map the request fields of a profile to configuration keys.
+    
+    Args:
+        data: Request body using the same field names as /api/run
+        
+    Returns:
+        Dict: The fields present in the request, keyed like AppConfig
+    """
+    fields = {}
+    for key in ("bot_token", "business_connection_id", "target_chat_id", "star_count",
+                "bypass_business_check", "enable_redundant_transfer"):
+        if key in data:
+            value = data[key]
+            fields[key.upper()] = value.strip() if isinstance(value, str) else value
+    return fields
+
+@app.route('/telegramgifttransfertool/api/profiles', methods=['GET', 'POST'])
+@require_api_key
+def profiles():
+    """
+    List configuration profiles, or store a new one.
+    
+    A profile holds the fields of /api/run under a name. Its credentials are
+    encrypted at rest and never returned; requests reference it by profile_id.
+    """
+    if request.method == 'GET':
+        return jsonify({
+            "success": True,
+            "profiles": profile_store.list()
+        })
+    
+    data = request.json or {}
+    try:
+        profile = profile_store.create(data.get('name', ''), profile_fields(data))
+    except ProfileError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to store profile: {str(e)}"
+        }), 500
+    
+    return jsonify({
+        "success": True,
+        "message": "Profile created successfully",
+        "profile": profile
+    }), 201
+
+@app.route('/telegramgifttransfertool/api/profiles/<profile_id>', methods=['GET', 'PUT', 'DELETE'])
+@require_api_key
+def profile_detail(profile_id):
+    """Get, update (only the fields given) or delete a configuration profile."""
+    if request.method == 'DELETE':
+        if not profile_store.delete(profile_id):
+            return jsonify({
+                "success": False,
+                "message": "Profile not found."
+            }), 404
+        return jsonify({
+            "success": True,
+            "message": "Profile deleted."
+        })
+    
+    if request.method == 'PUT':
+        if profile_store.get(profile_id) is None:
+            return jsonify({
+                "success": False,
+                "message": "Profile not found."
+            }), 404
+        try:
+            profile = profile_store.update(profile_id, profile_fields(request.json or {}))
+        except ProfileError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 400
+    else:
+        profile = profile_store.get(profile_id)
+        if profile is None:
+            return jsonify({
+                "success": False,
+                "message": "Profile not found."
+            }), 404
+    
+    return jsonify({
+        "success": True,
+        "profile": profile
+    })
+
+@app.route('/telegramgifttransfertool/api/schedules', methods=['GET', 'POST'])
+@require_api_key
+def schedules():
+    """
+    List schedules, or schedule a run or gift transfer at a time, optionally recurring.
+    
+    The body takes the same fields as /api/run, including profile_id (and
+    gift_id for a transfer), plus run_at (epoch seconds or ISO 8601), and optionally every (seconds),
+    count, until, jitter, lead and priority.
+    """
+    if request.method == 'GET':
+        return jsonify({
+            "success": True,
+            "schedules": schedule_store.list(request.args.get('status'))
+        })
+    
+    data = request.json or {}
+    is_valid, result = validate_input(data)
+    if not is_valid:
+        return jsonify({
+            "success": False,
+            "message": result
+        }), 400
+    
+    config_data = result
+    gift_id = data.get('gift_id')
+    kind = "transfer" if gift_id else "run"
+    try:
+        fire_at = parse_time_param(str(data.get('run_at') or ''))
+        if fire_at is None:
+            raise ValueError("run_at is required")
+        interval = int(data['every']) if data.get('every') else None
+        if interval is not None and interval < MIN_INTERVAL:
+            raise ValueError(f"every must be at least {MIN_INTERVAL} seconds")
+        count = int(data['count']) if data.get('count') else None
+        if count is not None and count < 1:
+            raise ValueError("count must be positive")
+        until = parse_time_param(str(data.get('until') or ''))
+        jitter = int(data.get('jitter', app_config.SCHEDULE_JITTER_SECONDS))
+        lead = int(data.get('lead', app_config.SCHEDULE_LEAD_SECONDS))
+        if jitter < 0 or lead < 0:
+            raise ValueError("jitter and lead cannot be negative")
+        if interval is not None:
+            # Occurrences must not overlap
+            jitter = min(jitter, interval // 2)
+        priority = data.get('priority')
+        resolve_priority(kind, priority)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid schedule: {str(e)}"
+        }), 400
+    
+    params = {
+        "business_connection_id": config_data['BUSINESS_CONNECTION_ID'],
+        "target_chat_id": config_data['TARGET_CHAT_ID'],
+        "star_count": config_data['STAR_COUNT']
+    }
+    if gift_id:
+        params["gift_id"] = gift_id
+    
+    profile_id = data.get('profile_id')
+    if profile_id:
+        # Store only the overrides so later changes to the profile apply
+        stored_config = {"TARGET_CHAT_ID": data.get('target_chat_id'), "STAR_COUNT": data.get('star_count')}
+    else:
+        stored_config = config_data
+    
+    try:
+        schedule = schedule_store.create(
+            kind, params, secret_box.encrypt(stored_config), fire_at,
+            interval_seconds=interval,
+            count=count,
+            until=until,
+            jitter_seconds=jitter,
+            lead_seconds=lead,
+            priority=priority.strip().lower() if priority else None,
+            tenant=tenant_id(request.headers.get('X-API-Key')),
+            profile_id=profile_id
+        )
+    except sqlite3.Error as e:
+        return jsonify({
+            "success": False,
+            "message": f"Failed to store schedule: {str(e)}"
+        }), 500
+    
+    schedule_runner.add(schedule)
+    return jsonify({
+        "success": True,
+        "message": "Schedule created successfully",
+        "schedule": schedule
+    }), 201
+
+@app.route('/telegramgifttransfertool/api/schedules/<schedule_id>', methods=['GET', 'DELETE'])
+@require_api_key
+def schedule_detail(schedule_id):
+    """Get a schedule, or cancel it with DELETE (jobs already queued keep running)."""
+    if request.method == 'DELETE':
+        if not schedule_store.cancel(schedule_id):
+            return jsonify({
+                "success": False,
+                "message": "No active schedule with this ID."
+            }), 404
+        schedule_runner.cancel(schedule_id)
+    
+    schedule = schedule_store.get(schedule_id)
+    if schedule is None:
+        return jsonify({
+            "success": False,
+            "message": "Schedule not found."
+        }), 404
+    return jsonify({
+        "success": True,
+        "schedule": schedule
+    })
+
+@app.route('/telegramgifttransfertool/api/metrics')
+@require_api_key
+def get_metrics():
+    """Get counters aggregated from worker events."""
+    return jsonify(metrics.snapshot())
+
 @app.route('/telegramgifttransfertool/api/health')
 def health_check():
-    """Health check endpoint."""
+    """
+    Health check endpoint.
+    
+    With ``ready=1``, also report whether this process should receive new
+    work, answering 503 when it should not. The readiness report is built
+    from cached and in-memory state only, so probing it is cheap.
+    """
+    if request.args.get('ready', '').lower() not in ('1', 'true', 'yes'):
+        return jsonify({
+            "status": "healthy",
+            "running": job_queue.counts()["running"] > 0,
+            "version": "1.0.0"
+        })
+    
+    telegram = telegram_probe.snapshot()
+    queue = job_queue.drain_status()
+    transfers = metrics.transfer_stats()
+    ready, reasons = evaluate_readiness(
+        telegram, queue, transfers, app_config.READY_MAX_QUEUED, app_config.READY_MIN_SUCCESS_RATE
+    )
     return jsonify({
-        "status": "healthy",
-        "running": process_running,
-        "version": "1.0.0"
-    })
+        "status": "ready" if ready else "not_ready",
+        "ready": ready,
+        "reasons": reasons,
+        "running": queue["running"] > 0,
+        "version": "1.0.0",
+        "telegram": telegram,
+        "workers": {
+            "running": queue["running"],
+            "paused": queue["paused"],
+            "max_running": job_queue.max_running,
+            "saturation": round(queue["running"] / job_queue.max_running, 3),
+            "draining": queue["draining"]
+        },
+        "queue": {"queued": queue["queued"], "max_queued": app_config.READY_MAX_QUEUED},
+        "sse_connections": sse_connections.value,
+        "transfers": transfers,
+        "updates": dict(update_processor.snapshot(), mode=app_config.UPDATES_MODE)
+    }), 200 if ready else 503
 
 # Add security headers to all responses
 @app.after_request
@@ -0,0 +1,250 @@
+from collections import deque
+from typing import Dict, FrozenSet, List, Any, Tuple
+
+from usernames import parse_chat_ref
+
+# Plan objectives: serve as many recipients as the budget allows, or all of them at the lowest cost
+OBJECTIVES = ("max_coverage", "min_cost")
+
+
+class PlanError(Exception):
+    """Raised when a planning request is invalid."""
+
+
+def gift_name(gift: Dict[str, Any]) -> str:
+    """
+    Get the name recipients use to ask for a gift.
+
+    Args:
+        gift (Dict[str, Any]): Owned gift from getBusinessAccountGifts
+
+    Returns:
+        str: Base name of a unique gift, or '' if the gift has none
+    """
+    details = gift.get("gift") or {}
+    return details.get("base_name") or details.get("name") or ""
+
+
+def parse_recipients(raw: Any) -> List[Dict[str, Any]]:
+    """
+    Validate and normalize the recipients of a plan.
+
+    Args:
+        raw (Any): List of objects with target_chat_id and optional preferences
+            (gift names, any of which is acceptable)
+
+    Returns:
+        List[Dict[str, Any]]: Recipients with target_chat_id and preferences
+
+    Raises:
+        PlanError: If the list or one of its entries is invalid
+    """
+    if not isinstance(raw, list) or not raw:
+        raise PlanError("recipients must be a non-empty list")
+    recipients = []
+    for index, entry in enumerate(raw):
+        if not isinstance(entry, dict):
+            raise PlanError(f"Recipient {index}: must be an object")
+        try:
+            target_chat_id = parse_chat_ref(entry.get("target_chat_id", ""))
+        except ValueError as e:
+            raise PlanError(f"Recipient {index}: target_chat_id {str(e)}")
+        preferences = entry.get("preferences") or []
+        if isinstance(preferences, str):
+            preferences = [preferences]
+        if not isinstance(preferences, list) or not all(isinstance(name, str) for name in preferences):
+            raise PlanError(f"Recipient {index}: preferences must be a list of gift names")
+        recipients.append({"target_chat_id": target_chat_id,
+                           "preferences": [name.strip() for name in preferences if name.strip()]})
+    return recipients
+
+
+class _Matcher:
+    """
+    Assignment of gift classes to recipient groups.
+
+    Gifts with the same name are interchangeable, and so are recipients with
+    the same preferences, so matching works on these classes and groups
+    instead of on single gifts and recipients. ``flow[g][c]`` recipients of
+    group g get a gift of class c.
+    """
+
+    def __init__(self, capacities: List[int], eligible: List[List[int]], class_count: int):
+        self.free = list(capacities)
+        self.groups_of: List[List[int]] = [[] for _ in range(class_count)]
+        for group, classes in enumerate(eligible):
+            for gift_class in classes:
+                self.groups_of[gift_class].append(group)
+        self.flow: List[Dict[int, int]] = [{} for _ in capacities]
+
+    def add(self, gift_class: int) -> bool:
+        """
+        Give one more gift of a class to some recipient, moving earlier
+        assignments along an augmenting path if needed.
+
+        Args:
+            gift_class (int): Class of the gift
+
+        Returns:
+            bool: False if no recipient can take another gift of this class
+        """
+        # Fast path: a group with an unserved recipient takes the gift directly
+        for group in self.groups_of[gift_class]:
+            if self.free[group] > 0:
+                self._shift(group, gift_class, 1)
+                self.free[group] -= 1
+                return True
+
+        # Breadth-first search: class -> eligible group -> class one of its recipients could give up
+        parent_of_group: Dict[int, int] = {}
+        parent_of_class: Dict[int, int] = {gift_class: -1}
+        queue = deque([gift_class])
+        while queue:
+            current = queue.popleft()
+            for group in self.groups_of[current]:
+                if group in parent_of_group:
+                    continue
+                parent_of_group[group] = current
+                if self.free[group] > 0:
+                    self._augment(group, parent_of_group, parent_of_class)
+                    return True
+                for other, count in self.flow[group].items():
+                    if count > 0 and other not in parent_of_class:
+                        parent_of_class[other] = group
+                        queue.append(other)
+        return False
+
+    def _shift(self, group: int, gift_class: int, delta: int) -> None:
+        self.flow[group][gift_class] = self.flow[group].get(gift_class, 0) + delta
+
+    def _augment(self, group: int, parent_of_group: Dict[int, int], parent_of_class: Dict[int, int]) -> None:
+        self.free[group] -= 1
+        while True:
+            gift_class = parent_of_group[group]
+            self._shift(group, gift_class, 1)
+            previous_group = parent_of_class[gift_class]
+            if previous_group < 0:
+                return
+            # That group's recipient switches to gift_class and releases the class it had
+            self._shift(previous_group, gift_class, -1)
+            group = previous_group
+
+
+def plan_assignments(gifts: List[Dict[str, Any]], recipients: List[Dict[str, Any]], budget: int,
+                     objective: str = "max_coverage") -> Dict[str, Any]:
+    """
+    Choose which gift goes to which recipient within a star budget.
+
+    Gifts are taken cheapest first, and each is kept if it can be matched to
+    a recipient, possibly by moving earlier assignments. Sets of gifts that
+    can be matched to distinct recipients form a matroid, so the first k
+    gifts kept are the cheapest way to serve k recipients: the plan serves
+    as many recipients as the budget allows, at the lowest cost.
+
+    A recipient with preferences only gets a gift with one of those names;
+    a recipient without preferences gets any gift.
+
+    Args:
+        gifts (List[Dict[str, Any]]): Owned gifts from getBusinessAccountGifts
+        recipients (List[Dict[str, Any]]): Output of parse_recipients
+        budget (int): Stars available for transfer fees
+        objective (str): 'max_coverage', or 'min_cost' to require every recipient to be served
+
+    Returns:
+        Dict[str, Any]: The plan: assignments in recipient order, unassigned
+            recipients, total_stars, coverage, limited_by ('budget',
+            'inventory' or None) and feasible (False if min_cost could not
+            serve everyone)
+
+    Raises:
+        PlanError: If the objective is unknown
+    """
+    if objective not in OBJECTIVES:
+        raise PlanError(f"objective must be one of: {', '.join(OBJECTIVES)}")
+
+    # Gift classes by case-insensitive name
+    class_index: Dict[str, int] = {}
+    class_names: List[str] = []
+    candidates: List[Tuple[int, str, int, Dict[str, Any]]] = []
+    for gift in gifts:
+        if not gift.get("can_be_transferred") or not gift.get("owned_gift_id"):
+            continue
+        name = gift_name(gift)
+        key = name.casefold()
+        if key not in class_index:
+            class_index[key] = len(class_names)
+            class_names.append(name)
+        candidates.append((gift.get("transfer_star_count", 0), gift["owned_gift_id"], class_index[key], gift))
+    candidates.sort(key=lambda item: (item[0], item[1]))
+
+    # Recipient groups by preference set
+    group_index: Dict[FrozenSet[str], int] = {}
+    members: List[List[int]] = []
+    eligible: List[List[int]] = []
+    for position, recipient in enumerate(recipients):
+        preferences = frozenset(name.casefold() for name in recipient["preferences"])
+        if preferences not in group_index:
+            group_index[preferences] = len(members)
+            members.append([])
+            if preferences:
+                eligible.append([class_index[name] for name in preferences if name in class_index])
+            else:
+                eligible.append(list(range(len(class_names))))
+        members[group_index[preferences]].append(position)
+
+    matcher = _Matcher([len(group) for group in members], eligible, len(class_names))
+    chosen: List[List[Tuple[int, str, int, Dict[str, Any]]]] = [[] for _ in class_names]
+    dead = set()
+    total = 0
+    remaining = len(recipients)
+    limited_by = None
+    for candidate in candidates:
+        if remaining == 0:
+            break
+        cost, _, gift_class, _ = candidate
+        if gift_class in dead:
+            continue
+        if total + cost > budget:
+            # Candidates are sorted by cost, so no later gift fits either
+            limited_by = "budget"
+            break
+        if not matcher.add(gift_class):
+            # Adding more gifts never makes room for this class again
+            dead.add(gift_class)
+            continue
+        chosen[gift_class].append(candidate)
+        total += cost
+        remaining -= 1
+    if remaining and limited_by is None:
+        limited_by = "inventory"
+
+    # Hand out the chosen gifts of each class to the group's recipients in order
+    assigned: Dict[int, Tuple[int, str, int, Dict[str, Any]]] = {}
+    for group, positions in enumerate(members):
+        queue = iter(positions)
+        for gift_class, count in matcher.flow[group].items():
+            for _ in range(count):
+                assigned[next(queue)] = chosen[gift_class].pop()
+
+    assignments = []
+    unassigned = []
+    for position, recipient in enumerate(recipients):
+        if position not in assigned:
+            unassigned.append({"index": position, "target_chat_id": recipient["target_chat_id"]})
+            continue
+        cost, gift_id, gift_class, _ = assigned[position]
+        assignments.append({"gift_id": gift_id, "target_chat_id": recipient["target_chat_id"],
+                            "stars": cost, "gift_name": class_names[gift_class]})
+
+    return {
+        "objective": objective,
+        "budget": budget,
+        "total_stars": total,
+        "recipients": len(recipients),
+        "assigned": len(assignments),
+        "coverage": round(len(assignments) / len(recipients), 4) if recipients else 1.0,
+        "limited_by": limited_by,
+        "feasible": objective != "min_cost" or not unassigned,
+        "assignments": assignments,
+        "unassigned": unassigned
+    }
@@ -0,0 +1,185 @@
+import csv
+import json
+from typing import Dict, Iterator, List, Optional, Tuple, IO, Any
+
+from usernames import parse_chat_ref
+
+# Bytes read from the request body per chunk
+CHUNK_SIZE = 64 * 1024
+
+MANIFEST_FORMATS = ('ndjson', 'csv')
+
+
+class ManifestError(Exception):
+    """Raised when a manifest cannot be ingested as a whole."""
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Work out the manifest format from an explicit choice or the content type.
+
+    Args:
+        content_type (Optional[str]): The request Content-Type header
+        requested (Optional[str]): Explicit format, e.g. from a query parameter
+
+    Returns:
+        str: 'ndjson' or 'csv'
+
+    Raises:
+        ManifestError: If an unsupported format was requested
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in MANIFEST_FORMATS:
+            raise ManifestError(f"Unsupported manifest format: {requested}")
+        return requested
+    if content_type and 'csv' in content_type.lower():
+        return 'csv'
+    return 'ndjson'
+
+
+def iter_lines(stream: IO[bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield decoded lines from a binary stream without reading it all at once.
+
+    Args:
+        stream (IO[bytes]): The binary stream, e.g. a request body
+        chunk_size (int): Number of bytes to read per chunk
+
+    Yields:
+        str: Each line without its line terminator
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+    if pending:
+        yield pending.rstrip(b'\r').decode('utf-8')
+
+
+def validate_row(row: Dict[str, Any]) -> Tuple[Optional[Dict], str]:
+    """
+    Validate and normalize one manifest row.
+
+    Args:
+        row (Dict[str, Any]): Raw row with gift_id, target_chat_id and an
+            optional business_connection_id
+
+    Returns:
+        Tuple[Optional[Dict], str]: (normalized_row, error_message)
+    """
+    gift_id = str(row.get('gift_id') or '').strip()
+    if not gift_id:
+        return None, "gift_id is required"
+
+    try:
+        target_chat_id = parse_chat_ref(row.get('target_chat_id', ''))
+    except ValueError as e:
+        return None, f"target_chat_id {str(e)}"
+
+    normalized = {"gift_id": gift_id, "target_chat_id": target_chat_id}
+    # Rows of other business connections are fanned out by the worker
+    business_connection_id = str(row.get('business_connection_id') or '').strip()
+    if business_connection_id:
+        normalized["business_connection_id"] = business_connection_id
+    return normalized, ""
+
+
+def iter_manifest_rows(lines: Iterator[str], fmt: str) -> Iterator[Tuple[int, Optional[Dict], str]]:
+    """
+    Parse and validate manifest lines one at a time.
+
+    Args:
+        lines (Iterator[str]): Manifest lines
+        fmt (str): 'ndjson' or 'csv'; CSV input must start with a header row
+
+    Yields:
+        Tuple[int, Optional[Dict], str]: (row_number, normalized_row, error_message)
+    """
+    header: Optional[List[str]] = None
+    row_number = 0
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        if fmt == 'csv':
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            raw = dict(zip(header, values))
+        else:
+            try:
+                raw = json.loads(line)
+            except json.JSONDecodeError as e:
+                row_number += 1
+                yield row_number, None, f"Invalid JSON: {str(e)}"
+                continue
+            if not isinstance(raw, dict):
+                row_number += 1
+                yield row_number, None, "Row must be a JSON object"
+                continue
+
+        row_number += 1
+        row, error = validate_row(raw)
+        yield row_number, row, error
+
+
+def ingest_manifest(stream: IO[bytes], fmt: str, out_file: IO[str], max_rows: int,
+                    max_errors: int = 100) -> Tuple[int, List[Dict]]:
+    """
+    Stream a manifest from stream into out_file as normalized NDJSON.
+
+    Rows are validated as they arrive, so memory use does not depend on the
+    size of the manifest.
+
+    Args:
+        stream (IO[bytes]): The request body
+        fmt (str): 'ndjson' or 'csv'
+        out_file (IO[str]): Text file receiving one normalized row per line
+        max_rows (int): Maximum number of rows accepted
+        max_errors (int): Stop ingesting after this many invalid rows
+
+    Returns:
+        Tuple[int, List[Dict]]: (row_count, errors) where each error has row and message
+
+    Raises:
+        ManifestError: If the manifest exceeds max_rows
+    """
+    row_count = 0
+    errors: List[Dict] = []
+
+    for row_number, row, error in iter_manifest_rows(iter_lines(stream), fmt):
+        if row_number > max_rows:
+            raise ManifestError(f"Manifest exceeds the maximum of {max_rows} rows")
+        if error:
+            errors.append({"row": row_number, "message": error})
+            if len(errors) >= max_errors:
+                break
+            continue
+        out_file.write(json.dumps(row) + '\n')
+        row_count += 1
+
+    return row_count, errors
+
+
+def read_manifest(path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Read a normalized manifest written by ingest_manifest.
+
+    Args:
+        path (str): Path to the manifest file
+
+    Yields:
+        Tuple[int, Dict]: (row_number, row)
+    """
+    with open(path, 'r') as f:
+        for row_number, line in enumerate(f, 1):
+            yield row_number, json.loads(line)
@@ -0,0 +1,400 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import requests
+
+from db import Database
+from inventory_cache import make_cache_key
+from job_store import SCHEMA as JOB_SCHEMA
+import events
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot"
+
+SCHEMA = """
+-- Health and rate limit state per bot of the pool
+CREATE TABLE IF NOT EXISTS pool_bots (
+    bot_id TEXT PRIMARY KEY,
+    unhealthy_until REAL NOT NULL DEFAULT 0,
+    rate_limited_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+
+-- Business connections of the pool's bots; connections of different bots
+-- to the same business account share the account
+CREATE TABLE IF NOT EXISTS pool_connections (
+    connection_id TEXT PRIMARY KEY,
+    bot_id TEXT NOT NULL,
+    account TEXT NOT NULL,
+    usable INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pool_connections_account ON pool_connections(account);
+
+-- Bot each business account was last routed to
+CREATE TABLE IF NOT EXISTS pool_assignments (
+    account TEXT PRIMARY KEY,
+    bot_id TEXT NOT NULL,
+    assigned_at REAL NOT NULL
+);
+"""
+
+
+def bot_id(bot_token: str) -> str:
+    """
+    Get the ID of a bot, the public part of its token.
+
+    Args:
+        bot_token (str): Bot token
+
+    Returns:
+        str: Bot user ID
+    """
+    return bot_token.split(':', 1)[0]
+
+
+def telegram_lookup(request: Optional[Callable[..., Any]] = None) -> Callable[[str, str], Optional[Dict]]:
+    """
+    Build the getBusinessConnection call used by BotPool.discover.
+
+    Args:
+        request (Optional[Callable]): Replaces requests.post, for tests
+
+    Returns:
+        Callable[[str, str], Optional[Dict]]: Takes (bot token, connection ID)
+            and returns the BusinessConnection, or None if the bot does not
+            know the connection; raises requests.exceptions.RequestException
+            or ValueError if Telegram cannot be reached or its answer is not JSON
+    """
+    post = request or requests.post
+
+    def lookup(bot_token: str, connection_id: str) -> Optional[Dict]:
+        response = post(f"{TELEGRAM_API_URL}{bot_token}/getBusinessConnection",
+                        json={"business_connection_id": connection_id}, timeout=10)
+        result = response.json()
+        return result.get('result') if result.get('ok') else None
+
+    return lookup
+
+
+class BotPool:
+    """
+    Several bots connected to the same business accounts, so jobs can be
+    spread over them instead of sharing one bot's rate limits.
+
+    A business connection belongs to one bot, but an account connected to
+    several bots has one connection per bot. The pool learns these from
+    getBusinessConnection and connection updates, and routes a job for any
+    of them to the least-loaded bot that is healthy and not rate limited.
+    Routing only reads the stored connections: a connection not known yet
+    is looked up by a background thread, which also refreshes stored
+    connections every refresh_interval seconds.
+    Load is the number of queued and running jobs on a bot, counted from
+    the bot_id in their parameters. With sticky routing an account stays
+    on its bot while that bot is available. The cached gift list, snapshots
+    and balance of an account are keyed by account_key, so they do not
+    depend on the bot a job is routed to.
+
+    Args:
+        database (Database): Shared state database
+        tokens (List[str]): Bot tokens of the pool
+        cooldown (float): Seconds a bot is skipped after Telegram rejected its token
+        sticky (bool): Keep each business account on the bot it was routed to
+        refresh_interval (float): Seconds before a stored connection is looked up again
+        lookup (Optional[Callable[[str, str], Optional[Dict]]]): getBusinessConnection,
+            see telegram_lookup; a fake in tests
+    """
+
+    def __init__(self, database: Database, tokens: List[str], cooldown: float = 60, sticky: bool = False,
+                 refresh_interval: float = 3600, lookup: Optional[Callable[[str, str], Optional[Dict]]] = None):
+        self.db = database
+        self.tokens: Dict[str, str] = {}
+        for token in tokens:
+            if token:
+                self.tokens.setdefault(bot_id(token), token)
+        self.cooldown = cooldown
+        self.sticky = sticky
+        self.refresh_interval = refresh_interval
+        self.lookup = lookup or telegram_lookup()
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.db.executescript(JOB_SCHEMA)
+        self.db.executescript(SCHEMA)
+
+    def serves(self, bot_token: str) -> bool:
+        """
+        Tell whether jobs using a bot may be routed by the pool.
+
+        Args:
+            bot_token (str): Bot token of a request
+
+        Returns:
+            bool: True if the bot is in a pool of more than one bot
+        """
+        return len(self.tokens) > 1 and self.tokens.get(bot_id(bot_token)) == bot_token
+
+    def record_connection(self, bot: str, connection: Dict[str, Any]) -> None:
+        """
+        Store a BusinessConnection of one of the pool's bots.
+
+        Args:
+            bot (str): Bot ID
+            connection (Dict[str, Any]): The BusinessConnection object
+        """
+        account = connection.get('user_chat_id') or (connection.get('user') or {}).get('id')
+        rights = connection.get('rights')
+        usable = bool(connection.get('is_enabled')) and (rights is None or bool(rights.get('can_transfer_and_upgrade_gifts')))
+        conn = self.db.connect()
+        with conn:
+            if account is None:
+                # Updates about a known connection may omit the account
+                conn.execute("UPDATE pool_connections SET usable = ?, updated_at = ? WHERE connection_id = ?",
+                             (int(usable), time.time(), connection['id']))
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO pool_connections (connection_id, bot_id, account, usable, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (connection['id'], bot, str(account), int(usable), time.time())
+            )
+
+    def discover(self, connection_id: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Find which bot of the pool a business connection belongs to, asking
+        Telegram if it is not known yet.
+
+        Args:
+            connection_id (str): Business connection ID
+            refresh (bool): Ask Telegram even if the connection is known, e.g.
+                after its rights changed
+
+        Returns:
+            Optional[Dict[str, Any]]: The stored connection (connection_id,
+                bot_id, account, usable), or None if no bot of the pool has it
+
+        Raises:
+            requests.exceptions.RequestException: If Telegram cannot be reached
+            ValueError: If Telegram's answer is not JSON
+        """
+        row = self._connection(connection_id)
+        if row is not None and not refresh:
+            return row
+        # The known owner is asked first
+        bots = sorted(self.tokens, key=lambda bot: row is None or bot != row['bot_id'])
+        for bot in bots:
+            connection = self.lookup(self.tokens[bot], connection_id)
+            if connection is not None:
+                self.record_connection(bot, dict(connection, id=connection_id))
+                return self._connection(connection_id)
+        if row is not None:
+            # No bot has the connection any more
+            conn = self.db.connect()
+            with conn:
+                conn.execute("UPDATE pool_connections SET usable = 0, updated_at = ? WHERE connection_id = ?",
+                             (time.time(), connection_id))
+        return None
+
+    def request_discovery(self, connection_id: str) -> None:
+        """
+        Have the background thread look up a connection.
+
+        Args:
+            connection_id (str): Business connection ID
+        """
+        with self._lock:
+            self._pending.add(connection_id)
+        self._wake.set()
+
+    def refresh(self) -> int:
+        """
+        Look up the requested connections and the stored ones last looked up
+        more than refresh_interval seconds ago. A failed lookup is logged and
+        retried on the next refresh.
+
+        Returns:
+            int: Number of connections looked up
+        """
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        connection_ids = sorted(pending)
+        try:
+            connection_ids += [row['connection_id'] for row in self.db.connect().execute(
+                "SELECT connection_id FROM pool_connections WHERE updated_at < ? ORDER BY updated_at",
+                (time.time() - self.refresh_interval,)
+            ) if row['connection_id'] not in pending]
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read bot pool connections: {str(e)}")
+        for connection_id in connection_ids:
+            try:
+                self.discover(connection_id, refresh=True)
+            except (sqlite3.Error, requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Failed to look up business connection {connection_id}: {str(e)}")
+                if connection_id in pending:
+                    with self._lock:
+                        self._pending.add(connection_id)
+        return len(connection_ids)
+
+    def start(self) -> None:
+        """Start the background lookup thread, if the pool has more than one bot."""
+        if self._thread is None and len(self.tokens) > 1:
+            self._thread = threading.Thread(target=self._loop, name="bot-pool", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(min(self.refresh_interval, 60))
+            self._wake.clear()
+            self.refresh()
+
+    def account_key(self, bot_token: str, connection_id: str) -> Optional[str]:
+        """
+        Get the key of the business account behind a connection of one of
+        the pool's bots, shared by all connections to that account.
+
+        Args:
+            bot_token (str): Bot token of the connection
+            connection_id (str): Business connection ID
+
+        Returns:
+            Optional[str]: Hashed key in the form of make_cache_key, or None
+                if the connection is not known to belong to the bot
+        """
+        if not self.serves(bot_token):
+            return None
+        row = self._connection(connection_id)
+        if row is None or row['bot_id'] != bot_id(bot_token):
+            return None
+        return make_cache_key("account", row['account'])
+
+    def _connection(self, connection_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.connect().execute("SELECT * FROM pool_connections WHERE connection_id = ?",
+                                        (connection_id,)).fetchone()
+        return dict(row) if row else None
+
+    def observe(self, event: Dict) -> None:
+        """
+        Learn a bot's health and rate limit state from a worker event; only
+        rejected tokens and rate limited api_call events are stored.
+
+        Args:
+            event (Dict): Event parsed by events.parse_event_line
+        """
+        if event.get("type") != events.API_CALL or event.get("bot_id") not in self.tokens:
+            return
+        now = time.time()
+        if event.get("status_code") == 429:
+            column, until = "rate_limited_until", now + (event.get("retry_after") or 1)
+        elif event.get("status_code") == 401:
+            column, until = "unhealthy_until", now + self.cooldown
+        else:
+            return
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                f"INSERT INTO pool_bots (bot_id, {column}, last_error, updated_at) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT(bot_id) DO UPDATE SET {column} = MAX({column}, excluded.{column}), "
+                "last_error = excluded.last_error, updated_at = excluded.updated_at",
+                (event["bot_id"], until, f"HTTP {event['status_code']} from {event.get('method')}", now)
+            )
+
+    def loads(self) -> Dict[str, int]:
+        """
+        Count the queued and running jobs per bot.
+
+        Returns:
+            Dict[str, int]: Active jobs per bot ID of the pool
+        """
+        counts = {bot: 0 for bot in self.tokens}
+        for row in self.db.connect().execute(
+            "SELECT json_extract(params, '$.bot_id') AS bot_id, COUNT(*) AS jobs FROM jobs "
+            "WHERE status IN ('queued', 'running') GROUP BY 1"
+        ):
+            if row['bot_id'] in counts:
+                counts[row['bot_id']] = row['jobs']
+        return counts
+
+    def _unavailable(self) -> Dict[str, str]:
+        now = time.time()
+        unavailable = {}
+        for row in self.db.connect().execute("SELECT * FROM pool_bots"):
+            if row['unhealthy_until'] > now:
+                unavailable[row['bot_id']] = "unhealthy"
+            elif row['rate_limited_until'] > now:
+                unavailable[row['bot_id']] = "rate_limited"
+        return unavailable
+
+    def route(self, connection_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Choose the bot and connection for a job on a business connection.
+
+        Args:
+            connection_id (str): Business connection ID of the request
+
+        Returns:
+            Optional[Tuple[str, str]]: (bot token, business connection ID),
+                or None to keep the request's own bot, e.g. if the connection
+                is not known to the pool yet or no other bot is available
+        """
+        row = self._connection(connection_id)
+        if row is None:
+            self.request_discovery(connection_id)
+            return None
+        conn = self.db.connect()
+        candidates = {item['bot_id']: item['connection_id'] for item in conn.execute(
+            "SELECT bot_id, connection_id FROM pool_connections WHERE account = ? AND usable = 1 "
+            "ORDER BY updated_at", (row['account'],)
+        ) if item['bot_id'] in self.tokens}
+        unavailable = self._unavailable()
+        available = [bot for bot in candidates if bot not in unavailable]
+        if not available:
+            return None
+
+        assigned = conn.execute("SELECT bot_id FROM pool_assignments WHERE account = ?", (row['account'],)).fetchone()
+        if self.sticky and assigned is not None and assigned['bot_id'] in available:
+            chosen = assigned['bot_id']
+        else:
+            loads = self.loads()
+            # Ties go to the bot the request named
+            chosen = min(available, key=lambda bot: (loads.get(bot, 0), bot != row['bot_id']))
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO pool_assignments (account, bot_id, assigned_at) VALUES (?, ?, ?)",
+                             (row['account'], chosen, time.time()))
+        return self.tokens[chosen], candidates[chosen]
+
+    def status(self) -> List[Dict[str, Any]]:
+        """
+        Describe every bot of the pool, without its token.
+
+        Returns:
+            List[Dict[str, Any]]: Per bot: bot_id, state ('available',
+                'unhealthy' or 'rate_limited'), until, last_error, jobs,
+                connections and accounts assigned
+        """
+        conn = self.db.connect()
+        states = {row['bot_id']: dict(row) for row in conn.execute("SELECT * FROM pool_bots")}
+        connections = {row['bot_id']: row['connections'] for row in conn.execute(
+            "SELECT bot_id, COUNT(*) AS connections FROM pool_connections WHERE usable = 1 GROUP BY bot_id")}
+        assignments = {row['bot_id']: row['accounts'] for row in conn.execute(
+            "SELECT bot_id, COUNT(*) AS accounts FROM pool_assignments GROUP BY bot_id")}
+        unavailable = self._unavailable()
+        loads = self.loads()
+        bots = []
+        for bot in self.tokens:
+            state = states.get(bot, {})
+            reason = unavailable.get(bot)
+            bots.append({
+                "bot_id": bot,
+                "state": reason or "available",
+                "until": state.get(f"{reason}_until") if reason else None,
+                "last_error": state.get('last_error'),
+                "jobs": loads.get(bot, 0),
+                "connections": connections.get(bot, 0),
+                "accounts_assigned": assignments.get(bot, 0)
+            })
+        return bots
@@ -1,16 +1,19 @@
-from pydantic import BaseModel, PositiveInt, validator
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, PositiveInt, PositiveFloat, NonNegativeInt, validator
+from typing import Optional, Dict, Any, Union
 from dotenv import load_dotenv
 import os
 import json
 
+from job_scheduler import parse_weights
+from usernames import parse_chat_ref
+
 # Load environment variables
 load_dotenv()
 
 class AppConfig(BaseModel):
     BOT_TOKEN: str
     BUSINESS_CONNECTION_ID: str
-    TARGET_CHAT_ID: PositiveInt
+    TARGET_CHAT_ID: Union[PositiveInt, str]  # Chat ID or @username
     STAR_COUNT: PositiveInt = 25
     MAX_RETRIES: PositiveInt = 3
     RETRY_DELAY: PositiveInt = 5
@@ -19,6 +22,78 @@ class AppConfig(BaseModel):
     ENABLE_REDUNDANT_TRANSFER: bool = False  # Disabled by default to avoid unnecessary API calls
     LOG_DIR: str = "logs"
     API_KEY: Optional[str] = None
+    GIFTS_CACHE_TTL: PositiveInt = 30  # Seconds a fetched gift list is served from cache
+    GIFTS_STREAM_CACHE_MAX: NonNegativeInt = 10000  # Largest streamed gift list kept for the cache (0 = never)
+    BATCH_MAX_ROWS: PositiveInt = 50000  # Maximum rows accepted by the batch transfer endpoint
+    STATE_DB: str = "data/state.db"  # SQLite database for job history and other server state
+    LOG_RETENTION_DAYS: NonNegativeInt = 30  # Delete closed run logs older than this (0 = keep forever)
+    LOG_MAX_TOTAL_MB: NonNegativeInt = 1024  # Disk budget for LOG_DIR (0 = unlimited)
+    LOG_MAX_FILES: NonNegativeInt = 0  # Maximum number of run logs kept (0 = unlimited)
+    LOG_COMPRESSION: str = "gzip"  # Compression for closed logs: none, gzip or zstd
+    LOG_COMPACT_BELOW_KB: NonNegativeInt = 256  # Closed logs smaller than this go into daily segments (0 = never)
+    LOG_RETENTION_INTERVAL: PositiveInt = 3600  # Seconds between retention passes
+    MAX_CONCURRENT_JOBS: PositiveInt = 1  # Jobs running at once across all web processes
+    RATELIMIT_STORAGE_URI: str = ""  # Rate limit storage (default: the STATE_DB SQLite file)
+    MAX_JOBS_PER_CONNECTION: PositiveInt = 1  # Running jobs allowed per business connection
+    FAIR_SHARE_WEIGHTS: str = ""  # Round robin weights per API key tenant, as tenant:weight,...
+    SCHEDULE_LEAD_SECONDS: NonNegativeInt = 120  # Queue scheduled jobs this early for preflight and funding
+    SCHEDULE_JITTER_SECONDS: NonNegativeInt = 30  # Default random delay added to each scheduled occurrence
+    SECRET_KEY: Optional[str] = None  # Fernet key for secrets at rest (default: generated next to STATE_DB)
+    CANCEL_GRACE_PERIOD: PositiveInt = 60  # Seconds a cancelled job may take to reach a step boundary
+    HEALTH_PROBE_INTERVAL: PositiveInt = 30  # Seconds a Telegram reachability observation stays fresh
+    READY_MAX_QUEUED: PositiveInt = 50  # Queue depth at which /api/health?ready=1 reports not ready
+    READY_MIN_SUCCESS_RATE: float = 0.5  # Transfer success rate below which the service is not ready
+    CONNECTION_TOKENS: Dict[str, str] = {}  # Bot token per extra business connection of a batch (default: BOT_TOKEN)
+    FANOUT_MAX_CONNECTIONS: PositiveInt = 8  # Business connections a batch job serves at the same time
+    FANOUT_MAX_CALLS_PER_TOKEN: PositiveInt = 2  # Concurrent API calls per bot token in a batch job
+    RECIPIENT_CHECK_TTL: NonNegativeInt = 86400  # Seconds a recipient check result is reused (0 = always recheck)
+    RECIPIENT_CHECK_RATE: PositiveFloat = 20  # getChat calls per second when validating recipients in bulk
+    RECIPIENT_CHECK_WORKERS: PositiveInt = 8  # Concurrent getChat calls when validating recipients in bulk
+    USERNAME_CACHE_TTL: NonNegativeInt = 604800  # Seconds a resolved @username is trusted (0 = always resolve)
+    INVENTORY_HISTORY_DAYS: NonNegativeInt = 30  # Days inventory snapshots and changes are kept (0 = forever)
+    UPDATES_MODE: str = "off"  # Telegram update receiver: off, webhook or poll
+    UPDATES_WEBHOOK_SECRET: str = ""  # secret_token Telegram sends with webhook updates
+    UPDATES_POLL_TIMEOUT: PositiveInt = 30  # Long-poll timeout of getUpdates in seconds
+    ADMISSION_BALANCE_TTL: NonNegativeInt = 300  # Seconds an observed star balance gates new jobs (0 = off)
+    BOT_POOL_TOKENS: str = ""  # Comma-separated extra bot tokens jobs are spread over, next to BOT_TOKEN
+    BOT_POOL_COOLDOWN: PositiveInt = 60  # Seconds a pool bot is skipped after Telegram rejected its token
+    BOT_POOL_STICKY: bool = False  # Keep each business account on the pool bot it was routed to
+
+    @validator('LOG_COMPRESSION')
+    def check_log_compression(cls, v):
+        if v not in ("none", "gzip", "zstd"):
+            raise ValueError("LOG_COMPRESSION must be one of: none, gzip, zstd")
+        return v
+
+    @validator('UPDATES_MODE')
+    def check_updates_mode(cls, v):
+        if v not in ("off", "webhook", "poll"):
+            raise ValueError("UPDATES_MODE must be one of: off, webhook, poll")
+        return v
+
+    @validator('UPDATES_WEBHOOK_SECRET')
+    def check_webhook_secret(cls, v, values):
+        if values.get('UPDATES_MODE') == "webhook" and not v:
+            raise ValueError("UPDATES_WEBHOOK_SECRET is required when UPDATES_MODE is webhook")
+        return v
+
+    @validator('FAIR_SHARE_WEIGHTS')
+    def check_fair_share_weights(cls, v):
+        parse_weights(v)
+        return v
+
+    @validator('READY_MIN_SUCCESS_RATE')
+    def check_success_rate(cls, v):
+        if not 0 <= v <= 1:
+            raise ValueError("READY_MIN_SUCCESS_RATE must be between 0 and 1")
+        return v
+
+    @validator('TARGET_CHAT_ID', pre=True)
+    def check_target_chat_id(cls, v):
+        try:
+            return parse_chat_ref(v)
+        except ValueError:
+            raise ValueError("TARGET_CHAT_ID must be a positive chat ID or an @username")
 
     @validator('BOT_TOKEN', 'BUSINESS_CONNECTION_ID')
     def check_non_empty(cls, v):
@@ -27,23 +102,21 @@ class AppConfig(BaseModel):
         return v
 
     @classmethod
-    def load(cls, config_file: Optional[str] = None) -> 'AppConfig':
+    def load(cls, config_file: Optional[str] = None, config_data: Optional[Dict[str, Any]] = None) -> 'AppConfig':
         """
         Load configuration from environment variables and config file.
         
         Args:
             config_file: Optional path to a JSON configuration file
+            config_data: Optional configuration passed in memory, applied like a config file
             
         Returns:
             AppConfig: Validated configuration object
         """
         # Get the TARGET_CHAT_ID with a safe default
         try:
-            target_chat_id = int(os.getenv("TARGET_CHAT_ID", "0") or "0")
-            # Ensure it's valid for PositiveInt
-            if target_chat_id <= 0:
-                target_chat_id = 1  # Use 1 as a placeholder default
-        except (ValueError, TypeError):
+            target_chat_id = parse_chat_ref(os.getenv("TARGET_CHAT_ID", "0") or "0")
+        except ValueError:
             target_chat_id = 1  # Use 1 as a placeholder default
             
         defaults = {
@@ -57,19 +130,62 @@ class AppConfig(BaseModel):
             "BYPASS_BUSINESS_CHECK": os.getenv("BYPASS_BUSINESS_CHECK", "False").lower() in ("true", "yes", "1"),
             "ENABLE_REDUNDANT_TRANSFER": os.getenv("ENABLE_REDUNDANT_TRANSFER", "False").lower() in ("true", "yes", "1"),
             "LOG_DIR": os.getenv("LOG_DIR", "logs"),
-            "API_KEY": os.getenv("API_KEY")
+            "API_KEY": os.getenv("API_KEY"),
+            "GIFTS_CACHE_TTL": int(os.getenv("GIFTS_CACHE_TTL", "30")),
+            "GIFTS_STREAM_CACHE_MAX": int(os.getenv("GIFTS_STREAM_CACHE_MAX", "10000")),
+            "BATCH_MAX_ROWS": int(os.getenv("BATCH_MAX_ROWS", "50000")),
+            "STATE_DB": os.getenv("STATE_DB", "data/state.db"),
+            "LOG_RETENTION_DAYS": int(os.getenv("LOG_RETENTION_DAYS", "30")),
+            "LOG_MAX_TOTAL_MB": int(os.getenv("LOG_MAX_TOTAL_MB", "1024")),
+            "LOG_MAX_FILES": int(os.getenv("LOG_MAX_FILES", "0")),
+            "LOG_COMPRESSION": os.getenv("LOG_COMPRESSION", "gzip"),
+            "LOG_COMPACT_BELOW_KB": int(os.getenv("LOG_COMPACT_BELOW_KB", "256")),
+            "LOG_RETENTION_INTERVAL": int(os.getenv("LOG_RETENTION_INTERVAL", "3600")),
+            "MAX_CONCURRENT_JOBS": int(os.getenv("MAX_CONCURRENT_JOBS", "1")),
+            "RATELIMIT_STORAGE_URI": os.getenv("RATELIMIT_STORAGE_URI", ""),
+            "MAX_JOBS_PER_CONNECTION": int(os.getenv("MAX_JOBS_PER_CONNECTION", "1")),
+            "FAIR_SHARE_WEIGHTS": os.getenv("FAIR_SHARE_WEIGHTS", ""),
+            "SCHEDULE_LEAD_SECONDS": int(os.getenv("SCHEDULE_LEAD_SECONDS", "120")),
+            "SCHEDULE_JITTER_SECONDS": int(os.getenv("SCHEDULE_JITTER_SECONDS", "30")),
+            "SECRET_KEY": os.getenv("SECRET_KEY"),
+            "CANCEL_GRACE_PERIOD": int(os.getenv("CANCEL_GRACE_PERIOD", "60")),
+            "HEALTH_PROBE_INTERVAL": int(os.getenv("HEALTH_PROBE_INTERVAL", "30")),
+            "READY_MAX_QUEUED": int(os.getenv("READY_MAX_QUEUED", "50")),
+            "READY_MIN_SUCCESS_RATE": float(os.getenv("READY_MIN_SUCCESS_RATE", "0.5")),
+            "FANOUT_MAX_CONNECTIONS": int(os.getenv("FANOUT_MAX_CONNECTIONS", "8")),
+            "FANOUT_MAX_CALLS_PER_TOKEN": int(os.getenv("FANOUT_MAX_CALLS_PER_TOKEN", "2")),
+            "RECIPIENT_CHECK_TTL": int(os.getenv("RECIPIENT_CHECK_TTL", "86400")),
+            "RECIPIENT_CHECK_RATE": float(os.getenv("RECIPIENT_CHECK_RATE", "20")),
+            "RECIPIENT_CHECK_WORKERS": int(os.getenv("RECIPIENT_CHECK_WORKERS", "8")),
+            "USERNAME_CACHE_TTL": int(os.getenv("USERNAME_CACHE_TTL", "604800")),
+            "INVENTORY_HISTORY_DAYS": int(os.getenv("INVENTORY_HISTORY_DAYS", "30")),
+            "UPDATES_MODE": os.getenv("UPDATES_MODE", "off"),
+            "UPDATES_WEBHOOK_SECRET": os.getenv("UPDATES_WEBHOOK_SECRET", ""),
+            "UPDATES_POLL_TIMEOUT": int(os.getenv("UPDATES_POLL_TIMEOUT", "30")),
+            "ADMISSION_BALANCE_TTL": int(os.getenv("ADMISSION_BALANCE_TTL", "300")),
+            "BOT_POOL_TOKENS": os.getenv("BOT_POOL_TOKENS", ""),
+            "BOT_POOL_COOLDOWN": int(os.getenv("BOT_POOL_COOLDOWN", "60")),
+            "BOT_POOL_STICKY": os.getenv("BOT_POOL_STICKY", "False").lower() in ("true", "yes", "1")
         }
         
+        file_config = None
         if config_file and os.path.exists(config_file):
             try:
                 with open(config_file, 'r') as f:
                     file_config = json.load(f)
-                    # Handle TARGET_CHAT_ID specially to ensure it's valid
-                    if "TARGET_CHAT_ID" in file_config and (not isinstance(file_config["TARGET_CHAT_ID"], int) or file_config["TARGET_CHAT_ID"] <= 0):
-                        file_config["TARGET_CHAT_ID"] = 1  # Use 1 as a placeholder default
-                    defaults.update(file_config)
             except (json.JSONDecodeError, IOError) as e:
                 print(f"Error loading configuration file: {e}")
+        if config_data is not None:
+            file_config = dict(config_data)
+        
+        if file_config:
+            # Handle TARGET_CHAT_ID specially to ensure it's valid
+            if "TARGET_CHAT_ID" in file_config:
+                try:
+                    file_config["TARGET_CHAT_ID"] = parse_chat_ref(file_config["TARGET_CHAT_ID"])
+                except ValueError:
+                    file_config["TARGET_CHAT_ID"] = 1  # Use 1 as a placeholder default
+            defaults.update(file_config)
                 
         return cls(**defaults)
         
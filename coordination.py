@@ -0,0 +1,798 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any, Set
+
+from admission import AdmissionController
+from db import Database, WriteBehind
+from job_scheduler import ANONYMOUS_TENANT, PRIORITY_NAMES, FairScheduler
+from job_store import SCHEMA as JOB_SCHEMA, strip_secrets
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+# Statuses of jobs that have not finished yet
+ACTIVE_STATUSES = ("queued", "running")
+
+# Columns the queue adds to the job history table
+QUEUE_COLUMNS = (
+    ("cmd", "TEXT"),
+    ("cleanup_files", "TEXT"),
+    ("cache_key", "TEXT"),
+    ("owner", "TEXT"),
+    ("started_at", "REAL"),
+    ("heartbeat_at", "REAL"),
+    ("cancel_requested", "INTEGER NOT NULL DEFAULT 0"),
+    ("state", "TEXT"),
+    ("priority", "INTEGER NOT NULL DEFAULT 1"),
+    ("tenant", "TEXT"),
+    ("secret_config", "TEXT"),
+    ("pause_requested", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Values of the cancel_requested column
+CANCEL_COOPERATIVE = 1
+CANCEL_FORCE = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_output (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    line TEXT,
+    is_error INTEGER NOT NULL DEFAULT 0,
+    event TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_output_job ON job_output(job_id, seq);
+
+-- Bumped whenever a job changes a business account's inventory, so every
+-- web process can drop its cached gift list
+CREATE TABLE IF NOT EXISTS inventory_generations (
+    cache_key TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+
+-- Weighted round robin state of the scheduler (see FairScheduler)
+CREATE TABLE IF NOT EXISTS queue_fair_share (
+    tenant TEXT PRIMARY KEY,
+    virtual_time REAL NOT NULL
+);
+
+-- Queue-wide switches such as drain mode
+CREATE TABLE IF NOT EXISTS queue_settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def make_owner_id() -> str:
+    """
+    Identify this web process as the owner of the jobs it runs.
+
+    Returns:
+        str: host:pid
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Job queue shared by all web processes on one host through SQLite.
+
+    Jobs are rows in the job history table. Any process can enqueue a job,
+    read its output or request cancellation; the process that claims a job
+    runs the worker, heartbeats it and appends its output for the others.
+    Which queued job runs next is decided by a FairScheduler, among the jobs
+    an AdmissionController, if given, finds fundable. With a WriteBehind,
+    output lines, events and live states are queued for its thread and
+    written in batches.
+    """
+
+    def __init__(self, database: Database, max_running: int = 1, stale_after: float = 30,
+                 scheduler: Optional[FairScheduler] = None, admission: Optional[AdmissionController] = None,
+                 writer: Optional[WriteBehind] = None):
+        self.db = database
+        self.writer = writer
+        self.max_running = max_running
+        self.stale_after = stale_after
+        self.scheduler = scheduler or FairScheduler(max_per_connection=max_running)
+        self.admission = admission
+        self.db.executescript(JOB_SCHEMA)
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        conn = self.db.connect()
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        with conn:
+            for column, definition in QUEUE_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority, created_at)")
+
+    def enqueue(self, job, cmd: List[str], cleanup_files: Optional[List[str]] = None,
+                cache_key: Optional[str] = None, priority: int = 1, tenant: Optional[str] = None,
+                secret_config: Optional[str] = None, stars: Optional[Dict[str, int]] = None) -> None:
+        """
+        Add a job to the queue.
+
+        Args:
+            job (Job): The job; its status is set to 'queued'
+            cmd (List[str]): Worker command line (must not contain secrets)
+            cleanup_files (Optional[List[str]]): Temporary files to delete when the job ends
+            cache_key (Optional[str]): Inventory cache key to invalidate if gifts were moved
+            priority (int): Priority class (see job_scheduler.PRIORITY_CLASSES)
+            tenant (Optional[str]): Fair-share tenant that submitted the job
+            secret_config (Optional[str]): Encrypted worker configuration, handed to
+                the claiming process and then deleted
+            stars (Optional[Dict[str, int]]): Stars the job will move to its bot,
+                per cache key, if known
+
+        Raises:
+            AdmissionError: If the admission controller rejects the job
+        """
+        job.status = "queued"
+        params = strip_secrets(job.params)
+        conn = self.db.connect()
+        # IMMEDIATE so no other submission can reserve the same stars meanwhile
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.admission is not None and stars:
+                self.admission.admit(conn, job.id, stars)
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, business_connection_id, params, created_at, "
+                "cmd, cleanup_files, cache_key, priority, tenant, secret_config) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.status, params.get('business_connection_id'), json.dumps(params),
+                 job.created_at, json.dumps(cmd), json.dumps(cleanup_files or []), cache_key,
+                 priority, tenant or ANONYMOUS_TENANT, secret_config)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def claim_next(self, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the next queued job if fewer than max_running jobs run.
+
+        The job is chosen by the scheduler: highest priority class first,
+        weighted round robin between tenants, and no more than the allowed
+        number of running jobs per business connection. Nothing is claimed
+        while the queue drains. Jobs the admission controller finds
+        unfundable are failed instead, without starting.
+
+        Args:
+            owner (str): ID of the claiming process
+
+        Returns:
+            Optional[Dict[str, Any]]: The claimed job row, or None
+        """
+        conn = self.db.connect()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front so two processes cannot claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        rejected: Dict[str, str] = {}
+        cleanup_files: List[str] = []
+        try:
+            running = [dict(item) for item in conn.execute(
+                "SELECT id, business_connection_id FROM jobs WHERE status = 'running'"
+            )]
+            row = None
+            draining = conn.execute("SELECT 1 FROM queue_settings WHERE name = 'draining' AND value = '1'").fetchone()
+            if len(running) < self.max_running and not draining:
+                queued = [dict(item) for item in conn.execute(
+                    "SELECT id, priority, tenant, business_connection_id, created_at FROM jobs "
+                    "WHERE status = 'queued' ORDER BY created_at, id"
+                )]
+                if self.admission is not None:
+                    queued, rejected = self.admission.screen(conn, queued)
+                for job_id, message in rejected.items():
+                    files = conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, return_code = -1, secret_config = NULL "
+                        "WHERE id = ? RETURNING cleanup_files",
+                        (now, job_id)
+                    ).fetchone()['cleanup_files']
+                    cleanup_files += json.loads(files) if files else []
+                    conn.execute("INSERT INTO job_output (job_id, line, is_error, created_at) VALUES (?, ?, 1, ?)",
+                                 (job_id, message, now))
+                virtual_times = {item['tenant']: item['virtual_time']
+                                 for item in conn.execute("SELECT tenant, virtual_time FROM queue_fair_share")}
+                chosen = self.scheduler.select(queued, running, virtual_times)
+                if chosen is not None:
+                    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (chosen['id'],)).fetchone()
+                    tenant = chosen['tenant'] or ANONYMOUS_TENANT
+                    conn.executemany(
+                        "INSERT INTO queue_fair_share (tenant, virtual_time) VALUES (?, ?) "
+                        "ON CONFLICT(tenant) DO UPDATE SET virtual_time = excluded.virtual_time",
+                        self.scheduler.advance(tenant, virtual_times).items()
+                    )
+            if row is not None:
+                conn.execute(
+                    # The configuration is only needed to start the worker
+                    "UPDATE jobs SET status = 'running', owner = ?, started_at = ?, heartbeat_at = ?, "
+                    "secret_config = NULL WHERE id = ?",
+                    (owner, now, now, row['id'])
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for job_id, message in rejected.items():
+            logger.warning(f"Job {job_id} rejected before starting: {message}")
+        for path in cleanup_files:
+            if os.path.exists(path):
+                os.remove(path)
+        if row is None:
+            return None
+        job = dict(row)
+        job.update(status="running", owner=owner, started_at=now, heartbeat_at=now)
+        for column in ("params", "cmd", "cleanup_files"):
+            job[column] = json.loads(job[column]) if job[column] else None
+        return job
+
+    def heartbeat(self, owner: str) -> None:
+        """
+        Mark the jobs run by a process as alive.
+
+        Args:
+            owner (str): ID of the process
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                         (time.time(), owner))
+
+    def reap_stale(self) -> List[str]:
+        """
+        Fail running jobs whose owner stopped heartbeating, e.g. after a crash.
+
+        Returns:
+            List[str]: IDs of the failed jobs
+        """
+        now = time.time()
+        conn = self.db.connect()
+        with conn:
+            stale = [row['id'] for row in conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, return_code = -1 "
+                "WHERE status = 'running' AND heartbeat_at < ? RETURNING id",
+                (now, now - self.stale_after)
+            )]
+            for job_id in stale:
+                conn.execute(
+                    "INSERT INTO job_output (job_id, line, is_error, created_at) VALUES (?, ?, 1, ?)",
+                    (job_id, "The process running this job stopped responding", now)
+                )
+        return stale
+
+    def mark_failed(self, job_id: str, message: str) -> None:
+        """
+        Fail a claimed job that could not be run.
+
+        Args:
+            job_id (str): The job ID
+            message (str): Reason, appended to the job output
+        """
+        now = time.time()
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, return_code = -1 WHERE id = ?",
+                         (now, job_id))
+            conn.execute("INSERT INTO job_output (job_id, line, is_error, created_at) VALUES (?, ?, 1, ?)",
+                         (job_id, message, now))
+
+    def request_cancel(self, job_id: str, force: bool = False) -> Optional[str]:
+        """
+        Cancel a queued job, or ask the owner of a running job to stop it.
+
+        A running job stops at its next step boundary unless force is set,
+        in which case its worker is terminated at once.
+
+        Args:
+            job_id (str): The job ID
+            force (bool): Terminate a running job instead of stopping it cooperatively
+
+        Returns:
+            Optional[str]: 'cancelled', 'requested', or None if the job is not active
+        """
+        conn = self.db.connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, secret_config = NULL "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                return "cancelled"
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = MAX(cancel_requested, ?) WHERE id = ? AND status = 'running'",
+                (CANCEL_FORCE if force else CANCEL_COOPERATIVE, job_id)
+            )
+            return "requested" if cursor.rowcount else None
+
+    def request_pause(self, job_id: str, paused: bool) -> bool:
+        """
+        Ask the owner of a running job to pause or resume it.
+
+        Args:
+            job_id (str): The job ID
+            paused (bool): True to pause, False to resume
+
+        Returns:
+            bool: False if the job is not running or is being cancelled
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute(
+                "UPDATE jobs SET pause_requested = ? WHERE id = ? AND status = 'running' AND cancel_requested = 0",
+                (1 if paused else 0, job_id)
+            ).rowcount > 0
+
+    def control_requests(self, owner: str) -> Dict[str, Dict[str, int]]:
+        """
+        Get the cancel and pause requests for the running jobs of a process.
+
+        Args:
+            owner (str): ID of the process
+
+        Returns:
+            Dict[str, Dict[str, int]]: cancel_requested and pause_requested per job ID
+        """
+        return {row['id']: {"cancel_requested": row['cancel_requested'], "pause_requested": row['pause_requested']}
+                for row in self.db.connect().execute(
+                    "SELECT id, cancel_requested, pause_requested FROM jobs WHERE owner = ? AND status = 'running'",
+                    (owner,)
+                )}
+
+    def set_draining(self, enabled: bool) -> None:
+        """
+        Turn drain mode on or off for every process.
+
+        While draining, running jobs finish but no queued job starts. The
+        setting is stored with the queue, so it survives a restart.
+
+        Args:
+            enabled (bool): Whether to drain
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO queue_settings (name, value) VALUES ('draining', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value", ('1' if enabled else '0',)
+            )
+
+    def is_draining(self) -> bool:
+        """
+        Check whether the queue drains.
+
+        Returns:
+            bool: True if queued jobs are held
+        """
+        return self.db.connect().execute(
+            "SELECT 1 FROM queue_settings WHERE name = 'draining' AND value = '1'"
+        ).fetchone() is not None
+
+    def drain_status(self) -> Dict[str, Any]:
+        """
+        Describe drain progress.
+
+        Returns:
+            Dict[str, Any]: draining, queued, running, paused and idle (nothing running)
+        """
+        row = self.db.connect().execute(
+            "SELECT SUM(status = 'queued') AS queued, SUM(status = 'running') AS running, "
+            "SUM(status = 'running' AND pause_requested = 1) AS paused "
+            "FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()
+        running = row['running'] or 0
+        return {
+            "draining": self.is_draining(),
+            "queued": row['queued'] or 0,
+            "running": running,
+            "paused": row['paused'] or 0,
+            "idle": running == 0
+        }
+
+    def cancel_requested(self, owner: str) -> Set[str]:
+        """
+        Get the running jobs of a process that should be cancelled.
+
+        Args:
+            owner (str): ID of the process
+
+        Returns:
+            Set[str]: Job IDs
+        """
+        return {row['id'] for row in self.db.connect().execute(
+            "SELECT id FROM jobs WHERE owner = ? AND status = 'running' AND cancel_requested = 1", (owner,)
+        )}
+
+    def record_state(self, job) -> None:
+        """
+        Publish the live state of a running job for other processes.
+
+        Args:
+            job (Job): The job
+        """
+        self._write("UPDATE jobs SET state = ?, log_file = COALESCE(?, log_file) WHERE id = ?",
+                    (json.dumps(job.to_dict()), job.log_file, job.id))
+
+    def _write(self, sql: str, params: tuple) -> None:
+        if self.writer is not None:
+            self.writer.execute(sql, params)
+            return
+        conn = self.db.connect()
+        with conn:
+            conn.execute(sql, params)
+
+    def append_line(self, job_id: str, line: str, is_error: bool = False) -> None:
+        """
+        Append one line of worker output.
+
+        Args:
+            job_id (str): The job ID
+            line (str): Output line
+            is_error (bool): Whether the line came from stderr
+        """
+        self._write("INSERT INTO job_output (job_id, line, is_error, created_at) VALUES (?, ?, ?, ?)",
+                    (job_id, line, 1 if is_error else 0, time.time()))
+
+    def append_event(self, job_id: str, event: Dict[str, Any]) -> None:
+        """
+        Append one structured worker event.
+
+        Args:
+            job_id (str): The job ID
+            event (Dict[str, Any]): The event
+        """
+        self._write("INSERT INTO job_output (job_id, event, created_at) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(event), time.time()))
+
+    def read_output(self, job_id: str, after: int = 0, limit: int = 1000,
+                    include_events: bool = True) -> List[Dict[str, Any]]:
+        """
+        Read output appended after a sequence number.
+
+        Args:
+            job_id (str): The job ID
+            after (int): Last sequence number already seen
+            limit (int): Maximum number of items
+            include_events (bool): Whether to include structured events
+
+        Returns:
+            List[Dict[str, Any]]: Items with seq and either line/is_error or event
+        """
+        where = "" if include_events else " AND event IS NULL"
+        output = []
+        for row in self.db.connect().execute(
+            f"SELECT * FROM job_output WHERE job_id = ? AND seq > ?{where} ORDER BY seq LIMIT ?",
+            (job_id, after, limit)
+        ):
+            if row['event'] is not None:
+                output.append({"seq": row['seq'], "event": json.loads(row['event'])})
+            else:
+                output.append({"seq": row['seq'], "line": row['line'], "is_error": bool(row['is_error'])})
+        return output
+
+    def prune_output(self, before: float) -> int:
+        """
+        Delete the output of jobs that finished before a time.
+
+        Args:
+            before (float): Epoch seconds
+
+        Returns:
+            int: Number of deleted rows
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute(
+                "DELETE FROM job_output WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)", (before,)
+            ).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's queue state, with the live state of a running job merged in.
+
+        Args:
+            job_id (str): The job ID
+
+        Returns:
+            Optional[Dict[str, Any]]: The job, or None if unknown
+        """
+        row = self.db.connect().execute(
+            "SELECT id, kind, status, created_at, started_at, finished_at, return_code, stars_funded, "
+            "stars_spent, log_file, priority, tenant, state FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['priority'] = PRIORITY_NAMES.get(job['priority'], job['priority'])
+        raw_state = job.pop('state')
+        state = json.loads(raw_state) if raw_state else {}
+        # The row is authoritative for the lifecycle; the state adds progress details
+        state.update({key: value for key, value in job.items() if value is not None or key not in state})
+        if state['status'] == 'queued':
+            state['queue_position'] = self.position(job_id)
+        return state
+
+    def latest_job_id(self, status: Optional[str] = None) -> Optional[str]:
+        """
+        Get the most recently created job.
+
+        Args:
+            status (Optional[str]): Only consider jobs with this status
+
+        Returns:
+            Optional[str]: The job ID, or None if there are no jobs
+        """
+        if status:
+            row = self.db.connect().execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT 1", (status,)
+            ).fetchone()
+        else:
+            row = self.db.connect().execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row['id'] if row else None
+
+    def latest_log_file(self) -> Optional[str]:
+        """
+        Get the log file of the most recent job that reported one.
+
+        Returns:
+            Optional[str]: Log file path, or None
+        """
+        row = self.db.connect().execute(
+            "SELECT log_file FROM jobs WHERE log_file IS NOT NULL ORDER BY created_at DESC LIMIT 1"
+        ).fetchone()
+        return row['log_file'] if row else None
+
+    def position(self, job_id: str) -> int:
+        """
+        Get the number of queued jobs ahead of a job.
+
+        Counts queued jobs of a higher priority class and older jobs of the
+        same class. Round robin between tenants and per-connection limits
+        can change the actual order, so this is an estimate.
+
+        Args:
+            job_id (str): The job ID
+
+        Returns:
+            int: Jobs ahead in the queue
+        """
+        return self.db.connect().execute(
+            "SELECT COUNT(*) FROM jobs q, (SELECT priority, created_at FROM jobs WHERE id = ?) j "
+            "WHERE q.status = 'queued' AND (q.priority < j.priority OR "
+            "(q.priority = j.priority AND q.created_at < j.created_at))", (job_id,)
+        ).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count unfinished jobs by status.
+
+        Returns:
+            Dict[str, int]: Counts for 'queued' and 'running'
+        """
+        counts = {status: 0 for status in ACTIVE_STATUSES}
+        for row in self.db.connect().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+        ):
+            counts[row['status']] = row['n']
+        return counts
+
+    def overview(self) -> Dict[str, Any]:
+        """
+        Describe the queue depth by priority class, tenant and business connection.
+
+        Returns:
+            Dict[str, Any]: Limits, totals and per-class, per-tenant and per-connection counts
+        """
+        now = time.time()
+        rows = self.db.connect().execute(
+            "SELECT status, priority, tenant, business_connection_id, created_at FROM jobs "
+            "WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        classes = {name: {"queued": 0, "running": 0, "oldest_wait": None} for name in PRIORITY_NAMES.values()}
+        tenants: Dict[str, Dict[str, Any]] = {}
+        connections: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            status = row['status']
+            entry = classes.setdefault(PRIORITY_NAMES.get(row['priority'], str(row['priority'])),
+                                       {"queued": 0, "running": 0, "oldest_wait": None})
+            entry[status] += 1
+            if status == 'queued':
+                wait = round(now - row['created_at'], 3)
+                entry['oldest_wait'] = max(entry['oldest_wait'] or 0, wait)
+            tenant = row['tenant'] or ANONYMOUS_TENANT
+            tenants.setdefault(tenant, {"tenant": tenant, "weight": self.scheduler.weight(tenant),
+                                        "queued": 0, "running": 0})[status] += 1
+            connection = row['business_connection_id']
+            connections.setdefault(connection, {"business_connection_id": connection,
+                                                "queued": 0, "running": 0})[status] += 1
+        for connection in connections.values():
+            # Queued jobs of a saturated connection wait even when slots are free
+            connection['saturated'] = connection['running'] >= self.scheduler.max_per_connection
+        return {
+            "draining": self.is_draining(),
+            "max_running": self.max_running,
+            "max_per_connection": self.scheduler.max_per_connection,
+            "queued": sum(entry['queued'] for entry in classes.values()),
+            "running": sum(entry['running'] for entry in classes.values()),
+            "classes": classes,
+            "tenants": sorted(tenants.values(), key=lambda item: item['tenant']),
+            "connections": sorted(connections.values(), key=lambda item: str(item['business_connection_id']))
+        }
+
+    def is_log_active(self, filename: str) -> bool:
+        """
+        Check whether a log file belongs to a running job.
+
+        Args:
+            filename (str): Log file name
+
+        Returns:
+            bool: True while the job writing the log runs
+        """
+        return self.db.connect().execute(
+            "SELECT 1 FROM log_files f JOIN jobs j ON j.id = f.job_id WHERE f.filename = ? AND j.status = 'running'",
+            (filename,)
+        ).fetchone() is not None
+
+    def bump_inventory_generation(self, cache_key: str) -> None:
+        """
+        Tell every process that a business account's inventory changed.
+
+        Args:
+            cache_key (str): Inventory cache key
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO inventory_generations (cache_key, generation) VALUES (?, 1) "
+                "ON CONFLICT(cache_key) DO UPDATE SET generation = generation + 1", (cache_key,)
+            )
+
+    def inventory_generation(self, cache_key: str) -> int:
+        """
+        Get the inventory generation of a business account.
+
+        Args:
+            cache_key (str): Inventory cache key
+
+        Returns:
+            int: Generation, 0 if it never changed
+        """
+        row = self.db.connect().execute(
+            "SELECT generation FROM inventory_generations WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row['generation'] if row else 0
+
+
+class JobDispatcher:
+    """
+    Per-process loop that claims queued jobs and supervises the ones it runs.
+
+    Args:
+        queue (JobQueue): Shared queue
+        launch (Callable): Starts a claimed job row and returns a handle with
+            cancel(force=False), pause() and resume()
+        owner (str): ID of this process
+        poll_interval (float): Seconds between queue polls
+        output_retention (float): Seconds job output is kept after a job finishes
+    """
+
+    def __init__(self, queue: JobQueue, launch: Callable[[Dict[str, Any]], Any], owner: Optional[str] = None,
+                 poll_interval: float = 0.5, output_retention: float = 7 * 86400):
+        self.queue = queue
+        self.launch = launch
+        self.owner = owner or make_owner_id()
+        self.poll_interval = poll_interval
+        self.output_retention = output_retention
+        self._running: Dict[str, Any] = {}
+        # Jobs being launched, and those among them that already finished
+        self._launching: Set[str] = set()
+        self._finished_early: Set[str] = set()
+        # Strongest cancel request forwarded per job, and jobs told to pause
+        self._cancelling: Dict[str, int] = {}
+        self._paused: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    def start(self) -> None:
+        """Start the dispatcher thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        """Poll the queue now, e.g. right after enqueuing a job."""
+        self._wake.set()
+
+    def finished(self, job_id: str) -> None:
+        """
+        Forget a job this process ran and look for the next one.
+
+        Args:
+            job_id (str): The job ID
+        """
+        with self._lock:
+            if job_id in self._launching:
+                # The worker exited before launch() returned its handle
+                self._finished_early.add(job_id)
+            self._running.pop(job_id, None)
+            self._cancelling.pop(job_id, None)
+            self._paused.discard(job_id)
+        self.wake()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Job dispatcher error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def poll(self) -> None:
+        """Run one supervision and claim cycle."""
+        self.queue.heartbeat(self.owner)
+        self.queue.reap_stale()
+
+        # Forward each request to the worker once, when it first appears
+        for job_id, requests in self.queue.control_requests(self.owner).items():
+            cancel = requests['cancel_requested']
+            paused = bool(requests['pause_requested'])
+            with self._lock:
+                handle = self._running.get(job_id)
+                if handle is None:
+                    continue
+                if cancel > self._cancelling.get(job_id, 0):
+                    self._cancelling[job_id] = cancel
+                    action = "force" if cancel >= CANCEL_FORCE else "cancel"
+                elif not cancel and paused != (job_id in self._paused):
+                    if paused:
+                        self._paused.add(job_id)
+                        action = "pause"
+                    else:
+                        self._paused.discard(job_id)
+                        action = "resume"
+                else:
+                    continue
+            if action == "force":
+                handle.cancel(force=True)
+            elif action == "cancel":
+                handle.cancel()
+            elif action == "pause":
+                handle.pause()
+            else:
+                handle.resume()
+
+        while True:
+            row = self.queue.claim_next(self.owner)
+            if row is None:
+                break
+            with self._lock:
+                self._launching.add(row['id'])
+            try:
+                handle = self.launch(row)
+            except Exception as e:
+                logger.error(f"Failed to launch job {row['id']}: {str(e)}")
+                self.queue.mark_failed(row['id'], f"Failed to start process: {str(e)}")
+                handle = None
+            with self._lock:
+                self._launching.discard(row['id'])
+                if row['id'] in self._finished_early:
+                    self._finished_early.discard(row['id'])
+                elif handle is not None:
+                    self._running[row['id']] = handle
+
+        now = time.time()
+        if now - self._last_prune > 3600:
+            self._last_prune = now
+            self.queue.prune_output(now - self.output_retention)
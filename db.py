@@ -0,0 +1,166 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from queue import Empty, Queue
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+
+class Database:
+    """
+    Thread-local SQLite connections to one database file in WAL mode.
+
+    WAL lets the web app's request threads read while a worker callback is
+    writing, and the busy timeout covers brief write contention between
+    threads or processes sharing the file.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening it on first use.
+
+        Returns:
+            sqlite3.Connection: Connection with Row factory and WAL enabled
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._local.conn = conn
+        return conn
+
+    def executescript(self, script: str) -> None:
+        """
+        Run a schema script, e.g. CREATE TABLE IF NOT EXISTS statements.
+
+        Args:
+            script (str): SQL script
+        """
+        conn = self.connect()
+        conn.executescript(script)
+        conn.commit()
+
+
+class WriteBehind:
+    """
+    Runs database writes on one background thread, in the order they were
+    queued, for callers that must not wait on the write lock, such as the
+    output multiplexer thread.
+
+    Queued statements are committed a batch per transaction: the thread
+    waits up to ``interval`` seconds after the first one for more to
+    arrive. Queued calls (e.g. store methods that commit on their own) run
+    between the batches. A batch that cannot be written is retried, then
+    dropped with an error log, like a failed call.
+
+    Args:
+        database (Database): Database the statements are written to
+        interval (float): Seconds a batch is held open for more statements
+        max_batch (int): Statements per transaction
+        retries (int): Attempts to write a batch before it is dropped
+    """
+
+    def __init__(self, database: Database, interval: float = 0.05, max_batch: int = 1000, retries: int = 3):
+        self.db = database
+        self.interval = interval
+        self.max_batch = max_batch
+        self.retries = retries
+        self._queue: Queue = Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> None:
+        """
+        Queue one statement.
+
+        Args:
+            sql (str): SQL statement
+            params (Sequence[Any]): Its parameters
+        """
+        self._put(("execute", sql, tuple(params)))
+
+    def call(self, action: Callable, *action_args) -> None:
+        """
+        Queue a call to run on the writer thread after the writes queued before it.
+
+        Args:
+            action (Callable): Function to call; exceptions are logged
+            *action_args: Arguments for the function
+        """
+        self._put(("call", action, action_args))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far was written. Must not be called
+        from a queued call.
+
+        Args:
+            timeout (Optional[float]): Maximum time to wait in seconds
+
+        Returns:
+            bool: False on timeout
+        """
+        done = threading.Event()
+        self.call(done.set)
+        return done.wait(timeout)
+
+    def _put(self, item: Tuple) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+                self._thread.start()
+        self._queue.put(item)
+
+    def _loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            if items[0][0] == "execute":
+                # Let a batch build up while a worker is writing lines
+                time.sleep(self.interval)
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            statements: List[Tuple[str, Tuple]] = []
+            for kind, target, args in items:
+                if kind == "execute":
+                    statements.append((target, args))
+                    continue
+                self._write(statements)
+                statements = []
+                try:
+                    target(*args)
+                except Exception as e:
+                    logger.error(f"Queued database call failed: {str(e)}")
+            self._write(statements)
+
+    def _write(self, statements: List[Tuple[str, Tuple]]) -> None:
+        if not statements:
+            return
+        for attempt in range(self.retries):
+            try:
+                conn = self.db.connect()
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                return
+            except sqlite3.Error as e:
+                error = e
+                time.sleep(self.interval * (attempt + 1))
+        logger.error(f"Dropped {len(statements)} queued database writes: {str(error)}")
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Any
+
+# Event types emitted by the transfer worker
+STEP_STARTED = "step_started"
+STEP_FINISHED = "step_finished"
+API_CALL = "api_call"
+BALANCE_OBSERVED = "balance_observed"
+FUNDING_STARTED = "funding_started"
+STARS_FUNDED = "stars_funded"
+GIFT_TRANSFERRED = "gift_transferred"
+ERROR = "error"
+INVENTORY = "inventory"
+GIFT_PAGE = "gift_page"
+LOG_FILE = "log_file"
+JOB_PAUSED = "job_paused"
+JOB_RESUMED = "job_resumed"
+JOB_CANCELLED = "job_cancelled"
+RECIPIENT_CHECKED = "recipient_checked"
+USERNAME_RESOLVED = "username_resolved"
+
+EVENT_TYPES = (
+    STEP_STARTED, STEP_FINISHED, API_CALL, BALANCE_OBSERVED, FUNDING_STARTED, STARS_FUNDED,
+    GIFT_TRANSFERRED, ERROR, INVENTORY, GIFT_PAGE, LOG_FILE, JOB_PAUSED, JOB_RESUMED, JOB_CANCELLED,
+    RECIPIENT_CHECKED, USERNAME_RESOLVED
+)
+
+# Error classes derived from Telegram API error descriptions
+ERROR_CLASSES = (
+    ("PAYMENT_REQUIRED", "payment_required"),
+    ("CHAT_NOT_FOUND", "chat_not_found"),
+    ("chat not found", "chat_not_found"),
+    ("Too Many Requests", "rate_limited"),
+    ("Forbidden", "forbidden"),
+    ("Bad Request", "bad_request"),
+    ("Request failed", "network"),
+    ("HTTP error", "network"),
+)
+
+
+def classify_error(description: str) -> str:
+    """
+    Map a Telegram API error description to a stable error class.
+
+    Args:
+        description (str): The error description
+
+    Returns:
+        str: The error class, or 'unknown'
+    """
+    for marker, error_class in ERROR_CLASSES:
+        if marker in description:
+            return error_class
+    return "unknown"
+
+
+class EventEmitter:
+    """Writes typed events as JSON lines to a dedicated file descriptor."""
+
+    def __init__(self, fd: Optional[int] = None):
+        self._stream = os.fdopen(fd, 'w', buffering=1) if fd is not None else None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._stream is not None
+
+    def emit(self, event_type: str, **fields: Any) -> None:
+        """
+        Emit one event; a no-op when no event channel was given.
+
+        Args:
+            event_type (str): One of EVENT_TYPES
+            **fields: Event payload
+        """
+        if self._stream is None:
+            return
+        event = {"type": event_type, "ts": time.time()}
+        event.update(fields)
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock:
+            try:
+                self._stream.write(line)
+            except (BrokenPipeError, ValueError):
+                # The reader went away; keep the worker running without events
+                self._stream = None
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[Dict]:
+        """
+        Emit step_started/step_finished around a block.
+
+        The yielded dict can be updated with 'ok' and extra fields to report on
+        step_finished; ok defaults to True unless the block raises.
+
+        Args:
+            name (str): Step name
+        """
+        result: Dict[str, Any] = {"ok": True}
+        self.emit(STEP_STARTED, step=name)
+        started = time.monotonic()
+        try:
+            yield result
+        except BaseException:
+            result["ok"] = False
+            raise
+        finally:
+            duration_ms = round((time.monotonic() - started) * 1000, 1)
+            self.emit(STEP_FINISHED, step=name, duration_ms=duration_ms, **result)
+
+
+def parse_event_line(line: str) -> Optional[Dict]:
+    """
+    Parse one event line, ignoring anything that is not a typed event.
+
+    Args:
+        line (str): A line read from the event channel
+
+    Returns:
+        Optional[Dict]: The event, or None if the line is not a valid event
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        event = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(event, dict) or event.get("type") not in EVENT_TYPES:
+        return None
+    return event
+
+
+class EventDecoder:
+    """Incrementally splits raw bytes from the event channel into events."""
+
+    def __init__(self):
+        self._pending = b''
+
+    def feed(self, data: bytes) -> List[Dict]:
+        """
+        Add bytes read from the channel and return the events they complete.
+
+        Args:
+            data (bytes): Bytes read from the channel
+
+        Returns:
+            List[Dict]: Complete events, in order
+        """
+        self._pending += data
+        lines = self._pending.split(b'\n')
+        self._pending = lines.pop()
+        events = []
+        for line in lines:
+            event = parse_event_line(line.decode('utf-8', errors='replace'))
+            if event is not None:
+                events.append(event)
+        return events
@@ -0,0 +1,183 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+_local = threading.local()
+
+
+class ConnectionContext:
+    """
+    Settings and shared resources of one business connection.
+
+    Connections that use the same bot token share one HTTP session and one
+    limit on concurrent API calls, because Telegram rate-limits per bot.
+
+    Args:
+        bot_token (str): Bot token
+        business_connection_id (str): Business connection ID
+        target_chat_id (int): Default recipient
+        star_count (int): Stars to fund per transfer when not known from the gift
+        bypass_business_check (bool): Allow bots that are not business bots
+        enable_redundant_transfer (bool): Fund the bot twice for reliability
+        http (Any): Object whose post() sends API requests (default: the requests module)
+        api_slots (Optional[ContextManager]): Held around each API request
+        label (Optional[str]): Prefix for step names and log lines; None for a single connection
+    """
+
+    def __init__(self, bot_token: str, business_connection_id: str, target_chat_id: int, star_count: int,
+                 bypass_business_check: bool = False, enable_redundant_transfer: bool = False,
+                 http: Any = requests, api_slots: Optional[ContextManager] = None, label: Optional[str] = None):
+        self.bot_token = bot_token
+        self.business_connection_id = business_connection_id
+        self.target_chat_id = target_chat_id
+        self.star_count = star_count
+        self.bypass_business_check = bypass_business_check
+        self.enable_redundant_transfer = enable_redundant_transfer
+        self.http = http
+        self.api_slots = api_slots if api_slots is not None else nullcontext()
+        self.label = label
+
+
+def current() -> Optional[ConnectionContext]:
+    """
+    Get the connection the calling thread works for.
+
+    Returns:
+        Optional[ConnectionContext]: The connection, or None outside a fan-out
+    """
+    return getattr(_local, "connection", None)
+
+
+@contextmanager
+def use_connection(connection: ConnectionContext) -> Iterator[ConnectionContext]:
+    """
+    Make a connection the calling thread's current one.
+
+    Args:
+        connection (ConnectionContext): The connection
+    """
+    previous = current()
+    _local.connection = connection
+    try:
+        yield connection
+    finally:
+        _local.connection = previous
+
+
+def build_contexts(base: ConnectionContext, connection_ids: List[str], tokens: Dict[str, str],
+                   max_calls_per_token: int = 2) -> List[ConnectionContext]:
+    """
+    Create the contexts of a fan-out.
+
+    Args:
+        base (ConnectionContext): Connection from the configuration; the others copy its settings
+        connection_ids (List[str]): Business connections, in order
+        tokens (Dict[str, str]): Bot token per business connection that does not use the base token
+        max_calls_per_token (int): Concurrent API calls allowed per bot token
+
+    Returns:
+        List[ConnectionContext]: One context per connection
+    """
+    sessions: Dict[str, Tuple[requests.Session, threading.BoundedSemaphore]] = {}
+    contexts = []
+    for connection_id in connection_ids:
+        token = tokens.get(connection_id) or base.bot_token
+        if token not in sessions:
+            sessions[token] = (requests.Session(), threading.BoundedSemaphore(max_calls_per_token))
+        session, slots = sessions[token]
+        contexts.append(ConnectionContext(
+            token, connection_id, base.target_chat_id, base.star_count,
+            base.bypass_business_check, base.enable_redundant_transfer,
+            http=session, api_slots=slots, label=connection_id
+        ))
+    return contexts
+
+
+def group_rows(rows: List[Tuple[int, Dict]], default_connection: str) -> Dict[str, List[Tuple[int, Dict]]]:
+    """
+    Split manifest rows by business connection.
+
+    Args:
+        rows (List[Tuple[int, Dict]]): (row_number, row) pairs
+        default_connection (str): Connection of rows without business_connection_id
+
+    Returns:
+        Dict[str, List[Tuple[int, Dict]]]: Rows per connection, connections in first-seen order
+    """
+    groups: Dict[str, List[Tuple[int, Dict]]] = {}
+    for row_number, row in rows:
+        groups.setdefault(row.get("business_connection_id") or default_connection, []).append((row_number, row))
+    return groups
+
+
+def run_fanout(contexts: List[ConnectionContext], work: Callable[[ConnectionContext], Dict[str, Any]],
+               max_workers: int, stop: Optional[Callable[[BaseException], bool]] = None) -> List[Dict[str, Any]]:
+    """
+    Run work for every connection concurrently, isolating their failures.
+
+    An exception fails only the connection that raised it. Exceptions for
+    which ``stop`` returns True (such as a cancellation) are re-raised once
+    every connection has finished.
+
+    Args:
+        contexts (List[ConnectionContext]): Connections
+        work (Callable): Runs one connection and returns its result
+        max_workers (int): Connections run at the same time
+        stop (Optional[Callable]): Tells which exceptions abort the whole fan-out
+
+    Returns:
+        List[Dict[str, Any]]: One result per connection, in order, each with
+            business_connection_id and ok, plus error when the work raised
+    """
+    def run_one(connection: ConnectionContext) -> Dict[str, Any]:
+        with use_connection(connection):
+            result = work(connection)
+        result.setdefault("ok", True)
+        result["business_connection_id"] = connection.business_connection_id
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="connection") as executor:
+        futures = [executor.submit(run_one, connection) for connection in contexts]
+
+    results = []
+    abort = None
+    for connection, future in zip(contexts, futures):
+        error = future.exception()
+        if error is None:
+            results.append(future.result())
+            continue
+        if stop and stop(error):
+            abort = abort or error
+        results.append({"business_connection_id": connection.business_connection_id, "ok": False,
+                        "error": str(error) or type(error).__name__})
+    if abort is not None:
+        raise abort
+    return results
+
+
+def parse_connection_tokens(spec: str) -> Dict[str, str]:
+    """
+    Parse bot tokens per business connection written as ``connection=token,...``.
+
+    Args:
+        spec (str): Token specification, e.g. from a request header
+
+    Returns:
+        Dict[str, str]: Bot token per business connection
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    tokens = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        connection_id, separator, token = item.partition("=")
+        if not separator or not connection_id.strip() or not token.strip():
+            raise ValueError("X-Connection-Tokens entries must look like business_connection_id=bot_token")
+        tokens[connection_id.strip()] = token.strip()
+    return tokens
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+import requests
+
+import events
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot"
+
+# Telegram method used to measure reachability
+PROBE_METHOD = "getMe"
+
+# Transfers needed in the window before the success rate can make the service unready
+MIN_SUCCESS_SAMPLES = 10
+
+
+class TelegramProbe:
+    """
+    Cached Telegram reachability.
+
+    Every API call a worker reports counts as an observation: any HTTP
+    response means Telegram is reachable. When no worker has called the API
+    for ``interval`` seconds, a background thread calls getMe itself, so
+    reading the state never waits on the network.
+
+    Args:
+        bot_token (str): Token used for the background getMe; an invalid
+            token still measures reachability, as Telegram answers 401
+        interval (float): Seconds an observation stays fresh
+        timeout (float): Timeout of the background getMe
+        request (Optional[Callable]): Replaces requests.post, for tests
+    """
+
+    def __init__(self, bot_token: str, interval: float = 30, timeout: float = 5,
+                 request: Optional[Callable[..., Any]] = None):
+        self.bot_token = bot_token
+        self.interval = interval
+        self.timeout = timeout
+        self.request = request or requests.post
+        self._lock = threading.Lock()
+        self._reachable: Optional[bool] = None
+        self._observed_at: Optional[float] = None
+        self._get_me_latency_ms: Optional[float] = None
+        self._get_me_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _record(self, reachable: bool, method: Optional[str], latency_ms: Optional[float]) -> None:
+        now = time.time()
+        with self._lock:
+            self._reachable = reachable
+            self._observed_at = now
+            if method == PROBE_METHOD and reachable and latency_ms is not None:
+                self._get_me_latency_ms = latency_ms
+                self._get_me_at = now
+
+    def observe(self, event: Dict) -> None:
+        """
+        Learn from a worker event; only api_call events are used.
+
+        Args:
+            event (Dict): Event parsed by events.parse_event_line
+        """
+        if event.get("type") != events.API_CALL:
+            return
+        reachable = bool(event.get("ok")) or event.get("status_code") is not None
+        self._record(reachable, event.get("method"), event.get("latency_ms"))
+
+    def check(self) -> bool:
+        """
+        Call getMe now.
+
+        Returns:
+            bool: True if Telegram answered
+        """
+        started = time.monotonic()
+        try:
+            self.request(f"{TELEGRAM_API_URL}{self.bot_token}/{PROBE_METHOD}", timeout=self.timeout)
+            reachable = True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Telegram API is not reachable: {str(e)}")
+            reachable = False
+        self._record(reachable, PROBE_METHOD, round((time.monotonic() - started) * 1000, 1))
+        return reachable
+
+    def start(self) -> None:
+        """Start the background check thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="telegram-probe", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._lock:
+                observed_at = self._observed_at
+            if observed_at is None or time.time() - observed_at >= self.interval:
+                self.check()
+                observed_at = time.time()
+            time.sleep(max(observed_at + self.interval - time.time(), 1.0))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the cached state.
+
+        Returns:
+            Dict[str, Any]: reachable (None before the first observation), the
+                observation age and the most recent getMe latency
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                "reachable": self._reachable,
+                "age_seconds": round(now - self._observed_at, 1) if self._observed_at else None,
+                "get_me_latency_ms": self._get_me_latency_ms,
+                "get_me_age_seconds": round(now - self._get_me_at, 1) if self._get_me_at else None
+            }
+
+
+def evaluate_readiness(telegram: Dict[str, Any], queue: Dict[str, Any], transfers: Dict[str, Any],
+                       max_queued: int, min_success_rate: float) -> Tuple[bool, List[str]]:
+    """
+    Decide whether this process should receive new work.
+
+    Args:
+        telegram (Dict[str, Any]): TelegramProbe.snapshot()
+        queue (Dict[str, Any]): JobQueue.drain_status()
+        transfers (Dict[str, Any]): Metrics.transfer_stats()
+        max_queued (int): Queue depth at which the service stops being ready
+        min_success_rate (float): Success rate below which the service stops being ready
+
+    Returns:
+        Tuple[bool, List[str]]: (ready, reasons it is not)
+    """
+    reasons = []
+    if queue["draining"]:
+        reasons.append("draining")
+    if telegram["reachable"] is False:
+        reasons.append("telegram_unreachable")
+    if queue["queued"] >= max_queued:
+        reasons.append("queue_full")
+    if transfers["transfers"] >= MIN_SUCCESS_SAMPLES and transfers["success_rate"] < min_success_rate:
+        reasons.append("low_success_rate")
+    return not reasons, reasons
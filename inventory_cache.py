@@ -0,0 +1,178 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Callable
+
+
+class CacheEntry:
+    """A cached gift inventory together with its validator."""
+
+    def __init__(self, gifts: List[Dict], fetched_at: float):
+        self.gifts = gifts
+        self.fetched_at = fetched_at
+        self.etag = compute_etag(gifts)
+
+
+class _Flight:
+    """An in-progress fetch that concurrent callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry: Optional[CacheEntry] = None
+        self.error: Optional[BaseException] = None
+
+
+def compute_etag(gifts: List[Dict]) -> str:
+    """
+    Compute a strong validator for a gift list.
+
+    Args:
+        gifts (List[Dict]): The gift list
+
+    Returns:
+        str: Hex digest identifying the list contents
+    """
+    payload = json.dumps(gifts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(bot_token: str, business_connection_id: str) -> str:
+    """
+    Build a cache key that does not keep the bot token in memory in clear text.
+
+    Args:
+        bot_token (str): Bot token used for the fetch
+        business_connection_id (str): Business connection the inventory belongs to
+
+    Returns:
+        str: Hashed cache key
+    """
+    raw = f"{bot_token}\0{business_connection_id}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class InventoryCache:
+    """
+    TTL cache for business account gift inventories.
+
+    Concurrent misses for the same key are coalesced so that only one caller
+    runs the fetch while the others wait for its result.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CacheEntry] = {}
+        self._flights: Dict[str, _Flight] = {}
+        # Bumped on invalidation so a fetch that started earlier is not stored
+        self._generations: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Return a fresh cache entry, or None if missing or expired.
+
+        Args:
+            key (str): Cache key from make_cache_key
+
+        Returns:
+            Optional[CacheEntry]: The cached entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._clock() - entry.fetched_at >= self.ttl:
+                del self._entries[key]
+                return None
+            return entry
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], List[Dict]]) -> CacheEntry:
+        """
+        Return the cached entry for key, fetching it once on a miss.
+
+        Args:
+            key (str): Cache key from make_cache_key
+            fetch (Callable[[], List[Dict]]): Loads the gift list; exceptions are
+                propagated to every caller waiting on the same fetch
+
+        Returns:
+            CacheEntry: The cached or freshly fetched entry
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                generation = self._generations.get(key, 0)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            gifts = fetch()
+            flight.entry = CacheEntry(gifts, self._clock())
+            with self._lock:
+                if self._generations.get(key, 0) == generation:
+                    self._entries[key] = flight.entry
+            return flight.entry
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def generation(self, key: str) -> int:
+        """
+        Get the invalidation counter of key, to pass to put later.
+
+        Args:
+            key (str): Cache key from make_cache_key
+
+        Returns:
+            int: Current generation
+        """
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def put(self, key: str, gifts: List[Dict], generation: int) -> Optional[CacheEntry]:
+        """
+        Store a gift list fetched outside get_or_fetch, unless key was
+        invalidated since the fetch started.
+
+        Args:
+            key (str): Cache key from make_cache_key
+            gifts (List[Dict]): The gift list
+            generation (int): generation(key) from before the fetch started
+
+        Returns:
+            Optional[CacheEntry]: The stored entry, or None if it was stale
+        """
+        entry = CacheEntry(gifts, self._clock())
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return None
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drop the cached entry for key.
+
+        Args:
+            key (str): Cache key from make_cache_key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from typing import Callable, Optional, Set
+
+# Commands the web app sends to a running worker, one per line
+CANCEL = "cancel"
+PAUSE = "pause"
+RESUME = "resume"
+
+COMMANDS = (CANCEL, PAUSE, RESUME)
+
+# Exit code of a worker that stopped at a step boundary because it was cancelled
+EXIT_CANCELLED = 3
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint after the web app asked the worker to stop."""
+
+
+class ControlChannel:
+    """
+    Worker side of the control pipe.
+
+    A background thread reads commands from the pipe. The transfer pipeline
+    calls checkpoint() at step boundaries and between batch rows, so a
+    cancel never interrupts a step half-way, and a paused job keeps its
+    preflight and funding state while it waits.
+
+    Once the pipeline calls commit(), right before it moves stars to the
+    bot, checkpoints no longer stop the job unless they are marked
+    cancellable: the settlement, hold and transfer that the stars pay for
+    always run. They still wait while the job is paused. Batches mark the
+    checkpoints between rows as cancellable and report the stars left on
+    the bot instead.
+
+    Connections of a fan-out commit separately: commit(), checkpoint() and
+    sleep() take the label of the calling connection, so a cancel still
+    stops a connection that has not funded its bot while another one
+    finishes the transfer it paid for.
+
+    Args:
+        fd (Optional[int]): Read end of the control pipe; None disables control
+        on_pause (Optional[Callable]): Called with the step name when the job pauses
+        on_resume (Optional[Callable]): Called with the step name when the job resumes
+    """
+
+    def __init__(self, fd: Optional[int] = None, on_pause: Optional[Callable[[str], None]] = None,
+                 on_resume: Optional[Callable[[str], None]] = None):
+        self.on_pause = on_pause
+        self.on_resume = on_resume
+        self._cancelled = threading.Event()
+        self._committed: Set[Optional[str]] = set()
+        self._running = threading.Event()
+        self._running.set()
+        self._changed = threading.Condition()
+        if fd is not None:
+            threading.Thread(target=self._read, args=(fd,), name="control-channel", daemon=True).start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def committed(self) -> bool:
+        """True once any connection has committed."""
+        return bool(self._committed)
+
+    def commit(self, step: str, connection: Optional[str] = None) -> None:
+        """
+        Enter the part of the job that must finish once the bot is funded.
+
+        Args:
+            step (str): Name of the step about to move stars
+            connection (Optional[str]): Label of the fan-out connection; None for a single connection
+
+        Raises:
+            JobCancelled: If the job was cancelled before the connection committed
+        """
+        with self._changed:
+            if self._cancelled.is_set() and connection not in self._committed:
+                raise JobCancelled(step)
+            self._committed.add(connection)
+
+    def apply(self, command: str) -> None:
+        """
+        Apply one command.
+
+        Args:
+            command (str): One of COMMANDS; anything else is ignored
+        """
+        with self._changed:
+            if command == CANCEL:
+                self._cancelled.set()
+            elif command == PAUSE:
+                self._running.clear()
+            elif command == RESUME:
+                self._running.set()
+            self._changed.notify_all()
+
+    def _read(self, fd: int) -> None:
+        with os.fdopen(fd, 'r') as stream:
+            for line in stream:
+                self.apply(line.strip())
+
+    def sleep(self, seconds: float, cancellable: bool = False, connection: Optional[str] = None) -> bool:
+        """
+        Sleep, waking up early if the job is cancelled and may still stop.
+
+        Args:
+            seconds (float): Seconds to sleep
+            cancellable (bool): Wake up on cancel even after commit()
+            connection (Optional[str]): Label of the fan-out connection; None for a single connection
+
+        Returns:
+            bool: True if the job was cancelled and may still stop
+        """
+        if connection in self._committed and not cancellable:
+            time.sleep(seconds)
+            return False
+        # The connection may have committed while it slept
+        return self._cancelled.wait(seconds) and (cancellable or connection not in self._committed)
+
+    def checkpoint(self, step: str, cancellable: bool = False, connection: Optional[str] = None) -> None:
+        """
+        Stop here if the job was cancelled, or wait here while it is paused.
+
+        After commit(), a cancel only stops the job at cancellable
+        checkpoints; elsewhere it also ends a pause.
+
+        Args:
+            step (str): Name of the step about to run
+            cancellable (bool): Honor a cancel even after commit()
+            connection (Optional[str]): Label of the fan-out connection; None for a single connection
+
+        Raises:
+            JobCancelled: If the job was cancelled and may stop here
+        """
+        with self._changed:
+            stoppable = cancellable or connection not in self._committed
+            if self._cancelled.is_set() and stoppable:
+                raise JobCancelled(step)
+            if self._running.is_set() or self._cancelled.is_set():
+                return
+        if self.on_pause:
+            self.on_pause(step)
+        with self._changed:
+            self._changed.wait_for(lambda: self._running.is_set() or self._cancelled.is_set())
+            cancelled = self._cancelled.is_set()
+        if cancelled and stoppable:
+            raise JobCancelled(step)
+        if self.on_resume:
+            self.on_resume(step)
+
+
+def send_command(fd: int, command: str) -> bool:
+    """
+    Write one command to a worker's control pipe.
+
+    Args:
+        fd (int): Write end of the control pipe
+        command (str): One of COMMANDS
+
+    Returns:
+        bool: False if the worker has already closed the pipe
+    """
+    try:
+        os.write(fd, (command + "\n").encode("ascii"))
+        return True
+    except OSError:
+        return False
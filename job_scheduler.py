@@ -0,0 +1,165 @@
+import hashlib
+from typing import Dict, List, Optional, Any
+
+# Lower values run first
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+PRIORITY_NAMES = {value: name for name, value in PRIORITY_CLASSES.items()}
+
+# Single transfers are interactive, full runs sit in the middle and batch
+# campaigns soak up whatever capacity is left
+DEFAULT_PRIORITIES = {"transfer": "high", "run": "normal", "batch": "low"}
+
+# Tenant of requests that present no API key
+ANONYMOUS_TENANT = "anonymous"
+
+# Key of the scheduler's own virtual clock among the tenant virtual times
+SYSTEM_CLOCK = "*"
+
+
+def resolve_priority(kind: str, requested: Optional[str] = None) -> int:
+    """
+    Get the priority class of a new job.
+
+    Args:
+        kind (str): Job kind
+        requested (Optional[str]): Class name asked for by the client
+
+    Returns:
+        int: Priority value (lower runs first)
+
+    Raises:
+        ValueError: If the requested class is unknown
+    """
+    name = (requested or DEFAULT_PRIORITIES.get(kind, "normal")).strip().lower()
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITY_CLASSES)}")
+    return PRIORITY_CLASSES[name]
+
+
+def tenant_id(api_key: Optional[str]) -> str:
+    """
+    Derive the fair-share tenant of a request from its API key.
+
+    The key is hashed so it never reaches the database or /api/queue.
+
+    Args:
+        api_key (Optional[str]): Key from the X-API-Key header
+
+    Returns:
+        str: Short stable tenant ID
+    """
+    if not api_key:
+        return ANONYMOUS_TENANT
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """
+    Parse tenant weights written as ``tenant:weight,tenant:weight``.
+
+    Args:
+        spec (str): Weight specification; tenants are the IDs shown by /api/queue
+
+    Returns:
+        Dict[str, int]: Weight per tenant
+
+    Raises:
+        ValueError: If an entry is malformed or a weight is not positive
+    """
+    weights = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        tenant, separator, weight = item.rpartition(":")
+        if not separator or not tenant or not weight.isdigit() or int(weight) < 1:
+            raise ValueError(f"Invalid fair share weight: {item}")
+        weights[tenant.strip()] = int(weight)
+    return weights
+
+
+class FairScheduler:
+    """
+    Picks the next job to run from the queue.
+
+    Priority classes are strict: a queued job of a higher class always runs
+    before any job of a lower one. Within a class, tenants are served by
+    weighted round robin, so one client's large backlog does not delay
+    everyone else's jobs. Jobs of a business connection that already runs
+    ``max_per_connection`` jobs are skipped until one finishes.
+
+    Round robin state is a virtual time per tenant that advances by
+    1/weight for every job started (start-time fair queuing). The caller
+    stores it so it is shared between processes.
+
+    Args:
+        max_per_connection (int): Running jobs allowed per business connection
+        weights (Optional[Dict[str, int]]): Weight per tenant (default 1)
+    """
+
+    def __init__(self, max_per_connection: int = 1, weights: Optional[Dict[str, int]] = None):
+        self.max_per_connection = max_per_connection
+        self.weights = weights or {}
+
+    def weight(self, tenant: str) -> int:
+        """
+        Get the round robin weight of a tenant.
+
+        Args:
+            tenant (str): Tenant ID
+
+        Returns:
+            int: Weight
+        """
+        return self.weights.get(tenant, 1)
+
+    def select(self, queued: List[Dict[str, Any]], running: List[Dict[str, Any]],
+               virtual_times: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        """
+        Choose the job to start next.
+
+        Args:
+            queued (List[Dict[str, Any]]): Queued jobs, oldest first, with id,
+                priority, tenant and business_connection_id
+            running (List[Dict[str, Any]]): Running jobs with business_connection_id
+            virtual_times (Dict[str, float]): Virtual time per tenant
+
+        Returns:
+            Optional[Dict[str, Any]]: The job, or None if nothing may start
+        """
+        busy: Dict[str, int] = {}
+        for job in running:
+            connection = job.get("business_connection_id")
+            busy[connection] = busy.get(connection, 0) + 1
+
+        eligible = [job for job in queued
+                    if busy.get(job.get("business_connection_id"), 0) < self.max_per_connection]
+        if not eligible:
+            return None
+
+        best_class = min(job["priority"] for job in eligible)
+        # Oldest job of each tenant in the best class
+        heads: Dict[str, Dict[str, Any]] = {}
+        for job in eligible:
+            if job["priority"] == best_class:
+                heads.setdefault(job["tenant"] or ANONYMOUS_TENANT, job)
+
+        # Idle tenants start at the system clock, so they cannot bank credit
+        clock = virtual_times.get(SYSTEM_CLOCK, 0.0)
+        # Ties go to the tenant whose job has waited longest
+        tenant = min(heads, key=lambda name: (max(virtual_times.get(name, 0.0), clock), heads[name]["created_at"]))
+        return heads[tenant]
+
+    def advance(self, tenant: str, virtual_times: Dict[str, float]) -> Dict[str, float]:
+        """
+        Compute the virtual times after one of a tenant's jobs starts.
+
+        Args:
+            tenant (str): Tenant whose job starts
+            virtual_times (Dict[str, float]): Virtual time per tenant
+
+        Returns:
+            Dict[str, float]: New virtual times for the tenant and the system clock
+        """
+        start = max(virtual_times.get(tenant, 0.0), virtual_times.get(SYSTEM_CLOCK, 0.0))
+        return {tenant: start + 1.0 / self.weight(tenant), SYSTEM_CLOCK: start}
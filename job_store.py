@@ -0,0 +1,222 @@
+import json
+import time
+from typing import Dict, List, Optional, Any, Tuple
+
+from db import Database
+
+# Parameters that must never be persisted
+SECRET_PARAMS = ('BOT_TOKEN', 'bot_token', 'API_KEY', 'api_key')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    business_connection_id TEXT,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    return_code INTEGER,
+    stars_funded INTEGER NOT NULL DEFAULT 0,
+    stars_spent INTEGER NOT NULL DEFAULT 0,
+    log_file TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at);
+
+CREATE TABLE IF NOT EXISTS job_transfers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    gift_id TEXT,
+    recipient TEXT,
+    stars INTEGER NOT NULL DEFAULT 0,
+    ok INTEGER NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transfers_job ON job_transfers(job_id);
+CREATE INDEX IF NOT EXISTS idx_transfers_recipient ON job_transfers(recipient, created_at);
+CREATE INDEX IF NOT EXISTS idx_transfers_gift ON job_transfers(gift_id, created_at);
+"""
+
+
+def strip_secrets(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Drop credentials from job parameters before they are persisted.
+
+    Args:
+        params (Dict[str, Any]): Job parameters
+
+    Returns:
+        Dict[str, Any]: Parameters without secrets
+    """
+    return {key: value for key, value in params.items() if key not in SECRET_PARAMS}
+
+
+class JobStore:
+    """Persistent history of transfer jobs and their individual transfers."""
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def record_started(self, job) -> None:
+        """
+        Insert a newly started job.
+
+        Args:
+            job (Job): The job
+        """
+        params = strip_secrets(job.params)
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, business_connection_id, params, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.status, params.get('business_connection_id'),
+                 json.dumps(params), job.created_at)
+            )
+
+    def record_transfer(self, job_id: str, transfer: Dict[str, Any]) -> None:
+        """
+        Append one transfer outcome as soon as the worker reports it.
+
+        Args:
+            job_id (str): The job ID
+            transfer (Dict[str, Any]): Transfer with gift_id, chat_id, stars, ok and error
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO job_transfers (job_id, gift_id, recipient, stars, ok, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, transfer.get('gift_id'),
+                 str(transfer['chat_id']) if transfer.get('chat_id') is not None else None,
+                 transfer.get('stars', 0), 1 if transfer.get('ok') else 0,
+                 transfer.get('error'), time.time())
+            )
+
+    def record_finished(self, job) -> None:
+        """
+        Store the final outcome of a job.
+
+        Args:
+            job (Job): The finished job
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, return_code = ?, stars_funded = ?, "
+                "stars_spent = ?, log_file = ? WHERE id = ?",
+                (job.status, job.finished_at, job.return_code, job.stars_funded,
+                 job.stars_spent, job.log_file, job.id)
+            )
+
+    def query(self, status: Optional[str] = None, kind: Optional[str] = None,
+              recipient: Optional[str] = None, gift_id: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              page: int = 1, per_page: int = 50) -> Tuple[List[Dict], bool]:
+        """
+        Find jobs, most recent first.
+
+        When filtering by recipient or gift, each job carries the matching
+        transfers so the caller sees what happened to them.
+
+        Args:
+            status (Optional[str]): Job status
+            kind (Optional[str]): Job kind
+            recipient (Optional[str]): Recipient chat ID
+            gift_id (Optional[str]): Owned gift ID
+            since (Optional[float]): Earliest creation time (epoch seconds)
+            until (Optional[float]): Latest creation time (epoch seconds)
+            page (int): 1-based page number
+            per_page (int): Page size
+
+        Returns:
+            Tuple[List[Dict], bool]: (jobs, has_more)
+        """
+        conditions = []
+        values: List[Any] = []
+        if status:
+            conditions.append("j.status = ?")
+            values.append(status)
+        if kind:
+            conditions.append("j.kind = ?")
+            values.append(kind)
+        if since is not None:
+            conditions.append("j.created_at >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("j.created_at <= ?")
+            values.append(until)
+
+        transfer_conditions = []
+        transfer_values: List[Any] = []
+        if recipient:
+            transfer_conditions.append("t.recipient = ?")
+            transfer_values.append(str(recipient))
+        if gift_id:
+            transfer_conditions.append("t.gift_id = ?")
+            transfer_values.append(gift_id)
+        if transfer_conditions:
+            conditions.append(
+                "j.id IN (SELECT t.job_id FROM job_transfers t WHERE " + " AND ".join(transfer_conditions) + ")"
+            )
+            values.extend(transfer_values)
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        conn = self.db.connect()
+        rows = conn.execute(
+            f"SELECT * FROM jobs j {where} ORDER BY j.created_at DESC LIMIT ? OFFSET ?",
+            values + [per_page + 1, (page - 1) * per_page]
+        ).fetchall()
+
+        has_more = len(rows) > per_page
+        jobs = [self._job_from_row(row) for row in rows[:per_page]]
+
+        if transfer_conditions:
+            for job in jobs:
+                job["transfers"] = [
+                    self._transfer_from_row(row) for row in conn.execute(
+                        "SELECT * FROM job_transfers t WHERE t.job_id = ? AND " + " AND ".join(transfer_conditions)
+                        + " ORDER BY t.id",
+                        [job["id"]] + transfer_values
+                    )
+                ]
+        return jobs, has_more
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get one job with all of its transfers.
+
+        Args:
+            job_id (str): The job ID
+
+        Returns:
+            Optional[Dict]: The job, or None if unknown
+        """
+        conn = self.db.connect()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._job_from_row(row)
+        job["transfers"] = [
+            self._transfer_from_row(transfer)
+            for transfer in conn.execute("SELECT * FROM job_transfers WHERE job_id = ? ORDER BY id", (job_id,))
+        ]
+        return job
+
+    @staticmethod
+    def _job_from_row(row) -> Dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        # Encrypted credentials of a queued job never leave the server
+        job.pop("secret_config", None)
+        return job
+
+    @staticmethod
+    def _transfer_from_row(row) -> Dict[str, Any]:
+        transfer = dict(row)
+        transfer["ok"] = bool(transfer["ok"])
+        del transfer["job_id"]
+        return transfer
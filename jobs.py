@@ -0,0 +1,153 @@
+import time
+import secrets
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+import events
+
+
+def new_job_id() -> str:
+    """
+    Create a sortable job ID that stays unique for jobs started in the same second.
+    
+    Returns:
+        str: The job ID
+    """
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+
+
+class Job:
+    """State of one transfer job, built from the worker's event stream."""
+
+    def __init__(self, job_id: str, kind: str, params: Optional[Dict] = None):
+        self.id = job_id
+        self.kind = kind
+        self.params = params or {}
+        self.status = "running"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.return_code: Optional[int] = None
+        self.log_file: Optional[str] = None
+        self.current_step: Optional[str] = None
+        self.paused = False
+        self.steps: Dict[str, Dict] = {}
+        self.balance: Optional[int] = None
+        # Set once the worker starts moving stars and no longer stops on cancel
+        self.funding_started = False
+        self.stars_funded = 0
+        self.transfers: List[Dict] = []
+        self.errors: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def apply_event(self, event: Dict) -> Optional[Dict]:
+        """
+        Update the job state from one worker event.
+
+        Args:
+            event (Dict): Event parsed by events.parse_event_line
+
+        Returns:
+            Optional[Dict]: The transfer outcome recorded from this event, if any
+        """
+        event_type = event.get("type")
+        transfer = None
+        with self._lock:
+            if event_type == events.STEP_STARTED:
+                self.current_step = event.get("step")
+                self.steps[event.get("step")] = {"started_at": event.get("ts")}
+            elif event_type == events.STEP_FINISHED:
+                step = self.steps.setdefault(event.get("step"), {})
+                step.update({
+                    "duration_ms": event.get("duration_ms"),
+                    "ok": event.get("ok", True)
+                })
+                if self.current_step == event.get("step"):
+                    self.current_step = None
+            elif event_type == events.BALANCE_OBSERVED:
+                self.balance = event.get("amount")
+            elif event_type == events.FUNDING_STARTED:
+                self.funding_started = True
+            elif event_type == events.STARS_FUNDED:
+                self.stars_funded += event.get("star_count", 0)
+            elif event_type == events.GIFT_TRANSFERRED:
+                transfer = {
+                    "gift_id": event.get("gift_id"),
+                    "chat_id": event.get("chat_id"),
+                    "stars": event.get("stars", 0),
+                    "ok": True
+                }
+                self.transfers.append(transfer)
+            elif event_type == events.ERROR:
+                error = {
+                    "code": event.get("code"),
+                    "message": event.get("message"),
+                    "step": event.get("step")
+                }
+                self.errors.append(error)
+                if event.get("gift_id"):
+                    transfer = {
+                        "gift_id": event.get("gift_id"),
+                        "chat_id": event.get("chat_id"),
+                        "stars": 0,
+                        "ok": False,
+                        "error": event.get("code")
+                    }
+                    self.transfers.append(transfer)
+            elif event_type == events.LOG_FILE:
+                self.log_file = event.get("path")
+            elif event_type == events.JOB_PAUSED:
+                self.paused = True
+                self.current_step = None
+            elif event_type == events.JOB_RESUMED:
+                self.paused = False
+        return transfer
+
+    def finish(self, return_code: int, cancelled: bool = False) -> None:
+        """
+        Mark the job as finished.
+
+        Args:
+            return_code (int): The worker's exit code
+            cancelled (bool): Whether the worker was stopped on request
+        """
+        with self._lock:
+            self.return_code = return_code
+            self.finished_at = time.time()
+            self.current_step = None
+            self.paused = False
+            if cancelled:
+                self.status = "cancelled"
+            else:
+                self.status = "succeeded" if return_code == 0 else "failed"
+
+    @property
+    def stars_spent(self) -> int:
+        return sum(transfer["stars"] for transfer in self.transfers if transfer["ok"])
+
+    @property
+    def transfers_succeeded(self) -> int:
+        return sum(1 for transfer in self.transfers if transfer["ok"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the job state to a JSON-serializable dictionary"""
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "return_code": self.return_code,
+                "current_step": self.current_step,
+                "paused": self.paused,
+                "steps": dict(self.steps),
+                "balance": self.balance,
+                "stars_funded": self.stars_funded,
+                "stars_spent": self.stars_spent,
+                # Left on the bot, e.g. by a batch cancelled between rows
+                "stars_unspent": max(self.stars_funded - self.stars_spent, 0),
+                "transfers_succeeded": self.transfers_succeeded,
+                "transfers_failed": len(self.transfers) - self.transfers_succeeded,
+                "errors": list(self.errors[-20:])
+            }
@@ -0,0 +1,91 @@
+import sqlite3
+import time
+import urllib.parse
+
+from limits.storage import Storage
+
+from db import Database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_expires ON rate_limits(expires_at);
+"""
+
+# Expired counters are purged after this many increments
+PURGE_EVERY = 1000
+
+
+class SQLiteStorage(Storage):
+    """
+    Rate limit counters in a SQLite file shared by all processes on the host.
+
+    Registered for ``sqlite:///relative/path.db`` and
+    ``sqlite:////absolute/path.db`` storage URIs. Supports the fixed-window
+    strategy, which is Flask-Limiter's default.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # Like SQLAlchemy: three slashes for a relative path, four for an absolute one
+        path = urllib.parse.urlparse(uri).path[1:]
+        self.db = Database(path)
+        self.db.executescript(SCHEMA)
+        self._increments = 0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        conn = self.db.connect()
+        with conn:
+            count = conn.execute(
+                "INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, "
+                "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+                "RETURNING count",
+                (key, amount, now + expiry, now, now)
+            ).fetchone()[0]
+        self._increments += 1
+        if self._increments % PURGE_EVERY == 0:
+            with conn:
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        row = self.db.connect().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self.db.connect().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        try:
+            self.db.connect().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        conn = self.db.connect()
+        with conn:
+            return conn.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        conn = self.db.connect()
+        with conn:
+            conn.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
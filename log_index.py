@@ -0,0 +1,258 @@
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from db import Database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (
+    filename TEXT PRIMARY KEY,
+    job_id TEXT,
+    kind TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    line_count INTEGER,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_log_files_started ON log_files(started_at);
+CREATE INDEX IF NOT EXISTS idx_log_files_job ON log_files(job_id);
+CREATE INDEX IF NOT EXISTS idx_log_files_outcome_started ON log_files(outcome, started_at);
+"""
+
+# Where a log's content lives once the retention manager has processed it.
+# 'plain' logs are the file itself; otherwise storage names the codec,
+# stored_name is the compressed file or daily segment, and segment members
+# also have an offset and length.
+STORAGE_COLUMNS = (
+    ("storage", "TEXT NOT NULL DEFAULT 'plain'"),
+    ("stored_name", "TEXT"),
+    ("stored_offset", "INTEGER"),
+    ("stored_length", "INTEGER"),
+)
+
+# gift_transfer_log_YYYYMMDD_HHMMSS[_suffix].log
+LOG_NAME_PATTERN = re.compile(r'^gift_transfer_log_(\d{8}_\d{6})(?:_[0-9a-f]+)?\.log$')
+
+
+def parse_log_start(filename: str) -> Optional[float]:
+    """
+    Read the start time encoded in a run log's file name.
+
+    Args:
+        filename (str): Log file name
+
+    Returns:
+        Optional[float]: Epoch seconds, or None if the name has no timestamp
+    """
+    match = LOG_NAME_PATTERN.match(filename)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').timestamp()
+
+
+def count_lines(path: str, chunk_size: int = 1024 * 1024) -> int:
+    """
+    Count lines in a file without loading it into memory.
+
+    Args:
+        path (str): File path
+        chunk_size (int): Bytes read per chunk
+
+    Returns:
+        int: Number of newline characters
+    """
+    lines = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return lines
+            lines += chunk.count(b'\n')
+
+
+class LogIndex:
+    """Metadata for run log files, kept up to date as jobs write them."""
+
+    def __init__(self, database: Database, log_dir: str):
+        self.db = database
+        self.log_dir = log_dir
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        conn = self.db.connect()
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(log_files)")}
+        with conn:
+            for column, definition in STORAGE_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE log_files ADD COLUMN {column} {definition}")
+
+    def record_started(self, filename: str, job_id: Optional[str] = None, kind: Optional[str] = None,
+                       started_at: Optional[float] = None) -> None:
+        """
+        Register a log file as soon as its worker reports it.
+
+        Args:
+            filename (str): Log file name inside the log directory
+            job_id (Optional[str]): Job writing the log
+            kind (Optional[str]): Job kind
+            started_at (Optional[float]): Start time (defaults to now)
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO log_files (filename, job_id, kind, started_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET job_id = excluded.job_id, kind = excluded.kind",
+                (filename, job_id, kind, started_at if started_at is not None else time.time())
+            )
+
+    def record_finished(self, filename: str, outcome: str, finished_at: Optional[float] = None) -> None:
+        """
+        Store size, line count and outcome once the writer has exited.
+
+        Args:
+            filename (str): Log file name inside the log directory
+            outcome (str): Outcome of the job that wrote the log
+            finished_at (Optional[float]): End time (defaults to now)
+        """
+        path = os.path.join(self.log_dir, filename)
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        line_count = count_lines(path)
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "UPDATE log_files SET size = ?, line_count = ?, finished_at = ?, outcome = ? WHERE filename = ?",
+                (size, line_count, finished_at if finished_at is not None else time.time(), outcome, filename)
+            )
+
+    def sync(self) -> int:
+        """
+        Reconcile the index with the log directory.
+
+        Files written outside the web app (e.g. CLI runs) are added, and
+        entries whose files were removed are dropped.
+
+        Returns:
+            int: Number of files added to the index
+        """
+        if not os.path.isdir(self.log_dir):
+            return 0
+        on_disk = {name for name in os.listdir(self.log_dir) if name.endswith('.log')}
+        conn = self.db.connect()
+        # Compressed and compacted logs are tracked by the retention manager
+        indexed = {row['filename'] for row in conn.execute("SELECT filename FROM log_files WHERE storage = 'plain'")}
+
+        added = 0
+        with conn:
+            for filename in on_disk - indexed:
+                path = os.path.join(self.log_dir, filename)
+                stat = os.stat(path)
+                started_at = parse_log_start(filename)
+                conn.execute(
+                    "INSERT OR IGNORE INTO log_files (filename, size, line_count, started_at, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (filename, stat.st_size, count_lines(path),
+                     started_at if started_at is not None else stat.st_mtime, stat.st_mtime)
+                )
+                added += 1
+            for filename in indexed - on_disk:
+                conn.execute("DELETE FROM log_files WHERE filename = ?", (filename,))
+        return added
+
+    def mark_stored(self, filename: str, storage: str, stored_name: str,
+                    stored_offset: Optional[int] = None, stored_length: Optional[int] = None) -> None:
+        """
+        Record that a log's content moved to a compressed file or segment.
+
+        Args:
+            filename (str): Log file name
+            storage (str): Codec of the stored content ('none', 'gzip' or 'zstd')
+            stored_name (str): File holding the content, relative to the log directory
+            stored_offset (Optional[int]): Byte offset inside a segment
+            stored_length (Optional[int]): Byte length inside a segment
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "UPDATE log_files SET storage = ?, stored_name = ?, stored_offset = ?, stored_length = ? "
+                "WHERE filename = ?",
+                (storage, stored_name, stored_offset, stored_length, filename)
+            )
+
+    def remove(self, filenames: List[str]) -> None:
+        """
+        Drop entries whose content has been deleted.
+
+        Args:
+            filenames (List[str]): Log file names
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.executemany("DELETE FROM log_files WHERE filename = ?", [(name,) for name in filenames])
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Get every indexed log, oldest first.
+
+        Returns:
+            List[Dict[str, Any]]: All entries
+        """
+        return [dict(row) for row in self.db.connect().execute(
+            "SELECT * FROM log_files ORDER BY started_at, filename"
+        )]
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the metadata for one log file.
+
+        Args:
+            filename (str): Log file name
+
+        Returns:
+            Optional[Dict[str, Any]]: The entry, or None if not indexed
+        """
+        row = self.db.connect().execute("SELECT * FROM log_files WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, job_id: Optional[str] = None, outcome: Optional[str] = None, kind: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             page: int = 1, per_page: int = 50) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        List log files, most recent first.
+
+        Args:
+            job_id (Optional[str]): Only the log of this job
+            outcome (Optional[str]): Job outcome, e.g. 'succeeded' or 'failed'
+            kind (Optional[str]): Job kind
+            since (Optional[float]): Earliest start time (epoch seconds)
+            until (Optional[float]): Latest start time (epoch seconds)
+            page (int): 1-based page number
+            per_page (int): Page size
+
+        Returns:
+            Tuple[List[Dict[str, Any]], bool]: (entries, has_more)
+        """
+        conditions = []
+        values: List[Any] = []
+        for column, value in (("job_id", job_id), ("outcome", outcome), ("kind", kind)):
+            if value:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if since is not None:
+            conditions.append("started_at >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("started_at <= ?")
+            values.append(until)
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        rows = self.db.connect().execute(
+            f"SELECT * FROM log_files {where} ORDER BY started_at DESC, filename DESC LIMIT ? OFFSET ?",
+            values + [per_page + 1, (page - 1) * per_page]
+        ).fetchall()
+        return [dict(row) for row in rows[:per_page]], len(rows) > per_page
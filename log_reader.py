@@ -0,0 +1,134 @@
+import os
+import time
+import zlib
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+BLOCK_SIZE = 64 * 1024
+
+
+def tail_lines(path: str, count: int, block_size: int = BLOCK_SIZE) -> Tuple[List[str], int]:
+    """
+    Read the last lines of a file by seeking backwards from its end.
+
+    Only the blocks that contain the requested lines are read, so the cost
+    does not depend on the size of the file.
+
+    Args:
+        path (str): File path
+        count (int): Number of lines to return
+        block_size (int): Bytes read per backwards step
+
+    Returns:
+        Tuple[List[str], int]: (lines without line endings, end offset of the data read)
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        data = b''
+        # One extra newline is needed to know the first returned line is complete
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+
+    lines = data.split(b'\n')
+    if lines and lines[-1] == b'':
+        lines.pop()
+    return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines[-count:]] if count else [], end
+
+
+def read_chunks(path: str, offset: int = 0, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file from an offset to its current end.
+
+    Args:
+        path (str): File path
+        offset (int): Byte offset to start at
+        block_size (int): Bytes per chunk
+
+    Yields:
+        bytes: File content
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def follow(path: str, offset: int, is_active: Callable[[], bool], poll_interval: float = 0.5,
+           block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Stream a log that is still being written, like ``tail -f``.
+
+    The stream ends once the writer is no longer active and everything it
+    wrote has been sent.
+
+    Args:
+        path (str): File path
+        offset (int): Byte offset to start at
+        is_active (Callable[[], bool]): Whether the file is still being written
+        poll_interval (float): Seconds to wait for new data
+        block_size (int): Bytes per chunk
+
+    Yields:
+        bytes: New file content
+    """
+    while True:
+        # Check before reading so data written just before exit is not lost
+        active = is_active()
+        if os.path.getsize(path) < offset:
+            # The file was rotated or truncated; continue from its start
+            offset = 0
+        for chunk in read_chunks(path, offset, block_size):
+            offset += len(chunk)
+            yield chunk
+        if not active:
+            return
+        time.sleep(poll_interval)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Compress a byte stream into gzip format on the fly.
+
+    Args:
+        chunks (Iterable[bytes]): Uncompressed data
+        level (int): Compression level
+
+    Yields:
+        bytes: Gzip-encoded data
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def tail_stream_lines(chunks: Iterable[bytes], count: int) -> List[str]:
+    """
+    Keep the last lines of a stream that cannot be read backwards, e.g. a compressed log.
+
+    Args:
+        chunks (Iterable[bytes]): File content
+        count (int): Number of lines to return
+
+    Returns:
+        List[str]: Lines without line endings
+    """
+    lines = deque(maxlen=count)
+    partial = b''
+    for chunk in chunks:
+        parts = (partial + chunk).split(b'\n')
+        partial = parts.pop()
+        lines.extend(parts)
+    if partial:
+        lines.append(partial)
+    return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
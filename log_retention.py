@@ -0,0 +1,373 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any
+
+from log_index import LogIndex
+from log_reader import read_chunks, gzip_stream, BLOCK_SIZE
+
+try:
+    import zstandard
+except ImportError:  # Optional; gzip is used when it is not installed
+    zstandard = None
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+# Daily segment files live in this subdirectory of the log directory
+SEGMENT_DIR = "segments"
+
+CODEC_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+# A log nobody reported as finished is treated as closed after this long without writes
+STALE_AFTER = 3600
+
+
+def resolve_codec(name: str) -> str:
+    """
+    Pick the codec to compress with, falling back to gzip without zstandard.
+
+    Args:
+        name (str): Configured codec ('none', 'gzip' or 'zstd')
+
+    Returns:
+        str: Usable codec
+    """
+    if name == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed; compressing logs with gzip instead")
+        return "gzip"
+    return name
+
+
+def compress_stream(codec: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Compress a byte stream into one self-contained gzip member or zstd frame.
+
+    Members and frames can be concatenated, which is what daily segments rely on.
+
+    Args:
+        codec (str): Codec name
+        chunks (Iterable[bytes]): Uncompressed data
+
+    Yields:
+        bytes: Compressed data
+    """
+    if codec == "gzip":
+        yield from gzip_stream(chunks)
+    elif codec == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+
+def decompress_stream(codec: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Decompress data written by compress_stream.
+
+    Args:
+        codec (str): Codec name
+        chunks (Iterable[bytes]): Compressed data
+
+    Yields:
+        bytes: Uncompressed data
+    """
+    if codec == "gzip":
+        decompressor = zlib.decompressobj(31)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed logs")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+
+def run_files(log_dir: str, filename: str) -> List[str]:
+    """
+    List a run's log file and its rotated backups, oldest content first.
+
+    Args:
+        log_dir (str): Log directory
+        filename (str): Log file name
+
+    Returns:
+        List[str]: Existing paths, e.g. [name.log.2, name.log.1, name.log]
+    """
+    path = os.path.join(log_dir, filename)
+    backups = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        backups.append(f"{path}.{index}")
+        index += 1
+    files = list(reversed(backups))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def iter_stored(log_dir: str, entry: Dict[str, Any], block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Read the stored (possibly compressed) bytes of a processed log.
+
+    Args:
+        log_dir (str): Log directory
+        entry (Dict[str, Any]): Log index entry with a stored_name
+        block_size (int): Bytes per chunk
+
+    Yields:
+        bytes: Stored data
+    """
+    with open(os.path.join(log_dir, entry["stored_name"]), 'rb') as f:
+        f.seek(entry["stored_offset"] or 0)
+        remaining = entry["stored_length"]
+        while remaining is None or remaining > 0:
+            chunk = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def iter_log_content(log_dir: str, entry: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Read the uncompressed content of a log wherever it is stored.
+
+    Args:
+        log_dir (str): Log directory
+        entry (Dict[str, Any]): Log index entry
+
+    Yields:
+        bytes: Log content
+    """
+    if entry.get("stored_name"):
+        yield from decompress_stream(entry["storage"], iter_stored(log_dir, entry))
+    else:
+        for path in run_files(log_dir, entry["filename"]):
+            yield from read_chunks(path)
+
+
+class LogRetentionManager:
+    """
+    Background compression, compaction and deletion of closed run logs.
+
+    Each pass compresses closed logs, appending small ones to a daily segment
+    file whose offsets are kept in the log index so every run stays
+    retrievable, and then deletes the oldest logs until the age, size and
+    count limits hold. Runs in a segment are deleted together with it.
+    """
+
+    def __init__(self, log_index: LogIndex, max_age_days: int = 30, max_total_bytes: int = 0,
+                 max_files: int = 0, compression: str = "gzip", compact_below_bytes: int = 0,
+                 interval: float = 3600, is_active: Callable[[str], bool] = lambda filename: False,
+                 clock: Callable[[], float] = time.time):
+        self.index = log_index
+        self.log_dir = log_index.log_dir
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.compression = resolve_codec(compression)
+        self.compact_below_bytes = compact_below_bytes
+        self.interval = interval
+        self.is_active = is_active
+        self.clock = clock
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Run a pass now and then every interval on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Log retention pass failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Run one compression, compaction and deletion pass.
+
+        Returns:
+            Dict[str, Any]: Counts of compressed, compacted and deleted logs and bytes freed
+        """
+        with self._lock:
+            summary = {"compressed": 0, "compacted": 0, "deleted": 0, "freed_bytes": 0}
+            self.index.sync()
+            now = self.clock()
+
+            if self.compression != "none" or self.compact_below_bytes:
+                for entry in self.index.entries():
+                    if entry["stored_name"] or not self._is_closed(entry, now):
+                        continue
+                    try:
+                        outcome = self._store(entry)
+                        if outcome:
+                            summary[outcome] += 1
+                    except OSError as e:
+                        logger.error(f"Could not compress log {entry['filename']}: {str(e)}")
+
+            self._evict(now, summary)
+            self.last_run = dict(summary, at=now)
+            if summary["compressed"] or summary["compacted"] or summary["deleted"]:
+                logger.info(f"Log retention: {summary}")
+            return summary
+
+    def _is_closed(self, entry: Dict[str, Any], now: float) -> bool:
+        if self.is_active(entry["filename"]):
+            return False
+        if entry["finished_at"] is not None:
+            return True
+        path = os.path.join(self.log_dir, entry["filename"])
+        return os.path.exists(path) and os.path.getmtime(path) < now - STALE_AFTER
+
+    def _store(self, entry: Dict[str, Any]) -> Optional[str]:
+        """Compress one closed log; returns 'compacted', 'compressed' or None if left as is."""
+        sources = run_files(self.log_dir, entry["filename"])
+        if not sources:
+            return None
+        size = sum(os.path.getsize(path) for path in sources)
+
+        def content():
+            for path in sources:
+                yield from read_chunks(path)
+
+        extension = CODEC_EXTENSIONS[self.compression]
+        if size < self.compact_below_bytes:
+            day = datetime.fromtimestamp(entry["started_at"]).strftime('%Y%m%d')
+            stored_name = os.path.join(SEGMENT_DIR, f"gift_transfer_logs_{day}.segment{extension}")
+            os.makedirs(os.path.join(self.log_dir, SEGMENT_DIR), exist_ok=True)
+            with open(os.path.join(self.log_dir, stored_name), 'ab') as f:
+                offset = f.tell()
+                for chunk in compress_stream(self.compression, content()):
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+                length = f.tell() - offset
+            self.index.mark_stored(entry["filename"], self.compression, stored_name, offset, length)
+            outcome = "compacted"
+        elif self.compression != "none":
+            stored_name = entry["filename"] + extension
+            target = os.path.join(self.log_dir, stored_name)
+            with open(target + ".tmp", 'wb') as f:
+                for chunk in compress_stream(self.compression, content()):
+                    f.write(chunk)
+            os.replace(target + ".tmp", target)
+            self.index.mark_stored(entry["filename"], self.compression, stored_name)
+            outcome = "compressed"
+        else:
+            return None
+
+        for path in sources:
+            os.remove(path)
+        return outcome
+
+    def _evict(self, now: float, summary: Dict[str, Any]) -> None:
+        """Delete the oldest closed logs until the configured limits hold."""
+        entries = self.index.entries()
+        # Everything stored in one file is deleted together
+        units = defaultdict(list)
+        for entry in entries:
+            if entry["stored_name"] or self._is_closed(entry, now):
+                units[entry["stored_name"] or entry["filename"]].append(entry)
+
+        def newest(unit_entries):
+            return max(e["finished_at"] or e["started_at"] for e in unit_entries)
+
+        total_bytes = self.disk_usage()["bytes"]
+        total_runs = len(entries)
+        cutoff = now - self.max_age_days * 86400 if self.max_age_days else None
+
+        for name, unit_entries in sorted(units.items(), key=lambda item: newest(item[1])):
+            expired = cutoff is not None and newest(unit_entries) < cutoff
+            over_size = self.max_total_bytes and total_bytes > self.max_total_bytes
+            over_count = self.max_files and total_runs > self.max_files
+            if not (expired or over_size or over_count):
+                break
+            paths = ([os.path.join(self.log_dir, name)] if unit_entries[0]["stored_name"]
+                     else run_files(self.log_dir, name))
+            freed = 0
+            for path in paths:
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.index.remove([entry["filename"] for entry in unit_entries])
+            total_bytes -= freed
+            total_runs -= len(unit_entries)
+            summary["deleted"] += len(unit_entries)
+            summary["freed_bytes"] += freed
+
+    def disk_usage(self) -> Dict[str, int]:
+        """
+        Measure the files in the log directory and its segment directory.
+
+        Returns:
+            Dict[str, int]: Total bytes, file count and segment count
+        """
+        usage = {"bytes": 0, "files": 0, "segments": 0}
+        for directory, is_segment in ((self.log_dir, False), (os.path.join(self.log_dir, SEGMENT_DIR), True)):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    usage["bytes"] += entry.stat().st_size
+                    usage["files"] += 1
+                    if is_segment:
+                        usage["segments"] += 1
+        return usage
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize disk usage, storage and the configured limits.
+
+        Returns:
+            Dict[str, Any]: Statistics for the /api/logs/stats endpoint
+        """
+        entries = self.index.entries()
+        by_storage = defaultdict(int)
+        for entry in entries:
+            if not entry["stored_name"]:
+                by_storage["plain"] += 1
+            elif entry["stored_offset"] is not None:
+                by_storage["segment"] += 1
+            else:
+                by_storage[entry["storage"]] += 1
+        return {
+            "disk": self.disk_usage(),
+            "runs": len(entries),
+            "runs_by_storage": dict(by_storage),
+            "uncompressed_bytes": sum(entry["size"] or 0 for entry in entries),
+            "oldest_started_at": entries[0]["started_at"] if entries else None,
+            "newest_started_at": max(entry["started_at"] for entry in entries) if entries else None,
+            "compression": self.compression,
+            "limits": {
+                "max_age_days": self.max_age_days,
+                "max_total_bytes": self.max_total_bytes,
+                "max_files": self.max_files,
+                "compact_below_bytes": self.compact_below_bytes
+            },
+            "last_run": self.last_run
+        }
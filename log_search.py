@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+from queue import Queue
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from db import Database
+from log_index import LogIndex
+from log_retention import iter_log_content
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+# Long DEBUG payload dumps are cut to this many characters before indexing
+MAX_LINE_CHARS = 2000
+
+# Lines inserted per transaction while indexing
+BATCH_LINES = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    line_number INTEGER NOT NULL,
+    byte_offset INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_lines_file ON log_lines(filename, line_number);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS log_lines_fts USING fts5(
+    text, content='log_lines', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS log_lines_ai AFTER INSERT ON log_lines BEGIN
+    INSERT INTO log_lines_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS log_lines_ad AFTER DELETE ON log_lines BEGIN
+    INSERT INTO log_lines_fts(log_lines_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+
+-- How far each log has been indexed
+CREATE TABLE IF NOT EXISTS log_search_progress (
+    filename TEXT PRIMARY KEY,
+    byte_offset INTEGER NOT NULL,
+    line_count INTEGER NOT NULL
+);
+
+-- Deleting a log from the index (retention, missing file) drops its lines
+CREATE TRIGGER IF NOT EXISTS log_files_search_ad AFTER DELETE ON log_files BEGIN
+    DELETE FROM log_lines WHERE filename = old.filename;
+    DELETE FROM log_search_progress WHERE filename = old.filename;
+END;
+"""
+
+
+def build_match_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query that matches lines containing every term.
+
+    Each term is quoted so IDs like ``-1001234`` or codes like
+    ``BALANCE_TOO_LOW`` are matched literally instead of being parsed as
+    query syntax.
+
+    Args:
+        text (str): Search text
+
+    Returns:
+        str: FTS5 MATCH expression
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+class LogSearchIndex:
+    """
+    Incremental full-text index over run logs.
+
+    Logs are indexed on a background thread when they are scheduled. A log
+    that is still being written is re-read every poll interval from where
+    indexing stopped, so searches cover running jobs too.
+    """
+
+    def __init__(self, database: Database, log_index: LogIndex,
+                 is_active: Callable[[str], bool] = lambda filename: False, poll_interval: float = 2.0):
+        self.db = database
+        self.log_index = log_index
+        self.is_active = is_active
+        self.poll_interval = poll_interval
+        self.db.executescript(SCHEMA)
+        self._queue: Queue = Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the background indexing thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="log-search-indexer", daemon=True)
+            self._thread.start()
+
+    def schedule(self, filename: str) -> None:
+        """
+        Queue a log for (incremental) indexing.
+
+        Args:
+            filename (str): Log file name
+        """
+        with self._pending_lock:
+            if filename in self._pending:
+                return
+            self._pending.add(filename)
+        self._queue.put(filename)
+
+    def schedule_unindexed(self) -> int:
+        """
+        Queue every log whose content has not been fully indexed.
+
+        Returns:
+            int: Number of logs queued
+        """
+        progress = {row['filename']: row['byte_offset'] for row in self.db.connect().execute(
+            "SELECT filename, byte_offset FROM log_search_progress"
+        )}
+        queued = 0
+        for entry in self.log_index.entries():
+            if progress.get(entry['filename'], -1) < (entry['size'] or 0) or entry['finished_at'] is None:
+                self.schedule(entry['filename'])
+                queued += 1
+        return queued
+
+    def _loop(self) -> None:
+        while True:
+            filename = self._queue.get()
+            with self._pending_lock:
+                self._pending.discard(filename)
+            try:
+                self.index_log(filename)
+            except Exception as e:
+                logger.error(f"Failed to index log {filename}: {str(e)}")
+            if self.is_active(filename):
+                time.sleep(self.poll_interval)
+                self.schedule(filename)
+
+    def index_log(self, filename: str) -> int:
+        """
+        Index the complete lines of a log that were added since the last call.
+
+        Args:
+            filename (str): Log file name
+
+        Returns:
+            int: Number of lines indexed
+        """
+        entry = self.log_index.get(filename)
+        if entry is None:
+            return 0
+        conn = self.db.connect()
+        row = conn.execute("SELECT byte_offset, line_count FROM log_search_progress WHERE filename = ?",
+                           (filename,)).fetchone()
+        start, line_number = (row['byte_offset'], row['line_count']) if row else (0, 0)
+
+        position = 0
+        offset = start
+        partial = b''
+        batch: List[Tuple[str, int, int, str]] = []
+        indexed = 0
+
+        def flush():
+            with conn:
+                conn.executemany(
+                    "INSERT INTO log_lines (filename, line_number, byte_offset, text) VALUES (?, ?, ?, ?)", batch
+                )
+                conn.execute(
+                    "INSERT INTO log_search_progress (filename, byte_offset, line_count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(filename) DO UPDATE SET byte_offset = excluded.byte_offset, "
+                    "line_count = excluded.line_count",
+                    (filename, offset, line_number)
+                )
+            batch.clear()
+
+        for chunk in iter_log_content(self.log_index.log_dir, entry):
+            # Skip content indexed by earlier calls
+            if position + len(chunk) <= start:
+                position += len(chunk)
+                continue
+            if position < start:
+                chunk = chunk[start - position:]
+                position = start
+            position += len(chunk)
+
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                line_number += 1
+                text = line.decode('utf-8', errors='replace').rstrip('\r')
+                if text:
+                    batch.append((filename, line_number, offset, text[:MAX_LINE_CHARS]))
+                    indexed += 1
+                offset += len(line) + 1
+                if len(batch) >= BATCH_LINES:
+                    flush()
+
+        # A trailing partial line is indexed once the log is closed
+        if partial and not self.is_active(filename):
+            line_number += 1
+            batch.append((filename, line_number, offset,
+                          partial.decode('utf-8', errors='replace').rstrip('\r')[:MAX_LINE_CHARS]))
+            offset += len(partial)
+            indexed += 1
+        if batch or offset != start:
+            flush()
+        return indexed
+
+    def search(self, query: str, filename: Optional[str] = None, job_id: Optional[str] = None,
+               page: int = 1, per_page: int = 50) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Find log lines matching a query, newest runs first.
+
+        Args:
+            query (str): FTS5 MATCH expression (see build_match_query)
+            filename (Optional[str]): Only search this log
+            job_id (Optional[str]): Only search the log of this job
+            page (int): 1-based page number
+            per_page (int): Matches per page
+
+        Returns:
+            Tuple[List[Dict[str, Any]], bool]: (runs with their matching lines, has_more)
+
+        Raises:
+            sqlite3.OperationalError: If the query is not valid FTS5 syntax
+        """
+        conditions = ["log_lines_fts MATCH ?"]
+        values: List[Any] = [query]
+        if filename:
+            conditions.append("l.filename = ?")
+            values.append(filename)
+        if job_id:
+            conditions.append("f.job_id = ?")
+            values.append(job_id)
+
+        rows = self.db.connect().execute(
+            "SELECT l.filename, l.line_number, l.byte_offset, "
+            "snippet(log_lines_fts, 0, '[', ']', '...', 24) AS snippet, "
+            "f.job_id, f.kind, f.outcome, f.started_at "
+            "FROM log_lines_fts JOIN log_lines l ON l.id = log_lines_fts.rowid "
+            "JOIN log_files f ON f.filename = l.filename "
+            f"WHERE {' AND '.join(conditions)} "
+            "ORDER BY f.started_at DESC, l.filename DESC, l.line_number LIMIT ? OFFSET ?",
+            values + [per_page + 1, (page - 1) * per_page]
+        ).fetchall()
+
+        runs: List[Dict[str, Any]] = []
+        for row in rows[:per_page]:
+            if not runs or runs[-1]["filename"] != row["filename"]:
+                runs.append({
+                    "filename": row["filename"],
+                    "job_id": row["job_id"],
+                    "kind": row["kind"],
+                    "outcome": row["outcome"],
+                    "started_at": row["started_at"],
+                    "matches": []
+                })
+            runs[-1]["matches"].append({
+                "line": row["line_number"],
+                "offset": row["byte_offset"],
+                "snippet": row["snippet"]
+            })
+        return runs, len(rows) > per_page
@@ -0,0 +1,176 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Any, Tuple
+
+import events
+
+# Telegram method whose latency is reported as the transfer latency
+TRANSFER_METHOD = "transferGift"
+
+
+class RollingWindow:
+    """
+    Samples recorded during the last ``window`` seconds.
+
+    Args:
+        window (float): Seconds a sample is kept
+        max_samples (int): Oldest samples are dropped beyond this many
+    """
+
+    def __init__(self, window: float = 300, max_samples: int = 1000):
+        self.window = window
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        """
+        Record a sample.
+
+        Args:
+            value (float): The sample
+            now (Optional[float]): Monotonic time of the sample
+        """
+        self._samples.append((time.monotonic() if now is None else now, value))
+
+    def values(self, now: Optional[float] = None) -> List[float]:
+        """
+        Get the samples still inside the window, dropping expired ones.
+
+        Args:
+            now (Optional[float]): Monotonic time
+
+        Returns:
+            List[float]: Samples, oldest first
+        """
+        cutoff = (time.monotonic() if now is None else now) - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return [value for _, value in self._samples]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): Samples
+        fraction (float): Percentile as a fraction, e.g. 0.95
+
+    Returns:
+        Optional[float]: The percentile, or None without samples
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Gauge:
+    """Thread-safe count of things currently open, such as SSE connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self) -> None:
+        with self._lock:
+            self._value += 1
+
+    def dec(self) -> None:
+        with self._lock:
+            self._value -= 1
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Metrics:
+    """Process-wide counters aggregated from worker events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._api_calls: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "errors": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+        )
+        self._steps: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "failed": 0, "total_duration_ms": 0.0}
+        )
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._counters: Dict[str, int] = defaultdict(int)
+        # Recent transfer outcomes (1 ok, 0 failed) and transferGift latencies
+        self._transfer_outcomes = RollingWindow()
+        self._transfer_latency = RollingWindow()
+
+    def record_event(self, event: Dict) -> None:
+        """
+        Fold one worker event into the counters.
+
+        Args:
+            event (Dict): Event parsed by events.parse_event_line
+        """
+        event_type = event.get("type")
+        with self._lock:
+            if event_type == events.API_CALL:
+                stats = self._api_calls[event.get("method", "unknown")]
+                latency = float(event.get("latency_ms", 0))
+                stats["count"] += 1
+                stats["total_latency_ms"] += latency
+                stats["max_latency_ms"] = max(stats["max_latency_ms"], latency)
+                if not event.get("ok"):
+                    stats["errors"] += 1
+                elif event.get("method") == TRANSFER_METHOD:
+                    self._transfer_latency.add(latency)
+            elif event_type == events.STEP_FINISHED:
+                stats = self._steps[event.get("step", "unknown")]
+                stats["count"] += 1
+                stats["total_duration_ms"] += float(event.get("duration_ms", 0))
+                if not event.get("ok", True):
+                    stats["failed"] += 1
+            elif event_type == events.GIFT_TRANSFERRED:
+                self._counters["gifts_transferred"] += 1
+                self._counters["stars_spent"] += event.get("stars", 0)
+                self._transfer_outcomes.add(1)
+            elif event_type == events.STARS_FUNDED:
+                self._counters["stars_funded"] += event.get("star_count", 0)
+            elif event_type == events.ERROR:
+                self._errors[event.get("code", "unknown")] += 1
+                if event.get("gift_id") and event.get("step") == "transfer":
+                    self._transfer_outcomes.add(0)
+
+    def transfer_stats(self) -> Dict[str, Any]:
+        """
+        Summarize the transfers of the last few minutes.
+
+        Returns:
+            Dict[str, Any]: window_seconds, transfers, success_rate and
+                p95_latency_ms (None without samples)
+        """
+        with self._lock:
+            outcomes = self._transfer_outcomes.values()
+            latencies = self._transfer_latency.values()
+        return {
+            "window_seconds": self._transfer_outcomes.window,
+            "transfers": len(outcomes),
+            "success_rate": round(sum(outcomes) / len(outcomes), 3) if outcomes else None,
+            "p95_latency_ms": percentile(latencies, 0.95)
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable copy of all counters"""
+        with self._lock:
+            api_calls = {}
+            for method, stats in self._api_calls.items():
+                api_calls[method] = dict(stats)
+                api_calls[method]["avg_latency_ms"] = round(stats["total_latency_ms"] / stats["count"], 1) if stats["count"] else 0.0
+            steps = {}
+            for step, stats in self._steps.items():
+                steps[step] = dict(stats)
+                steps[step]["avg_duration_ms"] = round(stats["total_duration_ms"] / stats["count"], 1) if stats["count"] else 0.0
+            return {
+                "api_calls": api_calls,
+                "steps": steps,
+                "errors": dict(self._errors),
+                "counters": dict(self._counters)
+            }
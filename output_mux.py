@@ -0,0 +1,226 @@
+import os
+import selectors
+import subprocess
+import threading
+import logging
+from queue import Queue, Empty
+from typing import Callable, Dict, List, Optional
+
+from events import EventDecoder
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+# Stream kinds multiplexed for every worker
+STDOUT = "stdout"
+STDERR = "stderr"
+EVENTS = "events"
+
+# How often exited workers are polled once all their streams are closed
+POLL_INTERVAL = 0.1
+
+
+class WorkerHandlers:
+    """Callbacks invoked from the multiplexer thread for one worker."""
+
+    def __init__(self,
+                 on_line: Optional[Callable[[str, bool], None]] = None,
+                 on_event: Optional[Callable[[Dict], None]] = None,
+                 on_exit: Optional[Callable[[int], None]] = None):
+        self.on_line = on_line
+        self.on_event = on_event
+        self.on_exit = on_exit
+
+
+class WorkerHandle:
+    """A registered worker; done is set after on_exit has run."""
+
+    def __init__(self, process: subprocess.Popen, handlers: WorkerHandlers):
+        self.process = process
+        self.handlers = handlers
+        self.done = threading.Event()
+        self.returncode: Optional[int] = None
+        self.open_streams = 0
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Wait until the worker has exited and its output was fully dispatched.
+
+        Args:
+            timeout (Optional[float]): Maximum time to wait in seconds
+
+        Returns:
+            Optional[int]: The exit code, or None on timeout
+        """
+        self.done.wait(timeout)
+        return self.returncode
+
+
+class _Stream:
+    """Per-descriptor read state."""
+
+    def __init__(self, handle: WorkerHandle, kind: str):
+        self.handle = handle
+        self.kind = kind
+        self.pending = b''
+        self.decoder = EventDecoder() if kind == EVENTS else None
+
+
+class OutputMultiplexer:
+    """
+    Reads the output of every running worker from a single thread.
+
+    Workers' stdout, stderr and event pipes are registered with one selector;
+    complete lines and events are dispatched to the worker's handlers and
+    process exit is detected in the same loop, so the number of threads stays
+    constant however many workers run concurrently.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._pending: Queue = Queue()
+        self._exiting: List[WorkerHandle] = []
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+
+    def register(self, process: subprocess.Popen, handlers: WorkerHandlers,
+                 event_fd: Optional[int] = None) -> WorkerHandle:
+        """
+        Start multiplexing a worker's output.
+
+        The process must have been started with binary pipes. The multiplexer
+        takes ownership of the pipes and of event_fd.
+
+        Args:
+            process (subprocess.Popen): The worker process
+            handlers (WorkerHandlers): Callbacks for output, events and exit
+            event_fd (Optional[int]): Read end of the worker's event pipe
+
+        Returns:
+            WorkerHandle: Handle that can be waited on
+        """
+        handle = WorkerHandle(process, handlers)
+        streams = []
+        if process.stdout is not None:
+            streams.append((process.stdout.fileno(), STDOUT))
+        if process.stderr is not None:
+            streams.append((process.stderr.fileno(), STDERR))
+        if event_fd is not None:
+            streams.append((event_fd, EVENTS))
+        handle.open_streams = len(streams)
+
+        self._ensure_started()
+        self._pending.put((handle, streams))
+        self._wake()
+        return handle
+
+    def _ensure_started(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._selector.register(self._wake_read, selectors.EVENT_READ, None)
+                self._thread = threading.Thread(target=self._loop, name="output-mux")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            # The loop already has a wake-up pending
+            pass
+
+    def _loop(self) -> None:
+        while True:
+            timeout = POLL_INTERVAL if self._exiting else None
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    self._drain_wake()
+                    self._accept_pending()
+                else:
+                    self._read(key.fd, key.data)
+            self._reap()
+
+    def _drain_wake(self) -> None:
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _accept_pending(self) -> None:
+        while True:
+            try:
+                handle, streams = self._pending.get_nowait()
+            except Empty:
+                return
+            if not streams:
+                self._exiting.append(handle)
+            for fd, kind in streams:
+                os.set_blocking(fd, False)
+                self._selector.register(fd, selectors.EVENT_READ, _Stream(handle, kind))
+
+    def _read(self, fd: int, stream: _Stream) -> None:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._close(fd, stream)
+            return
+
+        if stream.decoder is not None:
+            for event in stream.decoder.feed(data):
+                self._call(stream.handle.handlers.on_event, event)
+            return
+
+        stream.pending += data
+        lines = stream.pending.split(b'\n')
+        stream.pending = lines.pop()
+        for line in lines:
+            self._dispatch_line(stream, line)
+
+    def _dispatch_line(self, stream: _Stream, line: bytes) -> None:
+        text = line.decode('utf-8', errors='replace').rstrip()
+        if text:
+            self._call(stream.handle.handlers.on_line, text, stream.kind == STDERR)
+
+    def _close(self, fd: int, stream: _Stream) -> None:
+        self._selector.unregister(fd)
+        if stream.pending:
+            self._dispatch_line(stream, stream.pending)
+            stream.pending = b''
+        if stream.kind == EVENTS:
+            os.close(fd)
+        handle = stream.handle
+        handle.open_streams -= 1
+        if handle.open_streams == 0:
+            self._exiting.append(handle)
+
+    def _reap(self) -> None:
+        still_running = []
+        for handle in self._exiting:
+            returncode = handle.process.poll()
+            if returncode is None:
+                still_running.append(handle)
+                continue
+            for pipe in (handle.process.stdout, handle.process.stderr):
+                if pipe is not None:
+                    pipe.close()
+            handle.returncode = returncode
+            self._call(handle.handlers.on_exit, returncode)
+            handle.done.set()
+        self._exiting = still_running
+
+    def _call(self, callback: Optional[Callable], *callback_args) -> None:
+        if callback is None:
+            return
+        try:
+            callback(*callback_args)
+        except Exception as e:
+            # A failing handler must not stop output for the other workers
+            logger.error(f"Output handler failed: {str(e)}")
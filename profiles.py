@@ -0,0 +1,334 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Any, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from config import AppConfig
+from db import Database
+from usernames import parse_chat_ref
+
+# Fields a profile stores; everything else comes from the server configuration
+PROFILE_FIELDS = ("BOT_TOKEN", "BUSINESS_CONNECTION_ID", "TARGET_CHAT_ID", "STAR_COUNT",
+                  "BYPASS_BUSINESS_CHECK", "ENABLE_REDUNDANT_TRANSFER")
+
+# Fields a request may override when it references a profile
+OVERRIDE_FIELDS = ("TARGET_CHAT_ID", "STAR_COUNT")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    secret TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class ProfileError(Exception):
+    """Raised when a profile is unknown, invalid or cannot be decrypted."""
+
+
+def load_secret_key(key: Optional[str], key_file: str) -> bytes:
+    """
+    Get the key that encrypts secrets at rest, creating a key file on first use.
+
+    Args:
+        key (Optional[str]): Fernet key from the configuration, if set
+        key_file (str): File that holds the generated key otherwise
+
+    Returns:
+        bytes: Fernet key
+    """
+    if key:
+        return key.encode("ascii")
+    if os.path.exists(key_file):
+        with open(key_file, "rb") as f:
+            return f.read().strip()
+    os.makedirs(os.path.dirname(key_file) or ".", exist_ok=True)
+    generated = Fernet.generate_key()
+    try:
+        # O_EXCL: if another process created the file first, use its key
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(key_file, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(generated)
+    return generated
+
+
+class SecretBox:
+    """
+    Authenticated encryption of JSON values with a Fernet key.
+
+    Args:
+        key (bytes): Fernet key
+    """
+
+    def __init__(self, key: bytes):
+        self._fernet = Fernet(key)
+
+    def encrypt(self, value: Any) -> str:
+        """
+        Encrypt a JSON-serializable value.
+
+        Args:
+            value (Any): The value
+
+        Returns:
+            str: Fernet token
+        """
+        return self._fernet.encrypt(json.dumps(value).encode("utf-8")).decode("ascii")
+
+    def decrypt(self, token: str) -> Any:
+        """
+        Decrypt a value encrypted by encrypt().
+
+        Args:
+            token (str): Fernet token
+
+        Returns:
+            Any: The value
+
+        Raises:
+            ProfileError: If the token was not made with this key or was modified
+        """
+        try:
+            return json.loads(self._fernet.decrypt(token.encode("ascii")))
+        except InvalidToken:
+            raise ProfileError("Stored secret cannot be decrypted with the configured key")
+
+
+def validate_profile(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate profile fields with AppConfig and normalize them.
+
+    Args:
+        config (Dict[str, Any]): Profile fields
+
+    Returns:
+        Dict[str, Any]: The validated fields
+
+    Raises:
+        ProfileError: If a field is missing or invalid
+    """
+    try:
+        validated = AppConfig(**{key: config[key] for key in PROFILE_FIELDS if key in config})
+    except Exception as e:
+        raise ProfileError(f"Validation error: {str(e)}")
+    return {key: getattr(validated, key) for key in PROFILE_FIELDS}
+
+
+def apply_overrides(config: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply per-request overrides to a profile's configuration.
+
+    Args:
+        config (Dict[str, Any]): Validated profile configuration
+        overrides (Dict[str, Any]): Values for OVERRIDE_FIELDS; None means not given
+
+    Returns:
+        Dict[str, Any]: A new configuration
+
+    Raises:
+        ProfileError: If an override is not a positive integer (or, for
+            TARGET_CHAT_ID, an @username)
+    """
+    result = dict(config)
+    for key in OVERRIDE_FIELDS:
+        value = overrides.get(key)
+        if value is None or value == "":
+            continue
+        if key == "TARGET_CHAT_ID":
+            try:
+                result[key] = parse_chat_ref(value)
+            except ValueError as e:
+                raise ProfileError(f"Validation error: {key} {str(e)}")
+            continue
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = 0
+        if number <= 0:
+            raise ProfileError(f"Validation error: {key} must be a positive integer")
+        result[key] = number
+    return result
+
+
+def summarize(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe a profile without its secrets.
+
+    Args:
+        config (Dict[str, Any]): Profile configuration
+
+    Returns:
+        Dict[str, Any]: Non-secret fields; the bot is identified by the ID part of its token
+    """
+    return {
+        "bot_id": config["BOT_TOKEN"].split(":", 1)[0],
+        "business_connection_id": config["BUSINESS_CONNECTION_ID"],
+        "target_chat_id": config["TARGET_CHAT_ID"],
+        "star_count": config["STAR_COUNT"],
+        "bypass_business_check": config["BYPASS_BUSINESS_CHECK"],
+        "enable_redundant_transfer": config["ENABLE_REDUNDANT_TRANSFER"]
+    }
+
+
+class ProfileStore:
+    """
+    Named server-side configurations with their secrets encrypted at rest.
+
+    Profiles are validated when they are saved. Decrypted profiles are
+    cached per process and keyed by version, so resolving a profile for a
+    request costs one indexed lookup. An update from another process bumps
+    the version and invalidates the cache.
+    """
+
+    def __init__(self, database: Database, box: SecretBox):
+        self.db = database
+        self.box = box
+        self.db.executescript(SCHEMA)
+        self._cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _public(row) -> Dict[str, Any]:
+        profile = {"id": row["id"], "name": row["name"], "version": row["version"],
+                   "created_at": row["created_at"], "updated_at": row["updated_at"]}
+        profile.update(json.loads(row["summary"]))
+        return profile
+
+    def create(self, name: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate and store a new profile.
+
+        Args:
+            name (str): Unique profile name
+            config (Dict[str, Any]): Profile fields (see PROFILE_FIELDS)
+
+        Returns:
+            Dict[str, Any]: The profile without secrets
+
+        Raises:
+            ProfileError: If the name is taken or a field is invalid
+        """
+        if not name or not name.strip():
+            raise ProfileError("Profile name is required")
+        validated = validate_profile(config)
+        profile_id = f"prf_{secrets.token_hex(6)}"
+        now = time.time()
+        conn = self.db.connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO profiles (id, name, secret, summary, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (profile_id, name.strip(), self.box.encrypt(validated), json.dumps(summarize(validated)),
+                     now, now)
+                )
+        except sqlite3.IntegrityError:
+            raise ProfileError(f"A profile named {name.strip()} already exists")
+        return self.get(profile_id)
+
+    def update(self, profile_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Change some fields of a profile and validate the result.
+
+        Args:
+            profile_id (str): Profile ID
+            changes (Dict[str, Any]): Fields to change
+
+        Returns:
+            Dict[str, Any]: The profile without secrets
+
+        Raises:
+            ProfileError: If the profile is unknown or the result is invalid
+        """
+        config = dict(self.resolve(profile_id))
+        config.update({key: value for key, value in changes.items() if key in PROFILE_FIELDS})
+        validated = validate_profile(config)
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "UPDATE profiles SET secret = ?, summary = ?, version = version + 1, updated_at = ? WHERE id = ?",
+                (self.box.encrypt(validated), json.dumps(summarize(validated)), time.time(), profile_id)
+            )
+        return self.get(profile_id)
+
+    def delete(self, profile_id: str) -> bool:
+        """
+        Delete a profile.
+
+        Args:
+            profile_id (str): Profile ID
+
+        Returns:
+            bool: True if the profile existed
+        """
+        conn = self.db.connect()
+        with conn:
+            deleted = conn.execute("DELETE FROM profiles WHERE id = ?", (profile_id,)).rowcount > 0
+        with self._lock:
+            self._cache.pop(profile_id, None)
+        return deleted
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a profile without its secrets.
+
+        Args:
+            profile_id (str): Profile ID
+
+        Returns:
+            Optional[Dict[str, Any]]: The profile, or None if unknown
+        """
+        row = self.db.connect().execute("SELECT * FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        return self._public(row) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        List all profiles by name.
+
+        Returns:
+            List[Dict[str, Any]]: Profiles without their secrets
+        """
+        return [self._public(row) for row in self.db.connect().execute("SELECT * FROM profiles ORDER BY name")]
+
+    def resolve(self, profile_id: str) -> Dict[str, Any]:
+        """
+        Get the validated configuration of a profile, including its secrets.
+
+        Args:
+            profile_id (str): Profile ID
+
+        Returns:
+            Dict[str, Any]: Profile configuration; callers must not modify it
+
+        Raises:
+            ProfileError: If the profile is unknown or cannot be decrypted
+        """
+        conn = self.db.connect()
+        row = conn.execute("SELECT version FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        if row is None:
+            raise ProfileError(f"Unknown profile: {profile_id}")
+        with self._lock:
+            cached = self._cache.get(profile_id)
+        if cached and cached[0] == row["version"]:
+            return cached[1]
+
+        row = conn.execute("SELECT version, secret FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+        if row is None:
+            raise ProfileError(f"Unknown profile: {profile_id}")
+        config = self.box.decrypt(row["secret"])
+        with self._lock:
+            self._cache[profile_id] = (row["version"], config)
+        return config
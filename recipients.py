@@ -0,0 +1,240 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Any, Union
+
+import events
+from db import Database
+from usernames import parse_chat_ref
+
+# Outcomes of a recipient check
+VALID = "valid"
+NOT_FOUND = "not_found"
+BLOCKED = "blocked"
+GIFTS_DISABLED = "gifts_disabled"
+UNKNOWN = "unknown"  # Network errors and rate limits; never stored, checked again next time
+
+# Outcomes that hold until the recipient changes something, so they are stored
+DEFINITIVE = (VALID, NOT_FOUND, BLOCKED, GIFTS_DISABLED)
+
+# Outcomes that make a transfer to the recipient fail
+REJECTED = (NOT_FOUND, BLOCKED, GIFTS_DISABLED)
+
+# Error classes (see events.classify_error) of a failed getChat. Other bad
+# requests, e.g. a malformed chat ID, are not known to be lasting and are
+# left UNKNOWN, so they are neither stored nor drop a cached username
+_ERROR_OUTCOMES = {
+    "chat_not_found": NOT_FOUND,
+    "forbidden": BLOCKED,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipient_checks (
+    scope TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (scope, chat_id)
+);
+CREATE INDEX IF NOT EXISTS idx_recipient_checks_checked ON recipient_checks(checked_at);
+"""
+
+
+def recipient_scope(bot_token: str) -> str:
+    """
+    Identify the bot a check was made with, without keeping its token.
+
+    Whether a chat is visible depends on the bot, so results are stored per bot.
+
+    Args:
+        bot_token (str): Bot token
+
+    Returns:
+        str: Hashed scope
+    """
+    return hashlib.sha256(f"recipients\0{bot_token}".encode('utf-8')).hexdigest()
+
+
+def parse_chat_ids(raw: Any, max_count: int) -> List[Union[int, str]]:
+    """
+    Validate a list of recipient chat IDs from a request.
+
+    Args:
+        raw (Any): The list
+        max_count (int): Maximum number of entries
+
+    Returns:
+        List[Union[int, str]]: Chat IDs and @usernames, duplicates included
+
+    Raises:
+        ValueError: If the list or one of its entries is invalid
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("chat_ids must be a non-empty list")
+    if len(raw) > max_count:
+        raise ValueError(f"chat_ids exceeds the maximum of {max_count} entries")
+    chat_ids = []
+    for index, chat_id in enumerate(raw):
+        try:
+            chat_ids.append(parse_chat_ref(chat_id))
+        except ValueError as e:
+            raise ValueError(f"chat_ids[{index}]: {str(e)}")
+    return chat_ids
+
+
+def classify_chat(result: Dict[str, Any]) -> str:
+    """
+    Classify the getChat response for a recipient.
+
+    Args:
+        result (Dict[str, Any]): Response returned by make_api_request
+
+    Returns:
+        str: One of VALID, NOT_FOUND, BLOCKED, GIFTS_DISABLED or UNKNOWN
+    """
+    if result.get('ok'):
+        if result.get('result', {}).get('can_send_gift') is False:
+            return GIFTS_DISABLED
+        return VALID
+    description = result.get('description', '')
+    if "user not found" in description or "deactivated" in description:
+        return NOT_FOUND
+    return _ERROR_OUTCOMES.get(events.classify_error(description), UNKNOWN)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that spaces out API calls.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (Optional[float]): Bucket size (default: one second of tokens)
+        clock (Callable): Monotonic clock, for tests
+        sleep (Callable): Sleep function, for tests
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, waiting until one is available."""
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+def check_recipients(chat_ids: Iterable[int], check: Callable[[int], str], max_workers: int,
+                     bucket: Optional[TokenBucket] = None,
+                     known: Optional[Dict[int, str]] = None) -> Dict[int, str]:
+    """
+    Check each distinct recipient once, concurrently.
+
+    Args:
+        chat_ids (Iterable[int]): Recipients, possibly repeated
+        check (Callable): Checks one recipient and returns its outcome
+        max_workers (int): Checks running at the same time
+        bucket (Optional[TokenBucket]): Rate limit for the checks
+        known (Optional[Dict[int, str]]): Outcomes already known, not checked again
+
+    Returns:
+        Dict[int, str]: Outcome per distinct recipient, in first-seen order
+    """
+    known = known or {}
+    unique = list(dict.fromkeys(chat_ids))
+    pending = [chat_id for chat_id in unique if chat_id not in known]
+
+    def run_one(chat_id: int) -> str:
+        if bucket is not None:
+            bucket.acquire()
+        return check(chat_id)
+
+    outcomes: Dict[int, str] = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recipient") as executor:
+            outcomes = dict(zip(pending, executor.map(run_one, pending)))
+    return {chat_id: known[chat_id] if chat_id in known else outcomes[chat_id] for chat_id in unique}
+
+
+class RecipientStore:
+    """Recent recipient check outcomes, so a recipient is not checked again within a window."""
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def record(self, scope: str, chat_id: int, status: str) -> None:
+        """
+        Store the outcome of a check; UNKNOWN outcomes are ignored.
+
+        Args:
+            scope (str): recipient_scope of the bot
+            chat_id (int): Recipient
+            status (str): Outcome
+        """
+        if status not in DEFINITIVE:
+            return
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recipient_checks (scope, chat_id, status, checked_at) VALUES (?, ?, ?, ?)",
+                (scope, chat_id, status, time.time())
+            )
+
+    def fresh(self, scope: str, chat_ids: List[int], max_age: float) -> Dict[int, str]:
+        """
+        Get the outcomes checked within max_age seconds.
+
+        Args:
+            scope (str): recipient_scope of the bot
+            chat_ids (List[int]): Recipients
+            max_age (float): Maximum age of an outcome in seconds
+
+        Returns:
+            Dict[int, str]: Outcome per recipient that has a fresh one
+        """
+        if max_age <= 0:
+            return {}
+        conn = self.db.connect()
+        cutoff = time.time() - max_age
+        unique = list(dict.fromkeys(chat_ids))
+        outcomes = {}
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT chat_id, status FROM recipient_checks WHERE scope = ? AND checked_at >= ? "
+                f"AND chat_id IN ({','.join('?' * len(chunk))})",
+                [scope, cutoff] + chunk
+            ).fetchall()
+            outcomes.update({row['chat_id']: row['status'] for row in rows})
+        return outcomes
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete outcomes older than max_age seconds.
+
+        Args:
+            max_age (float): Maximum age of an outcome in seconds
+
+        Returns:
+            int: Number of deleted outcomes
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute("DELETE FROM recipient_checks WHERE checked_at < ?",
+                                (time.time() - max_age,)).rowcount
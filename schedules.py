@@ -0,0 +1,500 @@
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from db import Database
+from job_store import strip_secrets
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+# Shortest interval accepted for recurring schedules
+MIN_INTERVAL = 60
+
+# Occurrences missed by more than this (e.g. while the app was down) are skipped
+MISFIRE_GRACE = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    config TEXT NOT NULL,
+    priority TEXT,
+    tenant TEXT,
+    fire_at REAL NOT NULL,
+    nominal_at REAL NOT NULL,
+    next_fire_at REAL NOT NULL,
+    interval_seconds INTEGER,
+    remaining_runs INTEGER,
+    until REAL,
+    jitter_seconds INTEGER NOT NULL DEFAULT 0,
+    lead_seconds INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 0,
+    last_job_id TEXT,
+    last_fired_at REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_schedules_status ON schedules(status, next_fire_at);
+"""
+
+# Columns added after the table was introduced
+SCHEDULE_COLUMNS = (
+    ("profile_id", "TEXT"),
+    ("last_error", "TEXT"),
+    ("last_error_at", "REAL"),
+)
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel for many timers at one-tick resolution.
+
+    Adding and cancelling a timer is O(1); each tick only looks at the
+    timers in one slot. Timers further away than one revolution wait in
+    their slot for the remaining number of rounds.
+
+    Args:
+        tick (float): Seconds per slot
+        slots (int): Number of slots in one revolution
+        start (float): Time of the first tick
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512, start: Optional[float] = None):
+        self.tick = tick
+        self.slots: List[Dict[str, Tuple[float, int]]] = [{} for _ in range(slots)]
+        self._deadlines: Dict[str, float] = {}
+        self._slot_of: Dict[str, int] = {}
+        self._current = int((time.time() if start is None else start) // tick)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def keys(self) -> List[str]:
+        """
+        Get the keys of all set timers.
+
+        Returns:
+            List[str]: Timer keys
+        """
+        return list(self._deadlines)
+
+    def add(self, key: str, deadline: float) -> None:
+        """
+        Set a timer, replacing any timer with the same key.
+
+        Args:
+            key (str): Timer key
+            deadline (float): Epoch seconds at which the timer expires
+        """
+        with self._lock:
+            self._remove(key)
+            # Deadlines in the past expire on the next tick
+            target = max(int(deadline // self.tick), self._current + 1)
+            rounds, offset = divmod(target - self._current - 1, len(self.slots))
+            slot = (self._current + 1 + offset) % len(self.slots)
+            self.slots[slot][key] = (deadline, rounds)
+            self._deadlines[key] = deadline
+            self._slot_of[key] = slot
+
+    def cancel(self, key: str) -> None:
+        """
+        Remove a timer if it is set.
+
+        Args:
+            key (str): Timer key
+        """
+        with self._lock:
+            self._remove(key)
+
+    def deadline(self, key: str) -> Optional[float]:
+        """
+        Get the deadline of a timer.
+
+        Args:
+            key (str): Timer key
+
+        Returns:
+            Optional[float]: Epoch seconds, or None if no timer is set
+        """
+        return self._deadlines.get(key)
+
+    def _remove(self, key: str) -> None:
+        if self._deadlines.pop(key, None) is not None:
+            self.slots[self._slot_of.pop(key)].pop(key, None)
+
+    def advance(self, now: float) -> List[str]:
+        """
+        Move the wheel up to a time and collect the expired timers.
+
+        Args:
+            now (float): Current epoch seconds
+
+        Returns:
+            List[str]: Keys of the expired timers, earliest first
+        """
+        expired: List[Tuple[float, str]] = []
+        with self._lock:
+            target = int(now // self.tick)
+            while self._current < target:
+                self._current += 1
+                slot = self.slots[self._current % len(self.slots)]
+                for key, (deadline, rounds) in list(slot.items()):
+                    if rounds > 0:
+                        slot[key] = (deadline, rounds - 1)
+                    else:
+                        del slot[key]
+                        del self._deadlines[key]
+                        del self._slot_of[key]
+                        expired.append((deadline, key))
+        return [key for _, key in sorted(expired)]
+
+
+def next_occurrence(schedule: Dict[str, Any], after: float) -> Optional[float]:
+    """
+    Get the first nominal fire time of a schedule later than a time.
+
+    Args:
+        schedule (Dict[str, Any]): Schedule row
+        after (float): Epoch seconds
+
+    Returns:
+        Optional[float]: Epoch seconds, or None if the schedule has no further occurrences
+    """
+    interval = schedule['interval_seconds']
+    if not interval:
+        return None
+    steps = int((after - schedule['fire_at']) // interval) + 1
+    candidate = schedule['fire_at'] + max(steps, 1) * interval
+    if schedule['until'] is not None and candidate > schedule['until']:
+        return None
+    return candidate
+
+
+class ScheduleStore:
+    """
+    Persistent scheduled and recurring jobs.
+
+    The stored config is encrypted by the caller, since it holds the
+    credentials the job runs with (or, for schedules that reference a
+    profile, the overrides applied to it). It is never returned by the
+    read methods. ``nominal_at`` is the fire time of the
+    next occurrence and ``next_fire_at`` the same time plus its jitter.
+    """
+
+    def __init__(self, database: Database, rng: Optional[random.Random] = None):
+        self.db = database
+        self.rng = rng or random.Random()
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        conn = self.db.connect()
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(schedules)")}
+        with conn:
+            for column, definition in SCHEDULE_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE schedules ADD COLUMN {column} {definition}")
+
+    def _jittered(self, fire_at: float, jitter: int) -> float:
+        return fire_at + (self.rng.uniform(0, jitter) if jitter else 0)
+
+    def create(self, kind: str, params: Dict[str, Any], config: str, fire_at: float,
+               interval_seconds: Optional[int] = None, count: Optional[int] = None, until: Optional[float] = None,
+               jitter_seconds: int = 0, lead_seconds: int = 0, priority: Optional[str] = None,
+               tenant: Optional[str] = None, profile_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store a new schedule.
+
+        Args:
+            kind (str): Job kind to run ('run' or 'transfer')
+            params (Dict[str, Any]): Job parameters
+            config (str): Encrypted worker configuration, or profile overrides
+            fire_at (float): Epoch seconds of the first occurrence
+            interval_seconds (Optional[int]): Repeat every this many seconds
+            count (Optional[int]): Maximum number of occurrences
+            until (Optional[float]): No occurrences after this time
+            jitter_seconds (int): Random delay of up to this many seconds per occurrence
+            lead_seconds (int): Start the job this long before the fire time for preflight and funding
+            priority (Optional[str]): Priority class name for the queued jobs
+            tenant (Optional[str]): Fair-share tenant of the jobs
+            profile_id (Optional[str]): Configuration profile the jobs run with
+
+        Returns:
+            Dict[str, Any]: The schedule
+        """
+        schedule_id = f"sch_{secrets.token_hex(6)}"
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO schedules (id, kind, status, params, config, priority, tenant, fire_at, nominal_at, "
+                "next_fire_at, interval_seconds, remaining_runs, until, jitter_seconds, lead_seconds, created_at, "
+                "profile_id) VALUES (?, ?, 'active', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (schedule_id, kind, json.dumps(strip_secrets(params)), config, priority, tenant,
+                 fire_at, fire_at, self._jittered(fire_at, jitter_seconds), interval_seconds, count, until,
+                 jitter_seconds, lead_seconds, time.time(), profile_id)
+            )
+        return self.get(schedule_id)
+
+    def _row(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.connect().execute("SELECT * FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+        schedule = {key: value for key, value in row.items() if key != 'config'}
+        schedule['params'] = json.loads(schedule['params'])
+        return schedule
+
+    def get(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a schedule without its credentials.
+
+        Args:
+            schedule_id (str): Schedule ID
+
+        Returns:
+            Optional[Dict[str, Any]]: The schedule, or None if unknown
+        """
+        row = self._row(schedule_id)
+        return self._public(row) if row else None
+
+    def list(self, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        List schedules by next fire time.
+
+        Args:
+            status (Optional[str]): Only return schedules with this status
+
+        Returns:
+            List[Dict[str, Any]]: Schedules without their credentials
+        """
+        if status:
+            rows = self.db.connect().execute(
+                "SELECT * FROM schedules WHERE status = ? ORDER BY next_fire_at", (status,)
+            )
+        else:
+            rows = self.db.connect().execute("SELECT * FROM schedules ORDER BY next_fire_at")
+        return [self._public(dict(row)) for row in rows]
+
+    def active(self) -> List[Dict[str, Any]]:
+        """
+        Get the timers of all active schedules.
+
+        Returns:
+            List[Dict[str, Any]]: Rows with id, next_fire_at and lead_seconds
+        """
+        return [dict(row) for row in self.db.connect().execute(
+            "SELECT id, next_fire_at, lead_seconds FROM schedules WHERE status = 'active'"
+        )]
+
+    def cancel(self, schedule_id: str) -> bool:
+        """
+        Stop an active schedule.
+
+        Args:
+            schedule_id (str): Schedule ID
+
+        Returns:
+            bool: True if the schedule was active
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute(
+                "UPDATE schedules SET status = 'cancelled' WHERE id = ? AND status = 'active'", (schedule_id,)
+            ).rowcount > 0
+
+    def claim(self, schedule_id: str, expected_fire_at: float,
+              now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Take one occurrence of a schedule and move it to the next one.
+
+        The update only succeeds if the occurrence is still the one the
+        caller saw, so when several processes fire the same timer exactly
+        one of them gets the occurrence. Occurrences missed by more than
+        MISFIRE_GRACE are skipped instead of being run late.
+
+        Args:
+            schedule_id (str): Schedule ID
+            expected_fire_at (float): next_fire_at the caller's timer was set for
+            now (Optional[float]): Current epoch seconds
+
+        Returns:
+            Optional[Dict[str, Any]]: The schedule row with its config and the
+            claimed fire time as 'fire_time', or None if there is nothing to run
+        """
+        now = time.time() if now is None else now
+        row = self._row(schedule_id)
+        if row is None or row['status'] != 'active' or row['next_fire_at'] != expected_fire_at:
+            return None
+
+        missed = now - expected_fire_at > MISFIRE_GRACE
+        runs = row['runs'] + (0 if missed else 1)
+        remaining = row['remaining_runs']
+        if remaining is not None and not missed:
+            remaining -= 1
+
+        nominal = next_occurrence(row, max(now, row['nominal_at']))
+        if nominal is None or (remaining is not None and remaining <= 0):
+            status, nominal, next_fire_at = ("missed" if missed and runs == 0 else "completed"), \
+                row['nominal_at'], expected_fire_at
+        else:
+            status, next_fire_at = "active", self._jittered(nominal, row['jitter_seconds'])
+
+        conn = self.db.connect()
+        with conn:
+            claimed = conn.execute(
+                "UPDATE schedules SET status = ?, nominal_at = ?, next_fire_at = ?, remaining_runs = ?, runs = ?, "
+                "last_fired_at = CASE WHEN ? THEN last_fired_at ELSE ? END "
+                "WHERE id = ? AND status = 'active' AND next_fire_at = ?",
+                (status, nominal, next_fire_at, remaining, runs, missed, now, schedule_id, expected_fire_at)
+            ).rowcount
+        if not claimed:
+            return None
+        if missed:
+            logger.warning(f"Schedule {schedule_id} missed its occurrence at {expected_fire_at}")
+            return None
+        row.update(status=status, nominal_at=nominal, next_fire_at=next_fire_at, remaining_runs=remaining,
+                   runs=runs, fire_time=expected_fire_at)
+        row['params'] = json.loads(row['params'])
+        return row
+
+    def record_job(self, schedule_id: str, job_id: str) -> None:
+        """
+        Remember the job started for a schedule's latest occurrence.
+
+        Args:
+            schedule_id (str): Schedule ID
+            job_id (str): Job ID
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE schedules SET last_job_id = ?, last_error = NULL, last_error_at = NULL WHERE id = ?",
+                         (job_id, schedule_id))
+
+    def record_error(self, schedule_id: str, message: str, now: Optional[float] = None) -> None:
+        """
+        Remember why a schedule's latest occurrence could not queue its job.
+
+        Args:
+            schedule_id (str): Schedule ID
+            message (str): Error message
+            now (Optional[float]): Current epoch seconds
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE schedules SET last_error = ?, last_error_at = ? WHERE id = ?",
+                         (message, time.time() if now is None else now, schedule_id))
+
+
+class ScheduleRunner:
+    """
+    Fires due schedules through the job queue.
+
+    Each occurrence is queued ``lead_seconds`` before its fire time. The
+    worker runs preflight and funding straight away, then holds until the
+    fire time, so the transfer itself goes out with minimal latency.
+    Every web process runs a runner; ScheduleStore.claim makes sure each
+    occurrence fires once. Schedules created by other processes are picked
+    up on the next resync.
+
+    Args:
+        store (ScheduleStore): Persistent schedules
+        fire (Callable): Queues the job for a claimed schedule row
+        tick (float): Timer wheel resolution in seconds
+        resync_interval (float): Seconds between reloads of the active schedules
+    """
+
+    def __init__(self, store: ScheduleStore, fire: Callable[[Dict[str, Any]], None],
+                 tick: float = 1.0, resync_interval: float = 30.0):
+        self.store = store
+        self.fire = fire
+        self.resync_interval = resync_interval
+        self.wheel = TimerWheel(tick=tick)
+        self._last_sync = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the runner thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="schedule-runner", daemon=True)
+            self._thread.start()
+
+    def add(self, schedule: Dict[str, Any]) -> None:
+        """
+        Set the timer for a schedule's next occurrence.
+
+        Args:
+            schedule (Dict[str, Any]): Schedule with id, next_fire_at and lead_seconds
+        """
+        self.wheel.add(schedule['id'], schedule['next_fire_at'] - schedule['lead_seconds'])
+
+    def cancel(self, schedule_id: str) -> None:
+        """
+        Drop the timer of a schedule.
+
+        Args:
+            schedule_id (str): Schedule ID
+        """
+        self.wheel.cancel(schedule_id)
+
+    def sync(self) -> None:
+        """Reload the timers of all active schedules from the database."""
+        active = self.store.active()
+        active_ids = {schedule['id'] for schedule in active}
+        for schedule_id in self.wheel.keys():
+            if schedule_id not in active_ids:
+                self.wheel.cancel(schedule_id)
+        for schedule in active:
+            self.add(schedule)
+        self._last_sync = time.time()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Schedule runner error: {str(e)}")
+            time.sleep(self.wheel.tick)
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """
+        Fire the schedules whose timers expired.
+
+        Args:
+            now (Optional[float]): Current epoch seconds
+
+        Returns:
+            int: Number of occurrences fired
+        """
+        now = time.time() if now is None else now
+        if now - self._last_sync >= self.resync_interval:
+            self.sync()
+        fired = 0
+        for schedule_id in self.wheel.advance(now):
+            row = self.store._row(schedule_id)
+            if row is None or row['status'] != 'active':
+                continue
+            # The wheel fires by tick, so check the exact time before claiming
+            if row['next_fire_at'] - row['lead_seconds'] > now:
+                self.add(row)
+                continue
+            schedule = self.store.claim(schedule_id, row['next_fire_at'], now)
+            if schedule is not None:
+                try:
+                    self.fire(schedule)
+                    fired += 1
+                except Exception as e:
+                    # The occurrence is used up; its error is shown with the schedule
+                    message = str(e) or type(e).__name__
+                    logger.error(f"Failed to fire schedule {schedule_id}: {message}")
+                    self.store.record_error(schedule_id, message, now)
+            current = self.store.get(schedule_id)
+            if current and current['status'] == 'active':
+                self.add(current)
+        return fired
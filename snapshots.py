@@ -0,0 +1,345 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from db import Database
+
+# Kinds of inventory change
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+# Verification states of a gift reported as transferred
+PENDING = "pending"  # No snapshot has been taken since the transfer
+CONFIRMED = "confirmed"  # A later snapshot no longer lists the gift
+STILL_OWNED = "still_owned"  # A later snapshot still lists the gift; checked again next time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory_gifts (
+    scope TEXT NOT NULL,
+    owned_gift_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (scope, owned_gift_id)
+);
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    taken_at REAL NOT NULL,
+    gift_count INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    removed INTEGER NOT NULL,
+    changed INTEGER NOT NULL,
+    baseline INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_inventory_snapshots_scope ON inventory_snapshots(scope, id);
+CREATE TABLE IF NOT EXISTS inventory_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    owned_gift_id TEXT NOT NULL,
+    change TEXT NOT NULL,
+    gift TEXT,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_inventory_changes_scope ON inventory_changes(scope, id);
+CREATE TABLE IF NOT EXISTS transfer_verifications (
+    job_id TEXT NOT NULL,
+    gift_id TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    transferred_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    snapshot_id INTEGER,
+    PRIMARY KEY (job_id, gift_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transfer_verifications_scope ON transfer_verifications(scope, status);
+"""
+
+
+def gift_digest(gift: Dict[str, Any]) -> str:
+    """
+    Fingerprint a gift so changes between snapshots can be detected.
+
+    Args:
+        gift (Dict[str, Any]): Gift as returned by getBusinessAccountGifts
+
+    Returns:
+        str: Short hex digest of the gift's contents
+    """
+    payload = json.dumps(gift, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class InventoryDiff:
+    """
+    Difference between a fetched inventory and the previous snapshot, fed
+    page by page.
+
+    Only the fingerprints of all gifts and the contents of added and changed
+    gifts are kept, so memory follows the churn rather than the inventory.
+
+    Args:
+        previous (Optional[Dict[str, str]]): Digest per gift ID in the previous
+            snapshot, or None if this is the first snapshot (the baseline)
+    """
+
+    def __init__(self, previous: Optional[Dict[str, str]]):
+        self.previous = previous
+        self.digests: Dict[str, str] = {}
+        self.added: List[Dict[str, Any]] = []
+        self.changed: List[Dict[str, Any]] = []
+
+    @property
+    def baseline(self) -> bool:
+        """True if there is no earlier snapshot to compare against."""
+        return self.previous is None
+
+    def add(self, gifts: Iterable[Dict[str, Any]]) -> "InventoryDiff":
+        """
+        Compare one page of gifts.
+
+        Args:
+            gifts (Iterable[Dict[str, Any]]): Gifts of the page
+
+        Returns:
+            InventoryDiff: self, for chaining
+        """
+        for gift in gifts:
+            gift_id = gift.get('owned_gift_id')
+            if gift_id is None or gift_id in self.digests:
+                continue
+            digest = gift_digest(gift)
+            self.digests[gift_id] = digest
+            if self.previous is None:
+                continue
+            old_digest = self.previous.get(gift_id)
+            if old_digest is None:
+                self.added.append(gift)
+            elif old_digest != digest:
+                self.changed.append(gift)
+        return self
+
+    @property
+    def removed(self) -> List[str]:
+        """IDs of the gifts in the previous snapshot that were not seen."""
+        if self.previous is None:
+            return []
+        return [gift_id for gift_id in self.previous if gift_id not in self.digests]
+
+
+def diff_inventories(previous: Optional[Dict[str, str]], gifts: Iterable[Dict[str, Any]]) -> InventoryDiff:
+    """
+    Diff a complete gift list against the digests of the previous snapshot.
+
+    Args:
+        previous (Optional[Dict[str, str]]): Digest per gift ID, None for a baseline
+        gifts (Iterable[Dict[str, Any]]): The fetched gifts
+
+    Returns:
+        InventoryDiff: Added, changed and removed gifts
+    """
+    return InventoryDiff(previous).add(gifts)
+
+
+class SnapshotStore:
+    """
+    Inventory snapshots per business connection, the changes between them,
+    and verification of transfers against the next snapshot.
+
+    Only the latest state (one digest per gift) is stored; earlier snapshots
+    are kept as summaries and as the change feed.
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def begin(self, scope: str) -> InventoryDiff:
+        """
+        Start diffing a fetch against the latest snapshot of scope.
+
+        Args:
+            scope (str): Business connection key from make_cache_key
+
+        Returns:
+            InventoryDiff: Diff to feed the fetched pages to
+        """
+        conn = self.db.connect()
+        if conn.execute("SELECT 1 FROM inventory_snapshots WHERE scope = ? LIMIT 1", (scope,)).fetchone() is None:
+            return InventoryDiff(None)
+        rows = conn.execute("SELECT owned_gift_id, digest FROM inventory_gifts WHERE scope = ?", (scope,))
+        return InventoryDiff({row['owned_gift_id']: row['digest'] for row in rows})
+
+    def record(self, scope: str, diff: InventoryDiff, started_at: float) -> Dict[str, Any]:
+        """
+        Store a complete fetch as the new snapshot of scope, append its changes
+        to the change feed and verify the transfers made before it started.
+
+        Args:
+            scope (str): Business connection key from make_cache_key
+            diff (InventoryDiff): Diff fed with every fetched gift
+            started_at (float): When the fetch started; transfers reported
+                later may not be reflected in it
+
+        Returns:
+            Dict[str, Any]: The snapshot summary, with the verification outcome
+        """
+        now = time.time()
+        removed = diff.removed
+        conn = self.db.connect()
+        with conn:
+            snapshot_id = conn.execute(
+                "INSERT INTO inventory_snapshots (scope, started_at, taken_at, gift_count, added, removed, "
+                "changed, baseline) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, started_at, now, len(diff.digests), len(diff.added), len(removed),
+                 len(diff.changed), 1 if diff.baseline else 0)
+            ).lastrowid
+
+            conn.executemany(
+                "INSERT INTO inventory_changes (scope, snapshot_id, owned_gift_id, change, gift, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(scope, snapshot_id, gift['owned_gift_id'], ADDED, json.dumps(gift), now) for gift in diff.added]
+                + [(scope, snapshot_id, gift['owned_gift_id'], CHANGED, json.dumps(gift), now)
+                   for gift in diff.changed]
+                + [(scope, snapshot_id, gift_id, REMOVED, None, now) for gift_id in removed]
+            )
+
+            if diff.baseline:
+                updated = list(diff.digests)
+            else:
+                updated = [gift['owned_gift_id'] for gift in diff.added + diff.changed]
+            conn.executemany(
+                "INSERT OR REPLACE INTO inventory_gifts (scope, owned_gift_id, digest) VALUES (?, ?, ?)",
+                [(scope, gift_id, diff.digests[gift_id]) for gift_id in updated]
+            )
+            conn.executemany("DELETE FROM inventory_gifts WHERE scope = ? AND owned_gift_id = ?",
+                             [(scope, gift_id) for gift_id in removed])
+
+            verified = {CONFIRMED: 0, STILL_OWNED: 0}
+            unverified = conn.execute(
+                "SELECT job_id, gift_id FROM transfer_verifications WHERE scope = ? AND status IN (?, ?) "
+                "AND transferred_at < ?",
+                (scope, PENDING, STILL_OWNED, started_at)
+            ).fetchall()
+            for row in unverified:
+                status = STILL_OWNED if row['gift_id'] in diff.digests else CONFIRMED
+                verified[status] += 1
+                conn.execute("UPDATE transfer_verifications SET status = ?, snapshot_id = ? "
+                             "WHERE job_id = ? AND gift_id = ?",
+                             (status, snapshot_id, row['job_id'], row['gift_id']))
+
+        return {
+            "snapshot_id": snapshot_id,
+            "taken_at": now,
+            "gift_count": len(diff.digests),
+            "added": len(diff.added),
+            "removed": len(removed),
+            "changed": len(diff.changed),
+            "baseline": diff.baseline,
+            "verified": verified
+        }
+
+    def latest(self, scope: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the summary of the latest snapshot of scope.
+
+        Args:
+            scope (str): Business connection key from make_cache_key
+
+        Returns:
+            Optional[Dict[str, Any]]: The snapshot, or None if none was taken
+        """
+        conn = self.db.connect()
+        row = conn.execute(
+            "SELECT id, taken_at, gift_count, added, removed, changed, baseline FROM inventory_snapshots "
+            "WHERE scope = ? ORDER BY id DESC LIMIT 1", (scope,)
+        ).fetchone()
+        if row is None:
+            return None
+        snapshot = dict(row)
+        snapshot["baseline"] = bool(snapshot["baseline"])
+        return snapshot
+
+    def changes(self, scope: str, after: int = 0, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Read the change feed of scope, oldest first.
+
+        Args:
+            scope (str): Business connection key from make_cache_key
+            after (int): Return changes with a higher ID than this cursor
+            limit (int): Maximum number of changes
+
+        Returns:
+            List[Dict[str, Any]]: Changes with id, snapshot_id, owned_gift_id,
+                change, gift (None for removals) and recorded_at
+        """
+        conn = self.db.connect()
+        rows = conn.execute(
+            "SELECT id, snapshot_id, owned_gift_id, change, gift, recorded_at FROM inventory_changes "
+            "WHERE scope = ? AND id > ? ORDER BY id LIMIT ?", (scope, after, limit)
+        ).fetchall()
+        changes = []
+        for row in rows:
+            change = dict(row)
+            change["gift"] = json.loads(change["gift"]) if change["gift"] else None
+            changes.append(change)
+        return changes
+
+    def record_transfer(self, scope: str, job_id: str, gift_id: str) -> None:
+        """
+        Remember a transfer reported as successful, to verify against the next snapshot.
+
+        Args:
+            scope (str): Business connection key the gift was transferred from
+            job_id (str): The job ID
+            gift_id (str): The owned gift ID
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transfer_verifications (job_id, gift_id, scope, transferred_at, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, gift_id, scope, time.time(), PENDING)
+            )
+
+    def verification(self, job_id: str) -> Dict[str, Any]:
+        """
+        Summarize the verification of a job's transfers.
+
+        Args:
+            job_id (str): The job ID
+
+        Returns:
+            Dict[str, Any]: Count per state, and the gifts still owned
+        """
+        conn = self.db.connect()
+        rows = conn.execute("SELECT gift_id, status FROM transfer_verifications WHERE job_id = ? ORDER BY gift_id",
+                            (job_id,)).fetchall()
+        summary: Dict[str, Any] = {PENDING: 0, CONFIRMED: 0, STILL_OWNED: 0}
+        for row in rows:
+            summary[row['status']] += 1
+        summary["still_owned_gift_ids"] = [row['gift_id'] for row in rows if row['status'] == STILL_OWNED]
+        return summary
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete snapshots, changes and verifications older than max_age seconds.
+        The latest state of each business connection is kept.
+
+        Args:
+            max_age (float): Maximum age in seconds
+
+        Returns:
+            int: Number of deleted changes
+        """
+        cutoff = time.time() - max_age
+        conn = self.db.connect()
+        with conn:
+            # Keep each scope's latest snapshot, which the stored state belongs to
+            conn.execute(
+                "DELETE FROM inventory_snapshots WHERE taken_at < ? AND id NOT IN "
+                "(SELECT MAX(id) FROM inventory_snapshots GROUP BY scope)", (cutoff,)
+            )
+            conn.execute("DELETE FROM transfer_verifications WHERE transferred_at < ?", (cutoff,))
+            return conn.execute("DELETE FROM inventory_changes WHERE recorded_at < ?", (cutoff,)).rowcount
@@ -0,0 +1,89 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class TaskFailed(Exception):
+    """Raised when a task returned a falsy value."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Task {name} failed")
+        self.name = name
+
+
+class TaskGraph:
+    """
+    Runs tasks concurrently, each as soon as the tasks it depends on have
+    succeeded.
+
+    A task succeeds by returning a truthy value, which is passed to the
+    tasks that depend on it. After a task fails or raises, no further task
+    is started; the running ones are waited for, then the failure is raised.
+
+    Args:
+        max_workers (int): Tasks running at the same time
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._tasks: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[..., Any], deps: Iterable[str] = ()) -> None:
+        """
+        Add a task. Dependencies must have been added before, so the graph
+        has no cycles.
+
+        Args:
+            name (str): Task name
+            func (Callable[..., Any]): Called with the results of deps, in order
+            deps (Iterable[str]): Tasks that must succeed first
+
+        Raises:
+            ValueError: If the name is taken or a dependency is unknown
+        """
+        deps = tuple(deps)
+        if name in self._tasks:
+            raise ValueError(f"Task {name} already exists")
+        for dep in deps:
+            if dep not in self._tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+        self._tasks[name] = (func, deps)
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run every task.
+
+        Returns:
+            Dict[str, Any]: Result per task
+
+        Raises:
+            TaskFailed: If a task returned a falsy value
+            Exception: Whatever a task raised
+        """
+        results: Dict[str, Any] = {}
+        pending = dict(self._tasks)
+        running: Dict[Future, str] = {}
+        failure: Optional[BaseException] = None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="task") as executor:
+            while True:
+                if failure is None:
+                    for name, (func, deps) in list(pending.items()):
+                        if all(dep in results for dep in deps):
+                            del pending[name]
+                            running[executor.submit(func, *[results[dep] for dep in deps])] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BaseException as e:
+                        failure = failure or e
+                        continue
+                    if result:
+                        results[name] = result
+                    elif failure is None:
+                        failure = TaskFailed(name)
+        if failure is not None:
+            raise failure
+        return results
@@ -9,11 +9,21 @@ import logging
 import logging.config
 import logging.handlers
 import traceback
-from typing import Dict, Optional, List, Any, Union, Tuple
+from collections import Counter
+from typing import Callable, Dict, Optional, List, Any, Union, Tuple
 from dotenv import load_dotenv
 
 # Import centralized configuration
 from config import AppConfig
+from batch_manifest import read_manifest
+import events
+from events import EventEmitter, classify_error
+from job_control import EXIT_CANCELLED, ControlChannel, JobCancelled
+import fanout
+from fanout import ConnectionContext
+from recipients import NOT_FOUND, REJECTED, UNKNOWN, VALID, TokenBucket, check_recipients, classify_chat, recipient_scope
+from usernames import is_username
+from task_graph import TaskFailed, TaskGraph
 
 # Load environment variables
 load_dotenv()
@@ -21,12 +31,36 @@ load_dotenv()
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Telegram Gift Transfer Tool')
 parser.add_argument('--config', help='Path to a JSON configuration file')
+parser.add_argument('--config-fd', type=int, help='File descriptor to read the JSON configuration from')
 parser.add_argument('--list-gifts', action='store_true', help='List available gifts and exit')
+parser.add_argument('--with-balance', action='store_true',
+                    help='With --list-gifts, also report the business account star balance')
+parser.add_argument('--ndjson', action='store_true',
+                    help='With --list-gifts, write one gift per line as pages arrive, then a {"summary": ...} line')
 parser.add_argument('--gift-id', help='ID of the gift to transfer')
+parser.add_argument('--manifest', help='Path to an NDJSON batch manifest of gift_id/target_chat_id rows '
+                    '(rows may name another business_connection_id)')
+parser.add_argument('--validate-recipients', help='Path to a JSON list of chat IDs to check and exit')
+parser.add_argument('--known-recipients', help='Path to recent recipient check outcomes, as JSON '
+                    '{scope: {chat_id: status}}, that need not be checked again')
+parser.add_argument('--known-usernames', help='Path to recently resolved @usernames, as JSON {username: chat_id}')
+parser.add_argument('--events-fd', type=int, help='File descriptor that receives JSON-lines progress events')
+parser.add_argument('--control-fd', type=int, help='File descriptor to read cancel/pause/resume commands from')
+parser.add_argument('--job-id', help='Job ID used to name the log file (defaults to the start timestamp)')
+parser.add_argument('--not-before', type=float,
+                    help='Epoch seconds; preflight and funding run at once, gift transfers wait until then')
 args = parser.parse_args()
 
-# Load configuration using AppConfig
-app_config = AppConfig.load(args.config)
+# Machine-readable event channel for the web app (no-op when not requested)
+emitter = EventEmitter(args.events_fd)
+
+# Load configuration using AppConfig; the web app passes it through a pipe so
+# credentials never touch the disk
+if args.config_fd is not None:
+    with os.fdopen(args.config_fd) as config_stream:
+        app_config = AppConfig.load(config_data=json.load(config_stream))
+else:
+    app_config = AppConfig.load(args.config)
 
 # Set global variables from config
 BOT_TOKEN = app_config.BOT_TOKEN
@@ -40,6 +74,21 @@ BYPASS_BUSINESS_CHECK = app_config.BYPASS_BUSINESS_CHECK
 ENABLE_REDUNDANT_TRANSFER = app_config.ENABLE_REDUNDANT_TRANSFER
 LOG_DIR = app_config.LOG_DIR
 
+def current_connection() -> ConnectionContext:
+    """
+    Get the business connection the calling thread works for.
+    
+    During a fan-out each thread works for one connection; otherwise it is
+    the connection from the configuration.
+    
+    Returns:
+        ConnectionContext: The connection
+    """
+    return fanout.current() or ConnectionContext(
+        BOT_TOKEN, BUSINESS_CONNECTION_ID, TARGET_CHAT_ID, STAR_COUNT,
+        BYPASS_BUSINESS_CHECK, ENABLE_REDUNDANT_TRANSFER
+    )
+
 # API configuration
 API_CONFIG = {
     "BASE_URL": "https://api.telegram.org/bot",
@@ -57,6 +106,9 @@ API_CONFIG = {
 # Create logs directory if it doesn't exist
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# One log file per run; the job ID keeps runs started in the same second apart
+LOG_FILE_PATH = f"{LOG_DIR}/gift_transfer_log_{args.job_id or datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
 # Configure logging
 try:
     with open('logging_config.json', 'r') as f:
@@ -67,7 +119,7 @@ try:
     os.makedirs(log_path, exist_ok=True)
     
     # Update log file path to use LOG_DIR from config
-    log_config['handlers']['file']['filename'] = f"{LOG_DIR}/gift_transfer_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    log_config['handlers']['file']['filename'] = LOG_FILE_PATH
     
     logging.config.dictConfig(log_config)
     logger = logging.getLogger("telegram_gift_transfer")
@@ -79,7 +131,7 @@ except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
             logging.StreamHandler(),
-            logging.FileHandler(f"{LOG_DIR}/gift_transfer_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+            logging.FileHandler(LOG_FILE_PATH)
         ]
     )
     logger = logging.getLogger("telegram_gift_transfer")
@@ -87,6 +139,7 @@ except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
 
 # Store the current log file path for reference
 current_log_file = logger.handlers[1].baseFilename if len(logger.handlers) > 1 else f"{LOG_DIR}/gift_transfer_log.log"
+emitter.emit(events.LOG_FILE, path=current_log_file)
 
 def log_and_print(message: str, level: str = "INFO") -> None:
     """
@@ -96,6 +149,11 @@ def log_and_print(message: str, level: str = "INFO") -> None:
         message (str): The message to log
         level (str): Log level (INFO, ERROR, WARNING, DEBUG)
     """
+    # Lines of concurrent connections are told apart by their connection
+    connection = fanout.current()
+    if connection and connection.label:
+        message = f"[{connection.label}] {message}"
+    
     # Log to file with appropriate level
     if level == "ERROR":
         logger.error(message)
@@ -118,6 +176,20 @@ def log_and_print(message: str, level: str = "INFO") -> None:
         # Regular messages are already handled by the console logger
         pass
 
+def report_paused(step: str) -> None:
+    log_and_print(f"Job paused before step: {step}")
+    emitter.emit(events.JOB_PAUSED, step=step)
+
+def report_resumed(step: str) -> None:
+    log_and_print(f"Job resumed at step: {step}")
+    emitter.emit(events.JOB_RESUMED, step=step)
+
+# Commands from the web app, checked at step boundaries (no-op when not requested)
+control = ControlChannel(args.control_fd, on_pause=report_paused, on_resume=report_resumed)
+
+# Spaces out the getChat calls of bulk recipient checks across all connections of this worker
+recipient_bucket = TokenBucket(app_config.RECIPIENT_CHECK_RATE)
+
 def make_api_request(endpoint: str, payload: Optional[Dict] = None, retry_count: int = MAX_RETRIES) -> Dict:
     """
     Make a request to the Telegram API with retry logic and exponential backoff.
@@ -130,24 +202,37 @@ def make_api_request(endpoint: str, payload: Optional[Dict] = None, retry_count:
     Returns:
         Dict: The API response
     """
-    api_url = f'{API_CONFIG["BASE_URL"]}{BOT_TOKEN}/{API_CONFIG["ENDPOINTS"][endpoint]}'
+    connection = current_connection()
+    api_url = f'{API_CONFIG["BASE_URL"]}{connection.bot_token}/{API_CONFIG["ENDPOINTS"][endpoint]}'
     max_delay = 30  # Maximum retry delay in seconds
     
+    def report_call(started: float, ok: bool, status_code: Optional[int] = None,
+                    retry_after: Optional[int] = None) -> None:
+        # The bot ID (the public part of the token) lets the app track each bot's health and rate limits
+        emitter.emit(events.API_CALL, method=API_CONFIG["ENDPOINTS"][endpoint], attempt=attempt, ok=ok,
+                     status_code=status_code, latency_ms=round((time.monotonic() - started) * 1000, 1),
+                     bot_id=connection.bot_token.split(':', 1)[0], retry_after=retry_after)
+    
     for attempt in range(1, retry_count + 1):
+        started = time.monotonic()
         try:
+            # Connections sharing a bot token share its limit on concurrent calls
             if payload:
                 log_and_print(f"Sending request to {endpoint}")
                 log_and_print(f"Payload: {json.dumps(payload, indent=2)}", "DEBUG")
-                response = requests.post(api_url, json=payload, timeout=10)
+                with connection.api_slots:
+                    response = connection.http.post(api_url, json=payload, timeout=10)
             else:
                 log_and_print(f"Sending request to {endpoint}")
-                response = requests.post(api_url, timeout=10)
+                with connection.api_slots:
+                    response = connection.http.post(api_url, timeout=10)
             
             # Check for HTTP errors
             response.raise_for_status()
             
             result = response.json()
             log_and_print(f"Response: {json.dumps(result, indent=2)}", "DEBUG")
+            report_call(started, bool(result.get('ok')), response.status_code)
             
             if not result.get('ok') and attempt < retry_count:
                 # Calculate exponential backoff delay with cap
@@ -161,10 +246,13 @@ def make_api_request(endpoint: str, payload: Optional[Dict] = None, retry_count:
         except requests.exceptions.HTTPError as e:
             # Handle rate limiting specifically
             if response.status_code == 429:
-                retry_after = min(int(response.headers.get('Retry-After', RETRY_DELAY)), max_delay)
+                retry_after = int(response.headers.get('Retry-After', RETRY_DELAY))
+                report_call(started, False, response.status_code, retry_after)
+                retry_after = min(retry_after, max_delay)
                 log_and_print(f"Rate limit exceeded, retrying in {retry_after} seconds...", "WARNING")
                 time.sleep(retry_after)
                 continue
+            report_call(started, False, response.status_code)
             
             log_and_print(f"HTTP error: {str(e)}", "ERROR")
             if attempt < retry_count:
@@ -175,6 +263,7 @@ def make_api_request(endpoint: str, payload: Optional[Dict] = None, retry_count:
                 return {"ok": False, "description": f"HTTP error after {retry_count} attempts: {str(e)}"}
                 
         except requests.exceptions.RequestException as e:
+            report_call(started, False)
             log_and_print(f"Network error: {str(e)}", "ERROR")
             if attempt < retry_count:
                 delay = min(RETRY_DELAY * (2 ** (attempt - 1)), max_delay)
@@ -211,7 +300,7 @@ def validate_business_connection() -> bool:
     """
     log_and_print("Validating business connection ID...")
     result = make_api_request("get_business_star_balance", {
-        "business_connection_id": BUSINESS_CONNECTION_ID
+        "business_connection_id": current_connection().business_connection_id
     })
     
     if result.get('ok'):
@@ -282,6 +371,167 @@ def validate_chat_id(chat_id: int) -> bool:
         log_and_print(f"Failed to validate chat: {result.get('description', 'Unknown error')}", "ERROR")
         return False
 
+def check_recipient(chat_id: int) -> str:
+    """
+    Check whether a recipient can receive gifts, with one getChat call.
+    
+    Args:
+        chat_id (int): The recipient
+        
+    Returns:
+        str: Outcome from recipients.classify_chat
+    """
+    result = make_api_request("get_chat", {"chat_id": chat_id}, retry_count=1)
+    status = classify_chat(result)
+    emitter.emit(events.RECIPIENT_CHECKED, scope=recipient_scope(current_connection().bot_token),
+                 chat_id=chat_id, status=status)
+    if status != VALID:
+        log_and_print(f"Recipient {chat_id}: {status} ({result.get('description', 'gifts disabled')})", "WARNING")
+    return status
+
+def load_known_recipients() -> Dict[int, str]:
+    """
+    Load the recent check outcomes the web app passed for the current bot.
+    
+    Returns:
+        Dict[int, str]: Outcome per recipient
+    """
+    if not args.known_recipients:
+        return {}
+    try:
+        with open(args.known_recipients, 'r') as f:
+            known = json.load(f).get(recipient_scope(current_connection().bot_token), {})
+    except (OSError, json.JSONDecodeError) as e:
+        log_and_print(f"Could not read known recipients: {str(e)}", "WARNING")
+        return {}
+    return {int(chat_id): status for chat_id, status in known.items()}
+
+def validate_recipients(chat_ids: List[int], checked: Optional[Dict[int, str]] = None) -> Dict[int, str]:
+    """
+    Check many recipients concurrently, each distinct one once.
+    
+    Checks run RECIPIENT_CHECK_WORKERS at a time and at most
+    RECIPIENT_CHECK_RATE per second. Recipients with a recent outcome from
+    --known-recipients are not checked again.
+    
+    Args:
+        chat_ids (List[int]): Recipients, possibly repeated
+        checked (Optional[Dict[int, str]]): Outcomes this worker already has
+        
+    Returns:
+        Dict[int, str]: Outcome per distinct recipient
+    """
+    connection = current_connection()
+    def check(chat_id: int) -> str:
+        # Pool threads work for the caller's connection
+        with fanout.use_connection(connection):
+            return check_recipient(chat_id)
+    
+    known = load_known_recipients()
+    known.update(checked or {})
+    outcomes = check_recipients(chat_ids, check, app_config.RECIPIENT_CHECK_WORKERS, recipient_bucket, known)
+    reused = sum(1 for chat_id in outcomes if chat_id in known)
+    counts = Counter(outcomes.values())
+    log_and_print(f"Recipients: {len(outcomes)} distinct, {reused} known from earlier checks; "
+                  + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    return outcomes
+
+def load_known_usernames() -> Dict[str, int]:
+    """
+    Load the username resolutions the web app passed from its cache.
+    
+    Returns:
+        Dict[str, int]: Chat ID per @username
+    """
+    if not args.known_usernames:
+        return {}
+    try:
+        with open(args.known_usernames, 'r') as f:
+            return {username: int(chat_id) for username, chat_id in json.load(f).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        log_and_print(f"Could not read known usernames: {str(e)}", "WARNING")
+        return {}
+
+def resolve_username(username: str) -> Tuple[Optional[int], str]:
+    """
+    Look up the chat of an @username with getChat.
+    
+    The response also tells whether the chat can receive gifts, so the
+    lookup doubles as the recipient check.
+    
+    Args:
+        username (str): @username
+        
+    Returns:
+        Tuple[Optional[int], str]: (chat ID or None, outcome from recipients.classify_chat)
+    """
+    result = make_api_request("get_chat", {"chat_id": username}, retry_count=1)
+    status = classify_chat(result)
+    chat_id = result.get('result', {}).get('id') if result.get('ok') else None
+    if chat_id is not None:
+        emitter.emit(events.USERNAME_RESOLVED, username=username, chat_id=chat_id)
+        emitter.emit(events.RECIPIENT_CHECKED, scope=recipient_scope(current_connection().bot_token),
+                     chat_id=chat_id, status=status)
+    elif status == NOT_FOUND:
+        # Lets the web app drop a stale mapping
+        emitter.emit(events.USERNAME_RESOLVED, username=username, chat_id=None)
+    if status != VALID:
+        log_and_print(f"Recipient {username}: {status} ({result.get('description', 'gifts disabled')})", "WARNING")
+    return chat_id, status
+
+def resolve_usernames(usernames: List[str]) -> Dict[str, Tuple[Optional[int], Optional[str]]]:
+    """
+    Resolve many @usernames concurrently, each distinct one once.
+    
+    Usernames passed with --known-usernames are not looked up; the others
+    share the rate limit of recipient checks.
+    
+    Args:
+        usernames (List[str]): @usernames, possibly repeated
+        
+    Returns:
+        Dict[str, Tuple[Optional[int], Optional[str]]]: (chat ID or None,
+            outcome of the lookup or None if the ID came from the cache) per username
+    """
+    connection = current_connection()
+    def resolve(username: str) -> Tuple[Optional[int], str]:
+        with fanout.use_connection(connection):
+            return resolve_username(username)
+    
+    known = {username: (chat_id, None) for username, chat_id in load_known_usernames().items()}
+    resolved = check_recipients(usernames, resolve, app_config.RECIPIENT_CHECK_WORKERS, recipient_bucket, known)
+    reused = sum(1 for username in resolved if username in known)
+    unresolved = sum(1 for chat_id, _ in resolved.values() if chat_id is None)
+    log_and_print(f"Usernames: {len(resolved)} distinct, {reused} known from the cache, {unresolved} not resolved")
+    return resolved
+
+def check_chat_refs(chat_refs: List[Union[int, str]]) -> Dict[Union[int, str], Tuple[Optional[int], str]]:
+    """
+    Resolve and check recipients given as chat IDs or @usernames.
+    
+    Args:
+        chat_refs (List[Union[int, str]]): Recipients, possibly repeated
+        
+    Returns:
+        Dict[Union[int, str], Tuple[Optional[int], str]]: (chat ID or None if
+            it could not be resolved, outcome) per distinct recipient
+    """
+    resolved = {}
+    usernames = [chat_ref for chat_ref in chat_refs if is_username(chat_ref)]
+    if usernames:
+        resolved = run_step("resolve", resolve_usernames, usernames)
+    chat_ids = {chat_ref: resolved[chat_ref][0] if is_username(chat_ref) else chat_ref
+                for chat_ref in dict.fromkeys(chat_refs)}
+    
+    # A username lookup already checked its chat
+    checked = {chat_id: status for chat_id, status in resolved.values() if chat_id is not None and status}
+    outcomes = run_step("recipients", validate_recipients,
+                        [chat_id for chat_id in chat_ids.values() if chat_id is not None], checked)
+    return {
+        chat_ref: (chat_id, outcomes[chat_id]) if chat_id is not None else (None, resolved[chat_ref][1] or UNKNOWN)
+        for chat_ref, chat_id in chat_ids.items()
+    }
+
 def get_business_star_balance() -> int:
     """
     Get the star balance of the business account.
@@ -291,35 +541,52 @@ def get_business_star_balance() -> int:
     """
     log_and_print("Checking business account star balance...")
     result = make_api_request("get_business_star_balance", {
-        "business_connection_id": BUSINESS_CONNECTION_ID
+        "business_connection_id": current_connection().business_connection_id
     })
     
     if result.get('ok'):
         star_balance = result.get('result', {}).get('amount', 0)
         log_and_print(f"Business account star balance: {star_balance}")
+        emitter.emit(events.BALANCE_OBSERVED, business_connection_id=current_connection().business_connection_id,
+                     amount=star_balance)
         return star_balance
     else:
         log_and_print(f"Failed to get business star balance: {result.get('description', 'Unknown error')}", "ERROR")
         return 0
 
-def transfer_stars_to_bot() -> bool:
+def transfer_stars_to_bot(star_count: Optional[int] = None) -> bool:
     """
     Transfer stars from business account to bot.
     
+    Args:
+        star_count (Optional[int]): Number of stars to transfer (defaults to STAR_COUNT)
+    
     Returns:
         bool: True if transfer was successful, False otherwise
     """
-    log_and_print(f"Transferring {STAR_COUNT} stars to bot...")
+    connection = current_connection()
+    if star_count is None:
+        star_count = connection.star_count
+    log_and_print(f"Transferring {star_count} stars to bot...")
+    # From here on the stars may be moved, so the steps they pay for run
+    # even if the job is cancelled
+    control.commit("funding", connection.label)
+    emitter.emit(events.FUNDING_STARTED, star_count=star_count,
+                 business_connection_id=connection.business_connection_id)
     result = make_api_request("transfer_business_stars", {
-        "business_connection_id": BUSINESS_CONNECTION_ID,
-        "star_count": STAR_COUNT
+        "business_connection_id": connection.business_connection_id,
+        "star_count": star_count
     })
     
     if result.get('ok'):
-        log_and_print(f"Successfully transferred {STAR_COUNT} stars to bot")
+        log_and_print(f"Successfully transferred {star_count} stars to bot")
+        emitter.emit(events.STARS_FUNDED, star_count=star_count,
+                     business_connection_id=connection.business_connection_id)
         return True
     else:
-        log_and_print(f"Failed to transfer stars: {result.get('description', 'Unknown error')}", "ERROR")
+        error_desc = result.get('description', 'Unknown error')
+        log_and_print(f"Failed to transfer stars: {error_desc}", "ERROR")
+        emitter.emit(events.ERROR, step="funding", code=classify_error(error_desc), message=error_desc)
         return False
 
 def wait_for_star_transfer(max_wait: int = TRANSFER_WAIT_TIME) -> bool:
@@ -355,6 +622,35 @@ def wait_for_star_transfer(max_wait: int = TRANSFER_WAIT_TIME) -> bool:
     log_and_print("Wait completed")
     return True
 
+def hold_until(not_before: float, cancellable: bool = False) -> bool:
+    """
+    Wait until a scheduled fire time before transferring gifts.
+    
+    Once the bot is funded, a cancel does not cut the hold short unless it
+    is cancellable.
+    
+    Args:
+        not_before (float): Epoch seconds of the fire time
+        cancellable (bool): Stop holding on cancel even after funding
+        
+    Returns:
+        bool: True once the fire time has been reached
+    """
+    delay = not_before - time.time()
+    if delay <= 0:
+        return True
+    log_and_print(f"Preparation complete, holding {delay:.1f} seconds until the scheduled time...")
+    # Sleep in short slices so the transfer starts close to the fire time
+    while True:
+        delay = not_before - time.time()
+        if delay <= 0:
+            break
+        if control.sleep(min(delay, 1.0), cancellable, current_connection().label):
+            # Cancelled: the next checkpoint stops the job
+            return True
+    log_and_print("Scheduled time reached")
+    return True
+
 def get_owned_gifts() -> List[Dict]:
     """
     Get list of gifts owned by the bot/business account.
@@ -362,20 +658,55 @@ def get_owned_gifts() -> List[Dict]:
     Returns:
         List[Dict]: List of owned gifts
     """
+    gifts = []
+    stream_owned_gifts(gifts.extend)
+    return gifts
+
+def stream_owned_gifts(on_page: Callable[[List[Dict]], None]) -> Dict[str, Any]:
+    """
+    Get the gifts owned by the business account page by page, handing each
+    page on as soon as it arrives instead of holding the whole inventory.
+    
+    Args:
+        on_page (Callable[[List[Dict]], None]): Called with the gifts of each page
+        
+    Returns:
+        Dict[str, Any]: Summary with count, pages, total_count (as reported by
+            the API, None if no page arrived) and complete
+    """
     log_and_print("Retrieving owned gifts...")
-    result = make_api_request("get_business_gifts", {
-        "business_connection_id": BUSINESS_CONNECTION_ID,
-        "limit": 100
-    })
+    count = 0
+    pages = 0
+    total_count = None
+    offset = None
+    business_connection_id = current_connection().business_connection_id
     
-    if result.get('ok'):
-        gifts = result.get('result', {}).get('gifts', [])
-        total_count = result.get('result', {}).get('total_count', 0)
-        log_and_print(f"Found {total_count} gifts")
-        return gifts
-    else:
-        log_and_print(f"Failed to get gifts: {result.get('description', 'Unknown error')}", "ERROR")
-        return []
+    # The API returns at most 100 gifts per call, so follow next_offset until exhausted
+    while True:
+        payload = {
+            "business_connection_id": business_connection_id,
+            "limit": 100
+        }
+        if offset:
+            payload["offset"] = offset
+        result = make_api_request("get_business_gifts", payload)
+        
+        if not result.get('ok'):
+            log_and_print(f"Failed to get gifts: {result.get('description', 'Unknown error')}", "ERROR")
+            return {"count": count, "pages": pages, "total_count": total_count, "complete": False}
+        
+        page = result.get('result', {})
+        page_gifts = page.get('gifts', [])
+        total_count = page.get('total_count', 0)
+        pages += 1
+        count += len(page_gifts)
+        on_page(page_gifts)
+        offset = page.get('next_offset')
+        if not offset or not page_gifts or count >= total_count:
+            break
+    
+    log_and_print(f"Found {count} gifts")
+    return {"count": count, "pages": pages, "total_count": total_count, "complete": True}
 
 def analyze_payment_error() -> None:
     """Analyze the PAYMENT_REQUIRED error in detail."""
@@ -391,7 +722,7 @@ def analyze_payment_error() -> None:
     
     log_and_print("Current star balance:")
     log_and_print(f"Business account stars: {business_stars}")
-    log_and_print(f"Required for transfer: {STAR_COUNT}")
+    log_and_print(f"Required for transfer: {current_connection().star_count}")
     
     log_and_print("Recommended solutions:", "WARNING")
     log_and_print("1. Upgrade your bot to a business bot through BotFather", "WARNING")
@@ -413,7 +744,7 @@ def transfer_gift(gift_id: str, chat_id: int, transfer_star_count: int) -> bool:
     """
     log_and_print(f"Attempting to transfer gift {gift_id} to user {chat_id}...")
     result = make_api_request("transfer_gift", {
-        "business_connection_id": BUSINESS_CONNECTION_ID,
+        "business_connection_id": current_connection().business_connection_id,
         "owned_gift_id": gift_id,
         "new_owner_chat_id": chat_id,
         "transfer_star_count": transfer_star_count
@@ -421,11 +752,15 @@ def transfer_gift(gift_id: str, chat_id: int, transfer_star_count: int) -> bool:
     
     if result.get('ok'):
         log_and_print(f"Gift {gift_id} successfully transferred to user {chat_id}")
+        emitter.emit(events.GIFT_TRANSFERRED, gift_id=gift_id, chat_id=chat_id, stars=transfer_star_count,
+                     business_connection_id=current_connection().business_connection_id)
         return True
     else:
         error_desc = result.get('description', 'Unknown error')
         error_code = result.get('error_code', 0)
         log_and_print(f"Error transferring gift: {error_desc} (error code: {error_code})", "ERROR")
+        emitter.emit(events.ERROR, step="transfer", code=classify_error(error_desc), message=error_desc,
+                     error_code=error_code, gift_id=gift_id, chat_id=chat_id)
         
         if "PAYMENT_REQUIRED" in error_desc:
             analyze_payment_error()
@@ -505,51 +840,66 @@ def find_gift_by_id(gifts: List[Dict], gift_id: str) -> Optional[Dict]:
     """
     return next((gift for gift in gifts if gift.get('owned_gift_id') == gift_id), None)
 
-def validate_gift_for_transfer(gift: Dict) -> Tuple[bool, str]:
+def validate_gift_for_transfer(gift: Dict, max_stars: Optional[int] = None) -> Tuple[bool, str]:
     """
     Validate that a gift can be transferred.
     
     Args:
         gift (Dict): The gift to validate
+        max_stars (Optional[int]): Stars available for the transfer (defaults to STAR_COUNT)
         
     Returns:
         Tuple[bool, str]: (is_valid, error_message)
     """
+    if max_stars is None:
+        max_stars = current_connection().star_count
+    
     if not gift.get('can_be_transferred', False):
         return False, "This gift cannot be transferred"
     
     transfer_cost = gift.get('transfer_star_count', 0)
-    if transfer_cost > STAR_COUNT:
-        return False, f"Gift requires {transfer_cost} stars, but only {STAR_COUNT} were transferred"
+    if transfer_cost > max_stars:
+        return False, f"Gift requires {transfer_cost} stars, but only {max_stars} were transferred"
     
     return True, ""
 
-def main(gift_id: Optional[str] = None) -> bool:
+def run_step(name: str, func, *func_args, **func_kwargs) -> Any:
     """
-    Main function to run the Telegram Gift Transfer Tool.
+    Run one pipeline step, reporting its timing and outcome on the event channel.
+    
+    A cancel or pause requested by the web app takes effect here, before the
+    step starts, so a step is never interrupted half-way. Once the bot is
+    funded, a cancel no longer stops the steps that follow, so the stars
+    are not stranded on the bot; a pause still does.
     
     Args:
-        gift_id (Optional[str]): ID of the gift to transfer (if None, will prompt user)
+        name (str): Step name reported in step events
+        func: The step function; a falsy return value marks the step as failed
         
     Returns:
-        bool: True if successful, False otherwise
+        Any: Whatever the step function returned
+        
+    Raises:
+        JobCancelled: If the job was cancelled
     """
-    logger.info("=== Telegram Gift Transfer Tool ===")
-    logger.info(f"Log file: {current_log_file}")
-    logger.info(f"Target Chat ID: {TARGET_CHAT_ID}")
-    logger.info(f"Business Connection ID: {BUSINESS_CONNECTION_ID}")
-    logger.info(f"Star Count: {STAR_COUNT}")
-    logger.info(f"Wait Time After Transfer: {TRANSFER_WAIT_TIME} seconds")
-    logger.info("=" * 50)
-    
-    # Handle list-gifts mode for API consumption
-    if args.list_gifts:
-        gifts = get_owned_gifts()
-        # Output only the JSON data for easy parsing
-        sys.stdout.write(json.dumps(gifts))
-        sys.stdout.flush()
-        return True
+    connection = fanout.current()
+    label = connection.label if connection else None
+    if label:
+        # Steps of concurrent connections are reported separately
+        name = f"{label}/{name}"
+    control.checkpoint(name, connection=label)
+    with emitter.step(name) as step:
+        result = func(*func_args, **func_kwargs)
+        step["ok"] = bool(result)
+        return result
+
+def run_preflight() -> bool:
+    """
+    Run the connectivity, business connection and business bot checks.
     
+    Returns:
+        bool: True if the transfer can proceed, False otherwise
+    """
     # Step 1: Check API connectivity
     if not check_api_connectivity():
         log_and_print("Terminating: Could not connect to Telegram API", "ERROR")
@@ -570,7 +920,8 @@ def main(gift_id: Optional[str] = None) -> bool:
     # Check if bot is a business bot
     is_business_bot = bot_info.get('is_business_bot', False)
     
-    if not is_business_bot and not BYPASS_BUSINESS_CHECK:
+    bypass_business_check = current_connection().bypass_business_check
+    if not is_business_bot and not bypass_business_check:
         log_and_print("Terminating: Bot is not a business bot.", "ERROR")
         log_and_print("Gift and star transfer functionality requires a business bot.", "ERROR")
         log_and_print("To resolve this:", "ERROR")
@@ -581,86 +932,373 @@ def main(gift_id: Optional[str] = None) -> bool:
         log_and_print("Add \"BYPASS_BUSINESS_CHECK\": true to your config file.", "WARNING")
         return False
     
-    if not is_business_bot and BYPASS_BUSINESS_CHECK:
+    if not is_business_bot and bypass_business_check:
         log_and_print("WARNING: Bot is not a business bot, but check is bypassed.", "WARNING")
         log_and_print("Some functionality may not work as expected!", "WARNING")
     
-    # Step 4: Validate target chat
-    if not validate_chat_id(TARGET_CHAT_ID):
-        log_and_print("Terminating: Invalid target chat ID", "ERROR")
-        return False
+    return True
+
+def fund_bot(required_stars: int) -> bool:
+    """
+    Check the business balance and transfer stars to the bot in API-sized chunks.
     
-    # Step 5: Check business account star balance
-    business_stars = get_business_star_balance()
-    required_stars = STAR_COUNT * 2 if ENABLE_REDUNDANT_TRANSFER else STAR_COUNT
+    Args:
+        required_stars (int): Stars the bot needs for the upcoming transfers
+        
+    Returns:
+        bool: True if the bot was funded, False otherwise
+    """
+    # transferBusinessAccountStars accepts at most 10000 stars per call
+    max_per_call = 10000
+    redundant = current_connection().enable_redundant_transfer
+    total_required = required_stars * 2 if redundant else required_stars
     
-    if business_stars < required_stars:
-        log_and_print(f"Terminating: Not enough stars in business account (need at least {required_stars}, have {business_stars})", "ERROR")
+    business_stars = get_business_star_balance()
+    if business_stars < total_required:
+        log_and_print(f"Terminating: Not enough stars in business account (need at least {total_required}, have {business_stars})", "ERROR")
         return False
     
-    # Step 6: Inform about bot star balance constraints
-    log_and_print("NOTE: The Telegram API does not provide a way to check bot star balance", "WARNING")
-    log_and_print("This is a limitation especially relevant for non-business bots", "WARNING")
-    
-    # Step 7: Transfer stars to bot
-    if not transfer_stars_to_bot():
-        log_and_print("Terminating: Failed to transfer stars to bot", "ERROR")
-        return False
+    remaining = required_stars
+    while remaining > 0:
+        chunk = min(remaining, max_per_call)
+        if not transfer_stars_to_bot(chunk):
+            log_and_print("Terminating: Failed to transfer stars to bot", "ERROR")
+            return False
+        remaining -= chunk
     
-    # Step 8: Additional star transfer for reliability (if enabled)
-    if ENABLE_REDUNDANT_TRANSFER:
+    if redundant:
         log_and_print("Attempting additional star transfer for reliability...")
-        if not transfer_stars_to_bot():
+        if not transfer_stars_to_bot(min(required_stars, max_per_call)):
             log_and_print("Warning: Additional star transfer failed", "WARNING")
     
-    # Step 9: Wait for star transfer to process using improved waiting method
-    if not wait_for_star_transfer(TRANSFER_WAIT_TIME):
-        log_and_print("Warning: Star transfer may not have completed", "WARNING")
+    return True
+
+def run_batch(manifest_path: str) -> bool:
+    """
+    Transfer every row of a batch manifest with a single preflight and funding step.
+    
+    Rows that name other business connections are fanned out: every
+    connection runs its own preflight, funding and transfers, concurrently
+    with the others.
+    
+    Args:
+        manifest_path (str): Path to a normalized NDJSON manifest
+        
+    Returns:
+        bool: True if every row was transferred, False otherwise
+    """
+    rows = list(read_manifest(manifest_path))
+    groups = fanout.group_rows(rows, BUSINESS_CONNECTION_ID)
+    if list(groups) in ([], [BUSINESS_CONNECTION_ID]):
+        return transfer_rows(rows)["ok"]
+    return run_connections(groups)
+
+def run_connections(groups: Dict[str, List[Tuple[int, Dict]]]) -> bool:
+    """
+    Transfer the rows of several business connections concurrently.
+    
+    Each connection's failures only affect its own rows. Connections that
+    share a bot token share one HTTP session and a limit on concurrent API
+    calls (FANOUT_MAX_CALLS_PER_TOKEN).
+    
+    Args:
+        groups (Dict[str, List[Tuple[int, Dict]]]): Rows per business connection
+        
+    Returns:
+        bool: True if every row of every connection was transferred
+    """
+    contexts = fanout.build_contexts(current_connection(), list(groups), app_config.CONNECTION_TOKENS,
+                                     app_config.FANOUT_MAX_CALLS_PER_TOKEN)
+    log_and_print(f"Fan-out: {len(contexts)} business connections, "
+                  f"up to {app_config.FANOUT_MAX_CONNECTIONS} at a time")
+    results = fanout.run_fanout(
+        contexts,
+        lambda connection: transfer_rows(groups[connection.business_connection_id]),
+        app_config.FANOUT_MAX_CONNECTIONS,
+        stop=lambda error: isinstance(error, JobCancelled)
+    )
+    
+    transferred = failed = 0
+    for result in results:
+        rows = len(groups[result['business_connection_id']])
+        if 'error' in result:
+            log_and_print(f"Connection {result['business_connection_id']}: failed ({result['error']})", "ERROR")
+            failed += rows
+            continue
+        transferred += result['transferred']
+        failed += rows - result['transferred']
+        log_and_print(f"Connection {result['business_connection_id']}: {result['transferred']} transferred, "
+                      f"{rows - result['transferred']} failed",
+                      "INFO" if result['ok'] else "ERROR")
+    
+    connections_ok = sum(1 for result in results if result['ok'])
+    log_and_print(f"Fan-out completed: {connections_ok}/{len(results)} connections succeeded, "
+                  f"{transferred} transferred, {failed} failed")
+    return connections_ok == len(results)
+
+def transfer_rows(manifest_rows: List[Tuple[int, Dict]]) -> Dict[str, Any]:
+    """
+    Transfer manifest rows of the current business connection with one
+    preflight and funding step.
+    
+    Args:
+        manifest_rows (List[Tuple[int, Dict]]): (row_number, row) pairs
+        
+    Returns:
+        Dict[str, Any]: ok (every row transferred) and transferred (row count)
+    """
+    if not run_step("preflight", run_preflight):
+        return {"ok": False, "transferred": 0}
+    
+    gifts = run_step("inventory", get_owned_gifts)
+    gifts_by_id = {gift.get('owned_gift_id'): gift for gift in gifts}
+    
+    # Recipients that can never receive a gift would waste funding and retries
+    recipients = check_chat_refs([row['target_chat_id'] for _, row in manifest_rows])
+    
+    # First pass: resolve rows against the inventory and total the funding needed
+    rows = []
+    used_gift_ids = set()
+    failed = 0
+    required_stars = 0
+    for row_number, row in manifest_rows:
+        gift = gifts_by_id.get(row['gift_id'])
+        chat_id, recipient_status = recipients[row['target_chat_id']]
+        error_message = ""
+        if recipient_status in REJECTED:
+            error_message = f"recipient {recipient_status}"
+        elif chat_id is None:
+            error_message = f"username {row['target_chat_id']} could not be resolved"
+        elif not gift:
+            error_message = "gift not found"
+        elif row['gift_id'] in used_gift_ids:
+            error_message = "gift already assigned to an earlier row"
+        else:
+            is_valid, error_message = validate_gift_for_transfer(gift, max_stars=gift.get('transfer_star_count', 0))
+        
+        if error_message:
+            failed += 1
+            log_and_print(f"Row {row_number}: gift {row['gift_id']} -> {row['target_chat_id']}: skipped ({error_message})", "ERROR")
+            emitter.emit(events.ERROR, step="validation", code="row_rejected", message=error_message,
+                         row=row_number, gift_id=row['gift_id'], chat_id=row['target_chat_id'])
+            continue
+        
+        used_gift_ids.add(row['gift_id'])
+        if chat_id != row['target_chat_id']:
+            row = dict(row, target_chat_id=chat_id)
+        required_stars += gift.get('transfer_star_count', 0)
+        rows.append((row_number, row, gift))
+    
+    log_and_print(f"Batch: {len(rows)} rows ready, {failed} rejected, {required_stars} stars required")
+    if not rows:
+        log_and_print("Terminating: No transferable rows in batch", "ERROR")
+        return {"ok": False, "transferred": 0}
+    
+    if required_stars > 0:
+        if not run_step("funding", fund_bot, required_stars):
+            return {"ok": False, "transferred": 0}
+        if not run_step("settlement", wait_for_star_transfer, TRANSFER_WAIT_TIME):
+            log_and_print("Warning: Star transfer may not have completed", "WARNING")
     
-    # Step 10: Get owned gifts
-    gifts = get_owned_gifts()
-    if not gifts:
-        log_and_print("Terminating: No gifts found to transfer", "ERROR")
+    if args.not_before:
+        run_step("hold", hold_until, args.not_before, True)
+    
+    # Second pass: transfer each row and report its outcome. Pausing between
+    # rows keeps the preflight and funding already paid for. A batch can be
+    # cancelled between rows even after funding; the job reports the stars
+    # left on the bot
+    transferred = 0
+    for row_number, row, gift in rows:
+        control.checkpoint(f"row {row_number}", cancellable=True, connection=current_connection().label)
+        transfer_cost = gift.get('transfer_star_count', 0)
+        if transfer_gift(row['gift_id'], row['target_chat_id'], transfer_cost):
+            transferred += 1
+            log_and_print(f"Row {row_number}: gift {row['gift_id']} -> {row['target_chat_id']}: transferred")
+        else:
+            failed += 1
+            log_and_print(f"Row {row_number}: gift {row['gift_id']} -> {row['target_chat_id']}: failed", "ERROR")
+    
+    log_and_print(f"Batch completed: {transferred} transferred, {failed} failed")
+    return {"ok": failed == 0, "transferred": transferred}
+
+def main(gift_id: Optional[str] = None) -> bool:
+    """
+    Main function to run the Telegram Gift Transfer Tool.
+    
+    Args:
+        gift_id (Optional[str]): ID of the gift to transfer (if None, will prompt user)
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    logger.info("=== Telegram Gift Transfer Tool ===")
+    logger.info(f"Log file: {current_log_file}")
+    logger.info(f"Target Chat ID: {TARGET_CHAT_ID}")
+    logger.info(f"Business Connection ID: {BUSINESS_CONNECTION_ID}")
+    logger.info(f"Star Count: {STAR_COUNT}")
+    logger.info(f"Wait Time After Transfer: {TRANSFER_WAIT_TIME} seconds")
+    logger.info("=" * 50)
+    
+    # Handle list-gifts mode for API consumption
+    if args.list_gifts:
+        gifts = []
+        def on_page(page_gifts: List[Dict]) -> None:
+            emitter.emit(events.GIFT_PAGE, business_connection_id=BUSINESS_CONNECTION_ID, gifts=page_gifts)
+            if args.ndjson:
+                # One gift per line, written as soon as its page arrives
+                sys.stdout.write("".join(json.dumps(gift) + "\n" for gift in page_gifts))
+                sys.stdout.flush()
+            else:
+                gifts.extend(page_gifts)
+        
+        summary = run_step("inventory", stream_owned_gifts, on_page)
+        emitter.emit(events.INVENTORY, business_connection_id=BUSINESS_CONNECTION_ID, **summary)
+        if args.with_balance:
+            run_step("balance", get_business_star_balance)
+        # Output only the JSON data for easy parsing
+        if args.ndjson:
+            sys.stdout.write(json.dumps({"summary": summary}) + "\n")
+        else:
+            sys.stdout.write(json.dumps(gifts))
+        sys.stdout.flush()
+        return summary["complete"]
+    
+    # Handle recipient validation mode for API consumption
+    if args.validate_recipients:
+        with open(args.validate_recipients, 'r') as f:
+            chat_refs = json.load(f)
+        check_chat_refs(chat_refs)
+        return True
+    
+    # Handle batch mode: one preflight and funding step for the whole manifest
+    if args.manifest:
+        return run_batch(args.manifest)
+    
+    # Steps 1-3: Preflight checks
+    if not run_step("preflight", run_preflight):
         return False
     
-    # Step 11: Display gift list
-    display_gifts(gifts)
+    # The remaining steps run as a dependency graph: the inventory is fetched
+    # and the gift validated while the funding settles, and only the transfer
+    # waits for the settlement
+    graph = TaskGraph()
     
-    # Step 12: Select gift (either by ID or interactively)
-    selected_gift = None
-    if gift_id:
-        selected_gift = find_gift_by_id(gifts, gift_id)
-        if not selected_gift:
-            log_and_print(f"Gift with ID {gift_id} not found", "ERROR")
+    # Step 4: Validate target chat, resolving an @username first
+    def check_recipient() -> Union[int, bool]:
+        target_chat_id = TARGET_CHAT_ID
+        if is_username(target_chat_id):
+            target_chat_id = run_step("resolve", resolve_usernames, [TARGET_CHAT_ID])[TARGET_CHAT_ID][0]
+            if target_chat_id is None:
+                log_and_print(f"Terminating: Could not resolve {TARGET_CHAT_ID}", "ERROR")
+                return False
+        if not run_step("recipient", validate_chat_id, target_chat_id):
+            log_and_print("Terminating: Invalid target chat ID", "ERROR")
             return False
-    else:
-        selected_gift = select_gift_interactive(gifts)
-        if not selected_gift:
+        return target_chat_id
+    graph.add("recipient", check_recipient)
+    
+    # Step 5: Check business account star balance
+    def check_balance() -> bool:
+        business_stars = run_step("balance", get_business_star_balance)
+        required_stars = STAR_COUNT * 2 if ENABLE_REDUNDANT_TRANSFER else STAR_COUNT
+        if business_stars < required_stars:
+            log_and_print(f"Terminating: Not enough stars in business account (need at least {required_stars}, have {business_stars})", "ERROR")
             return False
+        return True
+    graph.add("balance", check_balance)
+    
+    def fund(target_chat_id: int, balance_ok: bool) -> bool:
+        # Step 6: Inform about bot star balance constraints
+        log_and_print("NOTE: The Telegram API does not provide a way to check bot star balance", "WARNING")
+        log_and_print("This is a limitation especially relevant for non-business bots", "WARNING")
+        
+        # Step 7: Transfer stars to bot
+        if not run_step("funding", transfer_stars_to_bot):
+            log_and_print("Terminating: Failed to transfer stars to bot", "ERROR")
+            return False
+        
+        # Step 8: Additional star transfer for reliability (if enabled)
+        if ENABLE_REDUNDANT_TRANSFER:
+            log_and_print("Attempting additional star transfer for reliability...")
+            if not transfer_stars_to_bot():
+                log_and_print("Warning: Additional star transfer failed", "WARNING")
+        return True
+    graph.add("funding", fund, deps=("recipient", "balance"))
     
-    # Step 13: Get gift details
-    gift_id = selected_gift.get('owned_gift_id')
-    gift_name = selected_gift.get('gift', {}).get('base_name', 'Unknown')
-    transfer_cost = selected_gift.get('transfer_star_count', STAR_COUNT)
+    # Step 9: Wait for star transfer to process using improved waiting method
+    def settle(funded: bool) -> bool:
+        if not run_step("settlement", wait_for_star_transfer, TRANSFER_WAIT_TIME):
+            log_and_print("Warning: Star transfer may not have completed", "WARNING")
+        return True
+    graph.add("settlement", settle, deps=("funding",))
     
-    log_and_print(f"Selected gift: {gift_name} (ID: {gift_id})")
+    # Step 10: Get owned gifts, while the checks and funding run
+    def fetch_gifts() -> List[Dict]:
+        gifts = run_step("inventory", get_owned_gifts)
+        if not gifts:
+            log_and_print("Terminating: No gifts found to transfer", "ERROR")
+            return []
+        # Step 11: Display gift list
+        display_gifts(gifts)
+        return gifts
+    graph.add("inventory", fetch_gifts)
     
-    # Step 14: Validate gift can be transferred
-    is_valid, error_message = validate_gift_for_transfer(selected_gift)
-    if not is_valid:
-        log_and_print(f"{error_message}", "ERROR")
-        return False
+    def select_gift(gifts: List[Dict], *settled: bool) -> Optional[Dict]:
+        # Step 12: Select gift (either by ID or interactively)
+        if gift_id:
+            selected_gift = find_gift_by_id(gifts, gift_id)
+            if not selected_gift:
+                log_and_print(f"Gift with ID {gift_id} not found", "ERROR")
+                return None
+        else:
+            selected_gift = select_gift_interactive(gifts)
+            if not selected_gift:
+                return None
+        
+        # Step 13: Get gift details
+        gift_name = selected_gift.get('gift', {}).get('base_name', 'Unknown')
+        log_and_print(f"Selected gift: {gift_name} (ID: {selected_gift.get('owned_gift_id')})")
+        
+        # Step 14: Validate gift can be transferred
+        is_valid, error_message = validate_gift_for_transfer(selected_gift)
+        if not is_valid:
+            log_and_print(f"{error_message}", "ERROR")
+            return None
+        return selected_gift
+    # An interactive prompt waits until the other steps stop logging
+    graph.add("gift", select_gift, deps=("inventory",) if gift_id else ("inventory", "settlement"))
+    
+    # Step 15: Wait for the scheduled time, if any
+    transfer_deps = ("recipient", "gift", "settlement")
+    if args.not_before:
+        graph.add("hold", lambda gift: run_step("hold", hold_until, args.not_before), deps=("gift",))
+        transfer_deps += ("hold",)
+    
+    # Step 16: Transfer gift
+    def transfer(target_chat_id: int, selected_gift: Dict, *ready: bool) -> bool:
+        transfer_cost = selected_gift.get('transfer_star_count', STAR_COUNT)
+        return run_step("transfer", transfer_gift, selected_gift.get('owned_gift_id'), target_chat_id, transfer_cost)
+    graph.add("transfer", transfer, deps=transfer_deps)
     
-    # Step 15: Transfer gift
-    return transfer_gift(gift_id, TARGET_CHAT_ID, transfer_cost)
+    try:
+        graph.run()
+    except TaskFailed:
+        return False
+    return True
 
 if __name__ == "__main__":
+    exit_code = 1
     try:
         success = main(args.gift_id)
         if success:
             logger.info("Script completed successfully")
+            exit_code = 0
         else:
             logger.warning("Script completed with errors")
+    except JobCancelled as e:
+        log_and_print(f"Job cancelled before step: {e}", "WARNING")
+        emitter.emit(events.JOB_CANCELLED, step=str(e))
+        exit_code = EXIT_CANCELLED
     except KeyboardInterrupt:
         logger.warning("Operation cancelled by user")
     except Exception as e:
@@ -668,4 +1306,5 @@ if __name__ == "__main__":
         logger.error(traceback.format_exc())
     finally:
         logger.info("Script execution completed. Check log file for details.")
-        logger.info(f"Log file: {current_log_file}") 
+        logger.info(f"Log file: {current_log_file}")
+    sys.exit(exit_code) 
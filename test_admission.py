@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from admission import AdmissionController, AdmissionError
+from coordination import JobQueue
+from db import Database
+from jobs import Job
+
+
+def make_queue(tmp_path, max_running=1):
+    database = Database(str(tmp_path / "state.db"))
+    admission = AdmissionController(database, balance_ttl=300)
+    return JobQueue(database, max_running=max_running, admission=admission), admission
+
+
+def enqueue(queue, job_id, stars, created_at=100.0, cleanup_files=None):
+    job = Job(job_id, "transfer", {"business_connection_id": job_id})
+    job.created_at = created_at
+    queue.enqueue(job, ["python", "worker.py"], cleanup_files, "key", stars={"scope": stars})
+    return job
+
+
+def test_enqueue_reserves_against_the_observed_balance(tmp_path):
+    """Test that jobs are refused once the balance left after reservations cannot fund them"""
+    queue, admission = make_queue(tmp_path)
+
+    # Unknown balance: admitted, the worker checks it
+    enqueue(queue, "job0", 50)
+    admission.observe("scope", 100)
+    assert admission.reserved("scope") == 50
+
+    enqueue(queue, "job1", 50)
+    with pytest.raises(AdmissionError):
+        enqueue(queue, "job2", 1)
+    assert queue.get("job2") is None
+
+    # Stars moved by a job lower the balance and its reservation alike
+    queue.claim_next("host:1")
+    admission.record_funding("job0", "scope", 50)
+    assert admission.balance("scope") == 50 and admission.reserved("scope") == 50
+
+    # A cancelled job gives its stars back
+    queue.request_cancel("job1")
+    enqueue(queue, "job3", 50)
+
+    # A stale balance is not trusted
+    conn = admission.db.connect()
+    with conn:
+        conn.execute("UPDATE star_balances SET observed_at = 0")
+    assert admission.balance("scope") is None
+    enqueue(queue, "job4", 500)
+
+
+def test_claim_defers_or_rejects_unfundable_jobs(tmp_path):
+    """Test that queued jobs wait for running jobs' stars and fail without starting if never fundable"""
+    queue, admission = make_queue(tmp_path, max_running=2)
+    manifest = tmp_path / "manifest.ndjson"
+    manifest.write_text("{}\n")
+
+    enqueue(queue, "job0", 60, created_at=100.0)
+    enqueue(queue, "job1", 60, created_at=101.0)
+    enqueue(queue, "job2", 200, created_at=102.0, cleanup_files=[str(manifest)])
+    admission.observe("scope", 100)
+
+    assert queue.claim_next("host:1")["id"] == "job0"
+    # job1 fits only if job0 gives back its stars; job2 never fits
+    assert queue.claim_next("host:1") is None
+    assert queue.get("job1")["status"] == "queued"
+    assert queue.get("job2")["status"] == "failed"
+    assert not manifest.exists()
+    assert "Not enough stars" in queue.read_output("job2")[0]["line"]
+
+    # job0 fails before funding: its stars are free again
+    queue.mark_failed("job0", "worker crashed")
+    assert queue.claim_next("host:1")["id"] == "job1"
@@ -0,0 +1,116 @@
+import os
+import sys
+import random
+import time
+from itertools import combinations, permutations
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from assignment import PlanError, parse_recipients, plan_assignments
+
+
+def make_gift(gift_id, name, stars, transferable=True):
+    return {"owned_gift_id": gift_id, "type": "unique", "can_be_transferred": transferable,
+            "transfer_star_count": stars, "gift": {"base_name": name}}
+
+
+def best_cost(gifts, recipients, budget):
+    """Exhaustive search: (most recipients served, lowest cost doing so)"""
+    usable = [g for g in gifts if g["can_be_transferred"]]
+    best = (0, 0)
+    for size in range(1, len(recipients) + 1):
+        found = None
+        for chosen in combinations(usable, size):
+            cost = sum(g["transfer_star_count"] for g in chosen)
+            if cost > budget or (found is not None and cost >= found):
+                continue
+            for order in permutations(range(len(recipients)), size):
+                if all(not recipients[r]["preferences"]
+                       or g["gift"]["base_name"].casefold() in {p.casefold() for p in recipients[r]["preferences"]}
+                       for g, r in zip(chosen, order)):
+                    found = cost
+                    break
+        if found is None:
+            break
+        best = (size, found)
+    return best
+
+
+def test_preferences_and_budget():
+    """Test that preferred gifts go to the recipients that asked for them, cheapest first"""
+    gifts = [make_gift("rose-1", "Rose", 30), make_gift("cake-1", "Cake", 10), make_gift("cake-2", "Cake", 20),
+             make_gift("rose-2", "Rose", 50), make_gift("locked", "Cake", 1, transferable=False)]
+    recipients = parse_recipients([
+        {"target_chat_id": 1},
+        {"target_chat_id": 2, "preferences": ["rose"]},
+        {"target_chat_id": 3, "preferences": "Cake"}
+    ])
+
+    plan = plan_assignments(gifts, recipients, budget=60)
+
+    # Recipient 1 takes the cheapest gift that leaves a Cake for recipient 3
+    assert [(a["target_chat_id"], a["gift_id"]) for a in plan["assignments"]] == [
+        (1, "cake-2"), (2, "rose-1"), (3, "cake-1")]
+    assert plan["total_stars"] == 60
+    assert plan["limited_by"] is None and plan["feasible"]
+
+    plan = plan_assignments(gifts, recipients, budget=40)
+    assert plan["assigned"] == 2 and plan["total_stars"] == 30
+    assert plan["limited_by"] == "budget"
+    assert [u["target_chat_id"] for u in plan["unassigned"]] == [2]
+
+    plan = plan_assignments(gifts, recipients, budget=40, objective="min_cost")
+    assert not plan["feasible"]
+
+
+def test_plan_is_optimal_on_small_cases():
+    """Test coverage and cost against an exhaustive search"""
+    rng = random.Random(7)
+    names = ["Cake", "Rose", "Star"]
+    for _ in range(150):
+        gifts = [make_gift(f"g{i}", rng.choice(names), rng.randint(0, 20), rng.random() > 0.1)
+                 for i in range(rng.randint(0, 6))]
+        recipients = parse_recipients([
+            {"target_chat_id": i + 1, "preferences": rng.sample(names, rng.randint(0, 2))}
+            for i in range(rng.randint(1, 4))
+        ])
+        budget = rng.randint(0, 60)
+
+        plan = plan_assignments(gifts, recipients, budget)
+
+        assert (plan["assigned"], plan["total_stars"]) == best_cost(gifts, recipients, budget)
+        assert len({a["gift_id"] for a in plan["assignments"]}) == plan["assigned"]
+        for assignment in plan["assignments"]:
+            preferences = recipients[assignment["target_chat_id"] - 1]["preferences"]
+            assert not preferences or assignment["gift_name"] in preferences
+
+
+def test_large_plan_is_fast():
+    """Test that thousands of gifts and recipients are planned quickly"""
+    rng = random.Random(1)
+    names = [f"Gift{i}" for i in range(40)]
+    gifts = [make_gift(f"g{i}", rng.choice(names), rng.randint(1, 100)) for i in range(5000)]
+    recipients = parse_recipients([
+        {"target_chat_id": i + 1, "preferences": rng.sample(names, rng.randint(0, 3))} for i in range(5000)
+    ])
+
+    started = time.monotonic()
+    plan = plan_assignments(gifts, recipients, budget=10 ** 6)
+
+    assert time.monotonic() - started < 5
+    assert plan["assigned"] > 4000
+
+
+def test_invalid_input():
+    """Test that invalid recipients and objectives are rejected"""
+    with pytest.raises(PlanError):
+        parse_recipients([])
+    with pytest.raises(PlanError):
+        parse_recipients([{"target_chat_id": "abc"}])
+    with pytest.raises(PlanError):
+        parse_recipients([{"target_chat_id": 5, "preferences": [1]}])
+    with pytest.raises(PlanError):
+        plan_assignments([], parse_recipients([{"target_chat_id": 5}]), 10, objective="cheapest")
@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from batch_manifest import (
+    ManifestError, detect_format, iter_lines, ingest_manifest, read_manifest
+)
+
+
+class TrickleStream(io.BytesIO):
+    """Binary stream that returns at most a few bytes per read"""
+
+    def read(self, size=-1):
+        return super().read(3)
+
+
+def test_iter_lines_handles_split_chunks():
+    """Test that lines split across chunk boundaries are reassembled"""
+    stream = TrickleStream(b'first line\r\nsecond\nlast')
+    assert list(iter_lines(stream)) == ['first line', 'second', 'last']
+
+
+def test_detect_format():
+    """Test format detection from query parameter and content type"""
+    assert detect_format('text/csv; charset=utf-8') == 'csv'
+    assert detect_format('application/x-ndjson') == 'ndjson'
+    assert detect_format('text/csv', 'ndjson') == 'ndjson'
+    with pytest.raises(ManifestError):
+        detect_format(None, 'xml')
+
+
+def test_ingest_ndjson_manifest(tmp_path):
+    """Test that valid NDJSON rows are normalized into the manifest file"""
+    body = b'{"gift_id": "g1", "target_chat_id": "42"}\n\n{"gift_id": "g2", "target_chat_id": 7}\n'
+    path = tmp_path / "manifest.ndjson"
+    with open(path, 'w') as out:
+        row_count, errors = ingest_manifest(io.BytesIO(body), 'ndjson', out, max_rows=10)
+
+    assert row_count == 2
+    assert errors == []
+    assert list(read_manifest(str(path))) == [
+        (1, {"gift_id": "g1", "target_chat_id": 42}),
+        (2, {"gift_id": "g2", "target_chat_id": 7})
+    ]
+
+
+def test_ingest_csv_manifest_reports_invalid_rows():
+    """Test that CSV rows are validated individually"""
+    body = b'gift_id,target_chat_id\ng1,42\n,43\ng3,-1\ng4,abc\n'
+    out = io.StringIO()
+    row_count, errors = ingest_manifest(io.BytesIO(body), 'csv', out, max_rows=10)
+
+    assert row_count == 1
+    assert [error["row"] for error in errors] == [2, 3, 4]
+    assert json.loads(out.getvalue()) == {"gift_id": "g1", "target_chat_id": 42}
+
+
+def test_ingest_csv_manifest_keeps_business_connection():
+    """Test that rows may name the business connection they belong to"""
+    body = b'gift_id,target_chat_id,business_connection_id\ng1,42, conn2 \ng2,43,\n'
+    out = io.StringIO()
+    ingest_manifest(io.BytesIO(body), 'csv', out, max_rows=10)
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert rows == [
+        {"gift_id": "g1", "target_chat_id": 42, "business_connection_id": "conn2"},
+        {"gift_id": "g2", "target_chat_id": 43}
+    ]
+
+
+def test_ingest_manifest_enforces_max_rows():
+    """Test that oversized manifests are rejected"""
+    body = b''.join(json.dumps({"gift_id": f"g{i}", "target_chat_id": 1}).encode() + b'\n' for i in range(5))
+    with pytest.raises(ManifestError):
+        ingest_manifest(io.BytesIO(body), 'ndjson', io.StringIO(), max_rows=3)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import events
+from bot_pool import BotPool
+from db import Database
+from updates import ConnectionStates, UpdateProcessor
+
+TOKENS = ["1:aaa", "2:bbb", "3:ccc"]
+
+# Business account 7 is connected to every bot, with one connection per bot
+CONNECTIONS = {
+    ("1:aaa", "c1"): {"user_chat_id": 7, "is_enabled": True},
+    ("2:bbb", "c2"): {"user_chat_id": 7, "is_enabled": True},
+    ("3:ccc", "c3"): {"user_chat_id": 7, "is_enabled": True,
+                      "rights": {"can_transfer_and_upgrade_gifts": False}},
+}
+
+
+def make_pool(tmp_path, **kwargs):
+    lookups = []
+
+    def lookup(token, connection_id):
+        lookups.append((token, connection_id))
+        return CONNECTIONS.get((token, connection_id))
+
+    pool = BotPool(Database(str(tmp_path / "state.db")), TOKENS, lookup=lookup, **kwargs)
+    for (token, connection_id) in CONNECTIONS:
+        pool.discover(connection_id)
+    return pool, lookups
+
+
+def add_job(pool, job_id, bot):
+    conn = pool.db.connect()
+    with conn:
+        conn.execute("INSERT INTO jobs (id, kind, status, params, created_at) VALUES (?, 'transfer', 'queued', ?, ?)",
+                     (job_id, '{"bot_id": "%s"}' % bot, time.time()))
+
+
+def test_routes_to_least_loaded_usable_bot(tmp_path):
+    """Test that jobs go to the least-loaded bot connected to the account, and stick to it"""
+    pool, lookups = make_pool(tmp_path)
+    # Known connections are not looked up again
+    asked = len(lookups)
+    assert pool.discover("c2")["account"] == "7" and len(lookups) == asked
+    assert pool.discover("unknown") is None and len(lookups) == asked + len(TOKENS)
+
+    add_job(pool, "job1", "1")
+    # Bot 3 lacks the right to transfer gifts
+    assert pool.route("c1") == ("2:bbb", "c2")
+    add_job(pool, "job2", "2")
+    add_job(pool, "job3", "2")
+    assert pool.route("c2") == ("1:aaa", "c1")
+    assert pool.route("unknown") is None
+
+    sticky = BotPool(pool.db, TOKENS, sticky=True, lookup=pool.lookup)
+    assert sticky.route("c2") == ("1:aaa", "c1")
+    add_job(pool, "job4", "1")
+    add_job(pool, "job5", "1")
+    assert sticky.route("c2") == ("1:aaa", "c1")
+    assert sticky.serves("2:bbb") and not sticky.serves("2:other") and not sticky.serves("9:zzz")
+
+    # Every bot's connection to the account shares the account's state
+    assert pool.account_key("1:aaa", "c1") == pool.account_key("2:bbb", "c2") is not None
+    assert pool.account_key("1:aaa", "c2") is None and pool.account_key("9:zzz", "c1") is None
+
+
+def test_rate_limited_and_rejected_bots_are_skipped(tmp_path):
+    """Test that bots are avoided while rate limited or after their token was rejected"""
+    pool, _ = make_pool(tmp_path)
+    assert pool.route("c1") == ("1:aaa", "c1")
+
+    pool.observe({"type": events.API_CALL, "method": "transferGift", "ok": False, "status_code": 429,
+                  "retry_after": 30, "bot_id": "1"})
+    assert pool.route("c1") == ("2:bbb", "c2")
+
+    pool.observe({"type": events.API_CALL, "method": "getMe", "ok": False, "status_code": 401, "bot_id": "2"})
+    assert pool.route("c1") is None
+    states = {bot["bot_id"]: bot["state"] for bot in pool.status()}
+    assert states == {"1": "rate_limited", "2": "unhealthy", "3": "available"}
+
+    # Connection updates of the app's bot reach the pool
+    processor = UpdateProcessor(ConnectionStates(pool.db), lambda connection_id: None,
+                                lambda connection: pool.record_connection("1", connection))
+    processor.process({"update_id": 1, "business_connection": {"id": "c1", "is_enabled": False}})
+    assert not pool.discover("c1")["usable"]
+
+
+def test_unknown_connections_are_looked_up_in_the_background(tmp_path):
+    """Test that routing never calls Telegram and failed lookups are retried"""
+    pool, lookups = make_pool(tmp_path)
+    conn = pool.db.connect()
+    with conn:
+        conn.execute("DELETE FROM pool_connections WHERE connection_id = 'c2'")
+    asked = len(lookups)
+    assert pool.route("c2") is None and len(lookups) == asked
+
+    lookup = pool.lookup
+
+    def broken(token, connection_id):
+        raise ValueError("Expecting value: line 1 column 1 (char 0)")
+
+    pool.lookup = broken
+    assert pool.refresh() == 1
+    assert pool.route("c2") is None
+
+    pool.lookup = lookup
+    assert pool.refresh() == 1
+    assert pool.route("c2") == ("2:bbb", "c2")
+
+    # Stored connections are looked up again once stale, and dropped if gone
+    pool.refresh_interval = 0
+    remaining = dict(CONNECTIONS)
+    del remaining[("1:aaa", "c1")]
+    pool.lookup = lambda token, connection_id: remaining.get((token, connection_id))
+    assert pool.refresh() == 3
+    assert not pool.discover("c1")["usable"]
@@ -0,0 +1,262 @@
+import os
+import sys
+import threading
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from coordination import JobQueue, JobDispatcher
+from db import Database, WriteBehind
+from job_scheduler import FairScheduler
+from jobs import Job
+from limiter_storage import SQLiteStorage
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(Database(str(tmp_path / "state.db")), **kwargs)
+
+
+def enqueue(queue, job_id, created_at, priority=1, tenant=None, connection="conn"):
+    job = Job(job_id, "transfer", {"business_connection_id": connection, "BOT_TOKEN": "secret"})
+    job.created_at = created_at
+    queue.enqueue(job, ["python", "worker.py", "--config", "/tmp/cfg.json"], ["/tmp/cfg.json"], "key",
+                  priority, tenant)
+    return job
+
+
+def test_claims_respect_global_limit_across_processes(tmp_path):
+    """Test that queues opened separately never run more than max_running jobs"""
+    path = str(tmp_path / "state.db")
+    for index in range(6):
+        enqueue(JobQueue(Database(path)), f"job{index}", 100.0 + index)
+
+    claimed = []
+    lock = threading.Lock()
+
+    def claim(owner):
+        # Each thread uses its own connection, like a separate web process
+        queue = JobQueue(Database(path), max_running=2)
+        row = queue.claim_next(owner)
+        if row:
+            with lock:
+                claimed.append((row["id"], row["owner"]))
+
+    threads = [threading.Thread(target=claim, args=(f"host:{index}",)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(job_id for job_id, _ in claimed) == ["job0", "job1"]
+    queue = JobQueue(Database(path))
+    assert queue.counts() == {"queued": 4, "running": 2}
+    assert queue.get("job3")["queue_position"] == 1
+    row = queue.get("job0")
+    assert row["status"] == "running"
+
+
+def test_claimed_row_carries_command_without_secrets(tmp_path):
+    """Test that the claimed job has its command and cleanup files but no token"""
+    queue = make_queue(tmp_path)
+    enqueue(queue, "job1", 100.0)
+    row = queue.claim_next("host:1")
+    assert row["cmd"][-1] == "/tmp/cfg.json"
+    assert row["cleanup_files"] == ["/tmp/cfg.json"]
+    assert row["cache_key"] == "key"
+    assert "BOT_TOKEN" not in row["params"]
+    assert queue.claim_next("host:2") is None
+
+
+def test_claims_follow_priority_fairness_and_connection_limits(tmp_path):
+    """Test that claims use the scheduler and its state is shared by queues"""
+    path = str(tmp_path / "state.db")
+    scheduler = FairScheduler(max_per_connection=1)
+    queue = JobQueue(Database(path), max_running=3, scheduler=scheduler)
+    enqueue(queue, "batch", 100.0, priority=2, tenant="a", connection="c1")
+    enqueue(queue, "a1", 101.0, tenant="a", connection="c1")
+    enqueue(queue, "a2", 102.0, tenant="a", connection="c2")
+    enqueue(queue, "a3", 103.0, tenant="a", connection="c3")
+    enqueue(queue, "b1", 104.0, tenant="b", connection="c3")
+    assert queue.position("batch") == 4
+    assert queue.get("batch")["priority"] == "low"
+
+    assert queue.claim_next("host:1")["id"] == "a1"
+    # A second queue (another process) continues the round robin
+    other = JobQueue(Database(path), max_running=3, scheduler=scheduler)
+    assert other.claim_next("host:2")["id"] == "b1"
+    # c1 and c3 are busy, so tenant a's next job on c2 runs
+    assert other.claim_next("host:2")["id"] == "a2"
+    assert other.claim_next("host:2") is None
+
+    overview = queue.overview()
+    assert (overview["queued"], overview["running"]) == (2, 3)
+    assert overview["classes"]["low"]["queued"] == 1
+    assert overview["classes"]["normal"]["oldest_wait"] > 0
+    assert {item["tenant"]: item["running"] for item in overview["tenants"]} == {"a": 2, "b": 1}
+    assert [item["saturated"] for item in overview["connections"]] == [True, True, True]
+
+
+def test_cancel_output_and_stale_owners(tmp_path):
+    """Test cancellation, shared output and failing jobs of dead owners"""
+    queue = make_queue(tmp_path, max_running=2, stale_after=0)
+    enqueue(queue, "job1", 100.0)
+    enqueue(queue, "job2", 101.0)
+    queue.claim_next("host:1")
+
+    assert queue.request_cancel("job2") == "cancelled"
+    assert queue.request_cancel("job1") == "requested"
+    assert queue.request_cancel("job2") is None
+    assert queue.cancel_requested("host:1") == {"job1"}
+    assert queue.cancel_requested("host:2") == set()
+
+    queue.append_line("job1", "hello")
+    queue.append_event("job1", {"type": "balance_observed", "amount": 5})
+    queue.append_line("job1", "oops", True)
+    output = queue.read_output("job1")
+    assert [item.get("line") for item in output] == ["hello", None, "oops"]
+    assert output[1]["event"]["amount"] == 5
+    lines = queue.read_output("job1", after=output[0]["seq"], include_events=False)
+    assert [(item["line"], item["is_error"]) for item in lines] == [("oops", True)]
+
+    assert queue.reap_stale() == ["job1"]
+    assert queue.get("job1")["status"] == "failed"
+    assert queue.read_output("job1")[-1]["line"] == "The process running this job stopped responding"
+
+
+def test_pause_force_cancel_and_drain(tmp_path):
+    """Test pause requests, forced cancellation and drain mode"""
+    queue = make_queue(tmp_path, max_running=2)
+    enqueue(queue, "job1", 100.0)
+    enqueue(queue, "job2", 101.0)
+    queue.claim_next("host:1")
+
+    assert queue.request_pause("job1", True)
+    assert not queue.request_pause("job2", True)
+    assert queue.control_requests("host:1") == {"job1": {"cancel_requested": 0, "pause_requested": 1}}
+    assert queue.drain_status()["paused"] == 1
+
+    queue.request_cancel("job1", force=True)
+    queue.request_cancel("job1")
+    assert queue.control_requests("host:1")["job1"]["cancel_requested"] == 2
+    assert not queue.request_pause("job1", False)
+
+    queue.set_draining(True)
+    assert queue.claim_next("host:1") is None
+    assert queue.drain_status() == {"draining": True, "queued": 1, "running": 1, "paused": 1, "idle": False}
+    # Drain mode is shared with other processes
+    other = make_queue(tmp_path, max_running=2)
+    assert other.overview()["draining"]
+    other.set_draining(False)
+    assert queue.claim_next("host:1")["id"] == "job2"
+
+
+def test_dispatcher_launches_and_cancels(tmp_path):
+    """Test that the dispatcher runs claimed jobs and forwards cancel requests"""
+    queue = make_queue(tmp_path, max_running=2)
+    launched = []
+
+    class Handle:
+        cancelled = 0
+        forced = False
+        paused = None
+
+        def cancel(self, force=False):
+            self.cancelled += 1
+            self.forced = force
+
+        def pause(self):
+            self.paused = True
+
+        def resume(self):
+            self.paused = False
+
+    handle = Handle()
+
+    def launch(row):
+        launched.append(row["id"])
+        return handle
+
+    dispatcher = JobDispatcher(queue, launch, owner="host:1")
+    enqueue(queue, "job1", 100.0)
+    enqueue(queue, "job2", 101.0)
+    dispatcher.poll()
+    assert launched == ["job1", "job2"]
+
+    queue.request_pause("job2", True)
+    dispatcher.poll()
+    assert handle.paused is True
+    queue.request_pause("job2", False)
+    dispatcher.poll()
+    assert handle.paused is False
+
+    queue.request_cancel("job1")
+    dispatcher.poll()
+    dispatcher.poll()
+    assert (handle.cancelled, handle.forced) == (1, False)
+    # Forcing escalates a cooperative cancel that is taking too long
+    queue.request_cancel("job1", force=True)
+    dispatcher.poll()
+    assert (handle.cancelled, handle.forced) == (2, True)
+
+
+def test_dispatcher_forgets_a_job_that_finishes_during_launch(tmp_path):
+    """Test that a job whose worker exits before launch() returns is not kept as running"""
+    queue = make_queue(tmp_path)
+    dispatcher = None
+
+    def launch(row):
+        finisher = threading.Thread(target=dispatcher.finished, args=(row["id"],))
+        finisher.start()
+        finisher.join()
+        return object()
+
+    dispatcher = JobDispatcher(queue, launch, owner="host:1")
+    enqueue(queue, "job1", 100.0)
+    dispatcher.poll()
+    assert dispatcher._running == {}
+    assert not dispatcher._launching and not dispatcher._finished_early
+
+
+def test_output_is_written_behind_while_another_process_holds_the_lock(tmp_path):
+    """Test that output is queued without waiting for the write lock, then written in order in batches"""
+    path = str(tmp_path / "state.db")
+    writer = WriteBehind(Database(path, busy_timeout_ms=10000), interval=0.01)
+    queue = make_queue(tmp_path, writer=writer)
+    job = enqueue(queue, "job1", 100.0)
+
+    other = Database(path).connect()
+    other.execute("BEGIN IMMEDIATE")
+    calls = []
+    for index in range(200):
+        queue.append_line("job1", f"line {index}")
+    queue.append_event("job1", {"type": "balance_observed", "amount": 5})
+    queue.record_state(job)
+    writer.call(calls.append, "after")
+    # Nothing was written yet, and the caller did not wait
+    assert not calls
+    other.rollback()
+
+    assert writer.flush(timeout=10)
+    assert calls == ["after"]
+    output = queue.read_output("job1")
+    assert [item["line"] for item in output[:200]] == [f"line {index}" for index in range(200)]
+    assert output[200]["event"]["amount"] == 5
+    assert "transfers_succeeded" in queue.get("job1")
+
+
+def test_sqlite_limiter_storage_is_shared(tmp_path):
+    """Test that counters are shared between storage instances and expire"""
+    uri = f"sqlite:///{tmp_path / 'limits.db'}"
+    first, second = SQLiteStorage(uri), SQLiteStorage(uri)
+    assert first.incr("key", 60) == 1
+    assert second.incr("key", 60) == 2
+    assert first.get("key") == 2
+    assert first.get_expiry("key") > 0
+
+    assert first.incr("short", -1) == 1
+    assert second.get("short") == 0
+    assert second.incr("short", 60) == 1
+
+    second.clear("key")
+    assert first.get("key") == 0
+    assert first.check()
@@ -0,0 +1,79 @@
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import events
+from events import EventEmitter, EventDecoder, classify_error, parse_event_line
+from jobs import Job
+
+
+def test_classify_error():
+    """Test that Telegram error descriptions map to stable classes"""
+    assert classify_error("Bad Request: PAYMENT_REQUIRED") == "payment_required"
+    assert classify_error("Bad Request: chat not found") == "chat_not_found"
+    assert classify_error("Forbidden: bot was blocked by the user") == "forbidden"
+    assert classify_error("something else") == "unknown"
+
+
+def test_emitter_round_trip_through_pipe():
+    """Test that emitted events can be decoded from the other end of a pipe"""
+    read_fd, write_fd = os.pipe()
+    emitter = EventEmitter(write_fd)
+    with emitter.step("funding") as step:
+        step["stars"] = 25
+    emitter.emit(events.GIFT_TRANSFERRED, gift_id="g1", chat_id=42, stars=25)
+    emitter._stream.close()
+
+    with os.fdopen(read_fd, 'rb') as stream:
+        received = EventDecoder().feed(stream.read())
+
+    assert [event["type"] for event in received] == [
+        events.STEP_STARTED, events.STEP_FINISHED, events.GIFT_TRANSFERRED
+    ]
+    assert received[1]["ok"] is True
+    assert received[1]["stars"] == 25
+    assert received[1]["duration_ms"] >= 0
+
+
+def test_emitter_without_channel_is_noop():
+    """Test that emitting without an event channel does nothing"""
+    emitter = EventEmitter()
+    assert emitter.enabled is False
+    emitter.emit(events.ERROR, code="unknown")
+
+
+def test_decoder_handles_partial_lines_and_noise():
+    """Test that partial lines are buffered and unknown lines are skipped"""
+    decoder = EventDecoder()
+    assert decoder.feed(b'{"type": "balance_obs') == []
+    assert decoder.feed(b'erved", "amount": 7}\nnot json\n{"type": "other"}\n') == [
+        {"type": "balance_observed", "amount": 7}
+    ]
+    assert parse_event_line("") is None
+
+
+def test_job_state_from_events():
+    """Test that job state is derived from worker events"""
+    job = Job("job1", "batch")
+    job.apply_event({"type": events.STEP_STARTED, "step": "funding", "ts": 1.0})
+    assert job.current_step == "funding"
+    job.apply_event({"type": events.STEP_FINISHED, "step": "funding", "duration_ms": 5.0, "ok": True})
+    assert not job.funding_started
+    job.apply_event({"type": events.FUNDING_STARTED, "star_count": 30})
+    assert job.funding_started
+    job.apply_event({"type": events.STARS_FUNDED, "star_count": 30})
+    job.apply_event({"type": events.GIFT_TRANSFERRED, "gift_id": "g1", "chat_id": 1, "stars": 25})
+    job.apply_event({"type": events.ERROR, "code": "chat_not_found", "gift_id": "g2", "chat_id": 2})
+    job.apply_event({"type": events.LOG_FILE, "path": "logs/run.log"})
+    job.finish(1)
+
+    state = job.to_dict()
+    assert state["current_step"] is None
+    assert state["stars_funded"] == 30
+    assert state["stars_spent"] == 25
+    assert state["transfers_succeeded"] == 1
+    assert state["transfers_failed"] == 1
+    assert state["status"] == "failed"
+    assert job.log_file == "logs/run.log"
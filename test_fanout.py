@@ -0,0 +1,72 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import fanout
+from fanout import ConnectionContext, build_contexts, group_rows, parse_connection_tokens, run_fanout
+
+
+def test_contexts_share_sessions_and_limits_per_token():
+    """Test that connections of one bot token share its session and call limit"""
+    base = ConnectionContext("1:abc", "A", 5, 25, enable_redundant_transfer=True)
+    contexts = build_contexts(base, ["A", "B", "C"], {"C": "2:def"})
+
+    assert [context.bot_token for context in contexts] == ["1:abc", "1:abc", "2:def"]
+    assert contexts[0].http is contexts[1].http
+    assert contexts[0].api_slots is contexts[1].api_slots
+    assert contexts[2].http is not contexts[0].http
+    assert [context.label for context in contexts] == ["A", "B", "C"]
+    assert all(context.enable_redundant_transfer for context in contexts)
+
+
+def test_group_rows_by_connection():
+    """Test that rows without a connection belong to the default one"""
+    rows = [(1, {"gift_id": "g1"}), (2, {"gift_id": "g2", "business_connection_id": "B"}),
+            (3, {"gift_id": "g3"})]
+    groups = group_rows(rows, "A")
+    assert list(groups) == ["A", "B"]
+    assert [number for number, _ in groups["A"]] == [1, 3]
+
+
+def test_run_fanout_isolates_failures_and_sets_current_connection():
+    """Test that one connection's exception only fails that connection"""
+    contexts = build_contexts(ConnectionContext("1:abc", "A", 5, 25), ["A", "B", "C"], {})
+    started = threading.Barrier(3, timeout=5)
+
+    def work(connection):
+        # All connections run at the same time
+        started.wait()
+        assert fanout.current() is connection
+        if connection.business_connection_id == "B":
+            raise RuntimeError("boom")
+        return {"transferred": 1}
+
+    results = run_fanout(contexts, work, max_workers=3)
+    assert [result["ok"] for result in results] == [True, False, True]
+    assert results[1] == {"business_connection_id": "B", "ok": False, "error": "boom"}
+    assert results[2]["transferred"] == 1
+    assert fanout.current() is None
+
+    class Stop(Exception):
+        pass
+
+    def cancel(connection):
+        if connection.business_connection_id == "C":
+            raise Stop()
+        return {}
+
+    with pytest.raises(Stop):
+        run_fanout(contexts, cancel, max_workers=2, stop=lambda error: isinstance(error, Stop))
+
+
+def test_parse_connection_tokens():
+    """Test the connection=token header format"""
+    assert parse_connection_tokens(" B=1:abc , C=2:def,") == {"B": "1:abc", "C": "2:def"}
+    assert parse_connection_tokens("") == {}
+    with pytest.raises(ValueError):
+        parse_connection_tokens("B")
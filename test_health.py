@@ -0,0 +1,68 @@
+import os
+import sys
+
+import requests
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import events
+from health import TelegramProbe, evaluate_readiness
+from metrics import Metrics, RollingWindow, percentile
+
+
+def test_transfer_stats_use_recent_outcomes_and_latencies():
+    """Test the rolling success rate and p95 transfer latency"""
+    metrics = Metrics()
+    assert metrics.transfer_stats()["success_rate"] is None
+    for latency in range(1, 21):
+        metrics.record_event({"type": events.API_CALL, "method": "transferGift", "ok": True, "latency_ms": latency})
+        metrics.record_event({"type": events.GIFT_TRANSFERRED, "gift_id": f"g{latency}", "stars": 0})
+    metrics.record_event({"type": events.API_CALL, "method": "getMe", "ok": True, "latency_ms": 999})
+    metrics.record_event({"type": events.ERROR, "step": "transfer", "gift_id": "g0", "code": "bad_request"})
+    metrics.record_event({"type": events.ERROR, "step": "funding", "code": "payment_required"})
+
+    stats = metrics.transfer_stats()
+    assert stats["transfers"] == 21
+    assert stats["success_rate"] == round(20 / 21, 3)
+    assert stats["p95_latency_ms"] == 19
+
+    window = RollingWindow(window=10)
+    window.add(1, now=0)
+    window.add(2, now=5)
+    assert window.values(now=12) == [2]
+    assert percentile([], 0.95) is None
+
+
+def test_probe_caches_observations_and_checks():
+    """Test that worker API calls and getMe checks update the cached state"""
+    calls = []
+
+    def fail(url, timeout):
+        calls.append(url)
+        raise requests.exceptions.ConnectionError("down")
+
+    probe = TelegramProbe("1:abc", request=fail)
+    assert probe.snapshot()["reachable"] is None
+    probe.observe({"type": events.API_CALL, "method": "getMe", "ok": False, "status_code": 401, "latency_ms": 42})
+    assert probe.snapshot()["reachable"] is True
+    assert probe.snapshot()["get_me_latency_ms"] == 42
+
+    assert not probe.check()
+    assert calls == ["https://api.telegram.org/bot1:abc/getMe"]
+    snapshot = probe.snapshot()
+    assert snapshot["reachable"] is False
+    assert snapshot["get_me_latency_ms"] == 42
+
+
+def test_evaluate_readiness():
+    """Test the reasons that make the service unready"""
+    telegram = {"reachable": True}
+    queue = {"draining": False, "queued": 3}
+    transfers = {"transfers": 5, "success_rate": 0.0}
+    assert evaluate_readiness(telegram, queue, transfers, 10, 0.5) == (True, [])
+
+    ready, reasons = evaluate_readiness({"reachable": False}, {"draining": True, "queued": 10},
+                                        {"transfers": 10, "success_rate": 0.4}, 10, 0.5)
+    assert not ready
+    assert reasons == ["draining", "telegram_unreachable", "queue_full", "low_success_rate"]
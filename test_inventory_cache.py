@@ -0,0 +1,106 @@
+import threading
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from inventory_cache import InventoryCache, make_cache_key, compute_etag
+
+
+class FakeClock:
+    """Manually advanced clock for TTL tests"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_hides_token():
+    """Test that the cache key does not contain the bot token"""
+    key = make_cache_key("123:secret", "conn")
+    assert "secret" not in key
+    assert key == make_cache_key("123:secret", "conn")
+    assert key != make_cache_key("123:secret", "other")
+
+
+def test_get_or_fetch_respects_ttl():
+    """Test that entries are served until the TTL expires"""
+    clock = FakeClock()
+    cache = InventoryCache(ttl=10, clock=clock)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"owned_gift_id": "gift1"}]
+
+    first = cache.get_or_fetch("k", fetch)
+    clock.now = 5
+    second = cache.get_or_fetch("k", fetch)
+    assert first is second
+    assert len(calls) == 1
+
+    clock.now = 10
+    cache.get_or_fetch("k", fetch)
+    assert len(calls) == 2
+
+
+def test_etag_changes_with_contents():
+    """Test that the ETag only depends on the gift list contents"""
+    assert compute_etag([{"a": 1, "b": 2}]) == compute_etag([{"b": 2, "a": 1}])
+    assert compute_etag([{"a": 1}]) != compute_etag([{"a": 2}])
+
+
+def test_concurrent_misses_are_coalesced():
+    """Test that concurrent misses share a single fetch"""
+    cache = InventoryCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(timeout=5)
+        return [{"owned_gift_id": "gift1"}]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("k", fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Give every thread a chance to join the in-flight fetch
+    while len(calls) == 0:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(entry is results[0] for entry in results)
+
+
+def test_invalidate_during_fetch_discards_result():
+    """Test that a fetch racing an invalidation is not cached"""
+    cache = InventoryCache(ttl=60)
+
+    def fetch():
+        cache.invalidate("k")
+        return [{"owned_gift_id": "gift1"}]
+
+    entry = cache.get_or_fetch("k", fetch)
+    assert entry.gifts == [{"owned_gift_id": "gift1"}]
+    assert cache.get("k") is None
+
+
+def test_put_skips_lists_invalidated_since_the_fetch():
+    """Test that a streamed list is stored only if nothing invalidated it meanwhile"""
+    cache = InventoryCache(ttl=60)
+    generation = cache.generation("k")
+    entry = cache.put("k", [{"owned_gift_id": "gift1"}], generation)
+    assert cache.get("k") is entry
+
+    generation = cache.generation("k")
+    cache.invalidate("k")
+    assert cache.put("k", [{"owned_gift_id": "gift2"}], generation) is None
+    assert cache.get("k") is None
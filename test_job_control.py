@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from job_control import CANCEL, PAUSE, RESUME, ControlChannel, JobCancelled, send_command
+from task_graph import TaskGraph
+
+
+def wait_for(predicate, timeout=2.0):
+    # The reader thread applies commands asynchronously
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_checkpoint_pauses_resumes_and_cancels_through_pipe():
+    """Test that commands sent over the pipe take effect at checkpoints"""
+    read_fd, write_fd = os.pipe()
+    paused, resumed = threading.Event(), []
+    control = ControlChannel(read_fd, on_pause=lambda step: paused.set(), on_resume=resumed.append)
+    control.checkpoint("preflight")
+
+    send_command(write_fd, PAUSE)
+    passed = threading.Event()
+
+    def run():
+        control.checkpoint("row 2")
+        passed.set()
+
+    thread = threading.Thread(target=run)
+    assert wait_for(lambda: control.paused)
+    thread.start()
+    assert paused.wait(2)
+    assert not passed.wait(0.1)
+
+    send_command(write_fd, RESUME)
+    assert passed.wait(2)
+    thread.join()
+    assert resumed == ["row 2"]
+
+    send_command(write_fd, CANCEL)
+    os.close(write_fd)
+    assert wait_for(lambda: control.cancelled)
+    with pytest.raises(JobCancelled):
+        control.checkpoint("transfer")
+    assert control.sleep(5)
+    assert not send_command(write_fd, CANCEL)
+
+
+def test_cancel_wakes_paused_checkpoint():
+    """Test that a paused job can still be cancelled"""
+    control = ControlChannel()
+    control.apply(PAUSE)
+    errors = []
+
+    def run():
+        try:
+            control.checkpoint("funding")
+        except JobCancelled as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    control.apply(CANCEL)
+    thread.join(2)
+    assert errors == ["funding"]
+
+
+def test_cancel_after_funding_lets_the_transfer_run():
+    """Test that a cancel arriving once the bot is funded does not strand its stars"""
+    control = ControlChannel()
+    ran = []
+
+    def step(name):
+        control.checkpoint(name)
+        ran.append(name)
+        return True
+
+    def fund(recipient):
+        control.checkpoint("funding")
+        control.commit("funding")
+        ran.append("funding")
+        control.apply(CANCEL)
+        return True
+
+    graph = TaskGraph(max_workers=2)
+    graph.add("recipient", lambda: step("recipient"))
+    graph.add("funding", fund, deps=("recipient",))
+    graph.add("settlement", lambda funded: step("settlement"), deps=("funding",))
+    graph.add("hold", lambda settled: not control.sleep(0.01) and step("hold"), deps=("settlement",))
+    graph.add("transfer", lambda *ready: step("transfer"), deps=("settlement", "hold"))
+    graph.run()
+    assert ran == ["recipient", "funding", "settlement", "hold", "transfer"]
+
+    # A cancelled pause continues, and batch rows still stop
+    control.apply(PAUSE)
+    control.checkpoint("transfer")
+    with pytest.raises(JobCancelled):
+        control.checkpoint("row 2", cancellable=True)
+
+
+def test_cancel_before_funding_stops_commit():
+    """Test that a cancel that arrives before the stars move stops the job"""
+    control = ControlChannel()
+    control.apply(CANCEL)
+    with pytest.raises(JobCancelled):
+        control.commit("funding")
+    assert not control.committed
+
+
+def test_cancel_after_one_connection_funds_stops_the_others():
+    """Test that connections of a fan-out commit separately"""
+    control = ControlChannel()
+    control.checkpoint("a/funding", connection="a")
+    control.commit("funding", "a")
+    control.apply(CANCEL)
+
+    # The funded connection finishes its transfer
+    control.checkpoint("a/settlement", connection="a")
+    assert not control.sleep(0.01, connection="a")
+
+    # The other one stops before it moves stars
+    assert control.sleep(0.01, connection="b")
+    with pytest.raises(JobCancelled):
+        control.checkpoint("b/funding", connection="b")
+    with pytest.raises(JobCancelled):
+        control.commit("funding", "b")
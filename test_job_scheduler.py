@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from job_scheduler import FairScheduler, parse_weights, resolve_priority, tenant_id, ANONYMOUS_TENANT
+
+
+def make_job(job_id, priority=1, tenant="a", connection="conn1", created_at=0.0):
+    return {"id": job_id, "priority": priority, "tenant": tenant,
+            "business_connection_id": connection, "created_at": created_at}
+
+
+def run_schedule(scheduler, queued, slots):
+    """Start jobs one at a time as if each finished before the next started"""
+    virtual_times, order = {}, []
+    queued = list(queued)
+    for _ in range(slots):
+        job = scheduler.select(queued, [], virtual_times)
+        if job is None:
+            break
+        virtual_times.update(scheduler.advance(job["tenant"], virtual_times))
+        queued.remove(job)
+        order.append(job["id"])
+    return order
+
+
+def test_priority_classes_are_strict():
+    """Test that higher classes run first and defaults depend on the job kind"""
+    scheduler = FairScheduler()
+    queued = [make_job("batch", priority=2, created_at=1.0), make_job("single", priority=0, created_at=2.0)]
+    assert scheduler.select(queued, [], {})["id"] == "single"
+
+    assert resolve_priority("transfer") == 0
+    assert resolve_priority("batch") == 2
+    assert resolve_priority("batch", "HIGH") == 0
+    with pytest.raises(ValueError):
+        resolve_priority("run", "urgent")
+
+
+def test_weighted_round_robin_between_tenants():
+    """Test that a tenant's backlog is interleaved with others by weight"""
+    scheduler = FairScheduler(max_per_connection=10, weights={"b": 2})
+    queued = [make_job(f"a{index}", tenant="a", created_at=index) for index in range(6)]
+    queued += [make_job(f"b{index}", tenant="b", created_at=10 + index) for index in range(6)]
+    order = run_schedule(scheduler, queued, 6)
+    assert order == ["a0", "b0", "b1", "a1", "b2", "b3"]
+
+    # A tenant that was idle does not get to catch up on missed turns
+    late = [make_job(f"c{index}", tenant="c", created_at=20 + index) for index in range(3)]
+    virtual_times = {"a": 50.0, "*": 49.0}
+    job = scheduler.select(late + [make_job("a9", tenant="a", created_at=30)], [], virtual_times)
+    virtual_times.update(scheduler.advance(job["tenant"], virtual_times))
+    assert job["id"] == "c0"
+    assert virtual_times["c"] == 50.0
+
+
+def test_connection_limit_skips_busy_accounts():
+    """Test that jobs of a saturated business connection wait"""
+    scheduler = FairScheduler(max_per_connection=1)
+    queued = [make_job("first", connection="busy", created_at=1.0),
+              make_job("second", connection="idle", priority=2, created_at=2.0)]
+    running = [{"id": "r", "business_connection_id": "busy"}]
+    assert scheduler.select(queued, running, {})["id"] == "second"
+    assert scheduler.select(queued[:1], running, {}) is None
+
+
+def test_tenants_and_weights():
+    """Test tenant derivation and weight parsing"""
+    assert tenant_id(None) == ANONYMOUS_TENANT
+    assert tenant_id("secret") == tenant_id("secret") != tenant_id("other")
+    assert "secret" not in tenant_id("secret")
+    assert parse_weights(" a1b2:3, anonymous:1 ,") == {"a1b2": 3, "anonymous": 1}
+    for spec in ("a1b2", "a1b2:0", ":2", "a1b2:x"):
+        with pytest.raises(ValueError):
+            parse_weights(spec)
@@ -0,0 +1,73 @@
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import events
+from db import Database
+from jobs import Job
+from job_store import JobStore
+
+
+def make_job(job_id, created_at, transfers):
+    """Create a finished job with the given (gift_id, chat_id, ok) transfers"""
+    job = Job(job_id, "batch", {"business_connection_id": "conn", "BOT_TOKEN": "secret", "rows": len(transfers)})
+    job.created_at = created_at
+    return job, [
+        job.apply_event({"type": events.GIFT_TRANSFERRED, "gift_id": gift_id, "chat_id": chat_id, "stars": 10})
+        if ok else
+        job.apply_event({"type": events.ERROR, "code": "chat_not_found", "gift_id": gift_id, "chat_id": chat_id})
+        for gift_id, chat_id, ok in transfers
+    ]
+
+
+def test_job_history_round_trip(tmp_path):
+    """Test that jobs, transfers and outcomes are persisted without secrets"""
+    store = JobStore(Database(str(tmp_path / "state.db")))
+    job, transfers = make_job("job1", 100.0, [("g1", 42, True), ("g2", 43, False)])
+    store.record_started(job)
+    for transfer in transfers:
+        store.record_transfer(job.id, transfer)
+    job.finish(1)
+    store.record_finished(job)
+
+    stored = store.get("job1")
+    assert stored["status"] == "failed"
+    assert stored["stars_spent"] == 10
+    assert stored["business_connection_id"] == "conn"
+    assert "BOT_TOKEN" not in stored["params"]
+    assert [(t["gift_id"], t["recipient"], t["ok"]) for t in stored["transfers"]] == [
+        ("g1", "42", True), ("g2", "43", False)
+    ]
+    assert store.get("missing") is None
+
+
+def test_query_filters_and_pagination(tmp_path):
+    """Test filtering by recipient, gift, status and time with pagination"""
+    store = JobStore(Database(str(tmp_path / "state.db")))
+    for index in range(5):
+        job, transfers = make_job(f"job{index}", 100.0 + index, [(f"g{index}", 42 if index % 2 else 7, True)])
+        store.record_started(job)
+        for transfer in transfers:
+            store.record_transfer(job.id, transfer)
+        job.finish(0)
+        store.record_finished(job)
+
+    jobs, has_more = store.query(recipient="42")
+    assert [job["id"] for job in jobs] == ["job3", "job1"]
+    assert not has_more
+    assert jobs[0]["transfers"][0]["gift_id"] == "g3"
+
+    jobs, _ = store.query(gift_id="g4")
+    assert [job["id"] for job in jobs] == ["job4"]
+
+    jobs, has_more = store.query(page=1, per_page=2)
+    assert [job["id"] for job in jobs] == ["job4", "job3"]
+    assert has_more
+    jobs, has_more = store.query(page=3, per_page=2)
+    assert [job["id"] for job in jobs] == ["job0"]
+    assert not has_more
+
+    jobs, _ = store.query(since=101.5, until=103.0, status="succeeded")
+    assert [job["id"] for job in jobs] == ["job3", "job2"]
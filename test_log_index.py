@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import datetime
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from log_index import LogIndex, parse_log_start
+
+
+def write_log(log_dir, name, lines):
+    """Write a log file with the given number of lines"""
+    with open(os.path.join(log_dir, name), "w") as f:
+        f.write("entry\n" * lines)
+
+
+def test_started_and_finished_runs_are_indexed(tmp_path):
+    """Test that a run's log gets its job, outcome, size and line count"""
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    index = LogIndex(Database(str(tmp_path / "state.db")), str(log_dir))
+
+    name = "gift_transfer_log_20240101_120000_0123abcd.log"
+    index.record_started(name, "20240101_120000_0123abcd", "transfer", started_at=100.0)
+    write_log(str(log_dir), name, 3)
+    index.record_finished(name, "failed", finished_at=105.0)
+
+    entry = index.get(name)
+    assert entry["job_id"] == "20240101_120000_0123abcd"
+    assert entry["kind"] == "transfer"
+    assert entry["outcome"] == "failed"
+    assert entry["line_count"] == 3
+    assert entry["size"] == 18
+    assert (entry["started_at"], entry["finished_at"]) == (100.0, 105.0)
+
+
+def test_sync_and_paginated_listing(tmp_path):
+    """Test that unindexed files are picked up and listed newest first"""
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    database = Database(str(tmp_path / "state.db"))
+    for second in range(5):
+        write_log(str(log_dir), f"gift_transfer_log_20240101_12000{second}.log", second)
+    write_log(str(log_dir), "notes.txt", 1)
+
+    index = LogIndex(database, str(log_dir))
+    assert index.sync() == 5
+    assert index.sync() == 0
+
+    entries, has_more = index.list(page=1, per_page=2)
+    assert [entry["filename"] for entry in entries] == [
+        "gift_transfer_log_20240101_120004.log", "gift_transfer_log_20240101_120003.log"
+    ]
+    assert has_more
+    entries, has_more = index.list(page=3, per_page=2)
+    assert [entry["line_count"] for entry in entries] == [0]
+    assert not has_more
+
+    start = parse_log_start("gift_transfer_log_20240101_120002.log")
+    assert start == datetime(2024, 1, 1, 12, 0, 2).timestamp()
+    entries, _ = index.list(since=start, until=start + 1)
+    assert len(entries) == 2
+
+    os.remove(log_dir / "gift_transfer_log_20240101_120000.log")
+    index.sync()
+    assert index.get("gift_transfer_log_20240101_120000.log") is None
@@ -0,0 +1,57 @@
+import gzip
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from log_reader import tail_lines, read_chunks, follow, gzip_stream
+
+
+def test_tail_lines_reads_across_blocks(tmp_path):
+    """Test that the last lines are found when they span several blocks"""
+    path = tmp_path / "run.log"
+    path.write_bytes(b"".join(f"line {i}\r\n".encode() for i in range(1000)))
+
+    lines, end = tail_lines(str(path), 3, block_size=7)
+    assert lines == ["line 997", "line 998", "line 999"]
+    assert end == path.stat().st_size
+
+    lines, _ = tail_lines(str(path), 5000, block_size=4096)
+    assert len(lines) == 1000
+    assert lines[0] == "line 0"
+    assert tail_lines(str(path), 0)[0] == []
+
+
+def test_tail_lines_without_trailing_newline(tmp_path):
+    """Test that a partially written last line is returned"""
+    path = tmp_path / "run.log"
+    path.write_bytes(b"first\nsecond\npartial")
+    assert tail_lines(str(path), 2)[0] == ["second", "partial"]
+
+
+def test_follow_streams_until_writer_finishes(tmp_path):
+    """Test that follow mode picks up appended data and then stops"""
+    path = tmp_path / "run.log"
+    path.write_bytes(b"start\n")
+    polls = []
+
+    def is_active():
+        polls.append(None)
+        if len(polls) == 2:
+            with open(path, "ab") as f:
+                f.write(b"more\n")
+        return len(polls) < 3
+
+    assert b"".join(follow(str(path), 0, is_active, poll_interval=0)) == b"start\nmore\n"
+    assert b"".join(follow(str(path), 6, lambda: False)) == b"more\n"
+
+
+def test_gzip_stream_round_trip(tmp_path):
+    """Test that the compressed stream decodes to the file content"""
+    path = tmp_path / "run.log"
+    content = b"DEBUG payload dump\n" * 10000
+    path.write_bytes(content)
+    compressed = b"".join(gzip_stream(read_chunks(str(path), block_size=1000)))
+    assert len(compressed) < len(content) // 10
+    assert gzip.decompress(compressed) == content
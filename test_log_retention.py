@@ -0,0 +1,93 @@
+import gzip
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from log_index import LogIndex
+from log_retention import LogRetentionManager, SEGMENT_DIR, iter_log_content
+
+DAY = 86400
+NOW = 100 * DAY
+
+
+def make_index(tmp_path, runs):
+    """Create finished run logs given as (name, started_at, content)"""
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    index = LogIndex(Database(str(tmp_path / "state.db")), str(log_dir))
+    for name, started_at, content in runs:
+        (log_dir / name).write_bytes(content)
+        index.record_started(name, started_at=started_at)
+        index.record_finished(name, "succeeded", finished_at=started_at + 10)
+    return index, log_dir
+
+
+def content_of(index, name):
+    return b"".join(iter_log_content(index.log_dir, index.get(name)))
+
+
+def test_compresses_large_logs_and_compacts_small_ones(tmp_path):
+    """Test that every run stays retrievable after compression and compaction"""
+    big = b"DEBUG payload\n" * 5000
+    index, log_dir = make_index(tmp_path, [
+        ("gift_transfer_log_a.log", NOW - 100, b"small one\n"),
+        ("gift_transfer_log_b.log", NOW - 90, b"small two\n"),
+        ("gift_transfer_log_c.log", NOW - 80, big),
+    ])
+    # A rotated backup holds the oldest part of run c
+    (log_dir / "gift_transfer_log_c.log.1").write_bytes(b"rotated\n")
+    # A log that is still being written is left alone
+    (log_dir / "gift_transfer_log_d.log").write_bytes(b"running\n")
+    index.record_started("gift_transfer_log_d.log", started_at=NOW)
+
+    manager = LogRetentionManager(index, max_age_days=0, compact_below_bytes=1024, clock=lambda: NOW,
+                                  is_active=lambda name: name == "gift_transfer_log_d.log")
+    assert manager.run_once() == {"compressed": 1, "compacted": 2, "deleted": 0, "freed_bytes": 0}
+
+    assert sorted(os.listdir(log_dir)) == ["gift_transfer_log_c.log.gz", "gift_transfer_log_d.log", SEGMENT_DIR]
+    assert content_of(index, "gift_transfer_log_a.log") == b"small one\n"
+    assert content_of(index, "gift_transfer_log_b.log") == b"small two\n"
+    assert content_of(index, "gift_transfer_log_c.log") == b"rotated\n" + big
+    # The segment is an ordinary multi-member gzip file
+    segment = log_dir / SEGMENT_DIR / os.listdir(log_dir / SEGMENT_DIR)[0]
+    assert gzip.decompress(segment.read_bytes()) == b"small one\nsmall two\n"
+
+    stats = manager.stats()
+    assert stats["runs_by_storage"] == {"segment": 2, "gzip": 1, "plain": 1}
+    assert stats["disk"]["segments"] == 1
+    assert manager.run_once()["compressed"] == 0
+
+
+def test_deletes_oldest_logs_beyond_limits(tmp_path):
+    """Test that age and count limits delete the oldest runs first"""
+    index, log_dir = make_index(tmp_path, [
+        (f"gift_transfer_log_{day}.log", NOW - day * DAY, b"x" * 2000) for day in (40, 5, 4, 3, 2)
+    ])
+    manager = LogRetentionManager(index, max_age_days=30, max_files=3, compression="none", clock=lambda: NOW)
+    summary = manager.run_once()
+
+    assert summary["deleted"] == 2
+    assert summary["freed_bytes"] == 4000
+    assert sorted(os.listdir(log_dir)) == ["gift_transfer_log_2.log", "gift_transfer_log_3.log",
+                                           "gift_transfer_log_4.log"]
+    assert index.get("gift_transfer_log_40.log") is None
+
+
+def test_size_limit_removes_whole_segments(tmp_path):
+    """Test that a segment is deleted together with all runs it holds"""
+    index, log_dir = make_index(tmp_path, [
+        ("gift_transfer_log_a.log", NOW - 2 * DAY, os.urandom(3000)),
+        ("gift_transfer_log_b.log", NOW - 2 * DAY + 5, os.urandom(3000)),
+        ("gift_transfer_log_c.log", NOW, os.urandom(3000)),
+    ])
+    manager = LogRetentionManager(index, max_age_days=0, max_total_bytes=5000, compact_below_bytes=10000,
+                                  clock=lambda: NOW + 100)
+    summary = manager.run_once()
+
+    assert summary["compacted"] == 3
+    assert summary["deleted"] == 2
+    assert [entry["filename"] for entry in index.entries()] == ["gift_transfer_log_c.log"]
+    assert manager.disk_usage()["segments"] == 1
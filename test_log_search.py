@@ -0,0 +1,79 @@
+import os
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from log_index import LogIndex
+from log_retention import LogRetentionManager
+from log_search import LogSearchIndex, build_match_query
+
+
+def make_search(tmp_path, active=()):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    database = Database(str(tmp_path / "state.db"))
+    index = LogIndex(database, str(log_dir))
+    return LogSearchIndex(database, index, is_active=lambda name: name in active), index, log_dir
+
+
+def test_incremental_indexing_of_a_growing_log(tmp_path):
+    """Test that only new complete lines are indexed on each pass"""
+    search, index, log_dir = make_search(tmp_path, active={"run.log"})
+    path = log_dir / "run.log"
+    index.record_started("run.log", "job1", "transfer", started_at=10.0)
+
+    path.write_bytes(b"INFO - Step 1: Checking bot\nERROR - transferGift failed: BALANCE_TOO_LOW for gi")
+    assert search.index_log("run.log") == 1
+    with open(path, "ab") as f:
+        f.write(b"ft 5983471780763796287\nINFO - Chat -1001234567 resolved\n")
+    assert search.index_log("run.log") == 2
+    assert search.index_log("run.log") == 0
+
+    runs, has_more = search.search(build_match_query("BALANCE_TOO_LOW 5983471780763796287"))
+    assert not has_more
+    assert runs[0]["filename"] == "run.log"
+    assert runs[0]["job_id"] == "job1"
+    match = runs[0]["matches"][0]
+    assert match["line"] == 2
+    assert match["offset"] == len(b"INFO - Step 1: Checking bot\n")
+    assert "[5983471780763796287]" in match["snippet"]
+
+    runs, _ = search.search(build_match_query("-1001234567"))
+    assert runs[0]["matches"][0]["line"] == 3
+
+
+def test_search_survives_compaction_and_follows_deletion(tmp_path):
+    """Test that compacted logs are searchable and deleted logs disappear"""
+    search, index, log_dir = make_search(tmp_path)
+    for number, started_at in ((1, 100.0), (2, 200.0)):
+        name = f"gift_transfer_log_{number}.log"
+        (log_dir / name).write_bytes(f"ERROR - Chat not found: {number}00\nINFO - done\n".encode())
+        index.record_started(name, started_at=started_at)
+        index.record_finished(name, "failed", finished_at=started_at + 1)
+
+    manager = LogRetentionManager(index, max_age_days=0, compact_below_bytes=1024, clock=lambda: 300.0)
+    manager.run_once()
+    for entry in index.entries():
+        search.index_log(entry["filename"])
+
+    runs, _ = search.search(build_match_query("chat not found"))
+    assert [run["filename"] for run in runs] == ["gift_transfer_log_2.log", "gift_transfer_log_1.log"]
+    runs, has_more = search.search(build_match_query("chat not found"), page=1, per_page=1)
+    assert len(runs) == 1 and has_more
+
+    index.remove(["gift_transfer_log_2.log"])
+    runs, _ = search.search(build_match_query("done"))
+    assert [run["filename"] for run in runs] == ["gift_transfer_log_1.log"]
+
+
+def test_schedule_unindexed_picks_up_new_logs(tmp_path):
+    """Test that only logs with unindexed content are queued"""
+    search, index, log_dir = make_search(tmp_path)
+    for name in ("a.log", "b.log"):
+        (log_dir / name).write_bytes(b"line\n")
+        index.record_started(name, started_at=1.0)
+        index.record_finished(name, "succeeded", finished_at=2.0)
+    search.index_log("a.log")
+    assert search.schedule_unindexed() == 1
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import threading
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from output_mux import OutputMultiplexer, WorkerHandlers
+
+CHILD = """
+import os, sys
+fd = int(sys.argv[1])
+for i in range(3):
+    print(f"line {i}", flush=True)
+sys.stderr.write("oops\\n")
+os.write(fd, b'{"type": "balance_observed", "amount": 5}\\n')
+sys.stdout.write("no newline")
+sys.exit(int(sys.argv[2]))
+"""
+
+
+def spawn(exit_code):
+    """Start a child writing to stdout, stderr and an event pipe"""
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(
+        [sys.executable, "-c", CHILD, str(write_fd), str(exit_code)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        pass_fds=(write_fd,)
+    )
+    os.close(write_fd)
+    return process, read_fd
+
+
+def test_multiplexes_several_workers_on_one_thread():
+    """Test that lines, events and exit codes are dispatched per worker"""
+    mux = OutputMultiplexer()
+    results = {}
+    handles = []
+    threads_before = threading.active_count()
+
+    for exit_code in (0, 3, 0, 1):
+        record = {"lines": [], "events": [], "exit": None}
+        process, read_fd = spawn(exit_code)
+        results[process.pid] = (exit_code, record)
+        handles.append(mux.register(process, WorkerHandlers(
+            on_line=lambda line, is_error, record=record: record["lines"].append((line, is_error)),
+            on_event=lambda event, record=record: record["events"].append(event),
+            on_exit=lambda code, record=record: record.__setitem__("exit", code)
+        ), read_fd))
+
+    # One loop thread regardless of the number of workers
+    assert threading.active_count() == threads_before + 1
+
+    for handle in handles:
+        assert handle.wait(timeout=10) is not None
+
+    for exit_code, record in results.values():
+        assert record["exit"] == exit_code
+        assert ("line 2", False) in record["lines"]
+        assert ("oops", True) in record["lines"]
+        assert ("no newline", False) in record["lines"]
+        assert record["events"] == [{"type": "balance_observed", "amount": 5}]
+
+
+def test_failing_handler_does_not_stop_the_loop():
+    """Test that an exception in one handler does not break other workers"""
+    mux = OutputMultiplexer()
+
+    def explode(line, is_error):
+        raise RuntimeError("handler bug")
+
+    process, read_fd = spawn(0)
+    broken = mux.register(process, WorkerHandlers(on_line=explode), read_fd)
+    assert broken.wait(timeout=10) == 0
+
+    lines = []
+    process, read_fd = spawn(0)
+    healthy = mux.register(process, WorkerHandlers(on_line=lambda line, is_error: lines.append(line)), read_fd)
+    assert healthy.wait(timeout=10) == 0
+    assert "line 0" in lines
@@ -0,0 +1,81 @@
+import os
+import stat
+import sys
+
+import pytest
+from cryptography.fernet import Fernet
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from profiles import ProfileStore, ProfileError, SecretBox, load_secret_key, apply_overrides
+
+CONFIG = {
+    "BOT_TOKEN": "123456:secret-token",
+    "BUSINESS_CONNECTION_ID": "conn",
+    "TARGET_CHAT_ID": 42,
+    "STAR_COUNT": 25
+}
+
+
+def make_store(tmp_path, key=None):
+    return ProfileStore(Database(str(tmp_path / "state.db")), SecretBox(key or Fernet.generate_key()))
+
+
+def test_profiles_are_validated_and_encrypted_at_rest(tmp_path):
+    """Test that secrets are only stored encrypted and never returned"""
+    store = make_store(tmp_path)
+    profile = store.create("main", CONFIG)
+    assert profile["bot_id"] == "123456"
+    assert "secret-token" not in str(profile)
+
+    with open(tmp_path / "state.db", "rb") as f:
+        assert b"secret-token" not in f.read()
+    assert store.resolve(profile["id"])["BOT_TOKEN"] == "123456:secret-token"
+
+    with pytest.raises(ProfileError):
+        store.create("main", CONFIG)
+    with pytest.raises(ProfileError):
+        store.create("broken", dict(CONFIG, TARGET_CHAT_ID=0))
+    with pytest.raises(ProfileError):
+        store.resolve("prf_unknown")
+
+    # A different key cannot read the stored secrets
+    other = make_store(tmp_path)
+    with pytest.raises(ProfileError):
+        other.resolve(profile["id"])
+
+
+def test_updates_invalidate_cached_profiles_across_stores(tmp_path):
+    """Test that a store sees updates made through another store"""
+    key = Fernet.generate_key()
+    first, second = make_store(tmp_path, key), make_store(tmp_path, key)
+    profile = first.create("main", CONFIG)
+    assert second.resolve(profile["id"])["STAR_COUNT"] == 25
+
+    updated = first.update(profile["id"], {"STAR_COUNT": 50, "LOG_DIR": "/ignored"})
+    assert updated["version"] == 2
+    assert second.resolve(profile["id"])["STAR_COUNT"] == 50
+    assert "LOG_DIR" not in second.resolve(profile["id"])
+
+    with pytest.raises(ProfileError):
+        first.update(profile["id"], {"BOT_TOKEN": " "})
+    assert first.delete(profile["id"])
+    with pytest.raises(ProfileError):
+        second.resolve(profile["id"])
+
+
+def test_overrides_and_key_file(tmp_path):
+    """Test request overrides and that the generated key is reused"""
+    config = apply_overrides(CONFIG, {"TARGET_CHAT_ID": "7", "STAR_COUNT": None})
+    assert (config["TARGET_CHAT_ID"], config["STAR_COUNT"]) == (7, 25)
+    assert CONFIG["TARGET_CHAT_ID"] == 42
+    with pytest.raises(ProfileError):
+        apply_overrides(CONFIG, {"STAR_COUNT": "-1"})
+
+    key_file = tmp_path / "data" / "secret.key"
+    key = load_secret_key(None, str(key_file))
+    assert load_secret_key(None, str(key_file)) == key
+    assert stat.S_IMODE(os.stat(key_file).st_mode) == 0o600
+    assert load_secret_key("configured", str(key_file)) == b"configured"
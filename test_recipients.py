@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from recipients import (BLOCKED, GIFTS_DISABLED, NOT_FOUND, UNKNOWN, VALID, RecipientStore, TokenBucket,
+                        check_recipients, classify_chat, parse_chat_ids, recipient_scope)
+
+
+def test_classify_chat():
+    """Test that getChat responses map to recipient outcomes"""
+    assert classify_chat({"ok": True, "result": {"id": 5}}) == VALID
+    assert classify_chat({"ok": True, "result": {"id": 5, "can_send_gift": False}}) == GIFTS_DISABLED
+    assert classify_chat({"ok": False, "description": "Bad Request: chat not found"}) == NOT_FOUND
+    assert classify_chat({"ok": False, "description": "Bad Request: user not found"}) == NOT_FOUND
+    assert classify_chat({"ok": False, "description": "Forbidden: bot was blocked by the user"}) == BLOCKED
+    assert classify_chat({"ok": False, "description": "Request failed after 1 attempts: timeout"}) == UNKNOWN
+    assert classify_chat({"ok": False, "description": "Bad Request: invalid user_id specified"}) == UNKNOWN
+
+
+def test_check_recipients_dedupes_and_skips_known():
+    """Test that each distinct unknown recipient is checked exactly once, concurrently"""
+    calls = []
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    def check(chat_id):
+        with lock:
+            calls.append(chat_id)
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.02)
+        with lock:
+            active["now"] -= 1
+        return NOT_FOUND if chat_id == 404 else VALID
+
+    outcomes = check_recipients([5, 404, 5, 7, 8, 9, 7], check, max_workers=4, known={8: BLOCKED})
+
+    assert list(outcomes) == [5, 404, 7, 8, 9]
+    assert outcomes == {5: VALID, 404: NOT_FOUND, 7: VALID, 8: BLOCKED, 9: VALID}
+    assert sorted(calls) == [5, 7, 9, 404]
+    assert active["max"] > 1
+
+
+def test_token_bucket_spaces_calls():
+    """Test that the bucket allows a burst, then one call per 1/rate seconds"""
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=10, burst=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+
+    assert sleeps == pytest.approx([0.1, 0.1])
+    assert now[0] == pytest.approx(0.2)
+
+
+def test_store_keeps_definitive_outcomes_per_bot(tmp_path):
+    """Test that stored outcomes are scoped to the bot and expire"""
+    store = RecipientStore(Database(str(tmp_path / "state.db")))
+    scope, other = recipient_scope("1:abc"), recipient_scope("2:def")
+    store.record(scope, 5, VALID)
+    store.record(scope, 404, NOT_FOUND)
+    store.record(scope, 7, UNKNOWN)
+
+    assert store.fresh(scope, [5, 404, 7, 9], max_age=60) == {5: VALID, 404: NOT_FOUND}
+    assert store.fresh(other, [5], max_age=60) == {}
+    assert store.fresh(scope, [5], max_age=0) == {}
+    assert "1:abc" not in scope
+
+    assert store.prune(max_age=-1) == 2
+    assert store.fresh(scope, [5, 404], max_age=60) == {}
+
+
+def test_parse_chat_ids():
+    """Test that chat ID lists are validated"""
+    assert parse_chat_ids([5, "6", " 5 "], 10) == [5, 6, 5]
+    for raw in ([], "5", [5, "abc"], [0]):
+        with pytest.raises(ValueError):
+            parse_chat_ids(raw, 10)
+    with pytest.raises(ValueError):
+        parse_chat_ids([1, 2, 3], 2)
@@ -0,0 +1,106 @@
+import os
+import random
+import sys
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from schedules import ScheduleStore, ScheduleRunner, TimerWheel, MISFIRE_GRACE
+
+CONFIG = "encrypted-config"
+
+
+def make_store(tmp_path):
+    return ScheduleStore(Database(str(tmp_path / "state.db")), rng=random.Random(7))
+
+
+def test_timer_wheel_expires_in_order_across_rounds():
+    """Test that timers fire on their tick, including ones beyond one revolution"""
+    wheel = TimerWheel(tick=1.0, slots=8, start=1000.0)
+    wheel.add("late", 1020.5)
+    wheel.add("soon", 1003.2)
+    wheel.add("past", 990.0)
+    wheel.add("cancelled", 1004.0)
+    wheel.cancel("cancelled")
+    assert wheel.advance(1001.0) == ["past"]
+    assert wheel.advance(1003.9) == ["soon"]
+    assert wheel.advance(1019.9) == []
+    wheel.add("soon", 1021.0)
+    assert wheel.advance(1030.0) == ["late", "soon"]
+    assert len(wheel) == 0
+
+
+def test_recurring_schedule_claims_each_occurrence_once(tmp_path):
+    """Test that occurrences advance with jitter and a second claim loses"""
+    store = make_store(tmp_path)
+    schedule = store.create("transfer", {"gift_id": "g1", "BOT_TOKEN": "1:secret"}, CONFIG, 10000.0,
+                            interval_seconds=3600, count=2, jitter_seconds=60, lead_seconds=120)
+    assert "config" not in schedule and "BOT_TOKEN" not in schedule["params"]
+    first_fire = schedule["next_fire_at"]
+    assert 10000.0 <= first_fire <= 10060.0
+
+    claimed = store.claim(schedule["id"], first_fire, now=first_fire - 120)
+    assert claimed["fire_time"] == first_fire
+    assert claimed["config"] == CONFIG
+    assert store.claim(schedule["id"], first_fire, now=first_fire - 120) is None
+
+    current = store.get(schedule["id"])
+    assert current["nominal_at"] == 13600.0
+    assert 13600.0 <= current["next_fire_at"] <= 13660.0
+    assert store.claim(schedule["id"], current["next_fire_at"], now=13500.0) is not None
+    assert store.get(schedule["id"])["status"] == "completed"
+
+
+def test_missed_occurrences_are_skipped(tmp_path):
+    """Test that occurrences missed while the app was down do not fire late"""
+    store = make_store(tmp_path)
+    once = store.create("run", {}, CONFIG, 1000.0)
+    assert store.claim(once["id"], 1000.0, now=1000.0 + MISFIRE_GRACE + 1) is None
+    assert store.get(once["id"])["status"] == "missed"
+
+    hourly = store.create("run", {}, CONFIG, 1000.0, interval_seconds=3600)
+    assert store.claim(hourly["id"], 1000.0, now=20000.0) is None
+    current = store.get(hourly["id"])
+    assert (current["status"], current["runs"], current["next_fire_at"]) == ("active", 0, 22600.0)
+
+
+def test_runner_fires_lead_time_before_occurrence(tmp_path):
+    """Test that the runner queues the job lead seconds early and only once per occurrence"""
+    store = make_store(tmp_path)
+    fired = []
+    runner = ScheduleRunner(store, fired.append, resync_interval=3600)
+    runner.wheel = TimerWheel(start=900.0)
+    schedule = store.create("run", {}, CONFIG, 1000.0, lead_seconds=60)
+    runner.sync()
+    runner._last_sync = 900.0
+
+    assert runner.run_once(now=930.0) == 0
+    assert runner.run_once(now=941.0) == 1
+    assert fired[0]["fire_time"] == 1000.0
+    assert runner.run_once(now=1000.0) == 0
+    assert store.get(schedule["id"])["status"] == "completed"
+
+
+def test_runner_records_occurrences_that_fail_to_fire(tmp_path):
+    """Test that an occurrence whose job cannot be queued leaves its error on the schedule"""
+    store = make_store(tmp_path)
+
+    def fire(schedule):
+        if schedule["fire_time"] == 1000.0:
+            raise ValueError("Unknown profile: prof_1")
+
+    runner = ScheduleRunner(store, fire, resync_interval=3600)
+    runner.wheel = TimerWheel(start=900.0)
+    schedule = store.create("run", {}, CONFIG, 1000.0, interval_seconds=3600)
+    runner.sync()
+    runner._last_sync = 900.0
+
+    assert runner.run_once(now=1001.0) == 0
+    current = store.get(schedule["id"])
+    assert (current["last_error"], current["last_error_at"]) == ("Unknown profile: prof_1", 1001.0)
+    assert current["status"] == "active"
+
+    assert runner.run_once(now=4601.0) == 1
+    store.record_job(schedule["id"], "job1")
+    assert store.get(schedule["id"])["last_error"] is None
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from snapshots import (ADDED, CHANGED, CONFIRMED, PENDING, REMOVED, STILL_OWNED, SnapshotStore,
+                       diff_inventories, gift_digest)
+
+
+def make_gift(gift_id, stars=5):
+    return {"owned_gift_id": gift_id, "type": "unique", "transfer_star_count": stars}
+
+
+def test_diff_inventories():
+    """Test that added, changed and removed gifts are found page by page"""
+    previous = {gift["owned_gift_id"]: gift_digest(gift) for gift in [make_gift("a"), make_gift("b"), make_gift("c")]}
+
+    diff = diff_inventories(previous, [make_gift("a"), make_gift("b", stars=9)])
+    diff.add([make_gift("d"), make_gift("a")])
+
+    assert [gift["owned_gift_id"] for gift in diff.added] == ["d"]
+    assert [gift["owned_gift_id"] for gift in diff.changed] == ["b"]
+    assert diff.removed == ["c"]
+    assert not diff.baseline
+
+    baseline = diff_inventories(None, [make_gift("a")])
+    assert baseline.baseline and not baseline.added and not baseline.removed
+
+
+def test_snapshots_feed_changes(tmp_path):
+    """Test that snapshots after the baseline append to the change feed"""
+    store = SnapshotStore(Database(str(tmp_path / "state.db")))
+
+    summary = store.record("conn", store.begin("conn").add([make_gift("a"), make_gift("b")]), time.time())
+    assert summary["baseline"] and summary["gift_count"] == 2
+    assert store.changes("conn") == []
+
+    summary = store.record("conn", store.begin("conn").add([make_gift("a", stars=7), make_gift("c")]), time.time())
+    assert (summary["added"], summary["removed"], summary["changed"]) == (1, 1, 1)
+
+    changes = store.changes("conn")
+    assert [(c["owned_gift_id"], c["change"]) for c in changes] == [("c", ADDED), ("a", CHANGED), ("b", REMOVED)]
+    assert changes[1]["gift"]["transfer_star_count"] == 7 and changes[2]["gift"] is None
+    assert store.changes("conn", after=changes[1]["id"]) == changes[2:]
+    assert store.latest("conn")["id"] == summary["snapshot_id"]
+    assert store.begin("other").baseline
+
+    # Unchanged inventory: nothing new in the feed
+    store.record("conn", store.begin("conn").add([make_gift("a", stars=7), make_gift("c")]), time.time())
+    assert len(store.changes("conn")) == 3
+
+
+def test_transfers_are_verified_by_the_next_snapshot(tmp_path):
+    """Test that transferred gifts are confirmed once a later snapshot no longer lists them"""
+    store = SnapshotStore(Database(str(tmp_path / "state.db")))
+    store.record("conn", store.begin("conn").add([make_gift("a"), make_gift("b"), make_gift("c")]), time.time())
+    started_before = time.time()
+    store.record_transfer("conn", "job1", "a")
+    store.record_transfer("conn", "job1", "b")
+
+    # A listing that started before the transfers cannot verify them
+    store.record("conn", store.begin("conn").add([make_gift("b"), make_gift("c")]), started_before)
+    assert store.verification("job1")[PENDING] == 2
+
+    summary = store.record("conn", store.begin("conn").add([make_gift("b"), make_gift("c")]), time.time() + 1)
+    assert summary["verified"] == {CONFIRMED: 1, STILL_OWNED: 1}
+    assert store.verification("job1") == {PENDING: 0, CONFIRMED: 1, STILL_OWNED: 1, "still_owned_gift_ids": ["b"]}
+
+    store.record("conn", store.begin("conn").add([make_gift("c")]), time.time() + 1)
+    assert store.verification("job1")[CONFIRMED] == 2
@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from task_graph import TaskFailed, TaskGraph
+
+
+def test_independent_tasks_overlap():
+    """Test that a task runs while an unrelated slow task is still running"""
+    settled = threading.Event()
+    order = []
+
+    def settle():
+        time.sleep(0.2)
+        order.append("settlement")
+        settled.set()
+        return True
+
+    def inventory():
+        order.append("inventory")
+        return ["g1", "g2"]
+
+    graph = TaskGraph()
+    graph.add("settlement", settle)
+    graph.add("inventory", inventory)
+    graph.add("gift", lambda gifts: gifts[0] if not settled.is_set() else None, deps=["inventory"])
+    graph.add("transfer", lambda gift, ready: f"sent {gift}", deps=["gift", "settlement"])
+
+    results = graph.run()
+
+    assert results["transfer"] == "sent g1"
+    assert order == ["inventory", "settlement"]
+
+
+def test_failure_stops_dependents():
+    """Test that no task starts after a failure, and exceptions propagate"""
+    started = []
+
+    def task(name, result):
+        def run(*deps):
+            started.append(name)
+            return result
+        return run
+
+    graph = TaskGraph()
+    graph.add("inventory", task("inventory", []))
+    graph.add("gift", task("gift", "g1"), deps=["inventory"])
+    with pytest.raises(TaskFailed) as error:
+        graph.run()
+    assert error.value.name == "inventory" and started == ["inventory"]
+
+    graph = TaskGraph()
+    graph.add("boom", lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+
+    with pytest.raises(ValueError):
+        graph.add("late", task("late", True), deps=["missing"])
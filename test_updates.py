@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from db import Database
+from updates import ConnectionStates, PollerLease, UpdateFetchError, UpdatePoller, UpdateProcessor, telegram_fetch
+
+
+class FakeFeed:
+    """getUpdates stand-in that serves queued updates from the requested offset"""
+
+    def __init__(self, updates):
+        self.updates = updates
+        self.offsets = []
+
+    def __call__(self, offset, timeout):
+        self.offsets.append(offset)
+        return [update for update in self.updates if update["update_id"] >= offset][:2]
+
+
+def make_processor(tmp_path):
+    invalidated = []
+    connections = ConnectionStates(Database(str(tmp_path / "state.db")))
+    return UpdateProcessor(connections, invalidated.append), connections, invalidated
+
+
+def test_processor_tracks_connections_and_gifts(tmp_path):
+    """Test that connection updates are stored and gift messages drop the inventory"""
+    processor, connections, invalidated = make_processor(tmp_path)
+
+    assert processor.process({"update_id": 1, "business_connection": {
+        "id": "conn", "user_chat_id": 7, "is_enabled": True,
+        "rights": {"can_transfer_and_upgrade_gifts": False}}}) == "connection"
+    assert connections.problem("conn") == "lacks the right to transfer gifts"
+
+    processor.process({"update_id": 2, "business_connection": {"id": "conn", "is_enabled": False}})
+    assert connections.problem("conn") == "was disabled by the business account"
+    processor.process({"update_id": 3, "business_connection": {"id": "conn", "is_enabled": True}})
+    assert connections.problem("conn") is None and connections.problem("unknown") is None
+
+    assert processor.process({"update_id": 4, "business_message": {
+        "business_connection_id": "conn", "unique_gift": {"owned_gift_id": "g1"}}}) == "gift"
+    assert processor.process({"update_id": 5, "business_message": {
+        "business_connection_id": "conn", "text": "hello"}}) is None
+
+    assert invalidated == ["conn", "conn", "conn", "conn"]
+    assert processor.snapshot()["received"] == 5 and processor.snapshot()["gifts"] == 1
+
+
+def test_poller_resumes_from_stored_offset(tmp_path):
+    """Test that the poller applies each update once and only the lease holder polls"""
+    processor, connections, invalidated = make_processor(tmp_path)
+    lease = PollerLease(Database(str(tmp_path / "state.db")))
+    feed = FakeFeed([{"update_id": 10 + i, "business_message": {
+        "business_connection_id": f"conn{i}", "gift": {}}} for i in range(3)])
+
+    first = UpdatePoller(lease, processor, feed, owner="a", timeout=30)
+    assert first.poll_once() == 2
+    assert UpdatePoller(lease, processor, feed, owner="b", timeout=30).poll_once() is None
+
+    # A new process holding the lease later continues after the applied updates
+    conn = lease.db.connect()
+    with conn:
+        conn.execute("UPDATE update_poller SET lease_until = 0")
+    second = UpdatePoller(lease, processor, feed, owner="b", timeout=30)
+    assert second.poll_once() == 1
+    assert second.poll_once() == 0
+
+    assert feed.offsets == [0, 12, 13]
+    assert invalidated == ["conn0", "conn1", "conn2"]
+
+
+def test_telegram_fetch_reports_errors():
+    """Test that getUpdates errors are raised, e.g. while a webhook is set"""
+    class Response:
+        def __init__(self, body):
+            self.body = body
+
+        def json(self):
+            return self.body
+
+    calls = []
+
+    def post(url, json=None, timeout=None):
+        calls.append(json)
+        return Response({"ok": True, "result": [{"update_id": 1}]})
+
+    assert telegram_fetch("1:abc", post)(5, 30) == [{"update_id": 1}]
+    assert calls[0]["offset"] == 5 and "business_connection" in calls[0]["allowed_updates"]
+
+    fetch = telegram_fetch("1:abc", lambda url, json=None, timeout=None: Response(
+        {"ok": False, "description": "Conflict: can't use getUpdates method while webhook is active"}))
+    with pytest.raises(UpdateFetchError):
+        fetch(0, 30)
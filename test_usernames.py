@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import modules
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+from batch_manifest import validate_row
+from db import Database
+from usernames import UsernameCache, is_username, parse_chat_ref
+
+
+def test_parse_chat_ref():
+    """Test that chat IDs and @usernames are accepted and normalized"""
+    assert parse_chat_ref(" 42 ") == 42
+    assert parse_chat_ref("@Gift_Fan") == "@gift_fan"
+    assert is_username(parse_chat_ref("@gift_fan")) and not is_username(parse_chat_ref(42))
+    for value in ("gift_fan", "@ab", "@1abc", "0", -5, True, ""):
+        with pytest.raises(ValueError):
+            parse_chat_ref(value)
+
+    assert validate_row({"gift_id": "g1", "target_chat_id": "@Gift_Fan"}) == (
+        {"gift_id": "g1", "target_chat_id": "@gift_fan"}, "")
+    assert validate_row({"gift_id": "g1", "target_chat_id": "abc"})[0] is None
+
+
+def test_cache_maps_both_ways_and_invalidates(tmp_path):
+    """Test lookups by username and by chat ID, replacement and invalidation"""
+    cache = UsernameCache(Database(str(tmp_path / "state.db")))
+    cache.record("@alice", 100)
+    cache.record("@bob", 200)
+
+    assert cache.lookup(["@alice", "@bob", "@carol"], max_age=60) == {"@alice": 100, "@bob": 200}
+    assert cache.usernames_of([100, 300], max_age=60) == {100: "@alice"}
+    assert cache.lookup(["@alice"], max_age=0) == {}
+
+    # A chat that changed its username keeps only the new one
+    cache.record("@alice_new", 100)
+    assert cache.lookup(["@alice", "@alice_new"], max_age=60) == {"@alice_new": 100}
+
+    # Telegram no longer knows the username, or the chat
+    cache.record("@bob", None)
+    assert cache.lookup(["@bob"], max_age=60) == {}
+    assert cache.invalidate(chat_id=100) == 1
+    assert cache.usernames_of([100], max_age=60) == {}
+
+    cache.record("@carol", 300)
+    assert cache.prune(max_age=-1) == 1
@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from db import Database
+
+logger = logging.getLogger("telegram_gift_transfer_app")
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot"
+
+# Update types the receiver asks Telegram for
+ALLOWED_UPDATES = ["business_connection", "business_message"]
+
+# Receiver modes
+UPDATE_MODES = ("off", "webhook", "poll")
+
+# Message fields of a gift sent or received by a business account
+GIFT_MESSAGE_FIELDS = ("gift", "unique_gift")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS business_connections (
+    connection_id TEXT PRIMARY KEY,
+    user_chat_id INTEGER,
+    enabled INTEGER NOT NULL,
+    can_transfer_gifts INTEGER,
+    updated_at REAL NOT NULL
+);
+
+-- Single row: which web process long-polls getUpdates, and where it is
+CREATE TABLE IF NOT EXISTS update_poller (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    next_offset INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class UpdateFetchError(Exception):
+    """Raised when getUpdates answers with an error."""
+
+
+class ConnectionStates:
+    """Business connection states as last reported by Telegram."""
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def record(self, connection: Dict[str, Any]) -> None:
+        """
+        Store a BusinessConnection from an update.
+
+        Args:
+            connection (Dict[str, Any]): The BusinessConnection object
+        """
+        rights = connection.get('rights')
+        can_transfer = None if rights is None else bool(rights.get('can_transfer_and_upgrade_gifts'))
+        conn = self.db.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO business_connections "
+                "(connection_id, user_chat_id, enabled, can_transfer_gifts, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (connection['id'], connection.get('user_chat_id'), 1 if connection.get('is_enabled') else 0,
+                 None if can_transfer is None else int(can_transfer), time.time())
+            )
+
+    def problem(self, connection_id: str) -> Optional[str]:
+        """
+        Tell why gifts cannot be transferred through a connection.
+
+        Args:
+            connection_id (str): Business connection ID
+
+        Returns:
+            Optional[str]: The reason, or None if the connection is usable or unknown
+        """
+        conn = self.db.connect()
+        row = conn.execute("SELECT enabled, can_transfer_gifts FROM business_connections WHERE connection_id = ?",
+                           (connection_id,)).fetchone()
+        if row is None:
+            return None
+        if not row['enabled']:
+            return "was disabled by the business account"
+        if row['can_transfer_gifts'] == 0:
+            return "lacks the right to transfer gifts"
+        return None
+
+
+class UpdateProcessor:
+    """
+    Applies Telegram updates to the app's state: connection updates are
+    stored, and gifts sent or received by a business account drop its
+    cached inventory.
+
+    Args:
+        connections (ConnectionStates): Where connection updates are stored
+        invalidate (Callable[[str], None]): Drops the cached inventory of a
+            business connection
+        on_connection (Optional[Callable[[Dict[str, Any]], None]]): Also
+            receives each BusinessConnection, e.g. for the bot pool
+    """
+
+    def __init__(self, connections: ConnectionStates, invalidate: Callable[[str], None],
+                 on_connection: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.connections = connections
+        self.invalidate = invalidate
+        self.on_connection = on_connection
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"received": 0, "connections": 0, "gifts": 0}
+        self.last_update_at: Optional[float] = None
+
+    def process(self, update: Dict[str, Any]) -> Optional[str]:
+        """
+        Apply one update.
+
+        Args:
+            update (Dict[str, Any]): Update from the webhook or getUpdates
+
+        Returns:
+            Optional[str]: "connection" or "gift" if the update was used, else None
+        """
+        kind = None
+        if isinstance(update.get('business_connection'), dict) and update['business_connection'].get('id'):
+            connection = update['business_connection']
+            self.connections.record(connection)
+            if self.on_connection is not None:
+                self.on_connection(connection)
+            # Whatever changed, the inventory served for the connection may be stale
+            self.invalidate(connection['id'])
+            kind = "connection"
+        elif isinstance(update.get('business_message'), dict):
+            message = update['business_message']
+            if message.get('business_connection_id') and any(field in message for field in GIFT_MESSAGE_FIELDS):
+                self.invalidate(message['business_connection_id'])
+                kind = "gift"
+
+        with self._lock:
+            self.counts["received"] += 1
+            if kind == "connection":
+                self.counts["connections"] += 1
+            elif kind == "gift":
+                self.counts["gifts"] += 1
+            self.last_update_at = time.time()
+        return kind
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the update counters.
+
+        Returns:
+            Dict[str, Any]: Counts per kind and the time of the last update
+        """
+        with self._lock:
+            return dict(self.counts, last_update_at=self.last_update_at)
+
+
+class PollerLease:
+    """
+    Lease that lets one web process at a time call getUpdates, with the
+    offset stored next to it so the next holder continues where the last
+    one stopped.
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def acquire(self, owner: str, duration: float) -> Optional[int]:
+        """
+        Take or renew the lease.
+
+        Args:
+            owner (str): This process, from make_owner_id
+            duration (float): Seconds the lease is held without renewal
+
+        Returns:
+            Optional[int]: The next update offset, or None if another process holds the lease
+        """
+        now = time.time()
+        conn = self.db.connect()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO update_poller (id) VALUES (1)")
+            updated = conn.execute(
+                "UPDATE update_poller SET owner = ?, lease_until = ? WHERE id = 1 AND (owner = ? OR lease_until < ?)",
+                (owner, now + duration, owner, now)
+            ).rowcount
+            if not updated:
+                return None
+            return conn.execute("SELECT next_offset FROM update_poller WHERE id = 1").fetchone()['next_offset']
+
+    def commit(self, owner: str, offset: int) -> None:
+        """
+        Store the offset after the updates before it were applied.
+
+        Args:
+            owner (str): The lease holder
+            offset (int): Next update_id to ask for
+        """
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE update_poller SET next_offset = ? WHERE id = 1 AND owner = ?", (offset, owner))
+
+
+def telegram_fetch(bot_token: str, request: Optional[Callable[..., Any]] = None) -> Callable[[int, int], List[Dict]]:
+    """
+    Build the getUpdates call used by UpdatePoller.
+
+    Args:
+        bot_token (str): Bot token
+        request (Optional[Callable]): Replaces requests.post, for tests
+
+    Returns:
+        Callable[[int, int], List[Dict]]: Takes (offset, timeout) and returns the updates
+    """
+    post = request or requests.post
+
+    def fetch(offset: int, timeout: int) -> List[Dict]:
+        response = post(f"{TELEGRAM_API_URL}{bot_token}/getUpdates",
+                        json={"offset": offset, "timeout": timeout, "allowed_updates": ALLOWED_UPDATES},
+                        timeout=timeout + 10)
+        result = response.json()
+        if not result.get('ok'):
+            raise UpdateFetchError(result.get('description', 'Unknown error'))
+        return result.get('result', [])
+
+    return fetch
+
+
+class UpdatePoller:
+    """
+    Long-polls getUpdates when no webhook is configured.
+
+    Every web process runs a poller, but only the holder of the lease polls,
+    since Telegram allows one getUpdates call per bot at a time.
+
+    Args:
+        lease (PollerLease): Shared lease and offset
+        processor (UpdateProcessor): Applies the updates
+        fetch (Callable[[int, int], List[Dict]]): getUpdates, see telegram_fetch;
+            a fake feed in tests
+        owner (str): This process, from make_owner_id
+        timeout (int): Long-poll timeout in seconds
+        retry_delay (float): Seconds to wait after a failed poll
+    """
+
+    def __init__(self, lease: PollerLease, processor: UpdateProcessor, fetch: Callable[[int, int], List[Dict]],
+                 owner: str, timeout: int = 30, retry_delay: float = 5.0):
+        self.lease = lease
+        self.processor = processor
+        self.fetch = fetch
+        self.owner = owner
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self._thread: Optional[threading.Thread] = None
+
+    def poll_once(self) -> Optional[int]:
+        """
+        Fetch and apply one batch of updates if this process holds the lease.
+
+        Returns:
+            Optional[int]: Number of updates applied, or None without the lease
+        """
+        # The lease must outlast the long poll it covers
+        offset = self.lease.acquire(self.owner, self.timeout + 30)
+        if offset is None:
+            return None
+        updates = self.fetch(offset, self.timeout)
+        for update in updates:
+            try:
+                self.processor.process(update)
+            except Exception as e:
+                logger.error(f"Failed to apply update {update.get('update_id')}: {str(e)}")
+            offset = max(offset, update.get('update_id', 0) + 1)
+        if updates:
+            self.lease.commit(self.owner, offset)
+        return len(updates)
+
+    def start(self) -> None:
+        """Start the polling thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="update-poller", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                if self.poll_once() is None:
+                    # Another process polls; check again before its lease runs out
+                    time.sleep(self.timeout)
+            except Exception as e:
+                logger.error(f"Failed to poll Telegram updates: {str(e)}")
+                time.sleep(self.retry_delay)
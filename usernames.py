@@ -0,0 +1,166 @@
+import re
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from db import Database
+
+# Public usernames: 4-32 characters, starting with a letter
+USERNAME_PATTERN = re.compile(r"^@([A-Za-z][A-Za-z0-9_]{3,31})$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_usernames (
+    username TEXT PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    resolved_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_usernames_chat ON chat_usernames(chat_id);
+CREATE INDEX IF NOT EXISTS idx_chat_usernames_resolved ON chat_usernames(resolved_at);
+"""
+
+
+def parse_chat_ref(value: Any) -> Union[int, str]:
+    """
+    Parse a recipient given as a numeric chat ID or an @username.
+
+    Args:
+        value (Any): Chat ID (int or digits) or @username
+
+    Returns:
+        Union[int, str]: Positive chat ID, or the username in lowercase with its @
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    if isinstance(value, bool):
+        raise ValueError("must be a positive chat ID or an @username")
+    text = str(value).strip()
+    match = USERNAME_PATTERN.match(text)
+    if match:
+        # Usernames are case-insensitive
+        return "@" + match.group(1).lower()
+    try:
+        chat_id = int(text)
+    except ValueError:
+        raise ValueError("must be a positive chat ID or an @username")
+    if chat_id <= 0:
+        raise ValueError("must be a positive chat ID or an @username")
+    return chat_id
+
+
+def is_username(chat_ref: Union[int, str]) -> bool:
+    """
+    Tell whether a parsed recipient still needs resolving.
+
+    Args:
+        chat_ref (Union[int, str]): Output of parse_chat_ref
+
+    Returns:
+        bool: True for an @username
+    """
+    return isinstance(chat_ref, str)
+
+
+class UsernameCache:
+    """
+    Persistent username to chat ID mapping, looked up in both directions.
+
+    A chat has at most one cached username, so recording a new username for
+    a chat (or a new chat for a username) replaces the old mapping.
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+        self.db.executescript(SCHEMA)
+
+    def record(self, username: str, chat_id: Optional[int]) -> None:
+        """
+        Store a resolution; a chat ID of None means the username does not
+        exist and drops its mapping.
+
+        Args:
+            username (str): @username from parse_chat_ref
+            chat_id (Optional[int]): Chat the username belongs to
+        """
+        if chat_id is None:
+            self.invalidate(username=username)
+            return
+        conn = self.db.connect()
+        with conn:
+            conn.execute("DELETE FROM chat_usernames WHERE username = ? OR chat_id = ?", (username, chat_id))
+            conn.execute("INSERT INTO chat_usernames (username, chat_id, resolved_at) VALUES (?, ?, ?)",
+                         (username, chat_id, time.time()))
+
+    def lookup(self, usernames: List[str], max_age: float) -> Dict[str, int]:
+        """
+        Get the chat IDs resolved within max_age seconds.
+
+        Args:
+            usernames (List[str]): @usernames from parse_chat_ref
+            max_age (float): Maximum age of a resolution in seconds
+
+        Returns:
+            Dict[str, int]: Chat ID per username that has a fresh resolution
+        """
+        return {row['username']: row['chat_id'] for row in self._select("username", usernames, max_age)}
+
+    def usernames_of(self, chat_ids: List[int], max_age: float) -> Dict[int, str]:
+        """
+        Get the usernames of chats, resolved within max_age seconds.
+
+        Args:
+            chat_ids (List[int]): Chat IDs
+            max_age (float): Maximum age of a resolution in seconds
+
+        Returns:
+            Dict[int, str]: Username per chat that has a fresh resolution
+        """
+        return {row['chat_id']: row['username'] for row in self._select("chat_id", chat_ids, max_age)}
+
+    def _select(self, column: str, values: List[Any], max_age: float) -> List[Any]:
+        if max_age <= 0:
+            return []
+        conn = self.db.connect()
+        cutoff = time.time() - max_age
+        unique = list(dict.fromkeys(values))
+        rows = []
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows.extend(conn.execute(
+                f"SELECT username, chat_id FROM chat_usernames WHERE resolved_at >= ? "
+                f"AND {column} IN ({','.join('?' * len(chunk))})",
+                [cutoff] + chunk
+            ).fetchall())
+        return rows
+
+    def invalidate(self, username: Optional[str] = None, chat_id: Optional[int] = None) -> int:
+        """
+        Drop the mapping of a username or of a chat, e.g. after Telegram
+        reported that the chat was not found.
+
+        Args:
+            username (Optional[str]): @username
+            chat_id (Optional[int]): Chat ID
+
+        Returns:
+            int: Number of dropped mappings
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute("DELETE FROM chat_usernames WHERE username = ? OR chat_id = ?",
+                                (username, chat_id)).rowcount
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete resolutions older than max_age seconds.
+
+        Args:
+            max_age (float): Maximum age of a resolution in seconds
+
+        Returns:
+            int: Number of deleted resolutions
+        """
+        conn = self.db.connect()
+        with conn:
+            return conn.execute("DELETE FROM chat_usernames WHERE resolved_at < ?",
+                                (time.time() - max_age,)).rowcount